@@ -1,11 +1,17 @@
+import atexit
+import logging
 from flask import Flask
 from flask_socketio import SocketIO
 from flask_cors import CORS
 from .config import Config
 
+logger = logging.getLogger(__name__)
+
 socketio = SocketIO(cors_allowed_origins="*")
 
-def create_app():
+def create_app(services=None, worker_index=0):
+    """Create the app; services may hold prebuilt instances (e.g. loaded before forking workers)"""
+    services = services or {}
     app = Flask(__name__)
     app.config.from_object(Config)
     
@@ -16,14 +22,236 @@ def create_app():
     from .routes.chat_routes import chat_bp
     app.register_blueprint(chat_bp)
     
-    # Initialize extensions
-    socketio.init_app(app)
+    # Initialize extensions; workers share a message queue so emits reach clients on any process
+    from .services.socketio_queue import create_client_manager
+    client_manager = create_client_manager(app.config.get('SOCKETIO_MESSAGE_QUEUE'))
+    if client_manager is not None:
+        socketio.init_app(app, client_manager=client_manager)
+    else:
+        socketio.init_app(app)
     
     # Preload services
     from .services.rag_service import RAGService
-    from .services.llm_service import LLMFactory
+    from .services.llm_service import PROVIDER_KEYS, LLMFactory, configured_providers
+    from .services.conversation_service import ConversationStore
+    from .services.conversation_db import ConversationDB
+    from .services.metrics import Metrics
+    
+    app.config['metrics'] = Metrics()
+    # Built inside an app context so RAGService reads this app's configuration
+    with app.app_context():
+        app.config['rag_service'] = services.get('rag_service') or RAGService()
+    app.config['llm_factory'] = services.get('llm_factory') or LLMFactory()
+    app.config['rag_service'].metrics = app.config['metrics']
+    app.config['rag_service'].collections.metrics = app.config['metrics']
+    
+    rate_limiter = None
+    if app.config['RATE_LIMIT_ENABLED']:
+        from .services.rate_limit import RateLimiter, parse_limits
+        rate_limiter = RateLimiter(
+            client_requests=app.config['CLIENT_REQUESTS_PER_MINUTE'],
+            client_tokens=app.config['CLIENT_TOKENS_PER_MINUTE'],
+            provider_limits=parse_limits(app.config['PROVIDER_RATE_LIMITS']),
+            queue_timeout=app.config['RATE_LIMIT_QUEUE_TIMEOUT'],
+            metrics=app.config['metrics'],
+            create_event=socketio.server.eio.create_event
+        )
+    app.config['rate_limiter'] = rate_limiter
+    
+    # Per-request tokens and cost, flushed in batches to a SQLite file all workers share
+    from .services.usage import PRICES, parse_prices
+    prices = dict(PRICES, **parse_prices(app.config['USAGE_PRICES']))
+    usage_collector = None
+    if app.config['USAGE_TRACKING']:
+        from .services.usage import UsageCollector
+        usage_collector = UsageCollector(
+            db_path=app.config['USAGE_DB_PATH'] or None,
+            flush_interval=app.config['USAGE_FLUSH_INTERVAL'],
+            prices=prices,
+            retention_days=app.config['USAGE_RETENTION_DAYS'],
+            latency_slack=app.config['USAGE_LATENCY_SLACK'],
+            min_requests=app.config['USAGE_MIN_REQUESTS'],
+            metrics=app.config['metrics']
+        )
+        atexit.register(usage_collector.close)
+    app.config['usage_collector'] = usage_collector
+    
+    # 'auto' messages go to the fastest eligible model, measured from every reply
+    model_router = None
+    if app.config['ROUTER_ENABLED']:
+        from .services.router import DEFAULT_CANDIDATES, ModelRouter, parse_candidates, parse_ceilings
+        model_router = ModelRouter(
+            candidates={name: parse_candidates(app.config[f'ROUTER_CANDIDATES_{name.upper()}'] or default)
+                        for name, default in DEFAULT_CANDIDATES.items()},
+            providers=configured_providers(app.config),
+            prices=prices,
+            ceilings=parse_ceilings(app.config['ROUTER_MAX_COST_PER_1K']),
+            window=app.config['ROUTER_WINDOW'],
+            min_samples=app.config['ROUTER_MIN_SAMPLES'],
+            explore=app.config['ROUTER_EXPLORE'],
+            completion_tokens=app.config['ROUTER_COMPLETION_TOKENS'],
+            long_tokens=app.config['ROUTER_LONG_QUERY_TOKENS'],
+            max_error_rate=app.config['ROUTER_MAX_ERROR_RATE'],
+            log_path=app.config['ROUTER_LOG_PATH'] or None
+        )
+        if usage_collector is not None:
+            # Start from the last hour's measurements instead of re-measuring every model after a restart
+            try:
+                model_router.seed(usage_collector.summary(hours=1)['models'])
+            except Exception as e:
+                logger.warning(f"Could not seed the model router from usage: {str(e)}")
+    app.config['model_router'] = model_router
+    
+    # The catalog clients pick from, also used by the factory to validate requested models
+    from .services.model_registry import ModelRegistry
+    from .services.router import AUTO_MODEL
+    model_registry = ModelRegistry(
+        app.config['llm_factory'].AVAILABLE_MODELS,
+        providers=configured_providers(app.config),
+        api_keys={provider: next((app.config.get(key) for key in keys if app.config.get(key)), '')
+                  for provider, keys in PROVIDER_KEYS.items()},
+        urls={'openai': f"{app.config['OPENAI_BASE_URL'].rstrip('/')}/models"} if app.config['OPENAI_BASE_URL'] else None,
+        extra={'auto': [AUTO_MODEL]} if model_router is not None else None,
+        ttl=app.config['MODEL_DISCOVERY_TTL'],
+        timeout=app.config['MODEL_DISCOVERY_TIMEOUT'],
+        metrics=app.config['metrics']
+    )
+    if app.config['MODEL_DISCOVERY_ENABLED']:
+        # An OS thread: listing models makes blocking HTTP requests
+        model_registry.start()
+        atexit.register(model_registry.stop)
+    app.config['model_registry'] = model_registry
+    app.config['llm_factory'].registry = model_registry
+    
+    # CPU-bound retrieval runs in a process pool; serve.py starts it before forking the web workers
+    retrieval_pool = services.get('retrieval_pool')
+    if retrieval_pool is None and app.config['RETRIEVAL_PROCESSES'] > 0:
+        from .services.retrieval_pool import RetrievalPool
+        retrieval_pool = RetrievalPool(app.config['rag_service'], app.config['RETRIEVAL_PROCESSES'],
+                                       path=app.config['RETRIEVAL_SOCKET'] or None).start()
+        atexit.register(retrieval_pool.stop)
+    if retrieval_pool is not None:
+        from .services.retrieval_pool import RetrievalClient
+        app.config['rag_service'].retrieval = RetrievalClient(
+            retrieval_pool.path,
+            max_pending=app.config['RETRIEVAL_MAX_PENDING'],
+            timeout=app.config['RETRIEVAL_TIMEOUT'],
+            async_mode=socketio.async_mode
+        )
+    
+    # Runtime uploads; one worker runs the indexing jobs, the others only queue and list them
+    document_service = None
+    if app.config['DOCUMENT_UPLOADS_ENABLED']:
+        from .services.document_service import DocumentService
+        offload = None
+        if socketio.async_mode == 'eventlet':
+            # Page parsing and in-process embedding run in OS threads so streams keep flowing
+            from eventlet import tpool
+            offload = tpool.execute
+        document_service = DocumentService(
+            app.config['rag_service'],
+            chunk_size=app.config['CHUNK_SIZE'],
+            chunk_overlap=app.config['CHUNK_OVERLAP'],
+            dedup=app.config['DEDUP_ENABLED'],
+            near_distance=app.config['DEDUP_NEAR_DISTANCE'],
+            batch_size=app.config['DOCUMENT_BATCH_SIZE'],
+            persist_interval=app.config['DOCUMENT_PERSIST_INTERVAL'],
+            notify=lambda record: socketio.emit('document_progress', record),
+            metrics=app.config['metrics'],
+            offload=offload,
+            sleep=socketio.sleep,
+            create_event=socketio.server.eio.create_event
+        )
+        if worker_index == 0:
+            document_service.start(socketio.start_background_task)
+            atexit.register(document_service.stop)
+    app.config['document_service'] = document_service
+    
+    from .services.wire import parse_formats
+    app.config['wire_formats'] = parse_formats(app.config['STREAM_WIRE_FORMATS'])
+    
+    # Replies are buffered so a client that reconnects mid-answer gets the rest instead of asking again
+    stream_buffers = None
+    if app.config['STREAM_RESUME_ENABLED']:
+        from .routes.chat_routes import send_message
+        from .services.stream_buffer import StreamBuffers
+        stream_buffers = StreamBuffers(
+            emit=send_message,
+            ttl=app.config['STREAM_BUFFER_TTL'],
+            max_stream_bytes=app.config['STREAM_BUFFER_MAX_KB'] * 1024,
+            max_bytes=app.config['STREAM_BUFFER_TOTAL_MB'] * 1024 * 1024,
+            metrics=app.config['metrics']
+        )
+    app.config['stream_buffers'] = stream_buffers
+    
+    # Searches drafts from 'typing' events so the final message finds its results cached
+    prefetcher = None
+    if app.config['PREFETCH_ENABLED']:
+        from .services.prefetch import Prefetcher
+        prefetch_offload = None
+        if socketio.async_mode == 'eventlet':
+            from eventlet import tpool
+            prefetch_offload = tpool.execute
+        prefetcher = Prefetcher(
+            app.config['rag_service'],
+            debounce=app.config['PREFETCH_DEBOUNCE_MS'] / 1000,
+            budget=app.config['PREFETCH_BUDGET'],
+            window=app.config['PREFETCH_WINDOW'],
+            min_chars=app.config['PREFETCH_MIN_CHARS'],
+            metrics=app.config['metrics'],
+            start_task=socketio.start_background_task,
+            sleep=socketio.sleep,
+            offload=prefetch_offload
+        )
+    app.config['prefetcher'] = prefetcher
+    
+    conversation_db = None
+    if app.config.get('CONVERSATION_DB_PATH'):
+        conversation_db = ConversationDB(
+            app.config['CONVERSATION_DB_PATH'],
+            archive_after_days=app.config['CONVERSATION_ARCHIVE_DAYS'],
+            retention_days=app.config['CONVERSATION_RETENTION_DAYS'],
+            compaction_interval=app.config['CONVERSATION_COMPACTION_INTERVAL']
+        )
+    app.config['conversation_db'] = conversation_db
+    app.config['conversation_store'] = ConversationStore(
+        max_history_tokens=app.config['HISTORY_MAX_TOKENS'],
+        completion_reserve=app.config['HISTORY_COMPLETION_RESERVE'],
+        max_conversations=app.config['CONVERSATION_CACHE_SIZE'],
+        db=conversation_db
+    )
+    
+    # Offline query batches: batch_query.py uses the runner directly, POST /api/chat/batch queues jobs for it
+    from .services.batch import BatchJobs, BatchRunner, parse_concurrency
+    batch_offload, batch_lock = None, None
+    if socketio.async_mode == 'eventlet':
+        from eventlet import tpool
+        from eventlet.semaphore import Semaphore
+        batch_offload, batch_lock = tpool.execute, Semaphore()
+    batch_runner = BatchRunner(
+        app.config['rag_service'],
+        app.config['llm_factory'],
+        app.config['conversation_store'],
+        concurrency=parse_concurrency(app.config['BATCH_PROVIDER_CONCURRENCY']),
+        default_concurrency=app.config['BATCH_DEFAULT_CONCURRENCY'],
+        max_retries=app.config['BATCH_MAX_RETRIES'],
+        rate_limiter=rate_limiter,
+        usage_collector=usage_collector,
+        metrics=app.config['metrics'],
+        offload=batch_offload
+    )
+    app.config['batch_runner'] = batch_runner
+    app.config['batch_jobs'] = None
+    if app.config['BATCH_ENABLED']:
+        app.config['batch_jobs'] = BatchJobs(batch_runner, app.config['BATCH_OUTPUT_DIR'],
+                                             start_task=socketio.start_background_task, app_context=app.app_context,
+                                             offload=batch_offload, lock=batch_lock)
     
-    app.config['rag_service'] = RAGService()
-    app.config['llm_factory'] = LLMFactory()
+    # Opt-in profiling surface
+    if app.config.get('PROFILER_ENABLED'):
+        from .services.profiler import ProfilerService
+        profiler_service = ProfilerService(app.config)
+        profiler_service.install_signal_handler()
+        app.config['profiler_service'] = profiler_service
 
     return app 
\ No newline at end of file
@@ -29,6 +29,7 @@ def create_app(test_config=None):
     app.config.from_mapping(
         SECRET_KEY=os.environ.get('SECRET_KEY', 'dev'),
         OPENAI_API_KEY=os.environ.get('OPENAI_API_KEY', ''),
+        OPENAI_BASE_URL=os.environ.get('OPENAI_BASE_URL', ''),
         COHERE_API_KEY=os.environ.get('COHERE_API_KEY', ''),
         HF_API_KEY=os.environ.get('HF_API_KEY', ''),
         HUGGINGFACE_API_KEY=os.environ.get('HUGGINGFACE_API_KEY', ''),
@@ -14,6 +14,176 @@ class Config:
     COHERE_API_KEY = os.environ.get('COHERE_API_KEY', '')
     HF_API_KEY = os.environ.get('HF_API_KEY', '')
     HUGGINGFACE_API_KEY = os.environ.get('HUGGINGFACE_API_KEY', '')
+    GROQ_API_KEY = os.environ.get('GROQ_API_KEY', '')
+    MISTRAL_API_KEY = os.environ.get('MISTRAL_API_KEY', '')
+    ANTHROPIC_API_KEY = os.environ.get('ANTHROPIC_API_KEY', '')
+    XAI_API_KEY = os.environ.get('XAI_API_KEY', '')
+    DEEPSEEK_API_KEY = os.environ.get('DEEPSEEK_API_KEY', '')
+    DASHSCOPE_API_KEY = os.environ.get('DASHSCOPE_API_KEY', '')
+    
+    # Optional OpenAI-compatible endpoint override (e.g. the local fake provider in benchmarks/)
+    OPENAI_BASE_URL = os.environ.get('OPENAI_BASE_URL', '')
+    
+    # Socket.IO message queue shared by worker processes (redis://host:6379/0 or local://host:port);
+    # empty for a single process
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE', '')
     
     # Vector store settings
-    VECTOR_STORE_PATH = os.environ.get('VECTOR_STORE_PATH', 'faiss_index') 
\ No newline at end of file
+    VECTOR_STORE_PATH = os.environ.get('VECTOR_STORE_PATH', 'faiss_index')
+    # Use the flat memory-mapped copy under VECTOR_STORE_PATH/mmap when create_index.py wrote one
+    VECTOR_STORE_MMAP = os.environ.get('VECTOR_STORE_MMAP', 'True') == 'True'
+    # Characters per chunk and overlap for create_index.py and runtime uploads (benchmarks/bench_retrieval.py compares
+    # settings), and passages retrieved per document search
+    CHUNK_SIZE = int(os.environ.get('CHUNK_SIZE', 1000))
+    CHUNK_OVERLAP = int(os.environ.get('CHUNK_OVERLAP', 200))
+    RETRIEVAL_K = int(os.environ.get('RETRIEVAL_K', 5))
+    # Skip chunks that copy one already indexed before embedding them: exact copies, and near copies whose
+    # SimHash fingerprints differ in at most DEDUP_NEAR_DISTANCE bits (0 for exact copies only)
+    DEDUP_ENABLED = os.environ.get('DEDUP_ENABLED', 'True') == 'True'
+    DEDUP_NEAR_DISTANCE = int(os.environ.get('DEDUP_NEAR_DISTANCE', 4))
+    # Named collections under VECTOR_STORE_PATH/collections are opened on first search; past this many open
+    # (per process), the least recently used one is closed
+    COLLECTIONS_MAX_LOADED = int(os.environ.get('COLLECTIONS_MAX_LOADED', 8))
+    
+    # Cross-encoder reranking of the top RERANK_CANDIDATES vector hits (opt-in; downloads the model).
+    # RERANK_BACKEND=onnx needs optimum[onnxruntime]; queries over RERANK_BUDGET_MS keep the vector order
+    RERANK_ENABLED = os.environ.get('RERANK_ENABLED', 'False') == 'True'
+    RERANK_MODEL = os.environ.get('RERANK_MODEL', 'cross-encoder/ms-marco-MiniLM-L-6-v2')
+    RERANK_BACKEND = os.environ.get('RERANK_BACKEND', 'torch')
+    RERANK_CANDIDATES = int(os.environ.get('RERANK_CANDIDATES', 20))
+    RERANK_BUDGET_MS = float(os.environ.get('RERANK_BUDGET_MS', 200))
+    RERANK_BATCH_SIZE = int(os.environ.get('RERANK_BATCH_SIZE', 16))
+    
+    # Hybrid mode runs document and web search concurrently; whatever finished by this deadline is used
+    HYBRID_SEARCH_TIMEOUT = float(os.environ.get('HYBRID_SEARCH_TIMEOUT', 4.0))
+    
+    # Resumable replies: each reply's messages are buffered (at most STREAM_BUFFER_MAX_KB per reply and
+    # STREAM_BUFFER_TOTAL_MB per worker) and kept STREAM_BUFFER_TTL seconds after it ends for 'resume' events
+    STREAM_RESUME_ENABLED = os.environ.get('STREAM_RESUME_ENABLED', 'True') == 'True'
+    STREAM_BUFFER_TTL = float(os.environ.get('STREAM_BUFFER_TTL', 120))
+    STREAM_BUFFER_MAX_KB = int(os.environ.get('STREAM_BUFFER_MAX_KB', 256))
+    STREAM_BUFFER_TOTAL_MB = int(os.environ.get('STREAM_BUFFER_TOTAL_MB', 64))
+    
+    # Wire formats clients may ask for with 'wire' in a message: 'json' (always accepted) and 'binary', which sends
+    # streamed tokens as 'chunk' frames of stream ID, offset and UTF-8 text
+    STREAM_WIRE_FORMATS = os.environ.get('STREAM_WIRE_FORMATS', 'json,binary')
+    
+    # POST /api/chat/stream sends an SSE comment after this many idle seconds; a closed connection is noticed on
+    # the next write and cancels the reply
+    SSE_KEEPALIVE_SECONDS = float(os.environ.get('SSE_KEEPALIVE_SECONDS', 10))
+    
+    # Batch jobs (batch_query.py, and POST /api/chat/batch with BATCH_ENABLED): at most BATCH_PROVIDER_CONCURRENCY
+    # ('provider=n,...') LLM requests in flight per provider, BATCH_DEFAULT_CONCURRENCY for the others; provider 429s
+    # are retried BATCH_MAX_RETRIES times. Queries, results and reports of HTTP jobs are kept in BATCH_OUTPUT_DIR
+    BATCH_ENABLED = os.environ.get('BATCH_ENABLED', 'False') == 'True'
+    BATCH_ADMIN_TOKEN = os.environ.get('BATCH_ADMIN_TOKEN', '')
+    BATCH_OUTPUT_DIR = os.environ.get('BATCH_OUTPUT_DIR', 'batch_jobs')
+    BATCH_PROVIDER_CONCURRENCY = os.environ.get('BATCH_PROVIDER_CONCURRENCY', 'openai=8')
+    BATCH_DEFAULT_CONCURRENCY = int(os.environ.get('BATCH_DEFAULT_CONCURRENCY', 4))
+    BATCH_MAX_RETRIES = int(os.environ.get('BATCH_MAX_RETRIES', 2))
+    
+    # Speculative search on 'typing' events: a draft unchanged for PREFETCH_DEBOUNCE_MS is searched ahead of the
+    # message, at most PREFETCH_BUDGET times per PREFETCH_WINDOW seconds per connection
+    PREFETCH_ENABLED = os.environ.get('PREFETCH_ENABLED', 'False') == 'True'
+    PREFETCH_DEBOUNCE_MS = int(os.environ.get('PREFETCH_DEBOUNCE_MS', 400))
+    PREFETCH_BUDGET = int(os.environ.get('PREFETCH_BUDGET', 6))
+    PREFETCH_WINDOW = float(os.environ.get('PREFETCH_WINDOW', 60))
+    PREFETCH_MIN_CHARS = int(os.environ.get('PREFETCH_MIN_CHARS', 12))
+    
+    # Context compression: drop duplicate passages and chunk overlap, keep the query-relevant sentences and
+    # cap retrieved context at CONTEXT_BUDGET_FRACTION of the model's window (at most CONTEXT_MAX_TOKENS)
+    CONTEXT_COMPRESSION = os.environ.get('CONTEXT_COMPRESSION', 'True') == 'True'
+    CONTEXT_MAX_TOKENS = int(os.environ.get('CONTEXT_MAX_TOKENS', 1500))
+    CONTEXT_BUDGET_FRACTION = float(os.environ.get('CONTEXT_BUDGET_FRACTION', 0.25))
+    CONTEXT_DUPLICATE_THRESHOLD = float(os.environ.get('CONTEXT_DUPLICATE_THRESHOLD', 0.8))
+    
+    # Seconds between checks for a live store saved by another process
+    VECTOR_STORE_REFRESH_INTERVAL = float(os.environ.get('VECTOR_STORE_REFRESH_INTERVAL', 2))
+    
+    # Runtime document uploads: indexed in the background by the first worker into VECTOR_STORE_PATH/live.
+    # The live store is saved when the queue drains and every DOCUMENT_PERSIST_INTERVAL seconds while busy.
+    # Off by default: with CORS open to every origin, set DOCUMENT_ADMIN_TOKEN before enabling it.
+    DOCUMENT_UPLOADS_ENABLED = os.environ.get('DOCUMENT_UPLOADS_ENABLED', 'False') == 'True'
+    DOCUMENT_ADMIN_TOKEN = os.environ.get('DOCUMENT_ADMIN_TOKEN', '')
+    DOCUMENT_BATCH_SIZE = int(os.environ.get('DOCUMENT_BATCH_SIZE', 32))
+    DOCUMENT_PERSIST_INTERVAL = float(os.environ.get('DOCUMENT_PERSIST_INTERVAL', 30))
+    MAX_CONTENT_LENGTH = int(float(os.environ.get('DOCUMENT_MAX_UPLOAD_MB', 50)) * 1024 * 1024)
+    
+    # Retrieval process pool: embedding, FAISS search and HTML parsing run in RETRIEVAL_PROCESSES
+    # forked processes behind a Unix socket (0 keeps them in the server process)
+    RETRIEVAL_PROCESSES = int(os.environ.get('RETRIEVAL_PROCESSES', 0))
+    RETRIEVAL_SOCKET = os.environ.get('RETRIEVAL_SOCKET', '')
+    RETRIEVAL_MAX_PENDING = int(os.environ.get('RETRIEVAL_MAX_PENDING', 8))
+    RETRIEVAL_TIMEOUT = float(os.environ.get('RETRIEVAL_TIMEOUT', 10))
+    
+    # Rate limiting: per-client requests and tokens per minute (0 disables), keyed by connection ('session') or
+    # client address ('ip'; only meaningful without a proxy in front). PROVIDER_RATE_LIMITS is 'provider=requests/min:tokens/min,...'; requests over a
+    # provider's limit queue (round-robin across clients) for up to RATE_LIMIT_QUEUE_TIMEOUT seconds
+    RATE_LIMIT_ENABLED = os.environ.get('RATE_LIMIT_ENABLED', 'True') == 'True'
+    RATE_LIMIT_CLIENT_KEY = os.environ.get('RATE_LIMIT_CLIENT_KEY', 'session')
+    CLIENT_REQUESTS_PER_MINUTE = float(os.environ.get('CLIENT_REQUESTS_PER_MINUTE', 20))
+    CLIENT_TOKENS_PER_MINUTE = float(os.environ.get('CLIENT_TOKENS_PER_MINUTE', 100000))
+    PROVIDER_RATE_LIMITS = os.environ.get('PROVIDER_RATE_LIMITS', '')
+    RATE_LIMIT_QUEUE_TIMEOUT = float(os.environ.get('RATE_LIMIT_QUEUE_TIMEOUT', 30))
+    # Completion tokens assumed when a request is admitted; settled against the reported usage afterwards
+    RATE_LIMIT_COMPLETION_TOKENS = int(os.environ.get('RATE_LIMIT_COMPLETION_TOKENS', 512))
+    
+    # Usage and cost accounting, flushed every USAGE_FLUSH_INTERVAL seconds to USAGE_DB_PATH (SQLite; empty keeps it
+    # in memory). USAGE_PRICES overrides list prices as 'model=prompt:cached:completion,...' in USD per million tokens.
+    # /api/chat/usage recommends per mode the cheapest model within USAGE_LATENCY_SLACK x the fastest model's TTFT
+    USAGE_TRACKING = os.environ.get('USAGE_TRACKING', 'True') == 'True'
+    USAGE_DB_PATH = os.environ.get('USAGE_DB_PATH', 'usage.db')
+    USAGE_FLUSH_INTERVAL = float(os.environ.get('USAGE_FLUSH_INTERVAL', 5))
+    USAGE_PRICES = os.environ.get('USAGE_PRICES', '')
+    USAGE_RETENTION_DAYS = float(os.environ.get('USAGE_RETENTION_DAYS', 30))
+    USAGE_LATENCY_SLACK = float(os.environ.get('USAGE_LATENCY_SLACK', 1.5))
+    USAGE_MIN_REQUESTS = int(os.environ.get('USAGE_MIN_REQUESTS', 5))
+    
+    # Model catalog (/api/chat/models): browsers reuse it for MODEL_CATALOG_MAX_AGE seconds, then revalidate by ETag.
+    # With MODEL_DISCOVERY_ENABLED, each configured provider's model list API is polled every MODEL_DISCOVERY_TTL seconds
+    MODEL_CATALOG_MAX_AGE = int(os.environ.get('MODEL_CATALOG_MAX_AGE', 60))
+    MODEL_DISCOVERY_ENABLED = os.environ.get('MODEL_DISCOVERY_ENABLED', 'False') == 'True'
+    MODEL_DISCOVERY_TTL = float(os.environ.get('MODEL_DISCOVERY_TTL', 3600))
+    MODEL_DISCOVERY_TIMEOUT = float(os.environ.get('MODEL_DISCOVERY_TIMEOUT', 10))
+    
+    # Automatic model selection ('auto' provider or model): ROUTER_CANDIDATES_<CLASS> lists 'provider:model,...' for
+    # simple, code and complex queries; ROUTER_MAX_COST_PER_1K caps the blended USD price per 1k tokens, as one value
+    # or 'simple=0.002,code=0.002,complex=0.01'. Decisions and outcomes are logged as JSON lines to ROUTER_LOG_PATH
+    ROUTER_ENABLED = os.environ.get('ROUTER_ENABLED', 'True') == 'True'
+    ROUTER_CANDIDATES_SIMPLE = os.environ.get('ROUTER_CANDIDATES_SIMPLE', '')
+    ROUTER_CANDIDATES_CODE = os.environ.get('ROUTER_CANDIDATES_CODE', '')
+    ROUTER_CANDIDATES_COMPLEX = os.environ.get('ROUTER_CANDIDATES_COMPLEX', '')
+    ROUTER_MAX_COST_PER_1K = os.environ.get('ROUTER_MAX_COST_PER_1K', 'simple=0.002,code=0.002,complex=0.01')
+    ROUTER_WINDOW = int(os.environ.get('ROUTER_WINDOW', 50))
+    ROUTER_MIN_SAMPLES = int(os.environ.get('ROUTER_MIN_SAMPLES', 3))
+    ROUTER_EXPLORE = float(os.environ.get('ROUTER_EXPLORE', 0.05))
+    ROUTER_COMPLETION_TOKENS = int(os.environ.get('ROUTER_COMPLETION_TOKENS', 300))
+    ROUTER_LONG_QUERY_TOKENS = int(os.environ.get('ROUTER_LONG_QUERY_TOKENS', 150))
+    # Models failing this share of their last ROUTER_WINDOW replies are only tried when exploring
+    ROUTER_MAX_ERROR_RATE = float(os.environ.get('ROUTER_MAX_ERROR_RATE', 0.5))
+    ROUTER_LOG_PATH = os.environ.get('ROUTER_LOG_PATH', 'routing.log')
+    
+    # Conversation history: prompt token cap and tokens reserved for the completion
+    HISTORY_MAX_TOKENS = int(os.environ.get('HISTORY_MAX_TOKENS', 8000))
+    HISTORY_COMPLETION_RESERVE = int(os.environ.get('HISTORY_COMPLETION_RESERVE', 1024))
+    CONVERSATION_CACHE_SIZE = int(os.environ.get('CONVERSATION_CACHE_SIZE', 1000))
+    
+    # Conversation persistence (SQLite in WAL mode); an empty path disables it
+    CONVERSATION_DB_PATH = os.environ.get('CONVERSATION_DB_PATH', 'conversations.db')
+    CONVERSATION_ARCHIVE_DAYS = float(os.environ.get('CONVERSATION_ARCHIVE_DAYS', 30))
+    CONVERSATION_RETENTION_DAYS = float(os.environ.get('CONVERSATION_RETENTION_DAYS', 0))
+    CONVERSATION_COMPACTION_INTERVAL = float(os.environ.get('CONVERSATION_COMPACTION_INTERVAL', 3600))
+    # Lets GET /api/chat/conversations list every conversation and read any of them (empty: nobody can)
+    CONVERSATION_ADMIN_TOKEN = os.environ.get('CONVERSATION_ADMIN_TOKEN', '')
+    
+    # Profiling (opt-in): admin endpoint, SIGUSR2 dumps and continuous low-rate sampling
+    PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED', 'False') == 'True'
+    # Also guards GET /api/chat/usage
+    PROFILER_ADMIN_TOKEN = os.environ.get('PROFILER_ADMIN_TOKEN', '')
+    PROFILER_MAX_SECONDS = float(os.environ.get('PROFILER_MAX_SECONDS', 60))
+    PROFILER_DEFAULT_HZ = float(os.environ.get('PROFILER_DEFAULT_HZ', 200))
+    PROFILER_SIGNAL_SECONDS = float(os.environ.get('PROFILER_SIGNAL_SECONDS', 10))
+    PROFILER_OUTPUT_DIR = os.environ.get('PROFILER_OUTPUT_DIR', 'profiles')
+    PROFILER_CONTINUOUS_HZ = float(os.environ.get('PROFILER_CONTINUOUS_HZ', 0))
+    PROFILER_CONTINUOUS_WINDOW = float(os.environ.get('PROFILER_CONTINUOUS_WINDOW', 60))
+    PROFILER_LOG_PATH = os.environ.get('PROFILER_LOG_PATH', 'profiler_hot.log')
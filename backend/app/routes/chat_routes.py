@@ -1,8 +1,19 @@
-from flask import Blueprint, request, jsonify, current_app
+from flask import Blueprint, Response, request, jsonify, current_app, send_file
 from .. import socketio
 from langchain.callbacks.base import BaseCallbackHandler
+from ..services.batch import read_queries
+from ..services.conversation_service import CONVERSATION_ID_PATTERN
+from ..services.llm_service import ReplyCancelled, invoke_messages, response_text, usage_from_result
+from ..services.personas import get_system_message
+from ..services.rate_limit import ProviderRateLimitError, RateLimited, is_rate_limit_error, retry_after_seconds
+from ..services.wire import encode_chunk, negotiate
 import logging
 import datetime
+import hmac
+import json
+import os
+import threading
+import time
 import uuid
 
 logger = logging.getLogger(__name__)
@@ -26,16 +37,318 @@ class SocketIOCallbackHandler(BaseCallbackHandler):
 class StreamingCallbackHandler(BaseCallbackHandler):
     """Callback handler for streaming LLM responses to SocketIO using the 'message' event"""
     
-    def __init__(self, socket_id):
+    # Let ReplyCancelled through instead of LangChain logging it, so it ends the provider stream
+    raise_error = True
+    
+    def __init__(self, socket_id, emit=None, cancelled=None):
         super().__init__()
         self.socket_id = socket_id
+        # Sends one 'message' payload; the reply's resumable stream when there is one
+        self.emit = emit or (lambda payload: socketio.emit('message', payload, room=socket_id))
+        self.cancelled = cancelled
+        self.first_token_at = None  # perf_counter() of the first streamed token, for time to first token
     
     def on_llm_new_token(self, token, **kwargs):
         """Stream tokens as they're generated"""
-        socketio.emit('message', {
+        if self.cancelled is not None and self.cancelled.is_set():
+            raise ReplyCancelled()
+        if self.first_token_at is None and token:
+            self.first_token_at = time.perf_counter()
+        self.emit({
             'type': 'stream',
             'content': token
-        }, room=self.socket_id)
+        })
+
+def client_key(socket_id):
+    """The identity rate limits are kept for: the connection, or the client address"""
+    if current_app.config.get('RATE_LIMIT_CLIENT_KEY') == 'ip':
+        return request.remote_addr or socket_id
+    return socket_id
+
+def emit_backpressure(socket_id, error, emit=None):
+    """Tell the client it was rate limited, with the scope and when to retry"""
+    payload = {
+        'type': 'backpressure',
+        'content': error.as_message()
+    }
+    if emit is not None:
+        emit(payload)
+    else:
+        socketio.emit('message', payload, room=socket_id)
+
+def send_message(socket_id, payload, wire='json'):
+    """Emit one reply message; in the binary wire format streamed tokens go as 'chunk' frames"""
+    if wire == 'binary' and payload.get('type') == 'stream':
+        socketio.emit('chunk', encode_chunk(payload.get('stream_id'), payload.get('offset', 0), payload['content']),
+                      room=socket_id)
+    else:
+        socketio.emit('message', payload, room=socket_id)
+
+def reply_emitter(socket_id, wire='json'):
+    """Return (stream_id, emit) for one reply's messages; with resumable streams they are buffered"""
+    stream_buffers = current_app.config.get('stream_buffers')
+    if stream_buffers is None:
+        return None, lambda payload: send_message(socket_id, payload, wire)
+    stream_id = stream_buffers.open(socket_id, wire)
+    return stream_id, lambda payload: stream_buffers.emit(stream_id, payload)
+
+class Reply:
+    """One message through the pipeline: model choice, retrieval, prompt, LLM call and accounting.
+    
+    Shared by the Socket.IO 'message' handler and POST /api/chat/stream;
+    everything the client sees goes through emit as 'message' payloads.
+    Setting cancelled stops the provider stream at its next token.
+    """
+    
+    def __init__(self, config, data, conversation_id, client_id, emit, prefetch=None, owned=False):
+        self.content = data.get('content')
+        self.provider = data.get('provider', 'openai')
+        self.model_id = data.get('model')
+        self.mode = data.get('mode', 'llm')
+        # Document search scope: a named collection and a metadata filter, validated in prepare()
+        self.collection = data.get('collection')
+        self.filter = data.get('filter')
+        self.conversation_id = conversation_id
+        self.conversation_token = data.get('conversation_token')
+        # The connection's own history (its socket ID) needs no token
+        self.owned = owned
+        self.persona_id = data.get('persona', 'default')
+        self.system_message = get_system_message(self.persona_id, data.get('system_message'))
+        self.client_id = client_id
+        self.emit = emit
+        self.prefetch = prefetch
+        self.cancelled = threading.Event()
+        
+        # Services
+        self.llm_factory = config['llm_factory']
+        self.rag_service = config['rag_service']
+        self.conversation_store = config['conversation_store']
+        self.metrics = config['metrics']
+        self.rate_limiter = config.get('rate_limiter')
+        self.usage_collector = config.get('usage_collector')
+        self.model_router = config.get('model_router')
+        self.completion_estimate = config.get('RATE_LIMIT_COMPLETION_TOKENS', 512)
+        
+        self.callback_handler = StreamingCallbackHandler(None, emit, self.cancelled)
+        self.routing = None
+        self.llm = None
+        self.actual_provider = None
+        self.model_name = None
+    
+    def prepare(self):
+        """Pick the provider and model; returns False after emitting an error when the message can't run"""
+        # An existing conversation is continued only by a client holding its token
+        if not isinstance(self.conversation_id, str) or not CONVERSATION_ID_PATTERN.match(self.conversation_id):
+            self.emit({
+                'type': 'error',
+                'content': 'conversation_id must be 16 to 128 letters, digits, - or _'
+            })
+            return False
+        if (not self.owned and self.conversation_store.exists(self.conversation_id)
+                and not self.conversation_store.check_token(self.conversation_id, self.conversation_token)):
+            self.emit({
+                'type': 'error',
+                'content': 'Unknown conversation or wrong conversation_token'
+            })
+            return False
+        
+        try:
+            self.collection, self.filter = self.rag_service.scope(self.collection, self.filter)
+        except ValueError as e:
+            self.emit({
+                'type': 'error',
+                'content': str(e)
+            })
+            return False
+        
+        # 'auto' lets the router pick the provider and model from live latency statistics
+        if self.provider == 'auto' or self.model_id == 'auto':
+            if self.model_router is None:
+                self.emit({
+                    'type': 'error',
+                    'content': 'Automatic model selection is disabled'
+                })
+                return False
+            self.routing = self.model_router.route(self.content)
+            # Nothing eligible (no API keys, or every candidate over the cost ceiling): the OpenAI default
+            self.provider, self.model_id = self.routing['provider'] or 'openai', self.routing['model']
+        
+        try:
+            # Try to get the requested model
+            llm = self.llm_factory.get_llm(self.provider, model_id=self.model_id)
+            self.actual_provider = self.provider
+        except Exception as e:
+            if self.provider != 'openai':
+                # If not OpenAI and there was an error, fall back to OpenAI
+                logger.warning(f"Error using provider {self.provider}: {str(e)}. Falling back to OpenAI.")
+                llm = self.llm_factory.get_llm('openai')
+                self.actual_provider = 'openai'
+                
+                # Notify client about fallback
+                self.emit({
+                    'type': 'error',
+                    'content': f"API key missing or invalid for {self.provider}. Falling back to OpenAI."
+                })
+            else:
+                # If OpenAI failed, return error
+                raise
+        
+        # Patch the LLM callbacks to include our handler
+        if not hasattr(llm, 'callbacks') or llm.callbacks is None:
+            llm.callbacks = [self.callback_handler]
+        else:
+            llm.callbacks.append(self.callback_handler)
+        self.llm = llm
+        self.model_name = getattr(llm, 'model_name', None) or getattr(llm, 'model', None) or self.model_id
+        return True
+    
+    def run(self):
+        """Answer the message; meant for a background task"""
+        llm, mode, model_name = self.llm, self.mode, self.model_name
+        actual_provider, routing = self.actual_provider, self.routing
+        metrics, rate_limiter = self.metrics, self.rate_limiter
+        usage_collector, model_router = self.usage_collector, self.model_router
+        callback_handler = self.callback_handler
+        
+        # Use RAG if mode is 'rag', web search if 'web', both concurrently if 'hybrid', otherwise just the LLM
+        use_rag = mode in ('rag', 'hybrid')
+        use_web = mode in ('web', 'hybrid')
+        
+        try:
+            # Start a new stream for the assistant's response
+            self.emit({
+                'type': 'stream',
+                'content': ''  # Initial empty content
+            })
+            
+            # Retrieve up front so the prompt always has the same layout:
+            # system message, retrieved context, history, user turn
+            started = time.perf_counter()
+            context, context_stats = None, None
+            if mode != 'llm':
+                # Stripped like prefetched drafts, so both use the same cache entries
+                context, context_stats = self.rag_service.build_context(self.content.strip(), use_web, use_rag,
+                                                                        model_name, collection=self.collection,
+                                                                        filter=self.filter)
+            context_ms = (time.perf_counter() - started) * 1000
+            
+            messages, history_stats = self.conversation_store.build_messages(
+                self.conversation_id, self.content, model_name, system=self.system_message, context=context
+            )
+            
+            # Waits its turn when the provider is saturated; clients are served round-robin
+            estimated_tokens = history_stats['prompt_tokens'] + self.completion_estimate
+            queued = 0.0
+            if rate_limiter is not None:
+                queued = rate_limiter.acquire(self.client_id, actual_provider, estimated_tokens)
+            if self.cancelled.is_set():
+                raise ReplyCancelled()
+            
+            requested = time.perf_counter()
+            try:
+                response = invoke_messages(llm, messages)
+            except ReplyCancelled:
+                raise
+            except Exception as e:
+                failed_ms = (time.perf_counter() - requested) * 1000
+                if usage_collector is not None:
+                    usage_collector.record(actual_provider, model_name, mode, error=True, duration_ms=failed_ms)
+                if model_router is not None:
+                    model_router.observe(actual_provider, model_name, error=True)
+                    if routing is not None:
+                        model_router.outcome(routing, actual_provider, model_name, total_ms=failed_ms,
+                                             error=str(e))
+                # OpenAI's SDK raises its own RateLimitError; the wrappers raise ProviderRateLimitError
+                if is_rate_limit_error(e) and not isinstance(e, RateLimited):
+                    raise ProviderRateLimitError(actual_provider, retry_after_seconds(e)) from e
+                raise
+            duration_ms = (time.perf_counter() - requested) * 1000
+            result = response_text(response)
+            ttft_ms = None
+            if callback_handler.first_token_at is not None:
+                ttft_ms = (callback_handler.first_token_at - requested) * 1000
+                metrics.observe('llm_ttft_ms', ttft_ms)
+            if context_stats:
+                for source, search in context_stats['sources'].items():
+                    metrics.observe('search_ms', search['ms'], source=source, mode=mode)
+                    metrics.incr('searches', source=source, status=search['status'])
+            if context_stats and 'context_tokens' in context_stats:
+                metrics.observe('context_tokens', context_stats['context_tokens'])
+                metrics.incr('context_tokens_saved', context_stats['saved_tokens'])
+                
+            usage = usage_from_result(llm, response)
+            if usage_collector is not None:
+                # Counted locally when the provider reported no usage; adds the cost
+                usage = usage_collector.record(actual_provider, model_name, mode, usage,
+                                               prompt_tokens=history_stats['prompt_tokens'], completion=result,
+                                               ttft_ms=ttft_ms, duration_ms=duration_ms)
+            tokens_per_sec = None
+            if ttft_ms is not None and usage and usage['completion_tokens'] > 1 and duration_ms > ttft_ms:
+                tokens_per_sec = usage['completion_tokens'] * 1000 / (duration_ms - ttft_ms)
+            if model_router is not None:
+                # Every reply feeds the router's statistics, routed or not
+                model_router.observe(actual_provider, model_name, ttft_ms, tokens_per_sec)
+                if routing is not None:
+                    model_router.outcome(routing, actual_provider, model_name, ttft_ms=ttft_ms,
+                                         tokens_per_sec=tokens_per_sec, total_ms=duration_ms, usage=usage)
+            if rate_limiter is not None and usage:
+                rate_limiter.settle(self.client_id, actual_provider, estimated_tokens,
+                                    usage['prompt_tokens'] + usage['completion_tokens'])
+            metrics.incr('llm_requests', provider=actual_provider, model=model_name, mode=mode)
+            if usage:
+                for field in ('prompt_tokens', 'completion_tokens', 'cached_tokens'):
+                    metrics.incr(f'llm_{field}', usage.get(field, 0), provider=actual_provider, model=model_name)
+                
+            # The streamed reply is persisted once, at completion, not per token
+            self.conversation_store.append_exchange(self.conversation_id, self.content, result)
+                
+            # Signal completion
+            self.emit({
+                'type': 'done',
+                'content': ''
+            })
+                
+            # Send metadata about the response
+            self.emit({
+                'type': 'metadata',
+                'content': {
+                    'provider': actual_provider,
+                    'model': self.model_id,
+                    'mode': mode,
+                    'collection': self.collection,
+                    'persona': self.persona_id,
+                    'conversation_id': self.conversation_id,
+                    'conversation_token': self.conversation_store.token(self.conversation_id),
+                    'history': history_stats,
+                    'context': context_stats,
+                    'prefetch': self.prefetch,
+                    'routing': routing,
+                    'timings': {
+                        'context_ms': round(context_ms, 1),
+                        'queued_ms': round(queued * 1000, 1),
+                        'ttft_ms': round(ttft_ms, 1) if ttft_ms is not None else None,
+                        'total_ms': round(duration_ms, 1)
+                    },
+                    'usage': usage,
+                    'timestamp': str(datetime.datetime.now())
+                }
+            })
+            
+        except ReplyCancelled:
+            logger.info(f"Reply cancelled by the client: {self.conversation_id}")
+            metrics.incr('replies_cancelled', provider=actual_provider, mode=mode)
+        except RateLimited as e:
+            logger.warning(f"Rate limited: {str(e)}")
+            if isinstance(e, ProviderRateLimitError) and rate_limiter is not None:
+                rate_limiter.backoff(e.provider, e.retry_after)
+            emit_backpressure(None, e, self.emit)
+        except Exception as e:
+            error_msg = str(e)
+            logger.error(f"Error in chain: {error_msg}")
+            self.emit({
+                'type': 'error',
+                'content': f"Error processing your query: {error_msg}"
+            })
 
 @chat_bp.route('/health', methods=['GET'])
 def health_check():
@@ -44,9 +357,327 @@ def health_check():
 
 @chat_bp.route('/models', methods=['GET'])
 def get_models():
-    """Return available models for all providers"""
-    llm_factory = current_app.config['llm_factory']
-    return jsonify(llm_factory.get_available_models())
+    """Return the chat models of every configured provider; repeat requests are answered 304 by ETag"""
+    model_registry = current_app.config.get('model_registry')
+    if model_registry is None:
+        return jsonify(current_app.config['llm_factory'].get_available_models())
+    body, etag = model_registry.catalog()
+    if request.if_none_match.contains(etag):
+        response = Response(status=304)
+    else:
+        response = Response(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.public = True
+    response.cache_control.max_age = current_app.config['MODEL_CATALOG_MAX_AGE']
+    return response
+
+@chat_bp.route('/collections', methods=['GET'])
+def list_collections():
+    """List the document collections a message can search, with their size and whether this process has them open"""
+    return jsonify({'collections': current_app.config['rag_service'].collections.describe()})
+
+@chat_bp.route('/admin/profile', methods=['GET', 'POST'])
+def profile():
+    """Sample all threads and greenlets for N seconds and return collapsed stacks"""
+    profiler_service = current_app.config.get('profiler_service')
+    if profiler_service is None:
+        return jsonify({'error': 'Profiling is disabled'}), 404
+    
+    if not profiler_service.check_token(request.headers.get('X-Admin-Token')):
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    try:
+        seconds = profiler_service.clamp_seconds(request.args.get('seconds', 10))
+        profiler = profiler_service.start_profile(request.args.get('hz'))
+    except ValueError:
+        return jsonify({'error': 'seconds and hz must be numbers'}), 400
+    
+    # Cooperative sleep so the request doesn't block other greenlets while sampling
+    try:
+        socketio.sleep(seconds)
+    finally:
+        profiler.stop()
+    
+    logger.info(f"Profile captured: {profiler.samples} samples over {seconds}s")
+    return Response(
+        profiler.collapsed(),
+        mimetype='text/plain',
+        headers={'Content-Disposition': 'attachment; filename=profile.folded'}
+    )
+
+@chat_bp.route('/metrics', methods=['GET'])
+def get_metrics():
+    """Return in-process counters and summaries"""
+    return jsonify(current_app.config['metrics'].snapshot())
+
+@chat_bp.route('/usage', methods=['GET'])
+def get_usage():
+    """Tokens, cost and speed per provider, model and mode, with the model to prefer for each mode.
+
+    Needs X-Admin-Token = PROFILER_ADMIN_TOKEN: the report shows spend and which providers are in use.
+    """
+    usage_collector = current_app.config.get('usage_collector')
+    if usage_collector is None:
+        return jsonify({'error': 'Usage tracking is disabled'}), 404
+    expected = current_app.config.get('PROFILER_ADMIN_TOKEN')
+    if not expected or not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), expected):
+        return jsonify({'error': 'Forbidden'}), 403
+    try:
+        return jsonify(usage_collector.summary(hours=float(request.args.get('hours', 24))))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+def _is_conversation_admin():
+    """Listing every conversation, or reading one without its token, needs X-Admin-Token = CONVERSATION_ADMIN_TOKEN"""
+    expected = current_app.config.get('CONVERSATION_ADMIN_TOKEN')
+    return bool(expected) and hmac.compare_digest(request.headers.get('X-Admin-Token', ''), expected)
+
+@chat_bp.route('/conversations', methods=['GET'])
+def list_conversations():
+    """Page through stored conversations, most recently updated first"""
+    conversation_db = current_app.config.get('conversation_db')
+    if conversation_db is None:
+        return jsonify({'error': 'Conversation persistence is disabled'}), 404
+    if not _is_conversation_admin():
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    try:
+        limit = min(int(request.args.get('limit', 20)), 100)
+        before = request.args.get('before')
+        before = float(before) if before is not None else None
+    except ValueError:
+        return jsonify({'error': 'limit and before must be numbers'}), 400
+    
+    return jsonify(conversation_db.list_conversations(limit=limit, before=before))
+
+@chat_bp.route('/conversations/<conversation_id>/messages', methods=['GET'])
+def get_conversation_messages(conversation_id):
+    """Page through a conversation's messages, newest first; needs the conversation's X-Conversation-Token"""
+    conversation_db = current_app.config.get('conversation_db')
+    if conversation_db is None:
+        return jsonify({'error': 'Conversation persistence is disabled'}), 404
+    conversation_store = current_app.config['conversation_store']
+    if not (conversation_store.check_token(conversation_id, request.headers.get('X-Conversation-Token'))
+            or _is_conversation_admin()):
+        return jsonify({'error': 'Forbidden'}), 403
+    
+    try:
+        limit = min(int(request.args.get('limit', 50)), 500)
+        before = request.args.get('before')
+        before = int(before) if before is not None else None
+    except ValueError:
+        return jsonify({'error': 'limit and before must be integers'}), 400
+    
+    return jsonify(conversation_db.get_messages(conversation_id, limit=limit, before=before))
+
+def _document_service():
+    """Return the document service or an error response when uploads are disabled"""
+    document_service = current_app.config.get('document_service')
+    if document_service is None:
+        return None, (jsonify({'error': 'Document uploads are disabled'}), 404)
+    return document_service, None
+
+def _check_document_token():
+    """Uploads and deletions need X-Admin-Token when DOCUMENT_ADMIN_TOKEN is set"""
+    expected = current_app.config.get('DOCUMENT_ADMIN_TOKEN')
+    if expected and not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), expected):
+        return jsonify({'error': 'Forbidden'}), 403
+    return None
+
+@chat_bp.route('/documents', methods=['GET'])
+def list_documents():
+    """List uploaded documents with their indexing status"""
+    document_service, error = _document_service()
+    if error:
+        return error
+    return jsonify({'documents': document_service.list(), 'index': document_service.stats()})
+
+@chat_bp.route('/documents', methods=['POST'])
+def upload_documents():
+    """Save uploaded files and queue them for indexing; progress arrives as document_progress events"""
+    document_service, error = _document_service()
+    if error:
+        return error
+    forbidden = _check_document_token()
+    if forbidden:
+        return forbidden
+    
+    files = request.files.getlist('file')
+    if not files:
+        return jsonify({'error': 'Upload one or more files in the "file" field'}), 400
+    
+    try:
+        # Reject the whole request before queueing anything
+        for f in files:
+            document_service.validate_filename(f.filename)
+        records = [document_service.upload(f.filename, f.stream) for f in files]
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    return jsonify({'documents': records}), 202
+
+@chat_bp.route('/documents/<document_id>', methods=['GET'])
+def get_document(document_id):
+    """Return one uploaded document's status"""
+    document_service, error = _document_service()
+    if error:
+        return error
+    record = document_service.get(document_id)
+    if record is None:
+        return jsonify({'error': 'Document not found'}), 404
+    return jsonify(record)
+
+@chat_bp.route('/documents/<document_id>', methods=['DELETE'])
+def delete_document(document_id):
+    """Remove a document and its chunks from the knowledge base"""
+    document_service, error = _document_service()
+    if error:
+        return error
+    forbidden = _check_document_token()
+    if forbidden:
+        return forbidden
+    record = document_service.delete(document_id)
+    if record is None:
+        return jsonify({'error': 'Document not found'}), 404
+    return jsonify(record), 202
+
+def _batch_jobs():
+    """Return the batch jobs service or an error response when batch jobs are disabled"""
+    batch_jobs = current_app.config.get('batch_jobs')
+    if batch_jobs is None:
+        return None, (jsonify({'error': 'Batch jobs are disabled'}), 404)
+    forbidden = _check_batch_token()
+    if forbidden:
+        return None, forbidden
+    return batch_jobs, None
+
+def _check_batch_token():
+    """Batch jobs need X-Admin-Token when BATCH_ADMIN_TOKEN is set"""
+    expected = current_app.config.get('BATCH_ADMIN_TOKEN')
+    if expected and not hmac.compare_digest(request.headers.get('X-Admin-Token', ''), expected):
+        return jsonify({'error': 'Forbidden'}), 403
+    return None
+
+@chat_bp.route('/batch', methods=['POST'])
+def submit_batch():
+    """Queue a JSONL file of queries (the "file" field, or the request body); mode, provider, model and
+    collection query parameters set the defaults for lines without them"""
+    batch_jobs, error = _batch_jobs()
+    if error:
+        return error
+    upload = request.files.get('file') if request.mimetype == 'multipart/form-data' else None
+    lines = upload.stream if upload is not None else request.get_data().splitlines()
+    defaults = {field: request.args[field] for field in ('mode', 'provider', 'model', 'collection')
+                if request.args.get(field)}
+    try:
+        queries = read_queries(lines, defaults)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if not queries:
+        return jsonify({'error': 'No queries'}), 400
+    return jsonify(batch_jobs.submit(queries)), 202
+
+@chat_bp.route('/batch/<job_id>', methods=['GET'])
+def get_batch(job_id):
+    """A batch job's status; finished jobs include throughput and latency percentiles"""
+    batch_jobs, error = _batch_jobs()
+    if error:
+        return error
+    record = batch_jobs.get(job_id)
+    if record is None:
+        return jsonify({'error': 'Batch job not found'}), 404
+    return jsonify(record)
+
+@chat_bp.route('/batch/<job_id>/results', methods=['GET'])
+def get_batch_results(job_id):
+    """The results written so far, one JSON line per query"""
+    batch_jobs, error = _batch_jobs()
+    if error:
+        return error
+    path = batch_jobs.results_path(job_id)
+    if path is None:
+        return jsonify({'error': 'No results for this batch job'}), 404
+    return send_file(os.path.abspath(path), mimetype='application/x-ndjson')
+
+@chat_bp.route('/batch/<job_id>/resume', methods=['POST'])
+def resume_batch(job_id):
+    """Run a stopped job again for the queries it has no answer for"""
+    batch_jobs, error = _batch_jobs()
+    if error:
+        return error
+    try:
+        record = batch_jobs.resume(job_id)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 409
+    if record is None:
+        return jsonify({'error': 'Batch job not found'}), 404
+    return jsonify(record), 202
+
+@chat_bp.route('/stream', methods=['POST'])
+def stream_message():
+    """Answer one message statelessly, streaming its reply as Server-Sent Events; closing the connection cancels it"""
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict) or not data.get('content'):
+        return jsonify({'error': 'Content is required'}), 400
+    
+    # No connection to keep history for: without a conversation ID the message stands alone
+    conversation_id = data.get('conversation_id') or str(uuid.uuid4())
+    client_id = request.remote_addr or 'unknown'
+    config = current_app.config
+    rate_limiter = config.get('rate_limiter')
+    if rate_limiter is not None:
+        try:
+            rate_limiter.admit(client_id)
+        except RateLimited as e:
+            response = jsonify({'error': 'Too many requests', 'backpressure': e.as_message()})
+            response.headers['Retry-After'] = str(max(1, round(e.retry_after or 1)))
+            return response, 429
+    
+    # The event loop's own queue: a threading one would block the hub while waiting, so the reply never ran
+    events = socketio.server.eio.create_queue()
+    queue_empty = socketio.server.eio.get_queue_empty_exception()
+    reply = Reply(config, data, conversation_id, client_id, events.put)
+    try:
+        if not reply.prepare():
+            return jsonify({'error': events.get_nowait()['content']}), 400
+    except Exception as e:
+        logger.error(f"Unhandled error in stream: {str(e)}")
+        return jsonify({'error': f"Server error: {str(e)}"}), 500
+    
+    def run_chain():
+        try:
+            reply.run()
+        finally:
+            events.put(None)
+    
+    socketio.start_background_task(run_chain)
+    keepalive = config['SSE_KEEPALIVE_SECONDS']
+    metrics = config['metrics']
+    
+    def generate():
+        finished = False
+        try:
+            conversation = {'conversation_id': conversation_id,
+                            'conversation_token': reply.conversation_store.token(conversation_id)}
+            yield f"event: conversation\ndata: {json.dumps(conversation)}\n\n"
+            while True:
+                try:
+                    payload = events.get(timeout=keepalive)
+                except queue_empty:
+                    # Also how a closed connection is noticed while the reply is still being prepared
+                    yield ": keepalive\n\n"
+                    continue
+                if payload is None:
+                    finished = True
+                    return
+                yield f"event: {payload['type']}\ndata: {json.dumps(payload, default=str)}\n\n"
+        finally:
+            if not finished:
+                # The client went away: stop generating at the next token
+                reply.cancelled.set()
+                metrics.incr('sse_disconnects')
+    
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
 
 @socketio.on('connect')
 def handle_connect():
@@ -60,6 +691,38 @@ def handle_connect():
 def handle_disconnect():
     """Handle client disconnection"""
     logger.info("Client disconnected")
+    prefetcher = current_app.config.get('prefetcher')
+    if prefetcher is not None:
+        prefetcher.forget(request.sid)
+
+@socketio.on('resume')
+def handle_resume(data):
+    """Replay a reply's messages after the client's last offset to this connection, then continue it live"""
+    if not isinstance(data, dict) or not data.get('stream_id'):
+        return
+    stream_buffers = current_app.config.get('stream_buffers')
+    try:
+        offset = int(data.get('offset', -1))
+    except (TypeError, ValueError):
+        offset = -1
+    if stream_buffers is None:
+        result = {'stream_id': data['stream_id'], 'status': 'unknown', 'replayed': 0}
+    else:
+        wire = negotiate(data.get('wire'), current_app.config['wire_formats']) if data.get('wire') else None
+        result = stream_buffers.resume(data['stream_id'], request.sid, offset, wire)
+    socketio.emit('message', {
+        'type': 'resume',
+        'content': result
+    }, room=request.sid)
+
+@socketio.on('typing')
+def handle_typing(data):
+    """Handle a draft of the next message; with prefetching enabled its searches start early"""
+    prefetcher = current_app.config.get('prefetcher')
+    if prefetcher is None or not isinstance(data, dict):
+        return
+    prefetcher.typing(request.sid, data.get('content') or '', data.get('mode', 'llm'), data.get('collection'),
+                      data.get('filter'))
 
 @socketio.on('message')
 def handle_message(data):
@@ -67,12 +730,12 @@ def handle_message(data):
     socket_id = request.sid
     logger.info(f"Received message: {data}")
     
-    # Extract data from the message
-    message_type = data.get('type', 'message')
     content = data.get('content')
-    provider = data.get('provider', 'openai')
-    model_id = data.get('model')
     mode = data.get('mode', 'llm')
+    # Without an explicit conversation ID, history is kept per connection
+    conversation_id = data.get('conversation_id') or socket_id
+    # Streamed tokens as JSON message events, or compact binary 'chunk' frames when asked for and allowed
+    wire = negotiate(data.get('wire'), current_app.config['wire_formats'])
     
     if not content:
         socketio.emit('message', {
@@ -81,100 +744,56 @@ def handle_message(data):
         }, room=socket_id)
         return
     
+    stream_buffers = current_app.config.get('stream_buffers')
+    stream_id = None
     try:
-        # Get services
-        llm_factory = current_app.config['llm_factory']
-        rag_service = current_app.config['rag_service']
-        
-        # Configure LLM with custom callback handler
-        callback_handler = StreamingCallbackHandler(socket_id)
-        
-        try:
-            # Try to get the requested model
-            llm = llm_factory.get_llm(provider, model_id=model_id)
-            actual_provider = provider
-        except Exception as e:
-            if provider != 'openai':
-                # If not OpenAI and there was an error, fall back to OpenAI
-                logger.warning(f"Error using provider {provider}: {str(e)}. Falling back to OpenAI.")
-                llm = llm_factory.get_llm('openai')
-                actual_provider = 'openai'
-                
-                # Notify client about fallback
-                socketio.emit('message', {
-                    'type': 'error',
-                    'content': f"API key missing or invalid for {provider}. Falling back to OpenAI."
-                }, room=socket_id)
-            else:
-                # If OpenAI failed, return error
-                raise
+        prefetcher = current_app.config.get('prefetcher')
+        prefetch = prefetcher.claim(socket_id, content, mode, data.get('collection'),
+                                    data.get('filter')) if prefetcher is not None else None
         
-        # Patch the LLM callbacks to include our handler
-        if not hasattr(llm, 'callbacks') or llm.callbacks is None:
-            llm.callbacks = [callback_handler]
-        else:
-            llm.callbacks.append(callback_handler)
+        # Refuse over-eager clients before any retrieval work is done
+        rate_limiter = current_app.config.get('rate_limiter')
+        client_id = client_key(socket_id)
+        if rate_limiter is not None:
+            try:
+                rate_limiter.admit(client_id)
+            except RateLimited as e:
+                emit_backpressure(socket_id, e)
+                return
         
-        # Use RAG if mode is 'rag', otherwise just use LLM
-        use_rag = mode == 'rag'
-        use_web = mode == 'web'
+        # Everything below is numbered and buffered, so a client that reconnects mid-reply can resume it
+        stream_id, emit = reply_emitter(socket_id, wire)
         
-        # Create chain and run query
-        if mode == 'llm':
-            chain = llm
-        else:
-            chain = rag_service.get_rag_chain(llm, use_web, use_rag)
+        reply = Reply(current_app.config, data, conversation_id, client_id, emit, prefetch,
+                      owned=conversation_id == socket_id)
+        if not reply.prepare():
+            if stream_id is not None:
+                stream_buffers.finish(stream_id)
+            return
         
         # Run in a background thread to not block the main thread
         def run_chain():
             try:
-                # Start a new stream for the assistant's response
-                socketio.emit('message', {
-                    'type': 'stream',
-                    'content': ''  # Initial empty content
-                }, room=socket_id)
-                
-                if mode == 'llm':
-                    result = llm.invoke(content)
-                else:
-                    result = chain.run(content)
-                
-                # Signal completion
-                socketio.emit('message', {
-                    'type': 'done',
-                    'content': ''
-                }, room=socket_id)
-                
-                # Send metadata about the response
-                socketio.emit('message', {
-                    'type': 'metadata',
-                    'content': {
-                        'provider': actual_provider,
-                        'model': model_id,
-                        'mode': mode,
-                        'timestamp': str(datetime.datetime.now())
-                    }
-                }, room=socket_id)
-                
-            except Exception as e:
-                error_msg = str(e)
-                logger.error(f"Error in chain: {error_msg}")
-                socketio.emit('message', {
-                    'type': 'error',
-                    'content': f"Error processing your query: {error_msg}"
-                }, room=socket_id)
+                reply.run()
+            finally:
+                if stream_id is not None:
+                    stream_buffers.finish(stream_id)
         
         socketio.start_background_task(run_chain)
         
         # Send acknowledgment
         socketio.emit('ack', {
             'status': 'processing',
-            'message_id': str(uuid.uuid4())
+            'message_id': str(uuid.uuid4()),
+            'stream_id': stream_id,
+            'wire': wire
         }, room=socket_id)
         
     except Exception as e:
         error_msg = str(e)
         logger.error(f"Unhandled error in message: {error_msg}")
+        if stream_id is not None:
+            stream_buffers.finish(stream_id)
         socketio.emit('message', {
             'type': 'error',
             'content': f"Server error: {error_msg}"
@@ -202,6 +821,18 @@ def handle_chat_query(data):
         llm_factory = current_app.config['llm_factory']
         rag_service = current_app.config['rag_service']
         
+        rate_limiter = current_app.config.get('rate_limiter')
+        if rate_limiter is not None:
+            try:
+                rate_limiter.admit(client_key(socket_id))
+            except RateLimited as e:
+                socketio.emit('chat_response', {
+                    'error': f"Too many requests, retry after {e.retry_after:.0f}s",
+                    'backpressure': e.as_message(),
+                    'status': 'error'
+                }, room=socket_id)
+                return
+        
         # Configure LLM with custom callback handler
         callback_handler = SocketIOCallbackHandler(socket_id)
         
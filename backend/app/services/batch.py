@@ -0,0 +1,421 @@
+import os
+import json
+import time
+import uuid
+import threading
+import concurrent.futures
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, List, Optional
+import logging
+
+from .metadata_filter import normalize_filter
+from .llm_service import invoke_messages, response_text, usage_from_result
+from .personas import get_system_message
+from .rate_limit import ProviderRateLimitError, RateLimited, is_rate_limit_error, retry_after_seconds
+
+logger = logging.getLogger(__name__)
+
+MODES = ('llm', 'rag', 'web', 'hybrid')
+# Latency percentiles in job reports
+REPORT_PERCENTILES = (50, 90, 99)
+# Seconds between progress callbacks while a job runs
+PROGRESS_INTERVAL = 1.0
+
+
+def parse_concurrency(spec: str) -> Dict[str, int]:
+    """Parse 'openai=8,groq=2' into {provider: concurrent requests}"""
+    limits = {}
+    for item in (spec or '').split(','):
+        if not item.strip():
+            continue
+        name, _, value = item.partition('=')
+        limits[name.strip()] = max(1, int(value))
+    return limits
+
+
+def normalize_query(content: str) -> str:
+    return ' '.join(content.split())
+
+
+def read_queries(lines: Iterable[str], defaults: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+    """Parse JSONL queries; raises ValueError naming the first bad line.
+
+    Each line is {"query": ...} (or "content") with optional "id", "mode",
+    "provider", "model", "persona", "collection" and "filter" (a metadata
+    filter for document search); missing fields come from defaults and a
+    missing ID is the line number.
+    """
+    defaults = dict({'mode': 'rag', 'provider': 'openai', 'model': None, 'persona': 'default', 'collection': None,
+                     'filter': None}, **(defaults or {}))
+    queries, seen = [], set()
+    for number, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if not line.strip():
+            continue
+        try:
+            item = json.loads(line)
+        except ValueError as e:
+            raise ValueError(f"Line {number} is not valid JSON: {str(e)}")
+        if not isinstance(item, dict):
+            raise ValueError(f"Line {number} is not a JSON object")
+        content = item.get('query') or item.get('content')
+        if not isinstance(content, str) or not content.strip():
+            raise ValueError(f"Line {number} has no query")
+        query_id = str(item.get('id', number))
+        if query_id in seen:
+            raise ValueError(f"Line {number} repeats ID {query_id}")
+        seen.add(query_id)
+        query = {field: item.get(field) or default for field, default in defaults.items()}
+        if query['mode'] not in MODES:
+            raise ValueError(f"Line {number} has unknown mode {query['mode']}")
+        try:
+            # Kept as given, so the query still round-trips through JSON
+            normalize_filter(query['filter'])
+        except ValueError as e:
+            raise ValueError(f"Line {number} has an invalid filter: {str(e)}")
+        query.update(id=query_id, query=content)
+        queries.append(query)
+    return queries
+
+
+def completed_ids(path: str) -> set:
+    """IDs answered without error in an output file; a line cut short by an interrupted run is ignored"""
+    done = set()
+    try:
+        with open(path) as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                if not record.get('error'):
+                    done.add(record['id'])
+    except FileNotFoundError:
+        pass
+    return done
+
+
+def summarize_latency(values: List[float]) -> Dict[str, float]:
+    if not values:
+        return {}
+    ordered = sorted(values)
+    summary = {'mean': round(sum(ordered) / len(ordered), 1), 'max': round(ordered[-1], 1)}
+    for point in REPORT_PERCENTILES:
+        index = min(len(ordered) - 1, max(0, int(round(point / 100.0 * len(ordered))) - 1))
+        summary[f'p{point}'] = round(ordered[index], 1)
+    return summary
+
+
+class BatchRunner:
+    """Answers a list of queries offline, appending one JSON line per query to an output file.
+
+    Queries that normalize to the same text (with the same mode, provider,
+    model, persona, collection and filter) are answered once. Document
+    retrieval is one embedding call and one vectorised index search per
+    collection and filter in the batch; the LLM
+    calls then run with at most concurrency[provider] (default_concurrency
+    for unlisted providers) in flight per provider, retrying provider 429s
+    up to max_retries times. Queries already answered in the output file are
+    skipped, so an interrupted job resumes where it stopped.
+    """
+
+    def __init__(self, rag_service, llm_factory, conversation_store, concurrency: Optional[Dict[str, int]] = None,
+                 default_concurrency: int = 4, max_retries: int = 2, rate_limiter=None, usage_collector=None,
+                 metrics=None, offload: Optional[Callable] = None):
+        self.rag_service = rag_service
+        self.llm_factory = llm_factory
+        self.conversation_store = conversation_store
+        self.concurrency = concurrency or {}
+        self.default_concurrency = default_concurrency
+        self.max_retries = max_retries
+        self.rate_limiter = rate_limiter
+        self.usage_collector = usage_collector
+        self.metrics = metrics
+        # Runs the batch embedding and search off the event loop when given
+        self.offload = offload or (lambda fn, *args: fn(*args))
+
+    def _group(self, queries: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        units = OrderedDict()
+        for query in queries:
+            text = normalize_query(query['query'])
+            scope = (query.get('collection'), normalize_filter(query.get('filter')))
+            key = (text, query['mode'], query['provider'], query['model'], query['persona']) + scope
+            unit = units.get(key)
+            if unit is None:
+                unit = units[key] = dict(query, text=text, ids=[], collection=scope[0], filter=scope[1])
+            unit['ids'].append(query['id'])
+        return list(units.values())
+
+    def _retrieve(self, units: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Search documents for every unit that needs them, one batch per collection and filter; returns timing stats"""
+        scopes = OrderedDict()
+        for unit in units:
+            if unit['mode'] in ('rag', 'hybrid') and not unit.get('scope_error'):
+                scopes.setdefault((unit['collection'], unit['filter']), OrderedDict())[unit['text']] = None
+        if not scopes:
+            return {'queries': 0, 'ms': 0.0}
+        started = time.perf_counter()
+        passages = {}
+        for (collection, filter), texts in scopes.items():
+            texts = list(texts)
+            try:
+                found = self.offload(self.rag_service.document_passages_batch, texts, None, collection, filter)
+            except Exception as e:
+                # Each query then searches on its own while it is answered
+                logger.error(f"Batch document search failed, searching per query: {str(e)}")
+                continue
+            passages.update(((collection, filter, text), result) for text, result in zip(texts, found))
+        for unit in units:
+            unit['documents'] = passages.get((unit['collection'], unit['filter'], unit['text']))
+        return {'queries': sum(len(texts) for texts in scopes.values()),
+                'ms': round((time.perf_counter() - started) * 1000, 1)}
+
+    def _invoke(self, llm, provider: str, messages: List[Dict[str, str]]):
+        for attempt in range(self.max_retries + 1):
+            try:
+                return invoke_messages(llm, messages)
+            except Exception as e:
+                if isinstance(e, ProviderRateLimitError):
+                    error = e
+                elif is_rate_limit_error(e) and not isinstance(e, RateLimited):
+                    error = ProviderRateLimitError(provider, retry_after_seconds(e))
+                else:
+                    raise
+                if self.rate_limiter is not None:
+                    # Interactive requests to the provider wait out the 429 as well
+                    self.rate_limiter.backoff(provider, error.retry_after)
+                if attempt == self.max_retries:
+                    if error is e:
+                        raise
+                    raise error from e
+                delay = error.retry_after or 2.0 ** attempt
+                logger.warning(f"Batch request rate limited by {provider}; retrying in {delay:.1f}s")
+                time.sleep(delay)
+
+    def _answer(self, unit: Dict[str, Any], llm, model_name: str, conversation_id: str) -> Dict[str, Any]:
+        started = time.perf_counter()
+        mode, provider = unit['mode'], unit['provider']
+        result = {'answer': None, 'error': None, 'sources': None, 'usage': None}
+        try:
+            context, context_stats = None, None
+            if mode != 'llm':
+                context, context_stats = self.rag_service.build_context(
+                    unit['text'], mode in ('web', 'hybrid'), mode in ('rag', 'hybrid'), model_name,
+                    documents=unit.get('documents'), collection=unit['collection'], filter=unit['filter'])
+                result['sources'] = context_stats['sources']
+            messages, history_stats = self.conversation_store.build_messages(
+                conversation_id, unit['text'], model_name, system=get_system_message(unit['persona']),
+                context=context
+            )
+            requested = time.perf_counter()
+            try:
+                response = self._invoke(llm, provider, messages)
+            except Exception:
+                if self.usage_collector is not None:
+                    self.usage_collector.record(provider, model_name, mode, error=True,
+                                                duration_ms=(time.perf_counter() - requested) * 1000)
+                raise
+            result['answer'] = response_text(response)
+            usage = usage_from_result(llm, response)
+            if self.usage_collector is not None:
+                usage = self.usage_collector.record(provider, model_name, mode, usage,
+                                                    prompt_tokens=history_stats['prompt_tokens'],
+                                                    completion=result['answer'],
+                                                    duration_ms=(time.perf_counter() - requested) * 1000)
+            result['usage'] = usage
+        except Exception as e:
+            logger.error(f"Batch query {unit['ids'][0]} failed: {str(e)}")
+            result['error'] = str(e)
+        result['latency_ms'] = round((time.perf_counter() - started) * 1000, 1)
+        if self.metrics:
+            self.metrics.incr('batch_queries', provider=provider, status='error' if result['error'] else 'ok')
+            self.metrics.observe('batch_latency_ms', result['latency_ms'])
+        return result
+
+    def _llms(self, units: List[Dict[str, Any]]) -> Dict[Any, Any]:
+        """One LLM per (provider, model), or the error creating it; needs an app context"""
+        llms = {}
+        for unit in units:
+            key = (unit['provider'], unit['model'])
+            if key in llms:
+                continue
+            try:
+                llm = self.llm_factory.get_llm(unit['provider'], model_id=unit['model'], streaming=False)
+                llms[key] = (llm, getattr(llm, 'model_name', None) or getattr(llm, 'model', None) or unit['model'])
+            except Exception as e:
+                llms[key] = e
+        return llms
+
+    def run(self, queries: List[Dict[str, Any]], output_path: str, job_id: Optional[str] = None,
+            progress: Optional[Callable[[Dict[str, Any]], None]] = None) -> Dict[str, Any]:
+        """Answer the queries not yet in output_path; returns the job report"""
+        job_id = job_id or uuid.uuid4().hex
+        started = time.perf_counter()
+        done = completed_ids(output_path)
+        pending = [query for query in queries if query['id'] not in done]
+        units = self._group(pending)
+        for unit in units:
+            try:
+                unit['collection'], unit['filter'] = self.rag_service.scope(unit['collection'], unit['filter'])
+            except ValueError as e:
+                unit['scope_error'] = str(e)
+        report = {
+            'job_id': job_id, 'queries': len(queries), 'resumed': len(queries) - len(pending),
+            'unique': len(units), 'completed': 0, 'failed': 0,
+        }
+        report['retrieval'] = self._retrieve(units)
+        llms = self._llms(units)
+
+        lock = threading.Lock()
+        latencies = []
+        last_progress = [time.monotonic()]
+        conversation_id = f"batch-{job_id}"  # Never appended to: every query is answered without history
+        os.makedirs(os.path.dirname(os.path.abspath(output_path)), exist_ok=True)
+        with open(output_path, 'a+') as output:
+            # A line cut short by an interrupted run must not swallow the next record
+            if output.tell() > 0:
+                output.seek(output.tell() - 1)
+                if output.read(1) != '\n':
+                    output.write('\n')
+
+            def answer(unit):
+                llm = llms[(unit['provider'], unit['model'])]
+                if isinstance(llm, Exception) or unit.get('scope_error'):
+                    result = {'answer': None, 'error': unit.get('scope_error') or str(llm), 'sources': None,
+                              'usage': None, 'latency_ms': 0.0}
+                else:
+                    result = self._answer(unit, llm[0], llm[1], conversation_id)
+                with lock:
+                    for position, query_id in enumerate(unit['ids']):
+                        output.write(json.dumps({
+                            'id': query_id, 'query': unit['query'], 'mode': unit['mode'],
+                            'provider': unit['provider'], 'model': unit['model'], 'collection': unit['collection'],
+                            'duplicate_of': unit['ids'][0] if position else None, **result
+                        }, default=str) + '\n')
+                    output.flush()
+                    report['failed' if result['error'] else 'completed'] += len(unit['ids'])
+                    latencies.append(result['latency_ms'])
+                    if progress is not None and time.monotonic() - last_progress[0] >= PROGRESS_INTERVAL:
+                        last_progress[0] = time.monotonic()
+                        progress(dict(report))
+
+            # One pool per provider bounds its requests in flight
+            executors = {}
+            futures = []
+            for unit in units:
+                provider = unit['provider']
+                if provider not in executors:
+                    executors[provider] = concurrent.futures.ThreadPoolExecutor(
+                        max_workers=self.concurrency.get(provider, self.default_concurrency),
+                        thread_name_prefix=f"batch-{provider}")
+                futures.append(executors[provider].submit(answer, unit))
+            try:
+                for future in futures:
+                    future.result()
+            finally:
+                for executor in executors.values():
+                    executor.shutdown(wait=True)
+
+        seconds = time.perf_counter() - started
+        report.update({
+            'seconds': round(seconds, 2),
+            'queries_per_sec': round((report['completed'] + report['failed']) / seconds, 2) if seconds else None,
+            'latency_ms': summarize_latency(latencies),
+        })
+        logger.info(f"Batch job {job_id}: {report['completed']} answered, {report['failed']} failed, "
+                    f"{report['resumed']} already done, {len(units)} unique in {seconds:.1f}s")
+        return report
+
+
+class BatchJobs:
+    """Batch jobs submitted over HTTP, kept under path as <id>.queries.jsonl, <id>.jsonl (results)
+    and <id>.json (status and report), so any worker can report on a job and a job can be resumed.
+
+    Jobs run one at a time per process (holding lock) in tasks started with
+    start_task, inside app_context(). Under eventlet, pass a green lock and
+    tpool.execute as offload: the runner's pools, waits and retry sleeps
+    then happen in an OS thread instead of blocking every other request.
+    """
+
+    def __init__(self, runner: BatchRunner, path: str, start_task: Callable, app_context: Callable,
+                 offload: Optional[Callable] = None, lock=None):
+        self.runner = runner
+        self.path = path
+        self.start_task = start_task
+        self.app_context = app_context
+        self.offload = offload or (lambda fn, *args: fn(*args))
+        self._running = lock or threading.Lock()
+        self._active = set()
+        os.makedirs(path, exist_ok=True)
+
+    def _file(self, job_id: str, suffix: str) -> str:
+        return os.path.join(self.path, f"{job_id}{suffix}")
+
+    def _write_status(self, record: Dict[str, Any]):
+        record['updated_at'] = time.time()
+        path = self._file(record['job_id'], '.json')
+        with open(path + '.tmp', 'w') as f:
+            json.dump(record, f)
+        os.replace(path + '.tmp', path)
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        if not job_id.isalnum():
+            return None
+        try:
+            with open(self._file(job_id, '.json')) as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def results_path(self, job_id: str) -> Optional[str]:
+        path = self._file(job_id, '.jsonl')
+        return path if job_id.isalnum() and os.path.exists(path) else None
+
+    def submit(self, queries: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """Store the queries and queue a new job"""
+        job_id = uuid.uuid4().hex
+        with open(self._file(job_id, '.queries.jsonl'), 'w') as f:
+            for query in queries:
+                f.write(json.dumps(query) + '\n')
+        return self._start(job_id, len(queries))
+
+    def resume(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """Queue a stopped job again to answer its remaining queries; raises ValueError if it is running here"""
+        record = self.get(job_id)
+        if record is None:
+            return None
+        if job_id in self._active:
+            raise ValueError(f"Batch job {job_id} is already {record['status']}")
+        return self._start(job_id, record['queries'])
+
+    def _start(self, job_id: str, count: int) -> Dict[str, Any]:
+        record = {'job_id': job_id, 'status': 'queued', 'queries': count, 'created_at': time.time()}
+        self._write_status(record)
+        self._active.add(job_id)
+        self.start_task(self._run, job_id)
+        return record
+
+    def _run(self, job_id: str):
+        with self._running:
+            record = self.get(job_id)
+            record.update(status='running', started_at=time.time())
+            self._write_status(record)
+            try:
+                report = self.offload(self._run_job, job_id, record)
+                record.update(report, status='done')
+            except Exception as e:
+                logger.error(f"Batch job {job_id} failed: {str(e)}")
+                record.update(status='failed', error=str(e))
+            finally:
+                self._active.discard(job_id)
+                record['finished_at'] = time.time()
+                self._write_status(record)
+
+    def _run_job(self, job_id: str, record: Dict[str, Any]) -> Dict[str, Any]:
+        with open(self._file(job_id, '.queries.jsonl')) as f:
+            queries = [json.loads(line) for line in f]
+        # Pushed here: an offloaded call runs outside the task's app context
+        with self.app_context():
+            return self.runner.run(queries, self._file(job_id, '.jsonl'), job_id,
+                                   progress=lambda report: self._write_status(dict(record, **report)))
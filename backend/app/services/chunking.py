@@ -0,0 +1,120 @@
+"""Chunking on offsets into a page buffer instead of on substrings.
+
+FastTextSplitter makes exactly the chunks langchain's
+RecursiveCharacterTextSplitter makes (same separators, the separator kept
+at the start of the following piece, whitespace stripped), so swapping it
+in changes no index. The difference is in how: separator positions are
+found once per buffer (with numpy for single-character separators), pieces
+are (start, end) offsets, pieces too large for a chunk are found with one
+vectorised comparison, and each chunk is packed with a binary search over
+the offsets rather than by building, measuring and re-joining lists of
+substrings. Only the finished chunks are sliced out of the buffer.
+"""
+import re
+from bisect import bisect_left, bisect_right
+from typing import Dict, Iterable, List, Sequence
+
+import numpy as np
+from langchain_core.documents import Document
+
+DEFAULT_SEPARATORS = ("\n\n", "\n", " ", "")
+
+
+class FastTextSplitter:
+    """Drop-in replacement for RecursiveCharacterTextSplitter(chunk_size, chunk_overlap)"""
+
+    def __init__(self, chunk_size: int = 1000, chunk_overlap: int = 200,
+                 separators: Sequence[str] = DEFAULT_SEPARATORS):
+        if chunk_overlap > chunk_size:
+            raise ValueError(f"Chunk overlap ({chunk_overlap}) is larger than the chunk size ({chunk_size})")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.separators = list(separators)
+        self._patterns = {sep: re.compile(re.escape(sep)) for sep in self.separators if len(sep) > 1}
+
+    def split_text(self, text: str) -> List[str]:
+        if len(text) < self.chunk_size:
+            # Every piece of a short text fits, so it is one chunk
+            text = text.strip()
+            return [text] if text else []
+        chunks: List[str] = []
+        self._split(text, _Positions(text, self._patterns), 0, len(text), 0, chunks)
+        return chunks
+
+    def split_documents(self, documents: Iterable[Document]) -> List[Document]:
+        return [Document(page_content=chunk, metadata=dict(doc.metadata))
+                for doc in documents for chunk in self.split_text(doc.page_content)]
+
+    def _split(self, text: str, positions: '_Positions', start: int, end: int, level: int, chunks: List[str]):
+        # The first separator found in the range splits it; pieces too large for a chunk go down a level
+        separators = self.separators
+        deeper = len(separators)
+        matches = np.empty(0, dtype=np.int64)
+        for i in range(level, len(separators)):
+            if separators[i] == '':
+                matches = np.arange(start + 1, end, dtype=np.int64)
+                break
+            matches = positions.find(separators[i], start, end)
+            if len(matches):
+                deeper = i + 1
+                break
+
+        bounds = np.concatenate(([start], matches[matches > start], [end]))
+        oversized = np.flatnonzero(np.diff(bounds) >= self.chunk_size).tolist()
+        bounds = bounds.tolist()
+        first = 0
+        for piece in oversized:
+            if piece > first:
+                self._merge(text, bounds[first:piece + 1], chunks)
+            if deeper < len(separators):
+                self._split(text, positions, bounds[piece], bounds[piece + 1], deeper, chunks)
+            else:
+                chunks.append(text[bounds[piece]:bounds[piece + 1]])
+            first = piece + 1
+        if first < len(bounds) - 1:
+            self._merge(text, bounds[first:], chunks)
+
+    def _merge(self, text: str, bounds: List[int], chunks: List[str]):
+        """Pack consecutive pieces (each shorter than a chunk) into chunks that share up to chunk_overlap"""
+        size, overlap = self.chunk_size, self.chunk_overlap
+        last = len(bounds) - 1
+        first = 0
+        while True:
+            # The first piece that does not fit after bounds[first] closes the chunk
+            piece = bisect_right(bounds, bounds[first] + size) - 1
+            if piece >= last:
+                break
+            chunk = text[bounds[first]:bounds[piece]].strip()
+            if chunk:
+                chunks.append(chunk)
+            # The next chunk starts with the longest tail that fits the overlap and leaves room for the piece
+            keep = min(overlap, size - (bounds[piece + 1] - bounds[piece]))
+            first = max(first, min(piece, bisect_left(bounds, bounds[piece] - keep)))
+        chunk = text[bounds[first]:bounds[last]].strip()
+        if chunk:
+            chunks.append(chunk)
+
+
+class _Positions:
+    """Separator offsets in one buffer, found on first use and sliced per range after that"""
+
+    def __init__(self, text: str, patterns: Dict[str, 're.Pattern']):
+        self.text = text
+        self.patterns = patterns
+        self._codes = None
+        self._found: Dict[str, np.ndarray] = {}
+
+    def find(self, separator: str, start: int, end: int) -> np.ndarray:
+        if len(separator) > 1:
+            # Non-overlapping matches depend on where the scan starts, so multi-character separators are
+            # matched within the range, as re.split would on the substring
+            return np.fromiter((match.start() for match in self.patterns[separator].finditer(self.text, start, end)),
+                               dtype=np.int64)
+        found = self._found.get(separator)
+        if found is None:
+            if self._codes is None:
+                # UTF-32 has one code unit per character, so indexes are string offsets
+                self._codes = np.frombuffer(self.text.encode('utf-32-le'), dtype=np.uint32)
+            found = self._found[separator] = np.flatnonzero(self._codes == ord(separator))
+        low, high = np.searchsorted(found, (start, end))
+        return found[low:high]
@@ -0,0 +1,144 @@
+"""Named collections: indexes built separately (by source directory, tag or tenant) and searched one at a time.
+
+The index at VECTOR_STORE_PATH is the 'default' collection. Every other
+collection is a complete index of its own under
+VECTOR_STORE_PATH/collections/<name>, written by create_index.py
+--collection or --partition-by, so a search in it touches only its
+vectors. Collections are opened on first use and at most max_loaded of
+them stay open: opening one more closes the least recently used, which
+unmaps its files (or frees a FAISS index) once in-flight searches finish.
+"""
+import os
+import re
+import json
+import itertools
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+import logging
+
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from .live_store import LIVE_DIRNAME, LiveVectorStore
+from .mmap_store import MANIFEST_FILE, MMAP_DIRNAME, MmapVectorStore
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_COLLECTION = 'default'
+COLLECTIONS_DIRNAME = 'collections'
+
+# Collection names are directory names, so no separators or leading dots
+NAME_RE = re.compile(r'^[A-Za-z0-9][A-Za-z0-9_.-]{0,63}$')
+
+
+def valid_name(name: str) -> bool:
+    return isinstance(name, str) and bool(NAME_RE.match(name))
+
+
+def collection_path(index_path: str, name: Optional[str]) -> str:
+    """Directory holding a collection's index"""
+    if not name or name == DEFAULT_COLLECTION:
+        return index_path
+    if not valid_name(name):
+        raise ValueError(f"Invalid collection name: {name!r} (letters, digits, '.', '_' and '-', at most 64)")
+    return os.path.join(index_path, COLLECTIONS_DIRNAME, name)
+
+
+def index_exists(path: str) -> bool:
+    return MmapVectorStore.exists(os.path.join(path, MMAP_DIRNAME)) or os.path.exists(os.path.join(path, 'index.faiss'))
+
+
+def open_base_store(path: str, embedding: Embeddings, use_mmap: bool = True) -> VectorStore:
+    """The offline-built index in path: the flat mmap copy when there is one, else the pickled FAISS index"""
+    mmap_path = os.path.join(path, MMAP_DIRNAME)
+    if use_mmap and MmapVectorStore.exists(mmap_path):
+        # The flat mmap copy needs no deserialization and is shared between processes
+        base = MmapVectorStore(mmap_path, embedding)
+        logger.info(f"Mapped vector store with {len(base)} chunks from {mmap_path}")
+        return base
+    from langchain_community.vectorstores import FAISS
+
+    return FAISS.load_local(path, embedding, allow_dangerous_deserialization=True)
+
+
+class CollectionManager:
+    """Opens collections on demand and keeps the max_loaded most recently used ones open"""
+
+    def __init__(self, index_path: str, embedding: Embeddings, default: LiveVectorStore, use_mmap: bool = True,
+                 refresh_interval: float = 2.0, max_loaded: int = 8, metrics=None):
+        self.index_path = index_path
+        self.embedding = embedding
+        self.default = default
+        self.use_mmap = use_mmap
+        self.refresh_interval = refresh_interval
+        self.max_loaded = max(1, max_loaded)
+        self.metrics = metrics
+        self._loaded: 'OrderedDict[str, LiveVectorStore]' = OrderedDict()
+        self._generations: Dict[str, int] = {}
+        self._counter = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def names(self) -> List[str]:
+        root = os.path.join(self.index_path, COLLECTIONS_DIRNAME)
+        try:
+            found = sorted(name for name in os.listdir(root) if valid_name(name) and name != DEFAULT_COLLECTION
+                           and index_exists(os.path.join(root, name)))
+        except FileNotFoundError:
+            found = []
+        return [DEFAULT_COLLECTION] + found
+
+    def exists(self, name: Optional[str]) -> bool:
+        if not name or name == DEFAULT_COLLECTION:
+            return True
+        return valid_name(name) and (name in self._loaded or index_exists(collection_path(self.index_path, name)))
+
+    def get(self, name: Optional[str] = None) -> LiveVectorStore:
+        """The collection's store, opening it (and closing the least recently used) if needed"""
+        if not name or name == DEFAULT_COLLECTION:
+            return self.default
+        with self._lock:
+            store = self._loaded.get(name)
+            if store is not None:
+                self._loaded.move_to_end(name)
+                return store
+            if not self.exists(name):
+                raise ValueError(f"Unknown collection: {name}")
+            # Mapping a store is cheap, so it happens under the lock rather than racing a second open
+            path = collection_path(self.index_path, name)
+            store = LiveVectorStore(open_base_store(path, self.embedding, self.use_mmap),
+                                    os.path.join(path, LIVE_DIRNAME), self.embedding,
+                                    refresh_interval=self.refresh_interval)
+            self._loaded[name] = store
+            self._generations[name] = next(self._counter)
+            while len(self._loaded) > self.max_loaded:
+                evicted, _ = self._loaded.popitem(last=False)
+                logger.info(f"Closed collection {evicted} ({self.max_loaded} open at most)")
+                if self.metrics:
+                    self.metrics.incr('collection_unloads')
+        logger.info(f"Opened collection {name} ({len(store)} chunks)")
+        if self.metrics:
+            self.metrics.incr('collection_loads')
+        return store
+
+    def generation(self, name: Optional[str]) -> int:
+        """Changes each time the collection is opened, so results cached from an earlier opening can be told apart"""
+        if not name or name == DEFAULT_COLLECTION:
+            return 0
+        return self._generations.get(name, 0)
+
+    def describe(self) -> List[Dict[str, Any]]:
+        """Name, chunk count and whether it is open, for every collection"""
+        collections = []
+        for name in self.names():
+            store = self.default if name == DEFAULT_COLLECTION else self._loaded.get(name)
+            chunks = len(store) if store is not None else self._manifest_count(name)
+            collections.append({'name': name, 'chunks': chunks, 'loaded': store is not None})
+        return collections
+
+    def _manifest_count(self, name: str) -> Optional[int]:
+        try:
+            with open(os.path.join(collection_path(self.index_path, name), MMAP_DIRNAME, MANIFEST_FILE)) as f:
+                return int(json.load(f)['count'])
+        except (OSError, ValueError, KeyError):
+            return None
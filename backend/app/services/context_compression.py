@@ -0,0 +1,203 @@
+import re
+import math
+import time
+from typing import Any, Dict, List, Optional, Sequence, Set, Tuple
+import logging
+
+from .conversation_service import context_window, count_tokens
+
+logger = logging.getLogger(__name__)
+
+SENTENCE_BOUNDARY = re.compile(r'(?<=[.!?])\s+|\n+')
+WORD = re.compile(r"[a-z0-9]+")
+STOPWORDS = frozenset(
+    "a an and are as at be been but by can could did do does for from had has have how i if in into is it its "
+    "me my no not of on or our should so than that the their them then there these they this to was we were "
+    "what when where which who why will with would you your".split()
+)
+
+# Word n-gram sizes: sentences are compared on trigrams, whole passages on 5-grams
+SENTENCE_SHINGLE = 3
+PASSAGE_SHINGLE = 5
+
+# Reciprocal rank fusion constant: larger values flatten the advantage of the top ranks
+RRF_K = 60
+
+
+def format_passages(passages: Sequence[Tuple[str, str]]) -> str:
+    """The prompt layout for retrieved passages: a Source line, then the text"""
+    return "\n\n".join(f"Source: {source}\n{text}" for source, text in passages)
+
+
+def split_sentences(text: str) -> List[str]:
+    return [sentence.strip() for sentence in SENTENCE_BOUNDARY.split(text) if sentence.strip()]
+
+
+def _words(text: str) -> List[str]:
+    return WORD.findall(text.lower())
+
+
+def _terms(words: List[str]) -> Set[str]:
+    """Content words, with a crude plural strip so 'tires' matches 'tire'"""
+    return {w[:-1] if len(w) > 3 and w.endswith('s') else w for w in words if w not in STOPWORDS}
+
+
+def _shingles(words: List[str], n: int) -> Set[Tuple[str, ...]]:
+    if len(words) < n:
+        return {tuple(words)} if words else set()
+    return {tuple(words[i:i + n]) for i in range(len(words) - n + 1)}
+
+
+def jaccard(a: Set, b: Set) -> float:
+    return len(a & b) / len(a | b) if a or b else 1.0
+
+
+def fuse_rankings(query: str, rankings: Sequence[Sequence[Tuple[str, str]]]) -> List[Tuple[str, str]]:
+    """Merge passage lists ranked by different searches with reciprocal rank fusion.
+
+    Scores from document and web search aren't comparable, so only ranks
+    are used; query term overlap is added as one more ranking so that
+    a strong lexical match from either side moves up.
+    """
+    candidates = [passage for ranking in rankings for passage in ranking]
+    scores = [0.0] * len(candidates)
+    offset = 0
+    for ranking in rankings:
+        for rank in range(len(ranking)):
+            scores[offset + rank] += 1.0 / (RRF_K + rank + 1)
+        offset += len(ranking)
+    query_terms = _terms(_words(query))
+    overlap = [len(query_terms & _terms(_words(text))) for _, text in candidates]
+    for rank, i in enumerate(sorted(range(len(candidates)), key=lambda i: -overlap[i])):
+        scores[i] += 1.0 / (RRF_K + rank + 1)
+    return [candidates[i] for i in sorted(range(len(candidates)), key=lambda i: -scores[i])]
+
+
+class ContextCompressor:
+    """Shrinks retrieved passages before they go into the prompt.
+
+    Three passes, all pure Python and a few milliseconds per request:
+    passages that are near-duplicates of a better ranked one (Jaccard of
+    word 5-gram shingles) are dropped; sentences whose trigrams were all
+    seen already (the overlap between neighbouring chunks) are dropped;
+    the remaining sentences are ranked by IDF-weighted overlap with the
+    query terms and kept, best first, with their neighbours, until the
+    token budget is spent.
+    The top keep_top passages are kept whole when they fit, so a
+    paraphrased answer with no words in common with the query survives.
+    """
+
+    def __init__(self, max_tokens: int = 1500, budget_fraction: float = 0.25, duplicate_threshold: float = 0.8,
+                 keep_top: int = 1, min_sentences: int = 3):
+        self.max_tokens = max_tokens
+        self.budget_fraction = budget_fraction
+        self.duplicate_threshold = duplicate_threshold
+        self.keep_top = keep_top
+        self.min_sentences = min_sentences
+
+    def budget(self, model_id: Optional[str] = None) -> int:
+        """Context tokens allowed for a model: a share of its window, capped by max_tokens"""
+        return max(1, min(self.max_tokens, int(context_window(model_id) * self.budget_fraction)))
+
+    def compress(self, query: str, passages: Sequence[Tuple[str, str]],
+                 model_id: Optional[str] = None) -> Tuple[str, Dict[str, Any]]:
+        """Return the compressed context and a report of what was removed"""
+        started = time.perf_counter()
+        budget = self.budget(model_id)
+        raw_tokens = count_tokens(format_passages(passages))
+
+        # Near-duplicate passages (the same page fetched twice, repeated boilerplate)
+        kept: List[Tuple[str, str]] = []
+        kept_shingles: List[Set] = []
+        for source, text in passages:
+            shingles = _shingles(_words(text), PASSAGE_SHINGLE)
+            if any(jaccard(shingles, other) >= self.duplicate_threshold for other in kept_shingles):
+                continue
+            kept.append((source, text))
+            kept_shingles.append(shingles)
+
+        # Sentences already covered by a better ranked passage (chunk overlap)
+        sentences = []
+        seen: Set[Tuple[str, ...]] = set()
+        overlapping = 0
+        for rank, (source, text) in enumerate(kept):
+            for position, sentence in enumerate(split_sentences(text)):
+                words = _words(sentence)
+                shingles = _shingles(words, SENTENCE_SHINGLE)
+                if shingles and shingles <= seen:
+                    overlapping += 1
+                    continue
+                seen |= shingles
+                sentences.append({'rank': rank, 'position': position, 'text': sentence, 'terms': _terms(words),
+                                  'tokens': count_tokens(sentence) + 1})
+
+        # IDF over the candidate sentences, so terms that appear everywhere count for little
+        query_terms = _terms(_words(query))
+        document_frequency = {term: sum(1 for s in sentences if term in s['terms']) for term in query_terms}
+        for s in sentences:
+            s['score'] = sum(math.log(1 + len(sentences) / (1 + document_frequency[term]))
+                             for term in query_terms & s['terms'])
+
+        selected = set()
+        headers = set()
+        used = 0
+
+        def take(index):
+            nonlocal used
+            s = sentences[index]
+            cost = s['tokens'] + (0 if s['rank'] in headers else count_tokens(f"Source: {kept[s['rank']][0]}") + 2)
+            if index in selected or used + cost > budget:
+                return False
+            selected.add(index)
+            headers.add(s['rank'])
+            used += cost
+            return True
+
+        for rank in range(min(self.keep_top, len(kept))):
+            members = [i for i, s in enumerate(sentences) if s['rank'] == rank]
+            if sum(sentences[i]['tokens'] for i in members) <= budget // 2:
+                for i in members:
+                    take(i)
+        for i in sorted((i for i, s in enumerate(sentences) if s['score'] > 0),
+                        key=lambda i: (-sentences[i]['score'], sentences[i]['rank'], sentences[i]['position'])):
+            take(i)
+        # Neighbours of a match often carry the answer ("... the C wire. It powers the display")
+        for i in sorted(selected):
+            if sentences[i]['score'] <= 0:
+                continue
+            for j in (i + 1, i - 1):
+                if 0 <= j < len(sentences) and sentences[j]['rank'] == sentences[i]['rank']:
+                    take(j)
+        # Too little lexical overlap to judge relevance: fall back to the leading sentences in rank order
+        for i in range(len(sentences)):
+            if len(selected) >= self.min_sentences:
+                break
+            take(i)
+
+        parts = []
+        for rank, (source, _) in enumerate(kept):
+            chosen = [sentences[i] for i in sorted(selected) if sentences[i]['rank'] == rank]
+            if not chosen:
+                continue
+            text = chosen[0]['text']
+            for previous, s in zip(chosen, chosen[1:]):
+                # Mark elided sentences so the model doesn't read across the gap
+                text += (" " if s['position'] == previous['position'] + 1 else " ... ") + s['text']
+            parts.append((source, text))
+        context = format_passages(parts)
+
+        context_tokens = count_tokens(context)
+        report = {
+            'budget_tokens': budget,
+            'raw_tokens': raw_tokens,
+            'context_tokens': context_tokens,
+            'saved_tokens': max(0, raw_tokens - context_tokens),
+            'saved_pct': round(100.0 * max(0, raw_tokens - context_tokens) / raw_tokens, 1) if raw_tokens else 0.0,
+            'passages': len(passages),
+            'duplicate_passages': len(passages) - len(kept),
+            'overlapping_sentences': overlapping,
+            'sentences': len(sentences) + overlapping,
+            'kept_sentences': len(selected),
+            'ms': round((time.perf_counter() - started) * 1000, 2),
+        }
+        return context, report
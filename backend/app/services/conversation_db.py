@@ -0,0 +1,298 @@
+import json
+import time
+import zlib
+import queue
+import secrets
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS conversations (
+    id TEXT PRIMARY KEY,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    message_count INTEGER NOT NULL DEFAULT 0,
+    archived INTEGER NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS idx_conversations_updated ON conversations(updated_at);
+
+CREATE TABLE IF NOT EXISTS messages (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    conversation_id TEXT NOT NULL,
+    role TEXT NOT NULL,
+    content TEXT NOT NULL,
+    tokens INTEGER NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_messages_conversation_time ON messages(conversation_id, created_at, id);
+
+CREATE TABLE IF NOT EXISTS conversation_archive (
+    conversation_id TEXT PRIMARY KEY,
+    payload BLOB NOT NULL,
+    message_count INTEGER NOT NULL,
+    archived_at REAL NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS settings (
+    name TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+
+class ConversationDB:
+    """SQLite (WAL) persistence for conversations with a batching background writer"""
+
+    def __init__(self, path: str, batch_size: int = 256, flush_interval: float = 0.5,
+                 archive_after_days: float = 30, retention_days: float = 0,
+                 compaction_interval: float = 3600):
+        self.path = path
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.archive_after_days = archive_after_days
+        self.retention_days = retention_days
+        self.compaction_interval = compaction_interval
+        self._queue: "queue.Queue" = queue.Queue()
+        self._local = threading.local()
+        self._pending = 0
+        self._pending_lock = threading.Condition()
+        self._stop = threading.Event()
+
+        conn = self._connect()
+        # auto_vacuum must be chosen before the first table is created
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL")
+        conn.executescript(SCHEMA)
+        # Signs conversation tokens; kept here so every worker, and the next start, shares it
+        conn.execute("INSERT OR IGNORE INTO settings (name, value) VALUES ('access_key', ?)",
+                     (secrets.token_hex(32),))
+        conn.commit()
+        self.access_key = conn.execute("SELECT value FROM settings WHERE name = 'access_key'").fetchone()['value']
+
+        self._writer = threading.Thread(target=self._run_writer, name='conversation-db-writer', daemon=True)
+        self._writer.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        """Return this thread's connection (WAL lets readers run alongside the writer)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    # Writes
+
+    def enqueue(self, conversation_id: str, turns: List[Any]):
+        """Queue finished turns for the writer; nothing touches disk on the caller's thread"""
+        with self._pending_lock:
+            self._pending += 1
+        self._queue.put((conversation_id, [(t.role, t.content, t.tokens, t.created_at) for t in turns]))
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Block until every queued write has been committed"""
+        deadline = None if timeout is None else time.time() + timeout
+        with self._pending_lock:
+            while self._pending:
+                remaining = None if deadline is None else deadline - time.time()
+                if remaining is not None and remaining <= 0:
+                    return False
+                self._pending_lock.wait(remaining)
+        return True
+
+    def close(self):
+        self.flush(timeout=10)
+        self._stop.set()
+        self._writer.join(timeout=5)
+
+    def _write_batch(self, batch: List[Tuple[str, List[tuple]]]):
+        """Commit a batch of queued exchanges in a single transaction"""
+        conn = self._connect()
+        rows = []
+        conversation_updates: Dict[str, List[float]] = {}
+        for conversation_id, turns in batch:
+            for role, content, tokens, created_at in turns:
+                rows.append((conversation_id, role, content, tokens, created_at))
+                update = conversation_updates.setdefault(conversation_id, [created_at, created_at, 0])
+                update[0] = min(update[0], created_at)
+                update[1] = max(update[1], created_at)
+                update[2] += 1
+
+        with conn:
+            # New messages make an archived conversation live again, so a later compaction archives them too
+            conn.executemany(
+                "INSERT INTO conversations (id, created_at, updated_at, message_count) VALUES (?, ?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET updated_at = MAX(updated_at, excluded.updated_at), "
+                "message_count = message_count + excluded.message_count, archived = 0",
+                [(cid, first, last, count) for cid, (first, last, count) in conversation_updates.items()]
+            )
+            conn.executemany(
+                "INSERT INTO messages (conversation_id, role, content, tokens, created_at) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+
+    def _run_writer(self):
+        last_compaction = time.time()
+        while not self._stop.is_set():
+            try:
+                batch = [self._queue.get(timeout=self.flush_interval)]
+            except queue.Empty:
+                batch = []
+
+            while batch and len(batch) < self.batch_size:
+                try:
+                    batch.append(self._queue.get_nowait())
+                except queue.Empty:
+                    break
+
+            if batch:
+                try:
+                    self._write_batch(batch)
+                except Exception as e:
+                    logger.error(f"Error persisting conversations: {str(e)}")
+                finally:
+                    with self._pending_lock:
+                        self._pending -= len(batch)
+                        self._pending_lock.notify_all()
+
+            if self.compaction_interval and time.time() - last_compaction >= self.compaction_interval:
+                last_compaction = time.time()
+                try:
+                    self.compact()
+                except Exception as e:
+                    logger.error(f"Error compacting conversations: {str(e)}")
+
+    # Reads
+
+    def load_recent_turns(self, conversation_id: str, max_tokens: int) -> List[Dict[str, Any]]:
+        """Return the newest turns whose stored token counts fit max_tokens, oldest first"""
+        conn = self._connect()
+        rows = conn.execute(
+            "SELECT id, role, content, tokens, created_at FROM messages "
+            "WHERE conversation_id = ? ORDER BY created_at DESC, id DESC",
+            (conversation_id,)
+        )
+        selected = []
+        used = 0
+        exhausted = True
+        for row in rows:
+            if used + row['tokens'] > max_tokens:
+                exhausted = False
+                break
+            used += row['tokens']
+            selected.append(dict(row))
+
+        # Continue into the archived part of the conversation if budget remains
+        if exhausted:
+            for message in reversed(self._archived_messages(conversation_id)):
+                if used + message['tokens'] > max_tokens:
+                    break
+                used += message['tokens']
+                selected.append(message)
+
+        selected.reverse()
+        return selected
+
+    def has_conversation(self, conversation_id: str) -> bool:
+        conn = self._connect()
+        return conn.execute("SELECT 1 FROM conversations WHERE id = ?", (conversation_id,)).fetchone() is not None
+
+    def list_conversations(self, limit: int = 20, before: Optional[float] = None) -> Dict[str, Any]:
+        """Page through conversations, most recently updated first"""
+        conn = self._connect()
+        if before is None:
+            rows = conn.execute(
+                "SELECT id, created_at, updated_at, message_count, archived FROM conversations "
+                "ORDER BY updated_at DESC LIMIT ?", (limit + 1,)
+            ).fetchall()
+        else:
+            rows = conn.execute(
+                "SELECT id, created_at, updated_at, message_count, archived FROM conversations "
+                "WHERE updated_at < ? ORDER BY updated_at DESC LIMIT ?", (before, limit + 1)
+            ).fetchall()
+
+        page = [dict(row) for row in rows[:limit]]
+        next_cursor = page[-1]['updated_at'] if len(rows) > limit else None
+        return {'conversations': page, 'next_cursor': next_cursor}
+
+    def get_messages(self, conversation_id: str, limit: int = 50,
+                     before: Optional[int] = None) -> Dict[str, Any]:
+        """Page through a conversation's messages, newest first, using the message ID as cursor"""
+        conn = self._connect()
+        query = ("SELECT id, role, content, tokens, created_at FROM messages WHERE conversation_id = ? "
+                 + ("AND id < ? " if before is not None else "")
+                 + "ORDER BY id DESC LIMIT ?")
+        params = (conversation_id, before, limit + 1) if before is not None else (conversation_id, limit + 1)
+        rows = [dict(row) for row in conn.execute(query, params).fetchall()]
+
+        # Older messages may have been compacted into the archive
+        if len(rows) <= limit:
+            oldest = rows[-1]['id'] if rows else before
+            archived = [m for m in reversed(self._archived_messages(conversation_id))
+                        if oldest is None or m['id'] < oldest]
+            rows.extend(archived[:limit + 1 - len(rows)])
+
+        page = rows[:limit]
+        next_cursor = page[-1]['id'] if len(rows) > limit else None
+        return {'conversation_id': conversation_id, 'messages': page, 'next_cursor': next_cursor}
+
+    def _archived_messages(self, conversation_id: str) -> List[Dict[str, Any]]:
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT payload FROM conversation_archive WHERE conversation_id = ?", (conversation_id,)
+        ).fetchone()
+        if row is None:
+            return []
+        return json.loads(zlib.decompress(row['payload']))
+
+    # Maintenance
+
+    def compact(self) -> Dict[str, int]:
+        """Archive idle conversations into one compressed row each and purge expired ones"""
+        conn = self._connect()
+        now = time.time()
+        archived = purged = 0
+
+        if self.archive_after_days:
+            cutoff = now - self.archive_after_days * 86400
+            candidates = [row['id'] for row in conn.execute(
+                "SELECT id FROM conversations WHERE archived = 0 AND updated_at < ?", (cutoff,)
+            )]
+            for conversation_id in candidates:
+                messages = [dict(row) for row in conn.execute(
+                    "SELECT id, role, content, tokens, created_at FROM messages "
+                    "WHERE conversation_id = ? ORDER BY id", (conversation_id,)
+                )]
+                previous = self._archived_messages(conversation_id)
+                payload = zlib.compress(json.dumps(previous + messages).encode('utf-8'))
+                with conn:
+                    conn.execute(
+                        "INSERT OR REPLACE INTO conversation_archive VALUES (?, ?, ?, ?)",
+                        (conversation_id, payload, len(previous) + len(messages), now)
+                    )
+                    conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+                    conn.execute("UPDATE conversations SET archived = 1 WHERE id = ?", (conversation_id,))
+                archived += 1
+
+        if self.retention_days:
+            cutoff = now - self.retention_days * 86400
+            expired = [row['id'] for row in conn.execute(
+                "SELECT id FROM conversations WHERE updated_at < ?", (cutoff,)
+            )]
+            with conn:
+                for conversation_id in expired:
+                    conn.execute("DELETE FROM messages WHERE conversation_id = ?", (conversation_id,))
+                    conn.execute("DELETE FROM conversation_archive WHERE conversation_id = ?", (conversation_id,))
+                    conn.execute("DELETE FROM conversations WHERE id = ?", (conversation_id,))
+            purged = len(expired)
+
+        if archived or purged:
+            conn.execute("PRAGMA incremental_vacuum")
+            conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            logger.info(f"Compacted conversations: {archived} archived, {purged} purged")
+        return {'archived': archived, 'purged': purged}
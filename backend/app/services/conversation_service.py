@@ -0,0 +1,266 @@
+import re
+import hmac
+import time
+import hashlib
+import secrets
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Conversation IDs come from clients and are what their history is found by, so they must be hard to guess
+CONVERSATION_ID_PATTERN = re.compile(r'^[A-Za-z0-9_-]{16,128}$')
+
+# Approximate per-message framing overhead used by chat APIs (role, separators)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+# Context window sizes by model id prefix (the longest matching prefix wins)
+MODEL_CONTEXT_WINDOWS = {
+    'gpt-4o-mini': 128000,
+    'gpt-4o': 128000,
+    'gpt-4': 8192,
+    'gpt-3.5-turbo': 16385,
+    'claude-': 200000,
+    'command-r': 128000,
+    'llama-3.': 128000,
+    'qwen-': 128000,
+    'deepseek-r1-distill-': 128000,
+    'codestral-latest': 256000,
+    'mistral-': 128000,
+    'open-mistral-nemo': 128000,
+    'grok-2': 131072,
+    'deepseek-chat': 64000,
+    'deepseek-reasoner': 64000,
+    'qwq': 131072,
+    'qwen-vl-': 32000,
+    'meta-llama/': 128000,
+    'deepseek-ai/': 128000,
+}
+DEFAULT_CONTEXT_WINDOW = 8192
+
+CONTEXT_TEMPLATE = (
+    "Use the following retrieved context to answer the user's question. "
+    "If it is not relevant, answer from your own knowledge.\n\n{context}"
+)
+
+_encoding = None
+_encoding_lock = threading.Lock()
+
+
+def _get_encoding():
+    """Load the tiktoken encoding once; returns None if tiktoken is unavailable"""
+    global _encoding
+    if _encoding is None:
+        with _encoding_lock:
+            if _encoding is None:
+                try:
+                    import tiktoken
+                    _encoding = tiktoken.get_encoding("cl100k_base")
+                except Exception as e:
+                    logger.warning(f"tiktoken unavailable, using character-based token estimates: {str(e)}")
+                    _encoding = False
+    return _encoding or None
+
+
+def count_tokens(text: str) -> int:
+    """Count tokens with a fast BPE tokenizer (cl100k), falling back to a chars/4 estimate"""
+    if not text:
+        return 0
+    encoding = _get_encoding()
+    if encoding is not None:
+        return len(encoding.encode_ordinary(text))
+    return len(text) // 4 + 1
+
+
+def context_window(model_id: Optional[str]) -> int:
+    """Return the context window for a model using the longest matching id prefix"""
+    if not model_id:
+        return DEFAULT_CONTEXT_WINDOW
+    matches = [prefix for prefix in MODEL_CONTEXT_WINDOWS if model_id.startswith(prefix)]
+    if not matches:
+        return DEFAULT_CONTEXT_WINDOW
+    return MODEL_CONTEXT_WINDOWS[max(matches, key=len)]
+
+
+class Turn:
+    """A single message in a conversation with its token count computed once"""
+
+    __slots__ = ('role', 'content', 'tokens', 'created_at')
+
+    def __init__(self, role: str, content: str, tokens: Optional[int] = None,
+                 created_at: Optional[float] = None):
+        self.role = role
+        self.content = content
+        self.tokens = count_tokens(content) + MESSAGE_OVERHEAD_TOKENS if tokens is None else tokens
+        self.created_at = created_at or time.time()
+
+    def as_message(self) -> Dict[str, str]:
+        return {"role": self.role, "content": self.content}
+
+
+class Conversation:
+    """Ordered turns plus a running token total"""
+
+    def __init__(self, conversation_id: str, loaded: bool = True):
+        self.id = conversation_id
+        self.turns: List[Turn] = []
+        self.total_tokens = 0
+        self.loaded = loaded
+        self.lock = threading.Lock()
+
+    def append(self, turn: Turn, max_tokens: Optional[int] = None):
+        """Append a turn; once history exceeds twice max_tokens, trim it back to max_tokens"""
+        with self.lock:
+            self.turns.append(turn)
+            self.total_tokens += turn.tokens
+            if max_tokens and self.total_tokens > 2 * max_tokens:
+                drop = 0
+                while self.total_tokens > max_tokens and drop < len(self.turns) - 1:
+                    self.total_tokens -= self.turns[drop].tokens
+                    drop += 1
+                del self.turns[:drop]
+
+
+class ConversationStore:
+    """Conversation history keyed by conversation ID with token-budgeted windows
+
+    Recent turns are cached in memory (LRU); when a ConversationDB is given,
+    evicted or unknown conversations are reloaded from it and finished
+    exchanges are persisted through its batching writer.
+
+    Each conversation has a token, an HMAC of its ID, given to the client
+    that starts it; continuing the conversation or reading its messages
+    needs it.
+    """
+
+    def __init__(self, max_history_tokens: int = 8000, completion_reserve: int = 1024,
+                 max_conversations: int = 1000, db=None):
+        self.max_history_tokens = max_history_tokens
+        self.completion_reserve = completion_reserve
+        self.max_conversations = max_conversations
+        self.db = db
+        self._conversations: "OrderedDict[str, Conversation]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._access_key = (db.access_key if db is not None else secrets.token_hex(32)).encode()
+
+    def token(self, conversation_id: str) -> str:
+        return hmac.new(self._access_key, conversation_id.encode(), hashlib.sha256).hexdigest()
+
+    def check_token(self, conversation_id: str, token: Optional[str]) -> bool:
+        return isinstance(token, str) and hmac.compare_digest(self.token(conversation_id), token)
+
+    def exists(self, conversation_id: str) -> bool:
+        """Whether the conversation has history, in memory or stored"""
+        with self._lock:
+            conversation = self._conversations.get(conversation_id)
+        if conversation is not None and conversation.turns:
+            return True
+        return self.db is not None and self.db.has_conversation(conversation_id)
+
+    def get(self, conversation_id: str) -> Conversation:
+        """Return a conversation, creating it if needed (least recently used ones are evicted)"""
+        with self._lock:
+            conversation = self._conversations.get(conversation_id)
+            if conversation is None:
+                conversation = Conversation(conversation_id, loaded=self.db is None)
+                self._conversations[conversation_id] = conversation
+                while len(self._conversations) > self.max_conversations:
+                    self._conversations.popitem(last=False)
+            else:
+                self._conversations.move_to_end(conversation_id)
+
+        if not conversation.loaded:
+            with conversation.lock:
+                if not conversation.loaded:
+                    # Stored token counts are reused, so reloading never re-tokenizes
+                    for row in self.db.load_recent_turns(conversation_id, self.max_history_tokens):
+                        turn = Turn(row['role'], row['content'], tokens=row['tokens'],
+                                    created_at=row['created_at'])
+                        conversation.turns.append(turn)
+                        conversation.total_tokens += turn.tokens
+                    conversation.loaded = True
+        return conversation
+
+    def append(self, conversation_id: str, role: str, content: str) -> Turn:
+        """Append a turn, tokenizing only the new content"""
+        turn = Turn(role, content)
+        self.get(conversation_id).append(turn, self.max_history_tokens)
+        if self.db is not None:
+            self.db.enqueue(conversation_id, [turn])
+        return turn
+
+    def append_exchange(self, conversation_id: str, user_content: str, assistant_content: str):
+        """Append a finished user/assistant exchange and persist it as one write"""
+        turns = [Turn('user', user_content), Turn('assistant', assistant_content)]
+        conversation = self.get(conversation_id)
+        for turn in turns:
+            conversation.append(turn, self.max_history_tokens)
+        if self.db is not None:
+            self.db.enqueue(conversation_id, turns)
+        return turns
+
+    def clear(self, conversation_id: str):
+        with self._lock:
+            self._conversations.pop(conversation_id, None)
+
+    def token_budget(self, model_id: Optional[str]) -> int:
+        """Prompt token budget for a model: its window minus the completion reserve, capped by config"""
+        return max(0, min(context_window(model_id) - self.completion_reserve, self.max_history_tokens))
+
+    def window(self, conversation_id: str, budget: int) -> Tuple[List[Turn], int]:
+        """Return the newest turns that fit in budget and how many older turns were dropped"""
+        conversation = self.get(conversation_id)
+        with conversation.lock:
+            turns = list(conversation.turns)
+            total = conversation.total_tokens
+
+        # Fast path: the whole history fits, no need to walk it
+        if total <= budget:
+            return turns, 0
+
+        used = 0
+        start = len(turns)
+        while start > 0 and used + turns[start - 1].tokens <= budget:
+            start -= 1
+            used += turns[start].tokens
+        # Never open the window with an orphaned assistant reply
+        while start < len(turns) and turns[start].role != 'user':
+            start += 1
+        return turns[start:], start
+
+    def build_messages(self, conversation_id: str, content: str, model_id: Optional[str] = None,
+                       system: Optional[str] = None,
+                       context: Optional[str] = None) -> Tuple[List[Dict[str, str]], Dict[str, Any]]:
+        """Build the provider messages list within the model's budget.
+
+        The layout is always system message, retrieved context, history, user
+        turn, so the leading part of the prompt stays byte-identical across
+        requests and providers with prompt caching can reuse it.
+        """
+        budget = self.token_budget(model_id)
+        context_message = CONTEXT_TEMPLATE.format(context=context) if context else None
+        fixed = count_tokens(content) + MESSAGE_OVERHEAD_TOKENS
+        for text in (system, context_message):
+            if text:
+                fixed += count_tokens(text) + MESSAGE_OVERHEAD_TOKENS
+
+        history, dropped = self.window(conversation_id, max(0, budget - fixed))
+
+        messages = []
+        if system:
+            messages.append({"role": "system", "content": system})
+        if context_message:
+            messages.append({"role": "system", "content": context_message})
+        messages.extend(turn.as_message() for turn in history)
+        messages.append({"role": "user", "content": content})
+
+        stats = {
+            'budget_tokens': budget,
+            'prompt_tokens': fixed + sum(turn.tokens for turn in history),
+            'history_turns': len(history),
+            'dropped_turns': dropped,
+        }
+        return messages, stats
+
@@ -0,0 +1,136 @@
+"""Exact and near-duplicate chunk detection, so repeated text is embedded once.
+
+Exact duplicates share a hash of their whitespace-normalised text. Near
+duplicates (the same boilerplate with a page number or date changed, a
+re-exported copy of a document) are found with 64-bit SimHash fingerprints
+over word bigrams: chunks whose fingerprints differ in at most
+near_distance bits are treated as copies. The fingerprint is cut into
+near_distance + 1 bands, and two fingerprints within that distance must
+agree on at least one band, so candidates come from dict lookups rather
+than a scan over every kept chunk.
+"""
+import re
+import zlib
+import hashlib
+from collections import defaultdict
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+from langchain_core.documents import Document
+
+WORD_RE = re.compile(r'\w+')
+
+# Word n-grams hashed into the SimHash; chunks with fewer than MIN_SHINGLES of them are only matched exactly
+SHINGLE_WORDS = 2
+MIN_SHINGLES = 8
+
+# Fingerprint rows are (exact hash, SimHash) as uint64; a SimHash of 0 means the chunk was too short for one
+FINGERPRINT_DTYPE = np.dtype('<u8')
+
+_SHIFTS = np.arange(64, dtype=np.uint64)
+_MULTIPLIERS = np.array([0x9E3779B97F4A7C15, 0xC2B2AE3D27D4EB4F], dtype=np.uint64)
+
+
+@lru_cache(maxsize=1 << 16)
+def _word_id(word: str) -> int:
+    return zlib.crc32(word.encode('utf-8'))
+
+
+def _mix(values: np.ndarray) -> np.ndarray:
+    """splitmix64 finaliser, so nearby word ids give unrelated shingle hashes"""
+    values = values ^ (values >> np.uint64(30))
+    values = values * np.uint64(0xBF58476D1CE4E5B9)
+    values = values ^ (values >> np.uint64(27))
+    values = values * np.uint64(0x94D049BB133111EB)
+    return values ^ (values >> np.uint64(31))
+
+
+def fingerprint(text: str) -> Tuple[int, int]:
+    """(exact hash, SimHash) of a chunk; both are stable across processes"""
+    normalized = ' '.join(text.split())
+    exact = int.from_bytes(hashlib.blake2b(normalized.encode('utf-8'), digest_size=8).digest(), 'little')
+    words = WORD_RE.findall(normalized.lower())
+    shingles = len(words) - SHINGLE_WORDS + 1
+    if shingles < MIN_SHINGLES:
+        return exact, 0
+    ids = np.fromiter(map(_word_id, words), dtype=np.uint64, count=len(words))
+    hashes = ids[:shingles] * _MULTIPLIERS[0]
+    for n in range(1, SHINGLE_WORDS):
+        hashes ^= ids[n:n + shingles] * _MULTIPLIERS[n]
+    bits = (_mix(hashes)[:, None] >> _SHIFTS) & np.uint64(1)
+    # Each bit is set when most shingles set it
+    votes = bits.sum(axis=0) * 2 > shingles
+    return exact, int(np.packbits(votes, bitorder='little').view('<u8')[0])
+
+
+class ChunkDeduplicator:
+    """Remembers the chunks kept so far and spots copies of them.
+
+    Kept chunks are numbered in the order they were added, which is their
+    position in the store for the index builder and their chunk number for
+    an uploaded document.
+    """
+
+    def __init__(self, near_distance: int = 4):
+        if not 0 <= near_distance < 32:
+            raise ValueError(f"Near-duplicate distance must be between 0 and 31 bits, not {near_distance}")
+        self.near_distance = near_distance
+        self.count = 0
+        self._exact: Dict[int, int] = {}
+        self._simhashes: Dict[int, int] = {}
+        bands = near_distance + 1 if near_distance else 0
+        edges = [64 * n // bands for n in range(bands + 1)] if bands else []
+        self._bands = [(edges[n], (1 << (edges[n + 1] - edges[n])) - 1) for n in range(bands)]
+        self._buckets: List[Dict[int, List[int]]] = [defaultdict(list) for _ in self._bands]
+
+    def load(self, fingerprints: np.ndarray):
+        """Restore the chunks kept by an interrupted run, from their (exact, SimHash) rows"""
+        for exact, simhash in fingerprints.reshape(-1, 2).tolist():
+            self.add(exact, simhash)
+
+    def add(self, exact: int, simhash: int) -> int:
+        number = self.count
+        self._exact.setdefault(exact, number)
+        if simhash and self._bands:
+            self._simhashes[number] = simhash
+            for (shift, mask), buckets in zip(self._bands, self._buckets):
+                buckets[(simhash >> shift) & mask].append(number)
+        self.count += 1
+        return number
+
+    def match(self, exact: int, simhash: int) -> Optional[Tuple[str, int, int]]:
+        """('exact' or 'near', kept chunk number, differing bits) for a copy of a kept chunk, else None"""
+        number = self._exact.get(exact)
+        if number is not None:
+            return 'exact', number, 0
+        if not simhash or not self._bands:
+            return None
+        best = None
+        for (shift, mask), buckets in zip(self._bands, self._buckets):
+            for number in buckets.get((simhash >> shift) & mask, ()):
+                distance = (simhash ^ self._simhashes[number]).bit_count()
+                if distance <= self.near_distance and (best is None or (distance, number) < best):
+                    best = (distance, number)
+        return ('near', best[1], best[0]) if best else None
+
+    def filter(self, documents: List[Document]) -> Tuple[List[Document], np.ndarray, List[Dict[str, Any]]]:
+        """Split documents into the ones to embed and the copies to skip.
+
+        Returns the kept documents, their fingerprint rows (for load()) and
+        one entry per skipped copy: its kind, the kept chunk number it
+        duplicates, the differing bits and the copy's metadata.
+        """
+        kept, rows, duplicates = [], [], []
+        for doc in documents:
+            exact, simhash = fingerprint(doc.page_content)
+            found = self.match(exact, simhash)
+            if found is None:
+                self.add(exact, simhash)
+                kept.append(doc)
+                rows.append((exact, simhash))
+            else:
+                kind, number, distance = found
+                duplicates.append({'kind': kind, 'duplicate_of': number, 'distance': distance,
+                                   'metadata': doc.metadata})
+        return kept, np.array(rows, dtype=FINGERPRINT_DTYPE).reshape(-1, 2), duplicates
@@ -0,0 +1,350 @@
+import os
+import json
+import time
+import uuid
+import shutil
+import threading
+from typing import Any, Callable, Dict, List, Optional
+import logging
+
+from langchain_core.documents import Document
+from werkzeug.utils import secure_filename
+
+from .chunking import FastTextSplitter
+from .dedup import ChunkDeduplicator
+from .ingestion import SUPPORTED_EXTENSIONS, iter_pages
+from .retrieval_pool import RetrievalBusyError
+
+logger = logging.getLogger(__name__)
+
+# Under the live store directory: uploaded files and one JSON record per document
+FILES_DIRNAME = 'files'
+RECORDS_DIRNAME = 'documents'
+DELETE_SUFFIX = '.delete'
+DUPLICATES_SUFFIX = '.duplicates.jsonl'
+
+
+def chunk_ids(document_id: str, start: int, count: int) -> List[str]:
+    return [f"{document_id}:{n}" for n in range(start, start + count)]
+
+
+class DocumentService:
+    """Upload, list and delete knowledge base documents while the server runs.
+
+    Files and records are kept on disk next to the live vector store, so any
+    worker process can accept an upload or a delete request. Only the
+    process that called start() (the indexer) runs the jobs: it reads each
+    queued file page by page, embeds the chunks in batches (in the retrieval
+    pool when there is one) and adds them to rag_service.vector_store. The
+    store is saved as soon as the queue drains, and every persist_interval
+    seconds while it stays busy; other processes load it from there.
+
+    With dedup, chunks that repeat an earlier chunk of the same document
+    (repeated boilerplate pages, headers) are not embedded; the record
+    counts them and <id>.duplicates.jsonl lists each with the chunk it
+    copies.
+    """
+
+    def __init__(self, rag_service, chunk_size: int = 1000, chunk_overlap: int = 200, batch_size: int = 32,
+                 persist_interval: float = 30.0, poll_interval: float = 1.0,
+                 notify: Optional[Callable[[Dict[str, Any]], None]] = None, metrics=None,
+                 offload: Optional[Callable] = None, dedup: bool = True, near_distance: int = 4,
+                 sleep: Optional[Callable[[float], None]] = None, create_event: Optional[Callable] = None):
+        self.rag_service = rag_service
+        self.store = rag_service.vector_store
+        self.batch_size = batch_size
+        self.persist_interval = persist_interval
+        self.poll_interval = poll_interval
+        self.notify = notify
+        self.metrics = metrics
+        # Runs blocking calls (page parsing, in-process embedding) off the event loop when given
+        self.offload = offload or (lambda fn, *args: fn(*args))
+        # Waits must yield to the event loop when the indexer runs as a green thread (socketio.sleep and
+        # socketio.server.eio.create_event); threading's would block every other request
+        self.sleep = sleep or time.sleep
+        self.splitter = FastTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        self.dedup = dedup
+        self.near_distance = near_distance
+        self.files_path = os.path.join(self.store.path, FILES_DIRNAME)
+        self.records_path = os.path.join(self.store.path, RECORDS_DIRNAME)
+        os.makedirs(self.files_path, exist_ok=True)
+        os.makedirs(self.records_path, exist_ok=True)
+
+        self._wake = (create_event or threading.Event)()
+        self._running = False
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+    def _record_path(self, document_id: str) -> str:
+        return os.path.join(self.records_path, f"{document_id}.json")
+
+    def _delete_requested(self, document_id: str) -> bool:
+        return os.path.exists(os.path.join(self.records_path, document_id + DELETE_SUFFIX))
+
+    def _remove_duplicates_log(self, document_id: str):
+        path = os.path.join(self.records_path, document_id + DUPLICATES_SUFFIX)
+        if os.path.exists(path):
+            os.remove(path)
+
+    def _read_record(self, document_id: str) -> Optional[Dict[str, Any]]:
+        try:
+            with open(self._record_path(document_id)) as f:
+                record = json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+        if self._delete_requested(document_id):
+            record['status'] = 'deleting'
+        return record
+
+    def _write_record(self, record: Dict[str, Any]):
+        record['updated_at'] = time.time()
+        path = self._record_path(record['id'])
+        with open(path + '.tmp', 'w') as f:
+            json.dump(record, f)
+        os.replace(path + '.tmp', path)
+
+    def _publish(self, record: Dict[str, Any]):
+        if self.notify:
+            try:
+                self.notify(record)
+            except Exception as e:
+                logger.warning(f"Could not send document progress: {str(e)}")
+
+    def get(self, document_id: str) -> Optional[Dict[str, Any]]:
+        if not document_id.isalnum():
+            return None
+        return self._read_record(document_id)
+
+    def list(self) -> List[Dict[str, Any]]:
+        """All uploaded documents, newest first"""
+        records = []
+        for name in os.listdir(self.records_path):
+            if name.endswith('.json'):
+                record = self._read_record(name[:-len('.json')])
+                if record is not None:
+                    records.append(record)
+        return sorted(records, key=lambda record: record['created_at'], reverse=True)
+
+    def stats(self) -> Dict[str, Any]:
+        self.store.refresh()
+        return {'base_chunks': self.store.base_count(), 'live_chunks': self.store.delta_count(),
+                'version': self.store.version}
+
+    @staticmethod
+    def validate_filename(filename: str) -> str:
+        """Return a safe version of filename, or raise ValueError for unsupported types"""
+        name = secure_filename(filename or '')
+        extension = os.path.splitext(name)[1].lower()
+        if extension not in SUPPORTED_EXTENSIONS:
+            raise ValueError(f"Unsupported file type {extension or '(none)'}; "
+                             f"expected one of {', '.join(SUPPORTED_EXTENSIONS)}")
+        return name
+
+    def upload(self, filename: str, stream) -> Dict[str, Any]:
+        """Save an uploaded file and queue it for indexing"""
+        name = self.validate_filename(filename)
+        extension = os.path.splitext(name)[1].lower()
+        document_id = uuid.uuid4().hex
+        stored_name = document_id + extension
+        with open(os.path.join(self.files_path, stored_name), 'wb') as f:
+            shutil.copyfileobj(stream, f)
+        record = {
+            'id': document_id,
+            'filename': name,
+            'file': stored_name,
+            'size': os.path.getsize(os.path.join(self.files_path, stored_name)),
+            'status': 'queued',
+            'pages': 0,
+            'chunks': 0,
+            'duplicates': 0,
+            'error': None,
+            'created_at': time.time(),
+            'indexed_at': None,
+        }
+        self._write_record(record)
+        logger.info(f"Queued document {name} ({document_id}, {record['size']} bytes)")
+        self._wake.set()
+        self._publish(record)
+        return record
+
+    def delete(self, document_id: str) -> Optional[Dict[str, Any]]:
+        """Request removal of a document; the indexer drops its chunks and files"""
+        record = self.get(document_id)
+        if record is None:
+            return None
+        open(os.path.join(self.records_path, document_id + DELETE_SUFFIX), 'w').close()
+        record['status'] = 'deleting'
+        self._wake.set()
+        self._publish(record)
+        return record
+
+    def start(self, start_task: Optional[Callable] = None):
+        """Make this process the indexer and start working through the queue"""
+        self._recover()
+        self._running = True
+        if start_task is None:
+            threading.Thread(target=self._run, name='document-indexer', daemon=True).start()
+        else:
+            start_task(self._run)
+        return self
+
+    def stop(self):
+        self._running = False
+        self._wake.set()
+        if self._dirty:
+            self._persist()
+
+    def _recover(self):
+        """Requeue documents whose chunks were not saved before the last shutdown"""
+        for record in self.list():
+            if record['status'] == 'deleting':
+                continue
+            saved = record['status'] == 'indexed' and (
+                not record['chunks'] or self.store.has_ids(chunk_ids(record['id'], 0, record['chunks'])))
+            if record['status'] in ('indexing', 'indexed') and not saved:
+                logger.info(f"Requeueing document {record['filename']} ({record['id']})")
+                self.store.delete(chunk_ids(record['id'], 0, record['chunks']))
+                record.update(status='queued', pages=0, chunks=0)
+                self._write_record(record)
+
+    def _next_job(self):
+        queued = []
+        for name in os.listdir(self.records_path):
+            if name.endswith(DELETE_SUFFIX):
+                return 'delete', name[:-len(DELETE_SUFFIX)]
+            if name.endswith('.json'):
+                record = self._read_record(name[:-len('.json')])
+                if record is not None and record['status'] == 'queued':
+                    queued.append(record)
+        if queued:
+            return 'index', min(queued, key=lambda record: record['created_at'])['id']
+        return None
+
+    def _run(self):
+        while self._running:
+            try:
+                job = self._next_job()
+                if job is None:
+                    if self._dirty:
+                        self._persist()
+                    self._wake.wait(self.poll_interval)
+                    self._wake.clear()
+                    continue
+                kind, document_id = job
+                if kind == 'delete':
+                    self._remove(document_id)
+                else:
+                    self._index(document_id)
+                if self._dirty and time.monotonic() - self._saved_at >= self.persist_interval:
+                    self._persist()
+            except Exception as e:
+                logger.error(f"Document indexer error: {str(e)}")
+                self.sleep(self.poll_interval)
+
+    def _persist(self):
+        started = time.time()
+        self.store.save()
+        self._dirty = False
+        self._saved_at = time.monotonic()
+        if self.metrics:
+            self.metrics.observe('document_persist_seconds', time.time() - started)
+
+    def _embed(self, texts: List[str]) -> List[List[float]]:
+        retrieval = self.rag_service.retrieval
+        if retrieval is None:
+            return self.offload(self.rag_service.embeddings.embed_documents, texts)
+        while True:
+            try:
+                return retrieval.embed_documents(texts)
+            except RetrievalBusyError:
+                # Interactive searches have priority over the backlog
+                self.sleep(0.5)
+
+    def _add(self, record: Dict[str, Any], chunks: List[Document], deduplicator: Optional[ChunkDeduplicator]):
+        if deduplicator is not None:
+            chunks, _, duplicates = deduplicator.filter(chunks)
+            if duplicates:
+                with open(os.path.join(self.records_path, record['id'] + DUPLICATES_SUFFIX), 'a') as f:
+                    for duplicate in duplicates:
+                        f.write(json.dumps(dict(duplicate['metadata'], kind=duplicate['kind'],
+                                                duplicate_of=f"{record['id']}:{duplicate['duplicate_of']}",
+                                                distance=duplicate['distance'])) + '\n')
+                record['duplicates'] += len(duplicates)
+                if self.metrics:
+                    self.metrics.incr('document_chunks_deduplicated', len(duplicates))
+        if not chunks:
+            return
+        texts = [chunk.page_content for chunk in chunks]
+        vectors = self._embed(texts)
+        self.store.add_embeddings(texts, vectors, [chunk.metadata for chunk in chunks],
+                                  chunk_ids(record['id'], record['chunks'], len(chunks)))
+        record['chunks'] += len(chunks)
+        self._dirty = True
+
+    def _index(self, document_id: str):
+        record = self._read_record(document_id)
+        if record is None:
+            return
+        started = time.time()
+        record.update(status='indexing', pages=0, chunks=0, duplicates=0, error=None)
+        self._write_record(record)
+        self._publish(record)
+        self._remove_duplicates_log(document_id)
+
+        pages = iter_pages(os.path.join(self.files_path, record['file']))
+        # Chunk numbers in the deduplicator are the document's chunk numbers, as both count kept chunks
+        deduplicator = ChunkDeduplicator(self.near_distance) if self.dedup else None
+        pending: List[Document] = []
+        try:
+            while True:
+                if self._delete_requested(document_id):
+                    logger.info(f"Stopped indexing {record['filename']}: deletion requested")
+                    self._write_record(record)
+                    return
+                item = self.offload(next, pages, None)
+                if item is None:
+                    break
+                _, page = item
+                record['pages'] += 1
+                for chunk in self.splitter.split_documents([page]):
+                    chunk.metadata = {'source': record['filename'], 'document_id': document_id,
+                                      **({'page': page.metadata['page']} if 'page' in page.metadata else {})}
+                    pending.append(chunk)
+                if len(pending) >= self.batch_size:
+                    self._add(record, pending, deduplicator)
+                    pending = []
+                    self._write_record(record)
+                    self._publish(record)
+            if pending:
+                self._add(record, pending, deduplicator)
+            record.update(status='indexed', indexed_at=time.time())
+            elapsed = time.time() - started
+            logger.info(f"Indexed {record['filename']}: {record['pages']} pages, {record['chunks']} chunks "
+                        f"({record['duplicates']} duplicates skipped) in {elapsed:.1f}s")
+            if self.metrics:
+                self.metrics.incr('documents_indexed')
+                self.metrics.incr('document_chunks_indexed', record['chunks'])
+                self.metrics.observe('document_index_seconds', elapsed)
+        except Exception as e:
+            logger.error(f"Error indexing {record['filename']}: {str(e)}")
+            self.store.delete(chunk_ids(document_id, 0, record['chunks']))
+            record.update(status='failed', chunks=0, error=str(e))
+            if self.metrics:
+                self.metrics.incr('documents_failed')
+        self._write_record(record)
+        self._publish(record)
+
+    def _remove(self, document_id: str):
+        marker = os.path.join(self.records_path, document_id + DELETE_SUFFIX)
+        record = self._read_record(document_id)
+        if record is not None:
+            if self.store.delete(chunk_ids(document_id, 0, record['chunks'])):
+                self._dirty = True
+            file_path = os.path.join(self.files_path, record['file'])
+            if os.path.exists(file_path):
+                os.remove(file_path)
+            os.remove(self._record_path(document_id))
+            self._remove_duplicates_log(document_id)
+            logger.info(f"Deleted document {record['filename']} ({document_id})")
+            self._publish(dict(record, status='deleted'))
+        os.remove(marker)
@@ -0,0 +1,317 @@
+import os
+import glob
+import json
+import time
+import resource
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+import logging
+
+import numpy as np
+from langchain_core.documents import Document
+
+from .chunking import FastTextSplitter
+from .dedup import FINGERPRINT_DTYPE, ChunkDeduplicator
+from .mmap_store import FILES_FILE, MMAP_DIRNAME, MmapStoreWriter
+
+logger = logging.getLogger(__name__)
+
+SUPPORTED_EXTENSIONS = ('.txt', '.pdf')
+
+# Text files are read in blocks of roughly this many characters ("pages")
+TEXT_PAGE_CHARS = 64 * 1024
+
+# pypdf caches every object it resolves; reopening the reader bounds that cache
+PDF_REOPEN_PAGES = 200
+
+CHECKPOINT_FILE = 'checkpoint.json'
+
+# Under the store directory: one line per chunk skipped as a copy, and (while building) the fingerprints of kept chunks
+DUPLICATES_FILE = 'duplicates.jsonl'
+FINGERPRINTS_FILE = 'fingerprints.raw'
+
+
+def find_documents(documents_path: str) -> List[str]:
+    """Return the supported files under documents_path in a stable order"""
+    files = []
+    for extension in SUPPORTED_EXTENSIONS:
+        files.extend(glob.glob(os.path.join(documents_path, f"**/*{extension}"), recursive=True))
+    return sorted(files)
+
+
+def _iter_pdf_pages(file_path: str, start_page: int) -> Iterator[Tuple[int, Document]]:
+    from pypdf import PdfReader
+
+    page_number = start_page
+    while True:
+        reader = PdfReader(file_path)
+        total = len(reader.pages)
+        stop = min(total, page_number + PDF_REOPEN_PAGES)
+        for i in range(page_number, stop):
+            text = reader.pages[i].extract_text() or ''
+            yield i, Document(page_content=text, metadata={'source': file_path, 'page': i})
+        page_number = stop
+        del reader
+        if page_number >= total:
+            return
+
+
+def _iter_text_pages(file_path: str, start_page: int) -> Iterator[Tuple[int, Document]]:
+    with open(file_path, encoding='utf-8', errors='replace') as f:
+        page_number = 0
+        lines = []
+        size = 0
+        for line in f:
+            lines.append(line)
+            size += len(line)
+            if size >= TEXT_PAGE_CHARS:
+                if page_number >= start_page:
+                    yield page_number, Document(page_content=''.join(lines), metadata={'source': file_path})
+                page_number += 1
+                lines = []
+                size = 0
+        if lines and page_number >= start_page:
+            yield page_number, Document(page_content=''.join(lines), metadata={'source': file_path})
+
+
+def iter_pages(file_path: str, start_page: int = 0) -> Iterator[Tuple[int, Document]]:
+    """Yield (page number, page document) one page at a time, starting at start_page"""
+    if file_path.lower().endswith('.pdf'):
+        return _iter_pdf_pages(file_path, start_page)
+    return _iter_text_pages(file_path, start_page)
+
+
+def _row_ranges(rows) -> List[Tuple[int, int]]:
+    """Sorted (start, end) ranges covering the given row numbers"""
+    ranges: List[Tuple[int, int]] = []
+    for row in sorted(rows):
+        if ranges and ranges[-1][1] == row:
+            ranges[-1] = (ranges[-1][0], row + 1)
+        else:
+            ranges.append((row, row + 1))
+    return ranges
+
+
+def peak_rss_mb() -> float:
+    """Peak resident set size of this process so far (ru_maxrss is KB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if os.uname().sysname == 'Darwin' else peak / 1024
+
+
+def _file_signature(file_path: str) -> List[float]:
+    stat = os.stat(file_path)
+    return [stat.st_size, stat.st_mtime]
+
+
+class StreamingIndexBuilder:
+    """Builds the mmap vector store page by page with bounded memory.
+
+    Pages are split as they are read and chunks are embedded in batches of
+    batch_size, so memory depends on the batch size, not on the corpus.
+    After each flushed batch a checkpoint records the next page to read
+    and the store's written sizes; a rerun with the same settings resumes
+    from there instead of starting over.
+
+    With dedup, chunks that copy one already kept anywhere in the corpus
+    (exactly, or within near_distance SimHash bits) are not embedded. Each
+    one is logged to duplicates.jsonl in the store with its source, page
+    and the position of the kept chunk in the store.
+
+    Each file's chunks are contiguous in the store, and files.jsonl records
+    every file's row range with its metadata (its source plus whatever
+    build() was given for it, such as tags or a tenant), which is what lets
+    a filtered search scan only the matching files. A file whose chunks copy
+    ones kept for an earlier file also gets entries for those kept rows, so
+    its filter still finds the shared content.
+    """
+
+    def __init__(self, embeddings, index_path: str, chunk_size: int = 1000, chunk_overlap: int = 200,
+                 batch_size: int = 256, dtype: str = 'float32', model_name: Optional[str] = None,
+                 on_batch: Optional[Callable[[Dict[str, Any]], None]] = None, dedup: bool = True,
+                 near_distance: int = 4):
+        self.embeddings = embeddings
+        self.index_path = index_path
+        self.batch_size = batch_size
+        self.dtype = dtype
+        self.model_name = model_name
+        self.on_batch = on_batch
+        self.splitter = FastTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        self.dedup = dedup
+        self.near_distance = near_distance
+        self.settings = {'chunk_size': chunk_size, 'chunk_overlap': chunk_overlap, 'dtype': dtype,
+                         'model_name': model_name, 'near_distance': near_distance if dedup else None}
+        self.deduplicator: Optional[ChunkDeduplicator] = None
+        self.partial_path = os.path.join(index_path, MMAP_DIRNAME + '.partial')
+
+    def _load_checkpoint(self, files: List[str], metadata: Dict[str, Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+        path = os.path.join(self.partial_path, CHECKPOINT_FILE)
+        if not os.path.exists(path):
+            return None
+        with open(path) as f:
+            checkpoint = json.load(f)
+        if (checkpoint.get('settings') != self.settings or checkpoint.get('files') != files
+                or checkpoint.get('metadata', {}) != metadata):
+            logger.info("Index settings or document set changed since the checkpoint; starting over")
+            return None
+        for file_path, signature in checkpoint.get('signatures', {}).items():
+            if not os.path.exists(file_path) or _file_signature(file_path) != signature:
+                logger.info(f"{file_path} changed since the checkpoint; starting over")
+                return None
+        return checkpoint
+
+    def _save_checkpoint(self, files, metadata, file_index, next_page, file_start, shared, writer, stats):
+        checkpoint = {
+            'settings': self.settings,
+            'files': files,
+            'metadata': metadata,
+            'signatures': {f: _file_signature(f) for f in files[:file_index + 1] if os.path.exists(f)},
+            'file_index': file_index,
+            'next_page': next_page,
+            'store': writer.state(),
+            'file_start': file_start,
+            'shared_rows': sorted(shared),
+            'files_bytes': self._log_bytes(FILES_FILE),
+            'duplicates_bytes': self._log_bytes(DUPLICATES_FILE),
+            'stats': stats,
+        }
+        tmp = os.path.join(self.partial_path, CHECKPOINT_FILE + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump(checkpoint, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, os.path.join(self.partial_path, CHECKPOINT_FILE))
+
+    def build(self, files: List[str], resume: bool = True,
+              metadata: Optional[Dict[str, Dict[str, Any]]] = None) -> Dict[str, Any]:
+        """Index files into index_path/mmap and return a summary including peak RSS.
+
+        metadata maps a file to extra metadata for all of its chunks.
+        """
+        started = time.time()
+        metadata = metadata or {}
+        checkpoint = self._load_checkpoint(files, metadata) if resume else None
+        if checkpoint is None and os.path.exists(self.partial_path):
+            for name in os.listdir(self.partial_path):
+                os.remove(os.path.join(self.partial_path, name))
+
+        writer = MmapStoreWriter(self.partial_path, dtype=self.dtype,
+                                 state=checkpoint['store'] if checkpoint else None)
+        stats = dict(checkpoint['stats']) if checkpoint else {'files': 0, 'pages': 0, 'chunks': 0, 'errors': 0,
+                                                              'exact_duplicates': 0, 'near_duplicates': 0}
+        self._open_dedup(writer.count, checkpoint.get('duplicates_bytes', 0) if checkpoint else 0)
+        with open(os.path.join(self.partial_path, FILES_FILE), 'ab') as f:
+            f.truncate(checkpoint.get('files_bytes', 0) if checkpoint else 0)
+        start_file = checkpoint['file_index'] if checkpoint else 0
+        start_page = checkpoint['next_page'] if checkpoint else 0
+        file_start = checkpoint.get('file_start', writer.count) if checkpoint else 0
+        # Rows kept for earlier files that the current file's duplicates copy
+        shared = set(checkpoint.get('shared_rows', [])) if checkpoint else set()
+        if checkpoint:
+            logger.info(f"Resuming from {files[start_file] if start_file < len(files) else 'the end'} "
+                        f"page {start_page} ({writer.count} chunks already indexed)")
+
+        pending: List[Document] = []
+        for file_index in range(start_file, len(files)):
+            file_path = files[file_index]
+            first_page = start_page if file_index == start_file else 0
+            extra = metadata.get(file_path)
+            try:
+                for page_number, page in iter_pages(file_path, first_page):
+                    stats['pages'] += 1
+                    if extra:
+                        page.metadata.update(extra)
+                    pending.extend(self.splitter.split_documents([page]))
+                    # Flush only on page boundaries so a checkpoint never splits a page
+                    if len(pending) >= self.batch_size:
+                        shared.update(row for row in self._flush(writer, pending, stats) if row < file_start)
+                        pending = []
+                        self._save_checkpoint(files, metadata, file_index, page_number + 1, file_start, shared,
+                                              writer, stats)
+            except Exception as e:
+                stats['errors'] += 1
+                logger.error(f"Error reading {file_path}: {str(e)}")
+            stats['files'] += 1
+
+            if pending:
+                shared.update(row for row in self._flush(writer, pending, stats) if row < file_start)
+                pending = []
+            ranges = _row_ranges(shared)
+            if writer.count > file_start:
+                ranges.append((file_start, writer.count))
+            with open(os.path.join(self.partial_path, FILES_FILE), 'a', encoding='utf-8') as f:
+                for start, end in ranges:
+                    f.write(json.dumps({'source': file_path, 'start': start, 'end': end,
+                                        'metadata': dict(extra or {}, source=file_path)}, default=str) + '\n')
+            file_start = writer.count
+            shared = set()
+            self._save_checkpoint(files, metadata, file_index + 1, 0, file_start, shared, writer, stats)
+
+        manifest = writer.finalize(model_name=self.model_name)
+        os.remove(os.path.join(self.partial_path, CHECKPOINT_FILE))
+        for name in (FINGERPRINTS_FILE, DUPLICATES_FILE, FILES_FILE):
+            path = os.path.join(self.partial_path, name)
+            if os.path.exists(path) and (name == FINGERPRINTS_FILE or not os.path.getsize(path)):
+                os.remove(path)
+        self._publish()
+
+        elapsed = time.time() - started
+        duplicates = stats['exact_duplicates'] + stats['near_duplicates']
+        summary = dict(stats, seconds=elapsed, resumed=checkpoint is not None,
+                       chunks_per_sec=(stats['chunks'] + duplicates) / elapsed if elapsed else 0.0,
+                       embeddings_avoided_pct=100.0 * duplicates / ((stats['chunks'] + duplicates) or 1),
+                       vectors=manifest['count'], peak_rss_mb=peak_rss_mb())
+        return summary
+
+    def _open_dedup(self, kept: int, duplicates_bytes: int):
+        """Start the fingerprint and duplicate logs over, or cut them back to the checkpoint and reload"""
+        self.deduplicator = ChunkDeduplicator(self.near_distance) if self.dedup else None
+        if self.deduplicator is None:
+            return
+        os.makedirs(self.partial_path, exist_ok=True)
+        row_bytes = 2 * FINGERPRINT_DTYPE.itemsize
+        for name, size in ((FINGERPRINTS_FILE, kept * row_bytes), (DUPLICATES_FILE, duplicates_bytes)):
+            with open(os.path.join(self.partial_path, name), 'ab') as f:
+                f.truncate(size)
+        if kept:
+            self.deduplicator.load(np.fromfile(os.path.join(self.partial_path, FINGERPRINTS_FILE),
+                                               dtype=FINGERPRINT_DTYPE))
+
+    def _log_bytes(self, name: str) -> int:
+        path = os.path.join(self.partial_path, name)
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    def _flush(self, writer: MmapStoreWriter, documents: List[Document], stats: Dict[str, Any]) -> List[int]:
+        """Embed and store the documents that aren't copies; returns the kept rows the copies duplicate"""
+        duplicates = []
+        if self.deduplicator is not None:
+            documents, fingerprints, duplicates = self.deduplicator.filter(documents)
+            with open(os.path.join(self.partial_path, FINGERPRINTS_FILE), 'ab') as f:
+                f.write(fingerprints.tobytes())
+            with open(os.path.join(self.partial_path, DUPLICATES_FILE), 'a', encoding='utf-8') as f:
+                for duplicate in duplicates:
+                    stats[f"{duplicate['kind']}_duplicates"] += 1
+                    f.write(json.dumps(dict(duplicate['metadata'], kind=duplicate['kind'],
+                                            duplicate_of=duplicate['duplicate_of'], distance=duplicate['distance']),
+                                       default=str) + '\n')
+        if documents:
+            vectors = self.embeddings.embed_documents([doc.page_content for doc in documents])
+            writer.append(vectors, documents)
+        stats['chunks'] += len(documents)
+        if self.on_batch:
+            self.on_batch(dict(stats, peak_rss_mb=peak_rss_mb()))
+        return [duplicate['duplicate_of'] for duplicate in duplicates]
+
+    def _publish(self):
+        """Swap the finished store into place; processes that mapped the old one keep their mapping"""
+        final_path = os.path.join(self.index_path, MMAP_DIRNAME)
+        old_path = final_path + '.old'
+        if os.path.exists(old_path):
+            for name in os.listdir(old_path):
+                os.remove(os.path.join(old_path, name))
+            os.rmdir(old_path)
+        if os.path.exists(final_path):
+            os.rename(final_path, old_path)
+        os.rename(self.partial_path, final_path)
+        if os.path.exists(old_path):
+            for name in os.listdir(old_path):
+                os.remove(os.path.join(old_path, name))
+            os.rmdir(old_path)
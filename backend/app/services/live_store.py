@@ -0,0 +1,298 @@
+import os
+import json
+import time
+import shutil
+import threading
+from contextlib import contextmanager
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import logging
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from .metadata_filter import Filter, metadata_matches
+
+logger = logging.getLogger(__name__)
+
+# Subdirectory of the index directory holding documents added at runtime
+LIVE_DIRNAME = 'live'
+STATE_FILE = 'state.json'
+
+
+class ReadWriteLock:
+    """Many concurrent readers or one writer.
+
+    Writers wait for active readers to finish, and new readers wait while a
+    writer is waiting, so a stream of searches cannot starve an update.
+    """
+
+    def __init__(self):
+        self._cond = threading.Condition(threading.Lock())
+        self._readers = 0
+        self._writing = False
+        self._writers_waiting = 0
+
+    @contextmanager
+    def read(self):
+        with self._cond:
+            while self._writing or self._writers_waiting:
+                self._cond.wait()
+            self._readers += 1
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._readers -= 1
+                if not self._readers:
+                    self._cond.notify_all()
+
+    @contextmanager
+    def write(self):
+        with self._cond:
+            self._writers_waiting += 1
+            while self._writing or self._readers:
+                self._cond.wait()
+            self._writers_waiting -= 1
+            self._writing = True
+        try:
+            yield
+        finally:
+            with self._cond:
+                self._writing = False
+                self._cond.notify_all()
+
+
+def _empty_faiss(embedding: Embeddings, dim: int):
+    import faiss
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+
+    return FAISS(embedding, faiss.IndexFlatL2(dim), InMemoryDocstore(), {})
+
+
+def search_by_vector(store: VectorStore, embedding: List[float], k: int,
+                     filter: Optional[Filter] = None) -> List[Tuple[Document, float]]:
+    """Top-k (document, squared L2 distance) hits, among chunks matching the filter when one is given"""
+    if not filter or not hasattr(store, 'index'):
+        return store.similarity_search_with_score_by_vector(embedding, k, filter=filter)
+    # A langchain FAISS store filters its fetch_k nearest hits; fetching them all keeps the top k exact
+    return store.similarity_search_with_score_by_vector(embedding, k, filter=lambda m: metadata_matches(m, filter),
+                                                        fetch_k=int(store.index.ntotal))
+
+
+def search_by_vectors(store: VectorStore, embeddings: List[List[float]], k: int,
+                      filter: Optional[Filter] = None) -> List[List[Tuple[Document, float]]]:
+    """Top-k (document, squared L2 distance) hits for each query vector, in one call to the index"""
+    if hasattr(store, 'similarity_search_by_vectors_with_score'):
+        return store.similarity_search_by_vectors_with_score(embeddings, k, filter=filter)
+    import numpy as np
+
+    # A langchain FAISS store: faiss searches a whole query matrix at once
+    fetch = int(store.index.ntotal) if filter else k
+    distances, indices = store.index.search(np.asarray(embeddings, dtype=np.float32), fetch)
+    results = []
+    for row_distances, row_indices in zip(distances, indices):
+        hits = []
+        for distance, i in zip(row_distances, row_indices):
+            if i == -1:
+                continue
+            doc = store.docstore.search(store.index_to_docstore_id[int(i)])
+            if isinstance(doc, Document) and metadata_matches(doc.metadata, filter):
+                hits.append((doc, float(distance)))
+                if len(hits) == k:
+                    break
+        results.append(hits)
+    return results
+
+
+class LiveVectorStore(VectorStore):
+    """The offline-built index plus a writable FAISS delta for runtime uploads.
+
+    The base store (mmap or FAISS, from create_index.py) is never modified.
+    Chunks added at runtime go to a flat FAISS index searched alongside it;
+    both report squared L2 distances, so hits merge by score. Writes hold
+    the writer lock only to insert precomputed vectors or remove IDs, so
+    embedding never blocks searches.
+
+    save() writes the delta to a new versioned directory and then points
+    state.json at it. Other processes (web workers, retrieval processes)
+    notice the new version in refresh() and load it.
+    """
+
+    def __init__(self, base: VectorStore, path: str, embedding: Embeddings, refresh_interval: float = 2.0):
+        self.base = base
+        self.path = path
+        self.embedding = embedding
+        self.refresh_interval = refresh_interval
+        self.delta = None
+        self.version = 0
+        self._lock = ReadWriteLock()
+        self._state_mtime = None
+        self._checked_at = 0.0
+        try:
+            self._load_state()
+        except Exception as e:
+            logger.error(f"Failed to load live vector store from {path}: {str(e)}")
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self.embedding
+
+    def __len__(self) -> int:
+        return self.base_count() + self.delta_count()
+
+    def base_count(self) -> int:
+        if hasattr(self.base, 'index'):
+            return int(self.base.index.ntotal)
+        return len(self.base)
+
+    def delta_count(self) -> int:
+        delta = self.delta
+        return int(delta.index.ntotal) if delta is not None else 0
+
+    def has_ids(self, ids: List[str]) -> bool:
+        delta = self.delta
+        return delta is not None and all(i in delta.docstore._dict for i in ids)
+
+    def _read_state(self) -> Optional[Dict[str, Any]]:
+        try:
+            with open(os.path.join(self.path, STATE_FILE)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def _load_state(self) -> bool:
+        """Load the persisted delta if it is newer than the one in memory"""
+        from langchain_community.vectorstores import FAISS
+
+        state_path = os.path.join(self.path, STATE_FILE)
+        try:
+            mtime = os.stat(state_path).st_mtime_ns
+        except FileNotFoundError:
+            return False
+        if mtime == self._state_mtime:
+            return False
+        state = self._read_state()
+        if state is None or state['version'] <= self.version:
+            self._state_mtime = mtime
+            return False
+
+        # Load outside the lock; only the swap excludes readers
+        delta = None
+        if state.get('delta'):
+            delta = FAISS.load_local(os.path.join(self.path, state['delta']), self.embedding,
+                                     allow_dangerous_deserialization=True)
+        with self._lock.write():
+            self.delta = delta
+            self.version = state['version']
+        self._state_mtime = mtime
+        logger.info(f"Loaded live vector store version {self.version} ({self.delta_count()} chunks)")
+        return True
+
+    def refresh(self) -> bool:
+        """Pick up a delta saved by another process; checks the disk at most every refresh_interval"""
+        now = time.monotonic()
+        if now - self._checked_at < self.refresh_interval:
+            return False
+        self._checked_at = now
+        try:
+            return self._load_state()
+        except Exception as e:
+            # A save may be in progress; the next check retries
+            logger.warning(f"Could not refresh live vector store: {str(e)}")
+            return False
+
+    def add_embeddings(self, texts: List[str], embeddings: List[List[float]],
+                       metadatas: Optional[List[Dict]] = None, ids: Optional[List[str]] = None) -> List[str]:
+        """Insert chunks whose vectors were computed by the caller"""
+        if not texts:
+            return []
+        with self._lock.write():
+            if self.delta is None:
+                self.delta = _empty_faiss(self.embedding, len(embeddings[0]))
+            added = self.delta.add_embeddings(list(zip(texts, embeddings)), metadatas=metadatas, ids=ids)
+            self.version += 1
+        return added
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[Dict]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        return self.add_embeddings(texts, self.embedding.embed_documents(texts), metadatas, kwargs.get('ids'))
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        """Remove runtime chunks by ID; IDs not in the delta are ignored"""
+        if not ids:
+            return False
+        with self._lock.write():
+            if self.delta is None:
+                return False
+            present = [i for i in ids if i in self.delta.docstore._dict]
+            if not present:
+                return False
+            self.delta.delete(present)
+            self.version += 1
+        return True
+
+    def save(self):
+        """Persist the delta as a new version and drop the previous one"""
+        os.makedirs(self.path, exist_ok=True)
+        with self._lock.read():
+            version = self.version
+            dirname = f"delta-{version}" if self.delta is not None else None
+            if dirname:
+                self.delta.save_local(os.path.join(self.path, dirname))
+
+        state_path = os.path.join(self.path, STATE_FILE)
+        previous = self._read_state()
+        with open(state_path + '.tmp', 'w') as f:
+            json.dump({'version': version, 'delta': dirname, 'chunks': self.delta_count(),
+                       'saved_at': time.time()}, f)
+        os.replace(state_path + '.tmp', state_path)
+        self._state_mtime = os.stat(state_path).st_mtime_ns
+
+        if previous and previous.get('delta') and previous['delta'] != dirname:
+            shutil.rmtree(os.path.join(self.path, previous['delta']), ignore_errors=True)
+        logger.info(f"Saved live vector store version {version}")
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4,
+                                               filter: Optional[Filter] = None,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        """Nearest chunks of the base and the delta; filter is a normalized metadata filter"""
+        hits = search_by_vector(self.base, embedding, k, filter)
+        with self._lock.read():
+            if self.delta is not None and self.delta.index.ntotal:
+                hits = hits + search_by_vector(self.delta, embedding, k, filter)
+        return sorted(hits, key=lambda hit: hit[1])[:k]
+
+    def similarity_search_by_vectors_with_score(self, embeddings: List[List[float]], k: int = 4,
+                                                filter: Optional[Filter] = None) -> List[List[Tuple[Document, float]]]:
+        """Batch form of similarity_search_with_score_by_vector: one index call per store for all queries"""
+        if not len(embeddings):
+            return []
+        results = search_by_vectors(self.base, embeddings, k, filter)
+        with self._lock.read():
+            if self.delta is not None and self.delta.index.ntotal:
+                delta_hits = search_by_vectors(self.delta, embeddings, k, filter)
+                results = [hits + extra for hits, extra in zip(results, delta_hits)]
+        return [sorted(hits, key=lambda hit: hit[1])[:k] for hits in results]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[Filter] = None,
+                                     **kwargs: Any) -> List[Tuple[Document, float]]:
+        self.refresh()
+        return self.similarity_search_with_score_by_vector(self.embedding.embed_query(query), k, filter=filter)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, filter: Optional[Filter] = None,
+                                    **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k, filter=filter)]
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[Filter] = None,
+                          **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter=filter)]
+
+    def _select_relevance_score_fn(self):
+        return self._euclidean_relevance_score_fn
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[Dict]] = None,
+                   **kwargs: Any) -> "LiveVectorStore":
+        raise NotImplementedError("Wrap an existing store with LiveVectorStore(base, path, embedding)")
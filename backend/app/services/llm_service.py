@@ -6,13 +6,142 @@ from langchain_huggingface import HuggingFaceEndpoint
 from langchain.callbacks.streaming_stdout import StreamingStdOutCallbackHandler
 from langchain.callbacks.base import BaseCallbackManager
 from langchain_core.callbacks import CallbackManagerForLLMRun, Callbacks
+from langchain_core.language_models.chat_models import BaseChatModel
 from langchain_core.language_models.llms import LLM
 from langchain_core.outputs import Generation, GenerationChunk
 import cohere
 import logging
 
+from .rate_limit import ProviderRateLimitError, is_rate_limit_error, retry_after_seconds
+
 logger = logging.getLogger(__name__)
 
+# Config keys holding each provider's API key
+PROVIDER_KEYS = {
+    'openai': ('OPENAI_API_KEY',),
+    'cohere': ('COHERE_API_KEY',),
+    'huggingface': ('HF_API_KEY', 'HUGGINGFACE_API_KEY'),
+    'groq': ('GROQ_API_KEY',),
+    'mistral': ('MISTRAL_API_KEY',),
+    'anthropic': ('ANTHROPIC_API_KEY',),
+    'xai': ('XAI_API_KEY',),
+    'deepseek': ('DEEPSEEK_API_KEY',),
+    'alibaba': ('DASHSCOPE_API_KEY',),
+}
+
+def configured_providers(config) -> set:
+    """Providers with an API key in config"""
+    return {provider for provider, keys in PROVIDER_KEYS.items() if any(config.get(key) for key in keys)}
+
+def _resolve_messages(prompt: str, kwargs: Dict[str, Any]) -> List[Dict[str, str]]:
+    """Return the chat messages passed via kwargs, or a single user turn built from the prompt"""
+    return kwargs.get("messages") or [{"role": "user", "content": prompt}]
+
+def messages_to_prompt(messages: Sequence[Dict[str, str]]) -> str:
+    """Flatten chat messages into a plain-text transcript for completion-style models"""
+    lines = [f"{m['role'].capitalize()}: {m['content']}" for m in messages]
+    lines.append("Assistant:")
+    return "\n\n".join(lines)
+
+def invoke_messages(llm, messages: List[Dict[str, str]], **kwargs: Any):
+    """Invoke any LLM from the factory with a full chat messages list"""
+    if isinstance(llm, BaseChatModel):
+        return llm.invoke(messages, **kwargs)
+    if isinstance(llm, MESSAGE_AWARE_WRAPPERS):
+        return llm.invoke(messages[-1]["content"], messages=messages, **kwargs)
+    return llm.invoke(messages_to_prompt(messages), **kwargs)
+
+def _openai_usage(usage) -> Optional[Dict[str, int]]:
+    """Normalise an OpenAI-style usage object (also used by Groq, Mistral, DeepSeek and DashScope)"""
+    if usage is None:
+        return None
+    details = getattr(usage, 'prompt_tokens_details', None)
+    cached = getattr(details, 'cached_tokens', None) if details is not None else None
+    if cached is None:
+        # DeepSeek reports context-cache hits separately
+        cached = getattr(usage, 'prompt_cache_hit_tokens', None)
+    return {
+        'prompt_tokens': getattr(usage, 'prompt_tokens', 0) or 0,
+        'completion_tokens': getattr(usage, 'completion_tokens', 0) or 0,
+        'cached_tokens': cached or 0,
+    }
+
+def _chunk_usage(chunk) -> Optional[Dict[str, int]]:
+    """Return usage from a final OpenAI-compatible stream chunk (Groq nests it under x_groq)"""
+    usage = getattr(chunk, 'usage', None)
+    if usage is None:
+        usage = getattr(getattr(chunk, 'x_groq', None), 'usage', None)
+    return _openai_usage(usage)
+
+def _anthropic_usage(usage) -> Dict[str, int]:
+    """Normalise Anthropic usage, counting cache reads as cached prompt tokens"""
+    cache_read = getattr(usage, 'cache_read_input_tokens', 0) or 0
+    cache_write = getattr(usage, 'cache_creation_input_tokens', 0) or 0
+    return {
+        'prompt_tokens': (getattr(usage, 'input_tokens', 0) or 0) + cache_read + cache_write,
+        'completion_tokens': getattr(usage, 'output_tokens', 0) or 0,
+        'cached_tokens': cache_read,
+    }
+
+def _cohere_usage(usage) -> Optional[Dict[str, int]]:
+    """Normalise Cohere v2 usage (billed units, or raw tokens when billing info is absent)"""
+    if usage is None:
+        return None
+    counts = getattr(usage, 'tokens', None) or getattr(usage, 'billed_units', None)
+    if counts is None:
+        return None
+    return {
+        'prompt_tokens': int(getattr(counts, 'input_tokens', 0) or 0),
+        'completion_tokens': int(getattr(counts, 'output_tokens', 0) or 0),
+        'cached_tokens': 0,
+    }
+
+def _anthropic_request(messages: List[Dict[str, str]]) -> Dict[str, Any]:
+    """Split system messages into Anthropic's system blocks and add prompt-cache breakpoints.
+
+    Breakpoints go on the first system block (the persona, identical across
+    requests) and on the last history turn, so the stable prefix is reused.
+    """
+    system = [{"type": "text", "text": m["content"]} for m in messages if m["role"] == "system"]
+    turns = [{"role": m["role"], "content": m["content"]} for m in messages if m["role"] != "system"]
+    
+    if system:
+        system[0]["cache_control"] = {"type": "ephemeral"}
+    if len(turns) > 1:
+        previous = turns[-2]
+        previous["content"] = [{"type": "text", "text": previous["content"], "cache_control": {"type": "ephemeral"}}]
+    
+    request = {"messages": turns}
+    if system:
+        request["system"] = system
+    return request
+
+def usage_from_result(llm, result) -> Optional[Dict[str, int]]:
+    """Return normalised token usage for the last call made with llm"""
+    metadata = getattr(result, 'usage_metadata', None)
+    if metadata:
+        details = metadata.get('input_token_details') or {}
+        return {
+            'prompt_tokens': metadata.get('input_tokens', 0),
+            'completion_tokens': metadata.get('output_tokens', 0),
+            'cached_tokens': details.get('cache_read', 0) or 0,
+        }
+    return getattr(llm, 'last_usage', None)
+
+class ReplyCancelled(Exception):
+    """The client went away before the reply was complete; raised from a token callback to end the provider stream"""
+
+def _raise_if_rate_limited(provider: str, error: Exception):
+    """Surface a provider 429 as ProviderRateLimitError, so callers can back off"""
+    if isinstance(error, ProviderRateLimitError):
+        raise error
+    if is_rate_limit_error(error):
+        raise ProviderRateLimitError(provider, retry_after_seconds(error)) from error
+
+def response_text(result) -> str:
+    """Extract the text from an LLM or chat model result"""
+    return result.content if hasattr(result, "content") else str(result)
+
 class CohereClientV2Wrapper(LLM):
     """Wrapper around Cohere ClientV2 API"""
     
@@ -21,6 +150,7 @@ class CohereClientV2Wrapper(LLM):
     temperature: float = 0.7
     streaming: bool = True
     callbacks: Optional[Callbacks] = None
+    last_usage: Optional[Dict[str, int]] = None
     
     def _call(
         self,
@@ -35,7 +165,7 @@ class CohereClientV2Wrapper(LLM):
                 stream_iter = self._stream(prompt, stop=stop, run_manager=run_manager, **kwargs)
                 return "".join([chunk.text for chunk in stream_iter])
             
-            messages = [{"role": "user", "content": prompt}]
+            messages = _resolve_messages(prompt, kwargs)
             
             response = self.client.chat(
                 model=self.model,
@@ -43,12 +173,15 @@ class CohereClientV2Wrapper(LLM):
                 temperature=self.temperature
             )
             
+            self.last_usage = _cohere_usage(getattr(response, 'usage', None))
             return response.message.content[0].text
+        except ReplyCancelled:
+            raise
         except Exception as e:
+            _raise_if_rate_limited('cohere', e)
             error_msg = f"Error with Cohere API: {str(e)}"
             logger.error(error_msg)
-            # Return a fallback response rather than crashing
-            return f"I encountered an error connecting to Cohere's services. Please try another provider or check your API key configuration. Error: {str(e)}"
+            raise
     
     def _stream(
         self,
@@ -58,7 +191,7 @@ class CohereClientV2Wrapper(LLM):
         **kwargs: Any,
     ) -> Iterator[GenerationChunk]:
         """Stream the response."""
-        messages = [{"role": "user", "content": prompt}]
+        messages = _resolve_messages(prompt, kwargs)
         
         try:
             stream_response = self.client.chat_stream(
@@ -69,6 +202,10 @@ class CohereClientV2Wrapper(LLM):
             
             text = ""
             for chunk in stream_response:
+                # Usage arrives in the final message-end event
+                if getattr(chunk, 'type', None) == 'message-end':
+                    self.last_usage = _cohere_usage(getattr(getattr(chunk, 'delta', None), 'usage', None))
+                    continue
                 # Check if the chunk is a text generation or a message chunk
                 if hasattr(chunk, 'event_type') and chunk.event_type == "text-generation":
                     chunk_text = chunk.text
@@ -94,13 +231,13 @@ class CohereClientV2Wrapper(LLM):
                     if run_manager:
                         run_manager.on_llm_new_token(chunk_text)
                     yield chunk
+        except ReplyCancelled:
+            raise
         except Exception as e:
+            _raise_if_rate_limited('cohere', e)
             error_msg = f"Error streaming from Cohere API: {str(e)}"
             logger.error(error_msg)
-            error_chunk = GenerationChunk(text=f"\nError: {str(e)}")
-            if run_manager:
-                run_manager.on_llm_new_token(f"\nError: {str(e)}")
-            yield error_chunk
+            raise
     
     @property
     def _llm_type(self) -> str:
@@ -114,6 +251,7 @@ class GroqWrapper(LLM):
     temperature: float = 0.7
     streaming: bool = True
     callbacks: Optional[Callbacks] = None
+    last_usage: Optional[Dict[str, int]] = None
     
     def _call(
         self,
@@ -134,17 +272,19 @@ class GroqWrapper(LLM):
             
             response = client.chat.completions.create(
                 model=self.model,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
+                messages=_resolve_messages(prompt, kwargs),
                 temperature=self.temperature
             )
             
+            self.last_usage = _openai_usage(getattr(response, 'usage', None))
             return response.choices[0].message.content
+        except ReplyCancelled:
+            raise
         except Exception as e:
+            _raise_if_rate_limited('groq', e)
             error_msg = f"Error with Groq API: {str(e)}"
             logger.error(error_msg)
-            return f"I encountered an error connecting to Groq's services. Please try another provider or check your API key configuration. Error: {str(e)}"
+            raise
     
     def _stream(
         self,
@@ -160,14 +300,17 @@ class GroqWrapper(LLM):
             
             stream_response = client.chat.completions.create(
                 model=self.model,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
+                messages=_resolve_messages(prompt, kwargs),
                 temperature=self.temperature,
-                stream=True
+                stream=True,
+                stream_options={"include_usage": True}
             )
             
             for chunk in stream_response:
+                usage = _chunk_usage(chunk)
+                if usage:
+                    self.last_usage = usage
+                
                 if not chunk.choices:
                     continue
                 
@@ -178,13 +321,13 @@ class GroqWrapper(LLM):
                     if run_manager:
                         run_manager.on_llm_new_token(chunk_text)
                     yield chunk
+        except ReplyCancelled:
+            raise
         except Exception as e:
+            _raise_if_rate_limited('groq', e)
             error_msg = f"Error streaming from Groq API: {str(e)}"
             logger.error(error_msg)
-            error_chunk = GenerationChunk(text=f"\nError: {str(e)}")
-            if run_manager:
-                run_manager.on_llm_new_token(f"\nError: {str(e)}")
-            yield error_chunk
+            raise
     
     @property
     def _llm_type(self) -> str:
@@ -198,6 +341,7 @@ class MistralWrapper(LLM):
     temperature: float = 0.7
     streaming: bool = True
     callbacks: Optional[Callbacks] = None
+    last_usage: Optional[Dict[str, int]] = None
     
     def _call(
         self,
@@ -217,7 +361,7 @@ class MistralWrapper(LLM):
                 stream_iter = self._stream(prompt, stop=stop, run_manager=run_manager, **kwargs)
                 return "".join([chunk.text for chunk in stream_iter])
             
-            messages = [ChatMessage(role="user", content=prompt)]
+            messages = [ChatMessage(role=m["role"], content=m["content"]) for m in _resolve_messages(prompt, kwargs)]
             
             response = client.chat(
                 model=self.model,
@@ -225,11 +369,15 @@ class MistralWrapper(LLM):
                 temperature=self.temperature
             )
             
+            self.last_usage = _openai_usage(getattr(response, 'usage', None))
             return response.choices[0].message.content
+        except ReplyCancelled:
+            raise
         except Exception as e:
+            _raise_if_rate_limited('mistral', e)
             error_msg = f"Error with Mistral API: {str(e)}"
             logger.error(error_msg)
-            return f"I encountered an error connecting to Mistral's services. Please try another provider or check your API key configuration. Error: {str(e)}"
+            raise
     
     def _stream(
         self,
@@ -244,7 +392,7 @@ class MistralWrapper(LLM):
             
             client = MistralClient(api_key=self.api_key)
             
-            messages = [ChatMessage(role="user", content=prompt)]
+            messages = [ChatMessage(role=m["role"], content=m["content"]) for m in _resolve_messages(prompt, kwargs)]
             
             stream_response = client.chat_stream(
                 model=self.model,
@@ -253,6 +401,12 @@ class MistralWrapper(LLM):
             )
             
             for chunk in stream_response:
+                # The last chunk carries the usage
+                usage = _chunk_usage(chunk)
+                if usage:
+                    self.last_usage = usage
+                if not chunk.choices:
+                    continue
                 chunk_text = chunk.choices[0].delta.content or ""
                 
                 if chunk_text:
@@ -260,13 +414,13 @@ class MistralWrapper(LLM):
                     if run_manager:
                         run_manager.on_llm_new_token(chunk_text)
                     yield chunk
+        except ReplyCancelled:
+            raise
         except Exception as e:
+            _raise_if_rate_limited('mistral', e)
             error_msg = f"Error streaming from Mistral API: {str(e)}"
             logger.error(error_msg)
-            error_chunk = GenerationChunk(text=f"\nError: {str(e)}")
-            if run_manager:
-                run_manager.on_llm_new_token(f"\nError: {str(e)}")
-            yield error_chunk
+            raise
     
     @property
     def _llm_type(self) -> str:
@@ -278,8 +432,10 @@ class AnthropicWrapper(LLM):
     api_key: str
     model: str = "claude-3-5-haiku-latest"
     temperature: float = 0.7
+    max_tokens: int = 1024
     streaming: bool = True
     callbacks: Optional[Callbacks] = None
+    last_usage: Optional[Dict[str, int]] = None
     
     def _call(
         self,
@@ -300,17 +456,20 @@ class AnthropicWrapper(LLM):
             
             message = client.messages.create(
                 model=self.model,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
-                temperature=self.temperature
+                max_tokens=self.max_tokens,
+                temperature=self.temperature,
+                **_anthropic_request(_resolve_messages(prompt, kwargs))
             )
             
+            self.last_usage = _anthropic_usage(message.usage)
             return message.content[0].text
+        except ReplyCancelled:
+            raise
         except Exception as e:
+            _raise_if_rate_limited('anthropic', e)
             error_msg = f"Error with Anthropic API: {str(e)}"
             logger.error(error_msg)
-            return f"I encountered an error connecting to Anthropic's services. Please try another provider or check your API key configuration. Error: {str(e)}"
+            raise
     
     def _stream(
         self,
@@ -326,14 +485,23 @@ class AnthropicWrapper(LLM):
             
             stream = client.messages.create(
                 model=self.model,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
+                max_tokens=self.max_tokens,
                 temperature=self.temperature,
-                stream=True
+                stream=True,
+                **_anthropic_request(_resolve_messages(prompt, kwargs))
             )
             
+            usage = {}
             for chunk in stream:
+                # Input and cache usage arrive in message_start, output tokens in message_delta
+                chunk_type = getattr(chunk, 'type', None)
+                if chunk_type == 'message_start':
+                    usage.update(_anthropic_usage(chunk.message.usage))
+                    self.last_usage = usage
+                elif chunk_type == 'message_delta' and getattr(chunk, 'usage', None) is not None:
+                    usage['completion_tokens'] = getattr(chunk.usage, 'output_tokens', 0) or 0
+                    self.last_usage = usage
+                
                 if not hasattr(chunk, 'delta') or not hasattr(chunk.delta, 'text'):
                     continue
                 
@@ -344,13 +512,13 @@ class AnthropicWrapper(LLM):
                     if run_manager:
                         run_manager.on_llm_new_token(chunk_text)
                     yield chunk
+        except ReplyCancelled:
+            raise
         except Exception as e:
+            _raise_if_rate_limited('anthropic', e)
             error_msg = f"Error streaming from Anthropic API: {str(e)}"
             logger.error(error_msg)
-            error_chunk = GenerationChunk(text=f"\nError: {str(e)}")
-            if run_manager:
-                run_manager.on_llm_new_token(f"\nError: {str(e)}")
-            yield error_chunk
+            raise
     
     @property
     def _llm_type(self) -> str:
@@ -364,6 +532,7 @@ class XaiWrapper(LLM):
     temperature: float = 0.7
     streaming: bool = True
     callbacks: Optional[Callbacks] = None
+    last_usage: Optional[Dict[str, int]] = None
     
     def _call(
         self,
@@ -384,17 +553,19 @@ class XaiWrapper(LLM):
             
             response = client.chat.completions.create(
                 model=self.model,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
+                messages=_resolve_messages(prompt, kwargs),
                 temperature=self.temperature
             )
             
+            self.last_usage = _openai_usage(getattr(response, 'usage', None))
             return response.choices[0].message.content
+        except ReplyCancelled:
+            raise
         except Exception as e:
+            _raise_if_rate_limited('xai', e)
             error_msg = f"Error with X AI API: {str(e)}"
             logger.error(error_msg)
-            return f"I encountered an error connecting to X AI's services. Please try another provider or check your API key configuration. Error: {str(e)}"
+            raise
     
     def _stream(
         self,
@@ -410,14 +581,17 @@ class XaiWrapper(LLM):
             
             stream_response = client.chat.completions.create(
                 model=self.model,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
+                messages=_resolve_messages(prompt, kwargs),
                 temperature=self.temperature,
-                stream=True
+                stream=True,
+                stream_options={"include_usage": True}
             )
             
             for chunk in stream_response:
+                usage = _chunk_usage(chunk)
+                if usage:
+                    self.last_usage = usage
+                
                 if not chunk.choices:
                     continue
                 
@@ -428,13 +602,13 @@ class XaiWrapper(LLM):
                     if run_manager:
                         run_manager.on_llm_new_token(chunk_text)
                     yield chunk
+        except ReplyCancelled:
+            raise
         except Exception as e:
+            _raise_if_rate_limited('xai', e)
             error_msg = f"Error streaming from X AI API: {str(e)}"
             logger.error(error_msg)
-            error_chunk = GenerationChunk(text=f"\nError: {str(e)}")
-            if run_manager:
-                run_manager.on_llm_new_token(f"\nError: {str(e)}")
-            yield error_chunk
+            raise
     
     @property
     def _llm_type(self) -> str:
@@ -448,6 +622,7 @@ class DeepseekWrapper(LLM):
     temperature: float = 0.7
     streaming: bool = True
     callbacks: Optional[Callbacks] = None
+    last_usage: Optional[Dict[str, int]] = None
     
     def _call(
         self,
@@ -468,17 +643,19 @@ class DeepseekWrapper(LLM):
             
             response = client.chat.completions.create(
                 model=self.model,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
+                messages=_resolve_messages(prompt, kwargs),
                 temperature=self.temperature
             )
             
+            self.last_usage = _openai_usage(getattr(response, 'usage', None))
             return response.choices[0].message.content
+        except ReplyCancelled:
+            raise
         except Exception as e:
+            _raise_if_rate_limited('deepseek', e)
             error_msg = f"Error with Deepseek API: {str(e)}"
             logger.error(error_msg)
-            return f"I encountered an error connecting to Deepseek's services. Please try another provider or check your API key configuration. Error: {str(e)}"
+            raise
     
     def _stream(
         self,
@@ -494,14 +671,17 @@ class DeepseekWrapper(LLM):
             
             stream_response = client.chat.completions.create(
                 model=self.model,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
+                messages=_resolve_messages(prompt, kwargs),
                 temperature=self.temperature,
-                stream=True
+                stream=True,
+                stream_options={"include_usage": True}
             )
             
             for chunk in stream_response:
+                usage = _chunk_usage(chunk)
+                if usage:
+                    self.last_usage = usage
+                
                 if not chunk.choices:
                     continue
                 
@@ -512,13 +692,13 @@ class DeepseekWrapper(LLM):
                     if run_manager:
                         run_manager.on_llm_new_token(chunk_text)
                     yield chunk
+        except ReplyCancelled:
+            raise
         except Exception as e:
+            _raise_if_rate_limited('deepseek', e)
             error_msg = f"Error streaming from Deepseek API: {str(e)}"
             logger.error(error_msg)
-            error_chunk = GenerationChunk(text=f"\nError: {str(e)}")
-            if run_manager:
-                run_manager.on_llm_new_token(f"\nError: {str(e)}")
-            yield error_chunk
+            raise
     
     @property
     def _llm_type(self) -> str:
@@ -532,6 +712,7 @@ class AlibabaWrapper(LLM):
     temperature: float = 0.7
     streaming: bool = True
     callbacks: Optional[Callbacks] = None
+    last_usage: Optional[Dict[str, int]] = None
     
     def _call(
         self,
@@ -555,17 +736,19 @@ class AlibabaWrapper(LLM):
             
             response = client.chat.completions.create(
                 model=self.model,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
+                messages=_resolve_messages(prompt, kwargs),
                 temperature=self.temperature
             )
             
+            self.last_usage = _openai_usage(getattr(response, 'usage', None))
             return response.choices[0].message.content
+        except ReplyCancelled:
+            raise
         except Exception as e:
+            _raise_if_rate_limited('alibaba', e)
             error_msg = f"Error with Alibaba API: {str(e)}"
             logger.error(error_msg)
-            return f"I encountered an error connecting to Alibaba's services. Please try another provider or check your API key configuration. Error: {str(e)}"
+            raise
     
     def _stream(
         self,
@@ -584,14 +767,17 @@ class AlibabaWrapper(LLM):
             
             stream_response = client.chat.completions.create(
                 model=self.model,
-                messages=[
-                    {"role": "user", "content": prompt}
-                ],
+                messages=_resolve_messages(prompt, kwargs),
                 temperature=self.temperature,
-                stream=True
+                stream=True,
+                stream_options={"include_usage": True}
             )
             
             for chunk in stream_response:
+                usage = _chunk_usage(chunk)
+                if usage:
+                    self.last_usage = usage
+                
                 if not chunk.choices:
                     continue
                 
@@ -610,18 +796,29 @@ class AlibabaWrapper(LLM):
                     if run_manager:
                         run_manager.on_llm_new_token(chunk_text)
                     yield chunk
+        except ReplyCancelled:
+            raise
         except Exception as e:
+            _raise_if_rate_limited('alibaba', e)
             error_msg = f"Error streaming from Alibaba API: {str(e)}"
             logger.error(error_msg)
-            error_chunk = GenerationChunk(text=f"\nError: {str(e)}")
-            if run_manager:
-                run_manager.on_llm_new_token(f"\nError: {str(e)}")
-            yield error_chunk
+            raise
     
     @property
     def _llm_type(self) -> str:
         return "alibaba"
 
+# Wrappers that accept a full ``messages`` list through invoke kwargs
+MESSAGE_AWARE_WRAPPERS = (
+    CohereClientV2Wrapper,
+    GroqWrapper,
+    MistralWrapper,
+    AnthropicWrapper,
+    XaiWrapper,
+    DeepseekWrapper,
+    AlibabaWrapper,
+)
+
 class LLMFactory:
     """Factory class to create different LLM instances based on provider"""
     
@@ -637,7 +834,6 @@ class LLMFactory:
             {'id': 'command-r-plus-08-2024', 'name': 'Command R+ (08/2024)', 'description': 'Latest R+ model with improved reasoning'},
             {'id': 'command-r7b-12-2024', 'name': 'Command R7B (12/2024)', 'description': 'Latest 7B model, fast and efficient'},
             {'id': 'command-nightly', 'name': 'Command Nightly', 'description': 'Latest nightly build with newest features'},
-            {'id': 'command-r-plus-08-2024', 'name': 'Command R+ (08/2024)', 'description': 'Latest R+ model with improved reasoning'},
         ],
         'huggingface': [
             {'id': 'meta-llama/Llama-3.3-70B-Instruct', 'name': 'Llama 3.3 70B', 'description': 'Meta\'s largest Llama 3.3 model'},
@@ -703,10 +899,22 @@ class LLMFactory:
             'alibaba': self._create_alibaba,
         }
     
+        # Model ids per provider for O(1) validation; a ModelRegistry, when set, takes over with the live catalog
+        self.registry = None
+        self._model_ids = {provider: {model['id'] for model in models}
+                           for provider, models in self.AVAILABLE_MODELS.items()}
+    
     def get_available_models(self):
         """Return a dictionary of available models by provider"""
+        if self.registry is not None:
+            return self.registry.models()
         return self.AVAILABLE_MODELS
     
+    def is_known_model(self, provider, model_id):
+        if self.registry is not None and self.registry.has_provider(provider):
+            return self.registry.has_model(provider, model_id)
+        return model_id in self._model_ids.get(provider, ())
+    
     def get_llm(self, provider='openai', model_id=None, streaming=True):
         """Get an LLM instance based on the provider name and model_id"""
         if provider not in self.providers:
@@ -728,8 +936,7 @@ class LLMFactory:
             model_id = default_models.get(provider, self.AVAILABLE_MODELS[provider][0]['id'])
             
         # Validate model_id
-        valid_models = [model['id'] for model in self.AVAILABLE_MODELS[provider]]
-        if model_id not in valid_models:
+        if not self.is_known_model(provider, model_id):
             logger.warning(f"Model {model_id} not found for provider {provider}. Using default model.")
             model_id = self.AVAILABLE_MODELS[provider][0]['id']
         
@@ -747,6 +954,7 @@ class LLMFactory:
         """Create an OpenAI LLM instance"""
         from flask import current_app
         api_key = current_app.config['OPENAI_API_KEY']
+        base_url = current_app.config.get('OPENAI_BASE_URL') or None
         
         if not api_key:
             raise ValueError("OpenAI API key not found. Please set OPENAI_API_KEY in your environment.")
@@ -755,9 +963,11 @@ class LLMFactory:
         
         return ChatOpenAI(
             openai_api_key=api_key,
+            openai_api_base=base_url,
             model_name=model_id,
             temperature=0.7,
             streaming=streaming,
+            stream_usage=True,
             callbacks=callbacks
         )
     
@@ -0,0 +1,136 @@
+"""Metadata filters for document search: {"key": value or [values]}.
+
+A chunk matches when, for every key, its metadata value (or one of them,
+for list values such as tags) equals one of the filter's values; values
+compare as strings. 'directory' also matches the directories below the
+one named, so {"directory": "contracts"} covers contracts/2024 too.
+
+FilterIndex answers a filter for an mmap store without reading its
+chunks: it maps each (key, value) to the files carrying it, and each file
+to its contiguous range of rows, so a filtered search scans only those
+rows.
+"""
+import posixpath
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+# A normalized filter: sorted (key, sorted values) pairs, hashable so it can be part of a cache key
+Filter = Tuple[Tuple[str, Tuple[str, ...]], ...]
+
+MAX_FILTER_KEYS = 16
+MAX_FILTER_VALUES = 256
+
+
+def _scalar(value: Any) -> bool:
+    return isinstance(value, (str, int, float, bool))
+
+
+def normalize_filter(spec: Any) -> Optional[Filter]:
+    """Validate a filter from a client; raises ValueError describing what is wrong with it"""
+    if spec is None or spec == {}:
+        return None
+    if isinstance(spec, tuple):
+        # Already normalized (JSON has no tuples)
+        return spec or None
+    if not isinstance(spec, dict):
+        raise ValueError("Filter must be an object of metadata keys to values")
+    if len(spec) > MAX_FILTER_KEYS:
+        raise ValueError(f"Filter has more than {MAX_FILTER_KEYS} keys")
+    items = []
+    for key, value in spec.items():
+        values = value if isinstance(value, list) else [value]
+        if not isinstance(key, str) or not key:
+            raise ValueError("Filter keys must be non-empty strings")
+        if not values or len(values) > MAX_FILTER_VALUES or not all(_scalar(v) for v in values):
+            raise ValueError(f"Filter on {key} must be a value or a list of 1 to {MAX_FILTER_VALUES} values")
+        texts = {_text(v) for v in values}
+        if key == 'directory':
+            texts = {text.strip('/') or '.' for text in texts}
+        items.append((key, tuple(sorted(texts))))
+    return tuple(sorted(items))
+
+
+def _text(value: Any) -> str:
+    if isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    return str(value)
+
+
+def metadata_values(key: str, value: Any) -> List[str]:
+    """The strings a metadata value is matched as"""
+    if value is None:
+        return []
+    values = [_text(v) for v in (value if isinstance(value, (list, tuple)) else [value]) if _scalar(v)]
+    if key == 'directory':
+        # A file in a/b is also in a
+        values = [parent for path in values for parent in _ancestors(path)]
+    return values
+
+
+def _ancestors(path: str) -> List[str]:
+    path = path.strip('/')
+    found = []
+    while path and path != '.':
+        found.append(path)
+        path = posixpath.dirname(path)
+    return found or ['.']
+
+
+def metadata_matches(metadata: Dict[str, Any], filter: Optional[Filter]) -> bool:
+    if not filter:
+        return True
+    metadata = metadata or {}
+    for key, values in filter:
+        if not set(metadata_values(key, metadata.get(key))).intersection(values):
+            return False
+    return True
+
+
+class FilterIndex:
+    """Row ranges of an mmap store by file-level metadata.
+
+    Built from entries {"start", "end", "metadata"}, one per file (or run of
+    rows sharing their metadata). Ranges may overlap: a chunk kept once for
+    several files has an entry for each of them.
+    """
+
+    def __init__(self, entries: Iterable[Dict[str, Any]]):
+        bounds = []
+        self._postings: Dict[str, Dict[str, List[int]]] = {}
+        for number, entry in enumerate(entries):
+            bounds.append((int(entry['start']), int(entry['end'])))
+            for key, value in (entry.get('metadata') or {}).items():
+                postings = self._postings.setdefault(key, {})
+                for text in set(metadata_values(key, value)):
+                    postings.setdefault(text, []).append(number)
+        self._bounds = np.array(bounds, dtype=np.int64).reshape(-1, 2)
+
+    def __len__(self) -> int:
+        return len(self._bounds)
+
+    def keys(self) -> List[str]:
+        return sorted(self._postings)
+
+    def runs(self, filter: Filter) -> np.ndarray:
+        """(start, end) row ranges matching the filter, in row order, with adjacent or overlapping ranges merged"""
+        selected = None
+        for key, values in filter:
+            postings = self._postings.get(key, {})
+            entries = set()
+            for value in values:
+                entries.update(postings.get(value, ()))
+            selected = entries if selected is None else selected & entries
+            if not selected:
+                break
+        if not selected:
+            return np.empty((0, 2), dtype=np.int64)
+        bounds = self._bounds[sorted(selected)]
+        bounds = bounds[np.argsort(bounds[:, 0], kind='stable')]
+        # A range that starts at or before the furthest end so far continues the run
+        reach = np.maximum.accumulate(bounds[:, 1])
+        starts = np.flatnonzero(np.concatenate(([True], bounds[1:, 0] > reach[:-1])))
+        ends = np.concatenate((starts[1:], [len(bounds)])) - 1
+        return np.stack([bounds[starts, 0], reach[ends]], axis=1)
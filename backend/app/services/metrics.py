@@ -0,0 +1,62 @@
+import threading
+from collections import defaultdict
+from typing import Any, Dict, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+def _key(name: str, labels: Dict[str, Any]) -> Tuple:
+    return (name,) + tuple(sorted((k, str(v)) for k, v in labels.items() if v is not None))
+
+
+def _format_key(key: Tuple) -> str:
+    name, labels = key[0], key[1:]
+    if not labels:
+        return name
+    return name + "{" + ",".join(f"{k}={v}" for k, v in labels) + "}"
+
+
+class Metrics:
+    """In-process counters and summaries, labelled Prometheus-style"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[Tuple, float] = defaultdict(float)
+        self._summaries: Dict[Tuple, Dict[str, float]] = {}
+        self._gauges: Dict[Tuple, float] = {}
+
+    def incr(self, name: str, value: float = 1, **labels):
+        """Add value to a counter"""
+        key = _key(name, labels)
+        with self._lock:
+            self._counters[key] += value
+
+    def observe(self, name: str, value: float, **labels):
+        """Record an observation (count, sum, min, max) for a summary"""
+        key = _key(name, labels)
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                self._summaries[key] = {'count': 1, 'sum': value, 'min': value, 'max': value}
+            else:
+                summary['count'] += 1
+                summary['sum'] += value
+                summary['min'] = min(summary['min'], value)
+                summary['max'] = max(summary['max'], value)
+
+    def gauge(self, name: str, value: float, **labels):
+        """Set a gauge to its current value"""
+        key = _key(name, labels)
+        with self._lock:
+            self._gauges[key] = value
+
+    def snapshot(self) -> Dict[str, Any]:
+        """Return a JSON-serialisable copy of all metrics"""
+        with self._lock:
+            counters = {_format_key(k): v for k, v in self._counters.items()}
+            gauges = {_format_key(k): v for k, v in self._gauges.items()}
+            summaries = {}
+            for key, summary in self._summaries.items():
+                summaries[_format_key(key)] = dict(summary, mean=summary['sum'] / summary['count'])
+        return {'counters': counters, 'gauges': gauges, 'summaries': summaries}
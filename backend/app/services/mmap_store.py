@@ -0,0 +1,356 @@
+import os
+import json
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import logging
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+from .metadata_filter import Filter, FilterIndex
+
+logger = logging.getLogger(__name__)
+
+# Subdirectory of the FAISS index directory holding the flat, mmap-able copy
+MMAP_DIRNAME = 'mmap'
+MANIFEST_FILE = 'manifest.json'
+VECTORS_FILE = 'vectors.npy'
+NORMS_FILE = 'norms.npy'
+CHUNKS_FILE = 'chunks.bin'
+OFFSETS_FILE = 'offsets.npy'
+# One line per indexed file: {"source", "start", "end", "metadata"}, its rows being start..end-1
+FILES_FILE = 'files.jsonl'
+
+# Rows converted to float32 at a time when searching a float16 matrix (small enough to stay in cache)
+SEARCH_BLOCK_ROWS = 4096
+
+# Queries searched per matrix product in a batch search; bounds the (chunks x queries) distance matrix
+SEARCH_QUERY_BATCH = 64
+
+# Row ranges of recent filters kept per store
+FILTER_CACHE_SIZE = 32
+
+# Chunk metadata that varies within a file, ignored when grouping rows of a store without files.jsonl
+PER_CHUNK_KEYS = ('page',)
+
+
+def write_mmap_store(path: str, vectors: np.ndarray, documents: List[Document], dtype: str = 'float32',
+                     model_name: Optional[str] = None):
+    """Write vectors as a flat .npy matrix plus an offsets-indexed chunk store.
+
+    Chunk i is the JSON record {"text", "metadata"} stored in
+    chunks.bin[offsets[i]:offsets[i + 1]], so a search decodes only its hits.
+    """
+    if dtype not in ('float32', 'float16'):
+        raise ValueError(f"Unsupported vector dtype: {dtype}")
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if len(vectors) != len(documents):
+        raise ValueError(f"{len(vectors)} vectors for {len(documents)} documents")
+    os.makedirs(path, exist_ok=True)
+
+    offsets = np.zeros(len(documents) + 1, dtype=np.int64)
+    with open(os.path.join(path, CHUNKS_FILE), 'wb') as f:
+        for i, doc in enumerate(documents):
+            record = json.dumps({'text': doc.page_content, 'metadata': doc.metadata or {}},
+                                ensure_ascii=False, default=str).encode('utf-8')
+            f.write(record)
+            offsets[i + 1] = offsets[i] + len(record)
+
+    stored = vectors.astype(dtype)
+    # Squared norms of the stored (possibly rounded) vectors, for L2 distances
+    norms = np.einsum('ij,ij->i', stored.astype(np.float32), stored.astype(np.float32))
+    np.save(os.path.join(path, VECTORS_FILE), stored)
+    np.save(os.path.join(path, NORMS_FILE), norms.astype(np.float32))
+    np.save(os.path.join(path, OFFSETS_FILE), offsets)
+
+    manifest = {
+        'count': int(len(documents)),
+        'dim': int(vectors.shape[1]) if vectors.ndim == 2 else 0,
+        'dtype': dtype,
+        'distance': 'l2',
+        'model_name': model_name,
+    }
+    # Written last: a store is only picked up once it is complete
+    with open(os.path.join(path, MANIFEST_FILE), 'w') as f:
+        json.dump(manifest, f)
+    logger.info(f"Wrote mmap vector store with {manifest['count']} chunks ({dtype}) to {path}")
+    return manifest
+
+
+class MmapStoreWriter:
+    """Append-only writer for the mmap layout, for indexes too large to hold in memory.
+
+    Vectors, chunk records and end offsets are appended to raw files as
+    batches arrive; finalize() converts them to the .npy files block by
+    block and writes the manifest. state() records the sizes written so
+    far, and a writer reopened with that state truncates anything written
+    after it, which is how an interrupted build resumes.
+    """
+
+    def __init__(self, path: str, dtype: str = 'float32', state: Optional[Dict[str, Any]] = None):
+        if dtype not in ('float32', 'float16'):
+            raise ValueError(f"Unsupported vector dtype: {dtype}")
+        self.path = path
+        self.dtype = np.dtype(dtype)
+        self.count = 0
+        self.dim = None
+        self.chunk_bytes = 0
+        os.makedirs(path, exist_ok=True)
+
+        if state:
+            self.count, self.dim, self.chunk_bytes = state['count'], state['dim'], state['chunk_bytes']
+        vector_bytes = self.count * (self.dim or 0) * self.dtype.itemsize
+        for name, size in (('vectors.raw', vector_bytes), (CHUNKS_FILE, self.chunk_bytes),
+                           ('offsets.raw', self.count * 8)):
+            with open(os.path.join(path, name), 'ab') as f:
+                f.truncate(size)
+
+    def append(self, vectors: np.ndarray, documents: List[Document]):
+        vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+        if len(vectors) != len(documents):
+            raise ValueError(f"{len(vectors)} vectors for {len(documents)} documents")
+        if not len(documents):
+            return
+        if self.dim is None:
+            self.dim = int(vectors.shape[1])
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Vector dimension {vectors.shape[1]} does not match {self.dim}")
+
+        ends = np.empty(len(documents), dtype=np.int64)
+        with open(os.path.join(self.path, CHUNKS_FILE), 'ab') as f:
+            for i, doc in enumerate(documents):
+                record = json.dumps({'text': doc.page_content, 'metadata': doc.metadata or {}},
+                                    ensure_ascii=False, default=str).encode('utf-8')
+                f.write(record)
+                self.chunk_bytes += len(record)
+                ends[i] = self.chunk_bytes
+        with open(os.path.join(self.path, 'vectors.raw'), 'ab') as f:
+            f.write(vectors.astype(self.dtype).tobytes())
+        with open(os.path.join(self.path, 'offsets.raw'), 'ab') as f:
+            f.write(ends.tobytes())
+        self.count += len(documents)
+
+    def state(self) -> Dict[str, Any]:
+        return {'count': self.count, 'dim': self.dim, 'chunk_bytes': self.chunk_bytes}
+
+    def finalize(self, model_name: Optional[str] = None) -> Dict[str, Any]:
+        """Write vectors.npy, norms.npy, offsets.npy and the manifest without loading the matrix"""
+        dim = self.dim or 0
+        raw = np.memmap(os.path.join(self.path, 'vectors.raw'), dtype=self.dtype, mode='r',
+                        shape=(self.count, dim)) if self.count and dim else np.zeros((0, dim), dtype=self.dtype)
+        vectors = np.lib.format.open_memmap(os.path.join(self.path, VECTORS_FILE), mode='w+',
+                                            dtype=self.dtype, shape=(self.count, dim))
+        norms = np.lib.format.open_memmap(os.path.join(self.path, NORMS_FILE), mode='w+',
+                                          dtype=np.float32, shape=(self.count,))
+        for start in range(0, self.count, SEARCH_BLOCK_ROWS):
+            block = np.asarray(raw[start:start + SEARCH_BLOCK_ROWS], dtype=np.float32)
+            vectors[start:start + len(block)] = raw[start:start + len(block)]
+            norms[start:start + len(block)] = np.einsum('ij,ij->i', block, block)
+        vectors.flush()
+        norms.flush()
+        del raw, vectors, norms
+
+        ends = np.fromfile(os.path.join(self.path, 'offsets.raw'), dtype=np.int64)
+        np.save(os.path.join(self.path, OFFSETS_FILE), np.concatenate([np.zeros(1, dtype=np.int64), ends]))
+        os.remove(os.path.join(self.path, 'vectors.raw'))
+        os.remove(os.path.join(self.path, 'offsets.raw'))
+
+        manifest = {
+            'count': int(self.count),
+            'dim': int(dim),
+            'dtype': self.dtype.name,
+            'distance': 'l2',
+            'model_name': model_name,
+        }
+        with open(os.path.join(self.path, MANIFEST_FILE), 'w') as f:
+            json.dump(manifest, f)
+        logger.info(f"Wrote mmap vector store with {self.count} chunks ({self.dtype.name}) to {self.path}")
+        return manifest
+
+
+def export_faiss(vector_store, path: str, dtype: str = 'float32', model_name: Optional[str] = None):
+    """Export a LangChain FAISS store (flat index) to the mmap layout"""
+    index = vector_store.index
+    vectors = index.reconstruct_n(0, index.ntotal)
+    documents = [vector_store.docstore.search(vector_store.index_to_docstore_id[i]) for i in range(index.ntotal)]
+    return write_mmap_store(path, vectors, documents, dtype=dtype, model_name=model_name)
+
+
+class MmapVectorStore(VectorStore):
+    """Read-only vector store over memory-mapped files written by write_mmap_store.
+
+    Opening it only maps the files: nothing is unpickled or copied. Every
+    process that maps the same files shares their pages through the OS
+    page cache, so N workers cost one copy of the index. Searching is a
+    brute-force L2 scan with numpy, equivalent to FAISS's flat index.
+
+    A search with a metadata filter scans only the rows of matching files,
+    found in a FilterIndex over files.jsonl (built on first use; stores
+    written without one are indexed from their chunk metadata instead).
+    """
+
+    def __init__(self, path: str, embedding: Embeddings):
+        self.path = path
+        self.embedding = embedding
+        with open(os.path.join(path, MANIFEST_FILE)) as f:
+            self.manifest = json.load(f)
+        self.vectors = np.load(os.path.join(path, VECTORS_FILE), mmap_mode='r')
+        self.norms = np.load(os.path.join(path, NORMS_FILE), mmap_mode='r')
+        self.offsets = np.load(os.path.join(path, OFFSETS_FILE), mmap_mode='r')
+        self.chunks = np.memmap(os.path.join(path, CHUNKS_FILE), dtype=np.uint8, mode='r') \
+            if self.offsets[-1] > 0 else np.zeros(0, dtype=np.uint8)
+        self._filter_index: Optional[FilterIndex] = None
+        self._filter_runs: 'OrderedDict[Filter, np.ndarray]' = OrderedDict()
+
+    @staticmethod
+    def exists(path: str) -> bool:
+        return os.path.exists(os.path.join(path, MANIFEST_FILE))
+
+    @property
+    def embeddings(self) -> Optional[Embeddings]:
+        return self.embedding
+
+    def __len__(self) -> int:
+        return int(self.manifest['count'])
+
+    def document(self, i: int) -> Document:
+        record = json.loads(bytes(self.chunks[self.offsets[i]:self.offsets[i + 1]]))
+        return Document(page_content=record['text'], metadata=record['metadata'])
+
+    def filter_index(self) -> FilterIndex:
+        if self._filter_index is None:
+            path = os.path.join(self.path, FILES_FILE)
+            if os.path.exists(path):
+                with open(path, encoding='utf-8') as f:
+                    self._filter_index = FilterIndex(json.loads(line) for line in f if line.strip())
+            else:
+                logger.info(f"{path} is missing; indexing filterable metadata from the chunks")
+                self._filter_index = FilterIndex(self._metadata_runs())
+        return self._filter_index
+
+    def _metadata_runs(self) -> Iterable[Dict[str, Any]]:
+        """Runs of consecutive rows with the same metadata (ignoring PER_CHUNK_KEYS), as FilterIndex entries"""
+        start, current = 0, None
+        for i in range(len(self)):
+            metadata = {key: value for key, value in self.document(i).metadata.items() if key not in PER_CHUNK_KEYS}
+            if metadata != current:
+                if i > start:
+                    yield {'start': start, 'end': i, 'metadata': current}
+                start, current = i, metadata
+        if len(self) > start:
+            yield {'start': start, 'end': len(self), 'metadata': current}
+
+    def filter_runs(self, filter: Filter) -> np.ndarray:
+        """(start, end) ranges of the rows whose file metadata matches the filter"""
+        runs = self._filter_runs.get(filter)
+        if runs is None:
+            runs = self._filter_runs[filter] = self.filter_index().runs(filter)
+            while len(self._filter_runs) > FILTER_CACHE_SIZE:
+                self._filter_runs.popitem(last=False)
+        return runs
+
+    def _distances(self, query: np.ndarray, runs: Optional[np.ndarray] = None) -> np.ndarray:
+        """Squared L2 distance from the query to every stored vector, or to the rows of the given (start, end)
+        ranges in order; a (dim, n) query gives one column per query"""
+        if runs is None:
+            runs = np.array([[0, len(self.vectors)]], dtype=np.int64)
+            norms = self.norms
+        else:
+            norms = np.concatenate([self.norms[start:end] for start, end in runs.tolist()])
+        dots = np.empty((len(norms),) + query.shape[1:], dtype=np.float32)
+        buffer = None
+        offset = 0
+        for start, end in runs.tolist():
+            if self.vectors.dtype == np.float32:
+                np.dot(self.vectors[start:end], query, out=dots[offset:offset + end - start])
+                offset += end - start
+                continue
+            # numpy has no fast float16 matmul; convert block by block into one reused buffer
+            if buffer is None:
+                buffer = np.empty((min(SEARCH_BLOCK_ROWS, len(norms)), self.vectors.shape[1]), dtype=np.float32)
+            for block_start in range(start, end, SEARCH_BLOCK_ROWS):
+                block = self.vectors[block_start:min(end, block_start + SEARCH_BLOCK_ROWS)]
+                converted = buffer[:len(block)]
+                np.copyto(converted, block)
+                np.dot(converted, query, out=dots[offset:offset + len(block)])
+                offset += len(block)
+        if query.ndim > 1:
+            norms = norms[:, None]
+        return norms - 2.0 * dots + np.einsum('i...,i...->...', query, query)
+
+    def _candidates(self, filter: Optional[Filter]) -> Tuple[Optional[np.ndarray], Optional[np.ndarray]]:
+        """The filter's row ranges and where each range starts among the distances, or (None, None) for all rows"""
+        if not filter:
+            return None, None
+        runs = self.filter_runs(filter)
+        return runs, np.cumsum(runs[:, 1] - runs[:, 0]) if len(runs) else np.zeros(0, dtype=np.int64)
+
+    @staticmethod
+    def _row(i: int, runs: Optional[np.ndarray], ends: Optional[np.ndarray]) -> int:
+        """Store row of the i-th distance"""
+        if runs is None:
+            return int(i)
+        run = int(np.searchsorted(ends, i, side='right'))
+        return int(runs[run, 0] + i - (ends[run] - (runs[run, 1] - runs[run, 0])))
+
+    def similarity_search_by_vector_with_score(self, embedding: List[float], k: int = 4,
+                                               filter: Optional[Filter] = None) -> List[Tuple[Document, float]]:
+        runs, ends = self._candidates(filter)
+        if len(self) == 0 or (runs is not None and not len(runs)):
+            return []
+        query = np.asarray(embedding, dtype=np.float32)
+        distances = self._distances(query, runs)
+        k = min(k, len(distances))
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top])]
+        return [(self.document(self._row(i, runs, ends)), float(distances[i])) for i in top]
+
+    def similarity_search_by_vectors_with_score(self, embeddings: List[List[float]], k: int = 4,
+                                                filter: Optional[Filter] = None) -> List[List[Tuple[Document, float]]]:
+        """Search many queries with one matrix product per SEARCH_QUERY_BATCH of them"""
+        runs, ends = self._candidates(filter)
+        if len(self) == 0 or not len(embeddings) or (runs is not None and not len(runs)):
+            return [[] for _ in embeddings]
+        queries = np.asarray(embeddings, dtype=np.float32)
+        k = min(k, len(self) if runs is None else int(ends[-1]))
+        results = []
+        for start in range(0, len(queries), SEARCH_QUERY_BATCH):
+            distances = self._distances(np.ascontiguousarray(queries[start:start + SEARCH_QUERY_BATCH].T), runs)
+            top = np.argpartition(distances, k - 1, axis=0)[:k]
+            for column in range(top.shape[1]):
+                rows = top[:, column]
+                rows = rows[np.argsort(distances[rows, column])]
+                results.append([(self.document(self._row(i, runs, ends)), float(distances[i, column]))
+                                for i in rows])
+        return results
+
+    def similarity_search_with_score_by_vector(self, embedding: List[float], k: int = 4,
+                                               filter: Optional[Filter] = None,
+                                               **kwargs: Any) -> List[Tuple[Document, float]]:
+        # Same name and result as FAISS, so either can back a LiveVectorStore
+        return self.similarity_search_by_vector_with_score(embedding, k, filter=filter)
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[Filter] = None,
+                                     **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_score(self.embedding.embed_query(query), k, filter=filter)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, filter: Optional[Filter] = None,
+                                    **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_by_vector_with_score(embedding, k, filter=filter)]
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[Filter] = None,
+                          **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k, filter=filter)]
+
+    def _select_relevance_score_fn(self):
+        return self._euclidean_relevance_score_fn
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[Dict]] = None, **kwargs: Any) -> List[str]:
+        raise NotImplementedError("MmapVectorStore is read-only; rebuild it with create_index.py")
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[Dict]] = None,
+                   **kwargs: Any) -> "MmapVectorStore":
+        raise NotImplementedError("Build the store with write_mmap_store() or export_faiss()")
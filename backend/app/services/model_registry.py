@@ -0,0 +1,165 @@
+import re
+import json
+import time
+import hashlib
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+import logging
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Ids of models that can't hold a chat (speech, video, image, embedding and moderation models)
+NON_CHAT_PATTERN = re.compile(
+    r"whisper|tts|speech|audio|transcri|realtime|video|image|dall-e|janus|embed|rerank|moderation|"
+    r"davinci|babbage|guard",
+    re.IGNORECASE
+)
+
+# Model list endpoints; all but Anthropic and Cohere use the OpenAI format
+MODEL_LIST_URLS = {
+    'openai': 'https://api.openai.com/v1/models',
+    'groq': 'https://api.groq.com/openai/v1/models',
+    'mistral': 'https://api.mistral.ai/v1/models',
+    'xai': 'https://api.x.ai/v1/models',
+    'deepseek': 'https://api.deepseek.com/models',
+    'alibaba': 'https://dashscope-intl.aliyuncs.com/compatible-mode/v1/models',
+    'anthropic': 'https://api.anthropic.com/v1/models?limit=1000',
+    'cohere': 'https://api.cohere.com/v1/models?endpoint=chat&page_size=1000',
+}
+
+
+def is_chat_model(model_id: str) -> bool:
+    return not NON_CHAT_PATTERN.search(model_id)
+
+
+def fetch_models(provider: str, api_key: str, url: str, timeout: float = 10.0) -> List[Dict[str, str]]:
+    """List a provider's chat models as [{'id', 'name'}] from its model list API"""
+    if provider == 'anthropic':
+        headers = {'x-api-key': api_key, 'anthropic-version': '2023-06-01'}
+    else:
+        headers = {'Authorization': f"Bearer {api_key}"}
+    response = requests.get(url, headers=headers, timeout=timeout)
+    response.raise_for_status()
+    payload = response.json()
+    models = []
+    if provider == 'cohere':
+        # Filtered to chat models by the endpoint=chat query
+        for model in payload.get('models', []):
+            models.append({'id': model['name'], 'name': model['name']})
+        return models
+    for model in payload.get('data', []):
+        capabilities = model.get('capabilities')
+        # Mistral says whether a model can chat
+        if isinstance(capabilities, dict) and capabilities.get('completion_chat') is False:
+            continue
+        models.append({'id': model['id'], 'name': model.get('display_name') or model.get('name') or model['id']})
+    return models
+
+
+class ModelRegistry:
+    """The model catalog served to clients and used to validate requested models.
+
+    Built from the static model list, deduplicated, limited to providers
+    with an API key and to models that can chat. With discovery enabled, a
+    background task lists each provider's models every ttl seconds and
+    adds the chat models missing from the static list; a provider whose
+    listing fails keeps what it had. Each rebuild serialises the
+    catalog once and hashes it into an ETag, so requests only compare
+    strings, and model lookups are set membership tests.
+    """
+
+    def __init__(self, static_models: Dict[str, List[Dict[str, Any]]], providers: Iterable[str],
+                 api_keys: Optional[Dict[str, str]] = None, urls: Optional[Dict[str, str]] = None,
+                 extra: Optional[Dict[str, List[Dict[str, Any]]]] = None, ttl: float = 3600,
+                 timeout: float = 10.0, metrics=None):
+        self.static_models = static_models
+        self.providers = set(providers)
+        self.api_keys = api_keys or {}
+        self.urls = dict(MODEL_LIST_URLS, **(urls or {}))
+        self.extra = extra or {}
+        self.ttl = ttl
+        self.timeout = timeout
+        self.metrics = metrics
+        self.refreshed_at: Optional[float] = None
+        self._discovered: Dict[str, List[Dict[str, str]]] = {}
+        self._stop = threading.Event()
+        self._rebuild()
+
+    def _provider_models(self, provider: str) -> List[Dict[str, Any]]:
+        # Static entries stay (aliases such as claude-3-5-haiku-latest aren't listed) and keep their curated names
+        entries = list(self.static_models.get(provider, []))
+        entries += [dict(model, description='') for model in self._discovered.get(provider, [])]
+        seen: Set[str] = set()
+        models = []
+        for model in entries:
+            if model['id'] in seen or not is_chat_model(model['id']):
+                continue
+            seen.add(model['id'])
+            models.append(model)
+        return models
+
+    def _rebuild(self):
+        catalog = dict(self.extra)
+        for provider in self.static_models:
+            if provider in self.providers:
+                models = self._provider_models(provider)
+                if models:
+                    catalog[provider] = models
+        body = json.dumps(catalog, sort_keys=True, separators=(',', ':')).encode()
+        ids = {provider: {model['id'] for model in models} for provider, models in catalog.items()}
+        etag = hashlib.sha1(body).hexdigest()[:16]
+        # One assignment, so readers never see a catalog and an ETag from different builds
+        self._state: Tuple[Dict[str, Any], Dict[str, Set[str]], bytes, str] = (catalog, ids, body, etag)
+
+    def models(self) -> Dict[str, List[Dict[str, Any]]]:
+        return self._state[0]
+
+    def catalog(self) -> Tuple[bytes, str]:
+        """The serialised catalog and its ETag"""
+        _, _, body, etag = self._state
+        return body, etag
+
+    def has_provider(self, provider: str) -> bool:
+        return provider in self._state[1]
+
+    def has_model(self, provider: str, model_id: str) -> bool:
+        return model_id in self._state[1].get(provider, ())
+
+    def refresh(self) -> Dict[str, int]:
+        """List every configured provider's models now; returns the number of chat models found per provider"""
+        found = {}
+        for provider in sorted(self.providers):
+            url, api_key = self.urls.get(provider), self.api_keys.get(provider)
+            if not url or not api_key:
+                continue
+            try:
+                listed = fetch_models(provider, api_key, url, self.timeout)
+            except Exception as e:
+                logger.warning(f"Could not list {provider} models: {str(e)}")
+                if self.metrics:
+                    self.metrics.incr('model_discovery_errors', provider=provider)
+                continue
+            self._discovered[provider] = [model for model in listed if is_chat_model(model['id'])]
+            found[provider] = len(self._discovered[provider])
+        previous = self._state[3]
+        self._rebuild()
+        self.refreshed_at = time.time()
+        if self._state[3] != previous:
+            logger.info(f"Model catalog changed: {found}")
+        return found
+
+    def start(self):
+        """Refresh in a daemon OS thread, so the blocking listing requests and waits never hold up the event loop"""
+        threading.Thread(target=self.run, name='model-discovery', daemon=True).start()
+        return self
+
+    def run(self):
+        """Refresh every ttl seconds until stop()"""
+        while not self._stop.is_set():
+            self.refresh()
+            self._stop.wait(self.ttl)
+
+    def stop(self):
+        self._stop.set()
@@ -94,4 +94,16 @@ DEFAULT_PERSONAS = [
         "description": "Create your own custom system message",
         "system_message": "You are a customizable AI assistant. Your behavior and responses will be guided by the custom system message provided by the user."
     }
-] 
\ No newline at end of file
+] 
+PERSONAS_BY_ID = {persona["id"]: persona for persona in DEFAULT_PERSONAS}
+
+
+def get_system_message(persona_id=None, custom_message=None):
+    """Return the system message for a persona ID, using custom_message for the 'custom' persona.
+
+    Unknown IDs fall back to the default persona so the system prefix stays stable.
+    """
+    if persona_id == "custom" and custom_message:
+        return custom_message
+    persona = PERSONAS_BY_ID.get(persona_id) or PERSONAS_BY_ID["default"]
+    return persona["system_message"]
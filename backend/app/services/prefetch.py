@@ -0,0 +1,186 @@
+import time
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Searches each message mode runs (see build_context)
+MODE_SOURCES = {
+    'rag': ('documents',),
+    'web': ('web',),
+    'hybrid': ('documents', 'web'),
+}
+
+# Drafts remembered per socket as prefetched
+WARMED_PER_SOCKET = 8
+
+
+def normalize_query(text: str) -> str:
+    return (text or '').strip()
+
+
+class Prefetcher:
+    """Speculative document and web search for the query a user is still typing.
+
+    Clients send 'typing' events with their draft. Once a draft has been
+    unchanged for debounce seconds it is searched exactly as the final
+    message would be, which fills the web result, fetched page and
+    document result caches. Each socket runs at most one speculative
+    search at a time and at most budget of them per window seconds;
+    drafts beyond that are dropped. claim() is called with the message
+    that was finally sent and records whether its searches were prefetched.
+    A draft is searched in the collection and with the metadata filter it
+    was typed with, and only counts as prefetched for a message sent with
+    the same ones.
+
+    Under eventlet, pass socketio.start_background_task, socketio.sleep and
+    tpool.execute (as offload) so the debounce waits and the blocking
+    searches don't hold up every other request.
+    """
+
+    def __init__(self, rag_service, debounce: float = 0.4, budget: int = 6, window: float = 60.0,
+                 min_chars: int = 12, metrics=None, start_task: Optional[Callable] = None,
+                 sleep: Optional[Callable[[float], None]] = None, offload: Optional[Callable] = None):
+        self.rag_service = rag_service
+        self.debounce = debounce
+        self.budget = budget
+        self.window = window
+        self.min_chars = min_chars
+        self.metrics = metrics
+        self.start_task = start_task or (lambda fn, *args: threading.Thread(target=fn, args=args, daemon=True).start())
+        self.sleep = sleep or time.sleep
+        self.offload = offload or (lambda fn, *args: fn(*args))
+        self._lock = threading.Lock()
+        self._sockets: Dict[str, Dict[str, Any]] = {}
+
+    def _incr(self, name: str, **labels):
+        if self.metrics:
+            self.metrics.incr(name, **labels)
+
+    def _state(self, socket_id: str) -> Dict[str, Any]:
+        state = self._sockets.get(socket_id)
+        if state is None:
+            state = self._sockets[socket_id] = {
+                'draft': None, 'updated': 0.0, 'pending': False, 'inflight': None, 'spent': deque(),
+                'warmed': OrderedDict()
+            }
+        return state
+
+    def _scope(self, collection: Any, filter: Any) -> Optional[Tuple[Optional[str], Any]]:
+        """The validated (collection, filter), or None when the message would be refused"""
+        try:
+            return self.rag_service.scope(collection, filter)
+        except ValueError:
+            return None
+
+    def typing(self, socket_id: str, draft: str, mode: str, collection: Any = None, filter: Any = None) -> bool:
+        """Note the latest draft; returns False when it is not worth prefetching"""
+        sources = MODE_SOURCES.get(mode)
+        query = normalize_query(draft)
+        if not sources or len(query) < self.min_chars:
+            return False
+        scope = self._scope(collection, filter)
+        if scope is None:
+            return False
+        with self._lock:
+            state = self._state(socket_id)
+            state['draft'] = (query, sources, scope)
+            state['updated'] = time.monotonic()
+            if state['pending']:
+                return True
+            state['pending'] = True
+        self.start_task(self._run, socket_id)
+        return True
+
+    def _run(self, socket_id: str):
+        """Wait for the draft to settle, search it, and repeat while the user keeps typing"""
+        while True:
+            skip = None
+            with self._lock:
+                state = self._sockets.get(socket_id)
+                if state is None:
+                    return
+                if state['draft'] is None:
+                    state['pending'] = False
+                    return
+                wait = state['updated'] + self.debounce - time.monotonic()
+                if wait <= 0:
+                    query, sources, scope = state['draft']
+                    state['draft'] = None
+                    skip = self._admit(state, (query, scope), sources)
+                    if not skip:
+                        state['inflight'] = (query, scope)
+            if wait > 0:
+                self.sleep(wait)
+                continue
+            if skip:
+                self._incr('prefetch_skipped', reason=skip)
+                continue
+            self.offload(self._warm, query, sources, scope)
+            with self._lock:
+                state = self._sockets.get(socket_id)
+                if state is None:
+                    return
+                state['inflight'] = None
+                warmed = state['warmed']
+                warmed[(query, scope)] = sources
+                warmed.move_to_end((query, scope))
+                while len(warmed) > WARMED_PER_SOCKET:
+                    warmed.popitem(last=False)
+
+    def _admit(self, state: Dict[str, Any], key: Tuple[str, Any], sources: Tuple[str, ...]) -> Optional[str]:
+        """Charge a search of key, a (query, scope) pair, to the socket's budget, or return why it is skipped"""
+        if set(sources) <= set(state['warmed'].get(key, ())):
+            return 'duplicate'
+        now = time.monotonic()
+        while state['spent'] and state['spent'][0] < now - self.window:
+            state['spent'].popleft()
+        if len(state['spent']) >= self.budget:
+            return 'budget'
+        state['spent'].append(now)
+        return None
+
+    def _warm(self, query: str, sources: Tuple[str, ...], scope: Tuple[Optional[str], Any]):
+        searches = {'documents': lambda text: self.rag_service.document_passages(text, *scope),
+                    'web': self.rag_service.web_passages}
+        for source in sources:
+            started = time.perf_counter()
+            try:
+                searches[source](query)
+            except Exception as e:
+                # Includes RetrievalBusyError when the retrieval pool is saturated
+                logger.debug(f"Prefetch of {source} for {query!r} failed: {str(e)}")
+                self._incr('prefetch_errors', source=source)
+                continue
+            self._incr('prefetch_runs', source=source)
+            if self.metrics:
+                self.metrics.observe('prefetch_ms', (time.perf_counter() - started) * 1000, source=source)
+
+    def claim(self, socket_id: str, content: str, mode: str, collection: Any = None,
+              filter: Any = None) -> Optional[str]:
+        """Whether the sent message's searches were prefetched: 'hit', 'inflight' (still running) or 'miss'.
+        
+        Returns None if this socket never sent a draft.
+        """
+        sources = MODE_SOURCES.get(mode)
+        key = (normalize_query(content), self._scope(collection, filter))
+        with self._lock:
+            state = self._sockets.get(socket_id)
+            if state is None or not sources:
+                return None
+            # The message is out; a draft still waiting for its debounce is no longer needed
+            state['draft'] = None
+            if set(sources) <= set(state['warmed'].get(key, ())):
+                result = 'hit'
+            elif state['inflight'] == key:
+                result = 'inflight'
+            else:
+                result = 'miss'
+        self._incr('prefetch_queries', result=result)
+        return result
+
+    def forget(self, socket_id: str):
+        with self._lock:
+            self._sockets.pop(socket_id, None)
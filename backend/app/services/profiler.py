@@ -0,0 +1,255 @@
+import os
+import sys
+import gc
+import hmac
+import signal
+import weakref
+import logging
+import importlib
+import datetime
+from collections import Counter
+from logging.handlers import RotatingFileHandler
+from typing import Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+def _original(module_name: str):
+    """Return the unpatched stdlib module when eventlet has monkey-patched it.
+
+    The sampler must run on a real OS thread; a green thread would only get
+    scheduled when the CPU-bound code we want to observe yields.
+    """
+    try:
+        from eventlet import patcher
+        if patcher.is_monkey_patched(module_name):
+            return patcher.original(module_name)
+    except ImportError:
+        pass
+    return importlib.import_module(module_name)
+
+
+_threading = _original('threading')
+_time = _original('time')
+
+
+def _frame_label(frame) -> str:
+    """Format a frame as 'function (file:line)' without collapsed-stack separators"""
+    code = frame.f_code
+    filename = os.path.basename(code.co_filename)
+    return f"{code.co_name} ({filename}:{frame.f_lineno})".replace(';', ':')
+
+
+def _stack(frame) -> List[str]:
+    """Return the stack for a frame, root first"""
+    labels = []
+    while frame is not None:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    labels.reverse()
+    return labels
+
+
+class SamplingProfiler:
+    """Low-overhead sampling profiler covering all OS threads and suspended greenlets"""
+
+    def __init__(self, interval: float = 0.005, include_greenlets: bool = True,
+                 greenlet_refresh: float = 1.0):
+        self.interval = interval
+        self.include_greenlets = include_greenlets
+        self.greenlet_refresh = greenlet_refresh
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._greenlets = weakref.WeakSet()
+        self._greenlets_refreshed = 0.0
+        self._stop = _threading.Event()
+        self._thread = None
+
+    def _refresh_greenlets(self):
+        """Rebuild the set of live greenlets (gc walk is expensive, so it is rate limited)"""
+        greenlet_module = sys.modules.get('greenlet')
+        if greenlet_module is None:
+            return
+        now = _time.monotonic()
+        if now - self._greenlets_refreshed < self.greenlet_refresh:
+            return
+        self._greenlets_refreshed = now
+        self._greenlets = weakref.WeakSet(
+            obj for obj in gc.get_objects() if isinstance(obj, greenlet_module.greenlet)
+        )
+
+    def sample_once(self):
+        """Record one stack per thread and per suspended greenlet"""
+        own_id = _threading.get_ident()
+        names = {t.ident: t.name for t in _threading.enumerate()}
+
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            root = f"thread:{names.get(thread_id, thread_id)}"
+            self.stacks[";".join([root] + _stack(frame))] += 1
+
+        if self.include_greenlets:
+            self._refresh_greenlets()
+            for glet in list(self._greenlets):
+                # gr_frame is only set while the greenlet is suspended; the running
+                # one is already covered by its thread's current frame
+                frame = getattr(glet, 'gr_frame', None)
+                if frame is not None:
+                    self.stacks[";".join(["greenlet"] + _stack(frame))] += 1
+
+        self.samples += 1
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = _time.perf_counter()
+            try:
+                self.sample_once()
+            except Exception as e:
+                logger.debug(f"Profiler sample failed: {str(e)}")
+            _time.sleep(max(0.0, self.interval - (_time.perf_counter() - started)))
+
+    def start(self):
+        """Start sampling on a dedicated OS thread"""
+        self._stop.clear()
+        self._thread = _threading.Thread(target=self._run, name='sampling-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop sampling and wait for the sampler thread"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+    def collapsed(self) -> str:
+        """Return the samples in Brendan Gregg's collapsed-stack format"""
+        return "".join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+class ContinuousProfiler:
+    """Low-rate sampler that logs the hottest functions of selected modules to a rolling log"""
+
+    def __init__(self, modules: List[str], hz: float = 1.0, window: float = 60.0,
+                 log_path: str = 'profiler_hot.log', top_n: int = 20):
+        self.modules = tuple(modules)
+        self.interval = 1.0 / hz
+        self.window = window
+        self.top_n = top_n
+        self.counts: Counter = Counter()
+        self._stop = _threading.Event()
+        self._thread = None
+
+        self.log = logging.getLogger('app.profiler.hot')
+        self.log.propagate = False
+        if not self.log.handlers:
+            handler = RotatingFileHandler(log_path, maxBytes=5 * 1024 * 1024, backupCount=3)
+            handler.setFormatter(logging.Formatter('%(asctime)s %(message)s'))
+            self.log.addHandler(handler)
+        self.log.setLevel(logging.INFO)
+
+    def _hot_frame(self, frame) -> Optional[str]:
+        """Return the innermost frame belonging to a watched module"""
+        while frame is not None:
+            filename = frame.f_code.co_filename
+            if filename.endswith(self.modules):
+                return f"{os.path.basename(filename)}:{frame.f_code.co_name}"
+            frame = frame.f_back
+        return None
+
+    def _flush(self):
+        if not self.counts:
+            return
+        total = sum(self.counts.values())
+        top = ", ".join(f"{name}={count}" for name, count in self.counts.most_common(self.top_n))
+        self.log.info(f"pid={os.getpid()} samples={total} {top}")
+        self.counts.clear()
+
+    def _run(self):
+        own_id = _threading.get_ident()
+        window_started = _time.monotonic()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id:
+                    continue
+                hot = self._hot_frame(frame)
+                if hot:
+                    self.counts[hot] += 1
+            if _time.monotonic() - window_started >= self.window:
+                self._flush()
+                window_started = _time.monotonic()
+        self._flush()
+
+    def start(self):
+        self._thread = _threading.Thread(target=self._run, name='continuous-profiler', daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+
+
+class ProfilerService:
+    """Opt-in profiling surface: on-demand profiles, SIGUSR2 dumps and continuous sampling"""
+
+    def __init__(self, config: Dict):
+        self.admin_token = config.get('PROFILER_ADMIN_TOKEN', '')
+        self.max_seconds = float(config.get('PROFILER_MAX_SECONDS', 60))
+        self.default_hz = float(config.get('PROFILER_DEFAULT_HZ', 200))
+        self.output_dir = config.get('PROFILER_OUTPUT_DIR', 'profiles')
+        self.signal_seconds = float(config.get('PROFILER_SIGNAL_SECONDS', 10))
+        self.continuous = None
+
+        continuous_hz = float(config.get('PROFILER_CONTINUOUS_HZ', 0) or 0)
+        if continuous_hz > 0:
+            self.continuous = ContinuousProfiler(
+                modules=['rag_service.py', 'llm_service.py'],
+                hz=continuous_hz,
+                window=float(config.get('PROFILER_CONTINUOUS_WINDOW', 60)),
+                log_path=config.get('PROFILER_LOG_PATH', 'profiler_hot.log'),
+            ).start()
+
+    def check_token(self, token: Optional[str]) -> bool:
+        """Return True if the admin token matches (profiling is refused without a configured token)"""
+        return bool(self.admin_token) and hmac.compare_digest(self.admin_token, token or '')
+
+    def start_profile(self, hz: Optional[float] = None) -> SamplingProfiler:
+        """Start a sampling profiler at the requested rate"""
+        hz = min(max(float(hz or self.default_hz), 1.0), 1000.0)
+        return SamplingProfiler(interval=1.0 / hz).start()
+
+    def clamp_seconds(self, seconds) -> float:
+        return min(max(float(seconds), 0.1), self.max_seconds)
+
+    def _dump_in_background(self):
+        """Profile for signal_seconds and write a collapsed-stack file"""
+        profiler = self.start_profile()
+        _time.sleep(self.signal_seconds)
+        profiler.stop()
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+        path = os.path.join(self.output_dir, f"profile-{os.getpid()}-{stamp}.folded")
+        with open(path, 'w') as f:
+            f.write(profiler.collapsed())
+        logger.info(f"Wrote profile with {profiler.samples} samples to {path}")
+
+    def install_signal_handler(self, signum=getattr(signal, 'SIGUSR2', None)):
+        """Dump a profile when the process receives SIGUSR2"""
+        if signum is None:
+            return False
+
+        def handler(received, frame):
+            _threading.Thread(target=self._dump_in_background, name='profile-dump', daemon=True).start()
+
+        try:
+            signal.signal(signum, handler)
+            return True
+        except ValueError:
+            # signal handlers can only be installed from the main thread
+            logger.warning("Profiler signal handler not installed: not running in the main thread")
+            return False
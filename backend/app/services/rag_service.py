@@ -1,8 +1,10 @@
 import os
+import time
+import threading
 import requests
 import concurrent.futures
+from collections import OrderedDict
 from functools import lru_cache
-from bs4 import BeautifulSoup
 from langchain_community.vectorstores import FAISS
 from langchain_huggingface import HuggingFaceEmbeddings
 from langchain.chains import RetrievalQA
@@ -10,21 +12,57 @@ from langchain_community.utilities import DuckDuckGoSearchAPIWrapper
 from langchain.agents import initialize_agent, Tool
 from langchain.agents import AgentType
 from flask import current_app, has_app_context
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple
 import logging
 
+from .collection_store import DEFAULT_COLLECTION, CollectionManager, open_base_store
+from .live_store import LIVE_DIRNAME, LiveVectorStore
+from .metadata_filter import Filter, normalize_filter
+from .reranker import Reranker
+from .context_compression import ContextCompressor, format_passages, fuse_rankings
+from .retrieval_pool import RetrievalBusyError, extract_text
+
 logger = logging.getLogger(__name__)
 
+# Fetched web pages kept in memory
+PAGE_CACHE_SIZE = 256
+
+# What the model is told when a search contributes nothing, by source and status
+SEARCH_NOTES = {
+    'documents': {
+        'empty': "No relevant documents found in the knowledge base.",
+        'busy': "Document search is busy; answering without the knowledge base.",
+        'timeout': "Document search timed out; answering without the knowledge base.",
+        'error': "Error searching documents: {error}",
+    },
+    'web': {
+        'empty': "No relevant web results found.",
+        'timeout': "Web search timed out; answering without web results.",
+        'error': "Error performing web search: {error}",
+    },
+}
+
 class RAGService:
     """Service for Retrieval Augmented Generation"""
     
     def __init__(self):
         self.embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+        self.k = current_app.config.get('RETRIEVAL_K', 5) if has_app_context() else 5  # Passages per document search
         self._init_vector_store()
+        self._init_reranker()
+        self._init_compressor()
         self.search = DuckDuckGoSearchAPIWrapper()
         self._document_cache = {}  # Cache for document retrieval
+        # (generation, live store version) per collection that the cache reflects
+        self._document_cache_versions = {DEFAULT_COLLECTION: (0, self.vector_store.version)}
         self._web_search_cache = {}  # Cache for web search results
+        self._page_cache = OrderedDict()  # Extracted text of fetched result pages, most recent last
+        self._page_cache_lock = threading.Lock()  # Pages are fetched from several threads at once
         self.max_workers = 4  # Number of parallel workers for web search
+        # Shared deadline for document and web search when both run (hybrid mode)
+        self.search_timeout = current_app.config.get('HYBRID_SEARCH_TIMEOUT', 4.0) if has_app_context() else 4.0
+        self.retrieval = None  # RetrievalClient: runs embedding, FAISS search and HTML parsing out of process
+        self.metrics = None  # Set by create_app to record rerank latency
     
     def _init_vector_store(self):
         """Initialize the vector store"""
@@ -32,48 +70,117 @@ class RAGService:
             # Get vector store path, safely handling if we're outside app context
             if has_app_context():
                 vector_store_path = current_app.config.get('VECTOR_STORE_PATH', 'faiss_index')
+                use_mmap = current_app.config.get('VECTOR_STORE_MMAP', True)
+                refresh_interval = current_app.config.get('VECTOR_STORE_REFRESH_INTERVAL', 2.0)
+                max_loaded = current_app.config.get('COLLECTIONS_MAX_LOADED', 8)
             else:
                 vector_store_path = 'faiss_index'
-                
-            self.vector_store = FAISS.load_local(vector_store_path, self.embeddings, allow_dangerous_deserialization=True)
-            self.retriever = self.vector_store.as_retriever(search_kwargs={"k": 5})
+                use_mmap = True
+                refresh_interval = 2.0
+                max_loaded = 8
+            
+            base = open_base_store(vector_store_path, self.embeddings, use_mmap)
         except Exception as e:
             # If index doesn't exist yet, create an empty one
             logger.warning(f"Failed to load vector store: {str(e)}. Creating empty store.")
-            self.vector_store = FAISS.from_texts(["Initialize empty vector store"], self.embeddings)
-            self.retriever = self.vector_store.as_retriever(search_kwargs={"k": 5})
+            base = FAISS.from_texts(["Initialize empty vector store"], self.embeddings)
+        
+        # Documents uploaded at runtime are layered on top of the offline index
+        self.vector_store = LiveVectorStore(base, os.path.join(vector_store_path, LIVE_DIRNAME), self.embeddings,
+                                            refresh_interval=refresh_interval)
+        self.retriever = self.vector_store.as_retriever(search_kwargs={"k": self.k})
+        # Named collections other than the default are opened on first search
+        self.collections = CollectionManager(vector_store_path, self.embeddings, self.vector_store, use_mmap=use_mmap,
+                                             refresh_interval=refresh_interval, max_loaded=max_loaded)
     
-    def _fetch_url_content(self, url: str, max_chars: int = 800) -> str:
-        """Fetch content from a URL with error handling and timeout"""
+    def _init_reranker(self):
+        """Load the cross-encoder when reranking is enabled"""
+        self.reranker = None
+        self.rerank_candidates = 0
+        if not has_app_context() or not current_app.config.get('RERANK_ENABLED'):
+            return
+        try:
+            self.reranker = Reranker(
+                current_app.config['RERANK_MODEL'],
+                backend=current_app.config['RERANK_BACKEND'],
+                batch_size=current_app.config['RERANK_BATCH_SIZE'],
+                budget_ms=current_app.config['RERANK_BUDGET_MS']
+            )
+            self.rerank_candidates = current_app.config['RERANK_CANDIDATES']
+        except Exception as e:
+            logger.error(f"Failed to load reranker: {str(e)}. Using vector search order.")
+    
+    def _init_compressor(self):
+        """Set up context compression (deduplication, sentence selection, token budget)"""
+        self.compressor = None
+        config = current_app.config if has_app_context() else {}
+        if config.get('CONTEXT_COMPRESSION', True):
+            self.compressor = ContextCompressor(
+                max_tokens=config.get('CONTEXT_MAX_TOKENS', 1500),
+                budget_fraction=config.get('CONTEXT_BUDGET_FRACTION', 0.25),
+                duplicate_threshold=config.get('CONTEXT_DUPLICATE_THRESHOLD', 0.8)
+            )
+    
+    def scope(self, collection: Any = None, filter: Any = None) -> Tuple[Optional[str], Optional[Filter]]:
+        """Validate a search's collection and metadata filter from a client; raises ValueError"""
+        if collection in (None, '', DEFAULT_COLLECTION):
+            collection = None
+        elif not isinstance(collection, str) or not self.collections.exists(collection):
+            raise ValueError(f"Unknown collection: {collection}")
+        return collection, normalize_filter(filter)
+    
+    def retrieve(self, query: str, k: int = 5, collection: Optional[str] = None,
+                 filter: Optional[Filter] = None) -> Tuple[List[Tuple[str, Dict[str, Any]]], Optional[Dict[str, Any]]]:
+        """Vector search, reranking the top candidates when a reranker is loaded; returns (hits, rerank report)"""
+        store = self.collections.get(collection)
+        docs = store.similarity_search(query, k=max(k, self.rerank_candidates), filter=filter)
+        hits = [(doc.page_content, getattr(doc, 'metadata', {}) or {}) for doc in docs]
+        if self.reranker is None:
+            return hits[:k], None
+        return self.reranker.rerank(query, hits, k)
+    
+    def clear_document_cache(self):
+        """Forget cached document search results after the knowledge base changes"""
+        self._document_cache.clear()
+        self._cached_document_passages.cache_clear()
+    
+    def _fetch_url_content(self, url: str, max_chars: int = 800) -> Optional[str]:
+        """Fetch the visible text of a URL, or None if it can't be fetched"""
+        # Differently worded queries often return the same pages
+        with self._page_cache_lock:
+            cached = self._page_cache.get((url, max_chars))
+        if cached is not None:
+            return cached
         try:
             response = requests.get(url, timeout=3)
             if response.status_code != 200:
-                return f"Failed to fetch content from {url} (Status: {response.status_code})"
+                logger.warning(f"Failed to fetch content from {url} (Status: {response.status_code})")
+                return None
             
-            soup = BeautifulSoup(response.text, 'html.parser')
-            
-            # Extract text and clean it up
-            text = soup.get_text(separator=' ', strip=True)
-            # Limit to max_chars to prevent overwhelming the LLM
-            return f"Source: {url}\n{text[:max_chars]}..."
+            # Extract text and clean it up, limited to max_chars to prevent overwhelming the LLM
+            if self.retrieval is not None:
+                text = self.retrieval.extract_text(response.text, max_chars)
+            else:
+                text = extract_text(response.text, max_chars)
+            with self._page_cache_lock:
+                self._page_cache[(url, max_chars)] = f"{text}..."
+                while len(self._page_cache) > PAGE_CACHE_SIZE:
+                    self._page_cache.popitem(last=False)
+            return f"{text}..."
         except Exception as e:
             logger.warning(f"Error fetching {url}: {str(e)}")
-            return f"Error fetching {url}: {str(e)}"
+            return None
     
-    @lru_cache(maxsize=100)
-    def web_search(self, query: str, max_results: int = 3) -> str:
-        """Perform a web search and retrieve content using parallel processing"""
+    def web_passages(self, query: str, max_results: int = 3) -> List[Tuple[str, str]]:
+        """Search the web and fetch the result pages in parallel; returns (url, text) passages"""
         # Check cache first
         cache_key = f"{query}_{max_results}"
         if cache_key in self._web_search_cache:
             return self._web_search_cache[cache_key]
         
-        try:
-            results = self.search.results(query, max_results=max_results)
-            
-            if not results:
-                return "No relevant web results found."
-            
+        results = self.search.results(query, max_results=max_results)
+        passages = []
+        if results:
             # Use thread pool to fetch URL contents in parallel
             with concurrent.futures.ThreadPoolExecutor(max_workers=self.max_workers) as executor:
                 # Submit all URL fetch tasks
@@ -83,51 +190,192 @@ class RAGService:
                 }
                 
                 # Collect results as they complete
-                contents = []
                 for future in concurrent.futures.as_completed(future_to_url):
-                    if future.result() and "Error fetching" not in future.result():
-                        contents.append(future.result())
-            
-            result_text = "\n\n".join(contents) if contents else "No relevant web results found."
-            
-            # Cache the result
-            self._web_search_cache[cache_key] = result_text
-            
-            return result_text
+                    if future.result():
+                        passages.append((future_to_url[future], future.result()))
+        
+        # Cache the result
+        self._web_search_cache[cache_key] = passages
+        return passages
+    
+    @lru_cache(maxsize=100)
+    def web_search(self, query: str, max_results: int = 3) -> str:
+        """Perform a web search and retrieve content using parallel processing"""
+        try:
+            passages = self.web_passages(query, max_results)
+            return format_passages(passages) if passages else "No relevant web results found."
         except Exception as e:
             logger.error(f"Error in web search: {str(e)}")
             return f"Error performing web search: {str(e)}"
     
+    def _refresh_collection(self, collection: Optional[str]):
+        """Open the collection and drop cached results it has outdated"""
+        store = self.collections.get(collection)
+        # Uploads and deletions (possibly in another process) invalidate cached results, as does reopening
+        store.refresh()
+        name = collection or DEFAULT_COLLECTION
+        version = (self.collections.generation(collection), store.version)
+        previous = self._document_cache_versions.get(name)
+        if previous != version:
+            if previous is not None:
+                self.clear_document_cache()
+            self._document_cache_versions[name] = version
+        return store
+    
+    def document_passages(self, query: str, collection: Optional[str] = None,
+                          filter: Optional[Filter] = None) -> List[Tuple[str, str]]:
+        """Search documents and return (source, content) passages with caching.
+        
+        collection (None for the default) and filter (from scope()) narrow the search.
+        """
+        self._refresh_collection(collection)
+        return list(self._cached_document_passages(query, collection, filter))
+    
     @lru_cache(maxsize=50)
-    def document_search(self, query: str) -> str:
-        """Search documents and return relevant content with caching"""
+    def _cached_document_passages(self, query: str, collection: Optional[str] = None,
+                                  filter: Optional[Filter] = None) -> Tuple[Tuple[str, str], ...]:
         # Check cache first
-        if query in self._document_cache:
-            return self._document_cache[query]
+        key = (query, collection, filter)
+        if key in self._document_cache:
+            return self._document_cache[key]
+        
+        # RetrievalBusyError propagates uncached: the same query should succeed once the pool drains
+        if self.retrieval is not None:
+            hits, rerank = self.retrieval.search_documents(query, k=self.k, collection=collection, filter=filter)
+        else:
+            hits, rerank = self.retrieve(query, k=self.k, collection=collection, filter=filter)
+        if rerank and self.metrics:
+            self.metrics.observe('rerank_ms', rerank['ms'])
+            self.metrics.incr('rerank_queries', fallback=rerank['fallback'])
+        
+        # Keep source information with each passage
+        passages = tuple((metadata.get('source', 'Unknown source'), content) for content, metadata in hits)
+        
+        # Cache the result
+        self._document_cache[key] = passages
+        return passages
+    
+    def document_passages_batch(self, queries: List[str], k: Optional[int] = None, collection: Optional[str] = None,
+                                filter: Optional[Filter] = None) -> List[List[Tuple[str, str]]]:
+        """document_passages for many queries: one embedding call and one vectorised index search.
         
+        Runs in this process (not the retrieval pool) and bypasses the per-query caches.
+        """
+        store = self.collections.get(collection)
+        store.refresh()
+        if not queries:
+            return []
+        vectors = self.embeddings.embed_documents(list(queries))
+        k = k or self.k
+        candidates = max(k, self.rerank_candidates)
+        results = []
+        for query, docs in zip(queries, store.similarity_search_by_vectors_with_score(vectors, candidates,
+                                                                                        filter=filter)):
+            hits = [(doc.page_content, getattr(doc, 'metadata', {}) or {}) for doc, _ in docs]
+            if self.reranker is None:
+                hits = hits[:k]
+            else:
+                hits, rerank = self.reranker.rerank(query, hits, k)
+                if self.metrics:
+                    self.metrics.observe('rerank_ms', rerank['ms'])
+                    self.metrics.incr('rerank_queries', fallback=rerank['fallback'])
+            results.append([(metadata.get('source', 'Unknown source'), content) for content, metadata in hits])
+        return results
+    
+    def document_search(self, query: str) -> str:
+        """Search documents and return relevant content with caching"""
         try:
-            docs = self.retriever.get_relevant_documents(query)
-            
-            if not docs:
-                return "No relevant documents found in the knowledge base."
-            
-            # Join document contents with source information when available
-            result = []
-            for doc in docs:
-                content = doc.page_content
-                metadata = getattr(doc, 'metadata', {})
-                source = metadata.get('source', 'Unknown source')
-                result.append(f"Source: {source}\n{content}")
-            
-            result_text = "\n\n".join(result)
-            
-            # Cache the result
-            self._document_cache[query] = result_text
-            
-            return result_text
+            passages = self.document_passages(query)
+        except RetrievalBusyError:
+            raise
         except Exception as e:
             logger.error(f"Error in document search: {str(e)}")
             return f"Error searching documents: {str(e)}"
+        if not passages:
+            return "No relevant documents found in the knowledge base."
+        return format_passages(passages)
+    
+    def _run_searches(self, query: str, searches: Dict[str, Any]) -> Dict[str, Dict[str, Any]]:
+        """Run the named searches, concurrently under search_timeout when there is more than one.
+        
+        Returns per-source passages, status (ok, empty, busy, error or timeout) and latency in ms.
+        """
+        def timed(search):
+            started = time.perf_counter()
+            result = {'passages': [], 'status': 'ok', 'error': None}
+            try:
+                result['passages'] = search(query)
+                if not result['passages']:
+                    result['status'] = 'empty'
+            except RetrievalBusyError as e:
+                logger.warning(f"Skipping document search: {str(e)}")
+                result['status'] = 'busy'
+            except Exception as e:
+                logger.error(f"Error in {search.__name__}: {str(e)}")
+                result.update(status='error', error=str(e))
+            result['ms'] = round((time.perf_counter() - started) * 1000, 1)
+            return result
+        
+        if len(searches) <= 1:
+            return {name: timed(search) for name, search in searches.items()}
+        
+        # A search that misses the deadline keeps running and fills its cache for the next message
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=len(searches))
+        futures = {name: executor.submit(timed, search) for name, search in searches.items()}
+        concurrent.futures.wait(futures.values(), timeout=self.search_timeout)
+        executor.shutdown(wait=False)
+        results = {}
+        for name, future in futures.items():
+            if future.done():
+                results[name] = future.result()
+            else:
+                logger.warning(f"Search of {name} missed the {self.search_timeout}s deadline")
+                results[name] = {'passages': [], 'status': 'timeout', 'error': None,
+                                 'ms': round(self.search_timeout * 1000, 1)}
+        return results
+    
+    def build_context(self, query: str, use_web: bool = False, use_rag: bool = True,
+                      model_id: Optional[str] = None,
+                      documents: Optional[List[Tuple[str, str]]] = None, collection: Optional[str] = None,
+                      filter: Optional[Filter] = None) -> Tuple[str, Dict[str, Any]]:
+        """Retrieve context for a query up front so it can be placed in the prompt.
+        
+        With both searches enabled (hybrid mode) they run concurrently and their results are merged
+        by rank. documents, when given, are document passages already retrieved (by a batch search);
+        otherwise documents are searched in collection (the default one when None), among chunks
+        matching filter. Returns the context and its stats: per-source status and latency and, when
+        compression is enabled, tokens before and after.
+        """
+        searches = {}
+        if use_rag:
+            if documents is not None:
+                searches['documents'] = lambda _: documents
+            elif collection or filter:
+                searches['documents'] = lambda text: self.document_passages(text, collection, filter)
+            else:
+                searches['documents'] = self.document_passages
+        if use_web:
+            searches['web'] = self.web_passages
+        results = self._run_searches(query, searches)
+        
+        notes = []
+        for name, result in results.items():
+            note = SEARCH_NOTES[name].get(result['status'])
+            if note:
+                notes.append(note.format(error=result['error']))
+        rankings = [result['passages'] for result in results.values() if result['passages']]
+        passages = fuse_rankings(query, rankings) if len(rankings) > 1 else [p for r in rankings for p in r]
+        
+        stats = {}
+        if self.compressor is not None and passages:
+            context, stats = self.compressor.compress(query, passages, model_id)
+        else:
+            context = format_passages(passages)
+        stats['sources'] = {
+            name: {'status': result['status'], 'passages': len(result['passages']), 'ms': result['ms']}
+            for name, result in results.items()
+        }
+        return "\n\n".join(part for part in [context] + notes if part), stats
     
     def get_rag_chain(self, llm, use_web: bool = False, use_rag: bool = True):
         """Get a RAG chain with optional web search and/or document search capabilities
@@ -0,0 +1,244 @@
+import re
+import time
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Clients with buckets in memory before idle ones are dropped
+MAX_TRACKED_CLIENTS = 10000
+
+
+class RateLimited(Exception):
+    """A request was refused or timed out waiting for capacity; carries the backpressure details"""
+
+    def __init__(self, scope: str, reason: str, retry_after: Optional[float] = None, provider: Optional[str] = None):
+        self.scope = scope  # 'client' or 'provider'
+        self.reason = reason  # 'requests', 'tokens', 'queue_timeout' or 'upstream_429'
+        self.retry_after = retry_after
+        self.provider = provider
+        retry = f", retry after {retry_after:.1f}s" if retry_after is not None else ""
+        super().__init__(f"Rate limited ({scope} {reason}){retry}")
+
+    def as_message(self) -> Dict[str, Any]:
+        """The content of a 'backpressure' Socket.IO message"""
+        return {
+            'scope': self.scope,
+            'reason': self.reason,
+            'provider': self.provider,
+            'retry_after': round(self.retry_after, 1) if self.retry_after is not None else None,
+        }
+
+
+class ProviderRateLimitError(RateLimited):
+    """The provider answered 429"""
+
+    def __init__(self, provider: str, retry_after: Optional[float] = None):
+        super().__init__('provider', 'upstream_429', retry_after, provider)
+
+
+def parse_limits(spec: str) -> Dict[str, Tuple[float, float]]:
+    """Parse 'openai=500:200000,groq=30:6000' into {provider: (requests/min, tokens/min)}; 0 means unlimited"""
+    limits = {}
+    for item in (spec or '').split(','):
+        if not item.strip():
+            continue
+        name, _, values = item.partition('=')
+        requests_per_min, _, tokens_per_min = values.partition(':')
+        limits[name.strip()] = (float(requests_per_min or 0), float(tokens_per_min or 0))
+    return limits
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Read Retry-After (or the x-ratelimit reset headers) from a provider SDK's HTTP error"""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    for name in ('retry-after', 'x-ratelimit-reset-requests', 'x-ratelimit-reset-tokens'):
+        value = headers.get(name)
+        if value:
+            # '2', '1.5' or Groq/OpenAI durations such as '7.66s' and '2m59.56s'
+            match = re.fullmatch(r'(?:(\d+)m)?([\d.]+)(ms|s)?', str(value).strip())
+            if match:
+                seconds = float(match.group(2)) / (1000 if match.group(3) == 'ms' else 1)
+                return seconds + 60 * int(match.group(1) or 0)
+    return None
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    status = getattr(error, 'status_code', None) or getattr(getattr(error, 'response', None), 'status_code', None)
+    return status == 429 or type(error).__name__ in ('RateLimitError', 'TooManyRequestsError')
+
+
+class TokenBucket:
+    """Refills at rate per second up to capacity; a rate of 0 never limits"""
+
+    def __init__(self, per_minute: float, burst: Optional[float] = None):
+        self.rate = per_minute / 60.0
+        self.capacity = burst if burst is not None else per_minute
+        self.level = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until amount can be taken (0 if it can be taken now)"""
+        if not self.rate:
+            return 0.0
+        self._refill(now)
+        # Requests larger than the whole bucket go through once it is full, leaving it in debt
+        needed = min(amount, self.capacity) - self.level
+        return max(0.0, needed / self.rate)
+
+    def take(self, amount: float, now: float):
+        if self.rate:
+            self._refill(now)
+            self.level -= amount
+
+
+class RateLimiter:
+    """Token-bucket limits per client and per provider, counting requests and estimated tokens.
+
+    Client limits (admit() for the request rate, then acquire() for its
+    tokens) refuse the request at once.
+    Provider limits queue it instead: each provider serves its waiting
+    clients round-robin, one request per turn, so a client with many
+    queued messages can't starve the others while the provider is
+    saturated. Estimated tokens are settled against the real usage once
+    the reply is done. Buckets live in this process; with several worker
+    processes each enforces the limits on its own share of the traffic.
+    """
+
+    def __init__(self, client_requests: float = 20, client_tokens: float = 40000,
+                 provider_limits: Optional[Dict[str, Tuple[float, float]]] = None,
+                 queue_timeout: float = 30.0, metrics=None, create_event: Optional[Callable] = None):
+        self.client_requests = client_requests
+        self.client_tokens = client_tokens
+        self.provider_limits = provider_limits or {}
+        self.queue_timeout = queue_timeout
+        self.metrics = metrics
+        # Queued requests wait on these events; under eventlet pass the green one
+        # (socketio.server.eio.create_event) so a wait doesn't block every other request
+        self.create_event = create_event or threading.Event
+        self._lock = threading.Lock()
+        self._clients: Dict[str, Tuple[TokenBucket, TokenBucket]] = {}
+        self._providers: Dict[str, Dict[str, Any]] = {}
+
+    def _client(self, client_id: str) -> Tuple[TokenBucket, TokenBucket]:
+        buckets = self._clients.get(client_id)
+        if buckets is None:
+            if len(self._clients) >= MAX_TRACKED_CLIENTS:
+                # Clients idle for a minute have full buckets again; forgetting them changes nothing
+                idle = time.monotonic() - 60
+                self._clients = {key: value for key, value in self._clients.items() if value[0].updated > idle}
+            buckets = self._clients[client_id] = (TokenBucket(self.client_requests), TokenBucket(self.client_tokens))
+        return buckets
+
+    def _provider(self, provider: str) -> Dict[str, Any]:
+        state = self._providers.get(provider)
+        if state is None:
+            requests_per_min, tokens_per_min = self.provider_limits.get(provider, (0, 0))
+            state = self._providers[provider] = {
+                'requests': TokenBucket(requests_per_min), 'tokens': TokenBucket(tokens_per_min),
+                'blocked_until': 0.0, 'queues': {}, 'turns': deque(), 'ready': self.create_event(),
+            }
+        return state
+
+    def _notify(self, state: Dict[str, Any]):
+        """Wake every request waiting on the provider's queue; call with the lock held"""
+        ready, state['ready'] = state['ready'], self.create_event()
+        ready.set()
+
+    def _incr(self, name: str, **labels):
+        if self.metrics:
+            self.metrics.incr(name, **labels)
+
+    def admit(self, client_id: str):
+        """Count one request against the client's request rate; raises RateLimited when it is over"""
+        with self._lock:
+            now = time.monotonic()
+            requests = self._client(client_id)[0]
+            wait = requests.wait_time(1, now)
+            if wait > 0:
+                self._incr('rate_limited', scope='client', reason='requests')
+                raise RateLimited('client', 'requests', wait)
+            requests.take(1, now)
+
+    def acquire(self, client_id: str, provider: str, tokens: int, timeout: Optional[float] = None) -> float:
+        """Admit about tokens tokens to the provider, waiting in its queue if needed; returns seconds queued.
+
+        Raises RateLimited when the client is over its token rate or the provider queue doesn't clear in time.
+        """
+        started = time.monotonic()
+        timeout = self.queue_timeout if timeout is None else timeout
+        with self._lock:
+            token_bucket = self._client(client_id)[1]
+            wait = token_bucket.wait_time(tokens, started)
+            if wait > 0:
+                self._incr('rate_limited', scope='client', reason='tokens')
+                raise RateLimited('client', 'tokens', wait, provider)
+            token_bucket.take(tokens, started)
+
+            state = self._provider(provider)
+            ticket = object()
+            queue = state['queues'].setdefault(client_id, deque())
+            queue.append(ticket)
+            if client_id not in state['turns']:
+                state['turns'].append(client_id)
+        try:
+            while True:
+                with self._lock:
+                    now = time.monotonic()
+                    wait = None
+                    if state['turns'][0] == client_id and queue[0] is ticket:
+                        wait = max(state['blocked_until'] - now, state['requests'].wait_time(1, now),
+                                   state['tokens'].wait_time(tokens, now), 0.0)
+                        if wait == 0:
+                            state['requests'].take(1, now)
+                            state['tokens'].take(tokens, now)
+                            break
+                    remaining = started + timeout - now
+                    if remaining <= 0:
+                        self._incr('rate_limited', scope='provider', reason='queue_timeout', provider=provider)
+                        # Hand the client's tokens back: the request never ran
+                        token_bucket.take(-tokens, now)
+                        raise RateLimited('provider', 'queue_timeout', wait, provider)
+                    # Taken under the lock, so a notify after it is released still wakes this wait
+                    ready = state['ready']
+                ready.wait(min(wait, remaining) if wait else remaining)
+        finally:
+            with self._lock:
+                head = queue[0] is ticket
+                queue.remove(ticket)
+                if not queue:
+                    state['turns'].remove(client_id)
+                    state['queues'].pop(client_id, None)
+                elif head and state['turns'][0] == client_id:
+                    # The client's turn is over (served, or its head request gave up); it rejoins at the back.
+                    # A later request timing out leaves the head request's place in the queue alone.
+                    state['turns'].popleft()
+                    state['turns'].append(client_id)
+                self._notify(state)
+        queued = time.monotonic() - started
+        if self.metrics and queued > 0.001:
+            self.metrics.observe('rate_limit_queued_seconds', queued, provider=provider)
+        return queued
+
+    def settle(self, client_id: str, provider: str, estimated: int, actual: Optional[int]):
+        """Replace a request's estimated tokens with the usage the provider reported"""
+        if actual is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            self._client(client_id)[1].take(actual - estimated, now)
+            self._provider(provider)['tokens'].take(actual - estimated, now)
+
+    def backoff(self, provider: str, retry_after: Optional[float]):
+        """Hold the provider's queue after a 429 so waiting requests don't hit it again straight away"""
+        with self._lock:
+            state = self._provider(provider)
+            state['blocked_until'] = max(state['blocked_until'], time.monotonic() + (retry_after or 1.0))
+        self._incr('rate_limited', scope='provider', reason='upstream_429', provider=provider)
@@ -0,0 +1,81 @@
+import time
+from typing import Any, Dict, List, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Weight of the newest measurement in the per-pair cost estimate
+COST_SMOOTHING = 0.2
+
+
+class Reranker:
+    """Cross-encoder reranking of vector search candidates under a per-query time budget.
+
+    Candidates are scored in vector rank order, one batch at a time. The
+    cost of scoring a pair is tracked as a moving average, so each query
+    only scores as many candidates as are expected to fit in budget_ms
+    (never fewer than k). If the deadline passes with candidates still
+    unscored, or fewer than k would fit, the vector order is kept.
+    """
+
+    def __init__(self, model_name: str = 'cross-encoder/ms-marco-MiniLM-L-6-v2', backend: str = 'torch',
+                 batch_size: int = 16, budget_ms: float = 200.0, max_length: int = 256):
+        from sentence_transformers import CrossEncoder
+
+        self.model_name = model_name
+        self.batch_size = batch_size
+        self.budget_ms = budget_ms
+        try:
+            self.model = CrossEncoder(model_name, backend=backend, max_length=max_length)
+        except ImportError as e:
+            # The ONNX backend needs optimum and onnxruntime
+            logger.warning(f"Reranker backend {backend} unavailable ({str(e)}); using torch")
+            backend = 'torch'
+            self.model = CrossEncoder(model_name, max_length=max_length)
+        self.backend = backend
+        self.pair_ms = None
+        self._warm_up()
+
+    def _warm_up(self):
+        """Run one batch so the first query doesn't pay for lazy initialisation and seeds the cost estimate"""
+        pairs = [("warm up query", "warm up passage " * 40)] * self.batch_size
+        started = time.perf_counter()
+        self.model.predict(pairs, batch_size=self.batch_size, show_progress_bar=False)
+        self.pair_ms = (time.perf_counter() - started) * 1000 / len(pairs)
+        logger.info(f"Loaded reranker {self.model_name} ({self.backend}), {self.pair_ms:.2f}ms per pair")
+
+    def rerank(self, query: str, hits: List[Tuple[str, Dict[str, Any]]], k: int) -> Tuple[List[Tuple[str, Dict[str, Any]]], Dict[str, Any]]:
+        """Return the best k hits and a report (candidates scored, elapsed ms, fallback reason)"""
+        started = time.perf_counter()
+        deadline = started + self.budget_ms / 1000
+        fits = int(self.budget_ms / self.pair_ms) if self.pair_ms else len(hits)
+        candidates = hits[:max(k, fits)]
+        report = {'candidates': len(hits), 'scored': 0, 'reranked': False, 'fallback': None}
+
+        if len(hits) <= 1:
+            report['fallback'] = 'too_few_candidates'
+        elif fits < k:
+            report['fallback'] = 'budget'
+            # Let the estimate recover from a slow spike so reranking is retried
+            self.pair_ms *= 1 - COST_SMOOTHING
+        else:
+            scores = []
+            for start in range(0, len(candidates), self.batch_size):
+                batch = candidates[start:start + self.batch_size]
+                batch_started = time.perf_counter()
+                scores.extend(self.model.predict([(query, content) for content, _ in batch],
+                                                 batch_size=self.batch_size, show_progress_bar=False))
+                pair_ms = (time.perf_counter() - batch_started) * 1000 / len(batch)
+                self.pair_ms = pair_ms if self.pair_ms is None else \
+                    (1 - COST_SMOOTHING) * self.pair_ms + COST_SMOOTHING * pair_ms
+                if time.perf_counter() > deadline and start + self.batch_size < len(candidates):
+                    report['fallback'] = 'deadline'
+                    break
+            report['scored'] = len(scores)
+            if report['fallback'] is None:
+                order = sorted(range(len(candidates)), key=lambda i: -float(scores[i]))
+                hits = [candidates[i] for i in order] + hits[len(candidates):]
+                report['reranked'] = True
+
+        report['ms'] = (time.perf_counter() - started) * 1000
+        return hits[:k], report
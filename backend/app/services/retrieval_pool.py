@@ -0,0 +1,196 @@
+import os
+import pickle
+import signal
+import socket
+import tempfile
+import threading
+from typing import Any, Dict, List, Optional
+import logging
+
+from bs4 import BeautifulSoup
+
+from .socketio_queue import read_frame, write_frame
+
+logger = logging.getLogger(__name__)
+
+
+class RetrievalBusyError(Exception):
+    """Raised when the retrieval pool has too many requests in flight"""
+
+
+class RetrievalError(Exception):
+    """Raised when a retrieval process fails to handle a request"""
+
+
+def extract_text(html: str, max_chars: int = 800) -> str:
+    """Extract the visible text of an HTML page, truncated to max_chars"""
+    soup = BeautifulSoup(html, 'html.parser')
+    return soup.get_text(separator=' ', strip=True)[:max_chars]
+
+
+def _handle(rag_service, op: str, kwargs: Dict[str, Any]):
+    """Run one CPU-bound retrieval operation"""
+    if op == 'search_documents':
+        return rag_service.retrieve(kwargs['query'], k=kwargs.get('k', 5), collection=kwargs.get('collection'),
+                                    filter=kwargs.get('filter'))
+    if op == 'embed_documents':
+        return rag_service.embeddings.embed_documents(kwargs['texts'])
+    if op == 'extract_text':
+        return extract_text(kwargs['html'], kwargs.get('max_chars', 800))
+    if op == 'ping':
+        return os.getpid()
+    raise ValueError(f"Unknown retrieval operation: {op}")
+
+
+def _serve(listener, rag_service):
+    """Accept one request per connection until the process is terminated"""
+    while True:
+        conn, _ = listener.accept()
+        try:
+            payload = read_frame(conn)
+            if payload is None:
+                continue
+            op, kwargs = pickle.loads(payload)
+            try:
+                response = ('ok', _handle(rag_service, op, kwargs))
+            except Exception as e:
+                logger.error(f"Retrieval operation {op} failed: {str(e)}")
+                response = ('error', str(e))
+            write_frame(conn, pickle.dumps(response, protocol=pickle.HIGHEST_PROTOCOL))
+        except OSError as e:
+            logger.warning(f"Retrieval connection error: {str(e)}")
+        finally:
+            conn.close()
+
+
+class RetrievalPool:
+    """Pool of forked processes running the CPU-bound parts of RAGService.
+
+    The processes are forked after the embedding model and FAISS index are
+    loaded, so they share those pages copy-on-write. They all accept on one
+    Unix socket: the kernel hands each connection to an idle process, and
+    connections beyond that wait in the listen backlog.
+    """
+
+    def __init__(self, rag_service, processes: int = 2, path: Optional[str] = None, backlog: int = 64):
+        self.rag_service = rag_service
+        self.processes = processes
+        self.path = path or os.path.join(tempfile.gettempdir(), f"chat-retrieval-{os.getpid()}.sock")
+        self.backlog = backlog
+        self.pids: List[int] = []
+        self._owner = os.getpid()
+        self._listener = None
+
+    def start(self):
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self._listener = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self._listener.bind(self.path)
+        os.chmod(self.path, 0o600)
+        self._listener.listen(self.backlog)
+        for _ in range(self.processes):
+            self._spawn()
+        logger.info(f"Started {self.processes} retrieval processes on {self.path}")
+        return self
+
+    def _spawn(self):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                signal.signal(signal.SIGINT, signal.SIG_IGN)
+                signal.signal(signal.SIGTERM, signal.SIG_DFL)
+                _serve(self._listener, self.rag_service)
+            except BaseException:
+                logger.exception("Retrieval process crashed")
+                code = 1
+            finally:
+                os._exit(code)
+        self.pids.append(pid)
+
+    def owns(self, pid: int) -> bool:
+        return pid in self.pids
+
+    def respawn(self, pid: int):
+        """Replace a retrieval process that exited"""
+        if pid in self.pids:
+            self.pids.remove(pid)
+            logger.warning(f"Retrieval process {pid} exited, restarting")
+            self._spawn()
+
+    def stop(self):
+        """Terminate the retrieval processes (only from the process that started them)"""
+        if os.getpid() != self._owner:
+            return
+        for pid in self.pids:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in self.pids:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        self.pids = []
+        if self._listener is not None:
+            self._listener.close()
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+
+
+class RetrievalClient:
+    """Client for a RetrievalPool with a cap on in-flight requests.
+
+    A request waits at most `timeout` seconds for one of `max_pending` slots
+    and then fails with RetrievalBusyError, so a burst of heavy RAG queries
+    is refused quickly instead of queueing without bound.
+    """
+
+    def __init__(self, path: str, max_pending: int = 8, timeout: float = 10.0, async_mode: Optional[str] = None):
+        self.path = path
+        self.max_pending = max_pending
+        self.timeout = timeout
+        # Under eventlet the calls must yield to other green threads while waiting
+        if async_mode == 'eventlet':
+            from eventlet.green import socket as green_socket
+            from eventlet.semaphore import Semaphore
+            self._socket_module = green_socket
+            self._slots = Semaphore(max_pending)
+        else:
+            self._socket_module = socket
+            self._slots = threading.Semaphore(max_pending)
+
+    def call(self, op: str, **kwargs):
+        if not self._slots.acquire(timeout=self.timeout):
+            raise RetrievalBusyError(f"Retrieval pool busy ({self.max_pending} requests in flight)")
+        try:
+            sock = self._socket_module.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            sock.settimeout(self.timeout)
+            try:
+                sock.connect(self.path)
+                write_frame(sock, pickle.dumps((op, kwargs), protocol=pickle.HIGHEST_PROTOCOL))
+                payload = read_frame(sock)
+            finally:
+                sock.close()
+        except OSError as e:
+            raise RetrievalError(f"Retrieval pool unavailable: {str(e)}")
+        finally:
+            self._slots.release()
+
+        if payload is None:
+            raise RetrievalError("Retrieval process closed the connection")
+        status, value = pickle.loads(payload)
+        if status != 'ok':
+            raise RetrievalError(value)
+        return value
+
+    def search_documents(self, query: str, k: int = 5, collection: Optional[str] = None, filter=None):
+        """Return (hits, rerank report), as RAGService.retrieve does"""
+        return self.call('search_documents', query=query, k=k, collection=collection, filter=filter)
+
+    def extract_text(self, html: str, max_chars: int = 800) -> str:
+        return self.call('extract_text', html=html, max_chars=max_chars)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.call('embed_documents', texts=texts)
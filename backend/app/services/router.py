@@ -0,0 +1,261 @@
+import re
+import json
+import time
+import uuid
+import random
+import threading
+from collections import deque
+from logging.handlers import RotatingFileHandler
+from statistics import median
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import logging
+
+from .conversation_service import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# Candidates per query class, in order of preference while there are no measurements
+DEFAULT_CANDIDATES = {
+    'simple': 'groq:llama-3.1-8b-instant,openai:gpt-4o-mini,deepseek:deepseek-chat,'
+              'anthropic:claude-3-5-haiku-latest,mistral:mistral-small-latest',
+    'code': 'mistral:codestral-latest,groq:qwen-2.5-coder-32b,deepseek:deepseek-chat,openai:gpt-4o-mini,'
+            'anthropic:claude-3-5-haiku-latest',
+    'complex': 'openai:gpt-4o,anthropic:claude-3-7-sonnet-latest,groq:llama-3.3-70b-versatile,'
+               'deepseek:deepseek-chat,mistral:mistral-large-latest',
+}
+
+# Generation speed assumed for a model whose replies haven't been timed yet
+DEFAULT_TOKENS_PER_SEC = 50.0
+
+# The catalog entry for automatic selection
+AUTO_MODEL = {'id': 'auto', 'name': 'Automatic',
+              'description': 'Picks the fastest model within the cost ceiling for each question'}
+
+CODE_PATTERN = re.compile(
+    r"```|^\s*(def|class|import|from|function|const|let|var|public|private|#include|SELECT)\b|[;{}]\s*$"
+    r"|\b(traceback|stack trace|exception|segfault|regex|compile[sd]?|syntax error|stderr)\b",
+    re.MULTILINE | re.IGNORECASE
+)
+REASONING_PATTERN = re.compile(
+    r"\b(why|explain|compare|analy[sz]e|prove|derive|step[- ]by[- ]step|trade-?offs?|design|evaluate|plan)\b",
+    re.IGNORECASE
+)
+
+
+def parse_candidates(spec: str) -> List[Tuple[str, str]]:
+    """Parse 'provider:model,...' into [(provider, model)]"""
+    candidates = []
+    for item in (spec or '').split(','):
+        provider, _, model = item.strip().partition(':')
+        if provider and model:
+            candidates.append((provider, model))
+    return candidates
+
+
+def parse_ceilings(spec: str) -> Dict[str, float]:
+    """Parse 'simple=0.002,code=0.002,complex=0.01' (or one number for every class) into USD per 1k tokens"""
+    spec = (spec or '').strip()
+    if not spec:
+        return {}
+    if '=' not in spec:
+        return {name: float(spec) for name in DEFAULT_CANDIDATES}
+    ceilings = {}
+    for item in spec.split(','):
+        name, _, value = item.partition('=')
+        if name.strip():
+            ceilings[name.strip()] = float(value)
+    return ceilings
+
+
+def classify(query: str, long_tokens: int = 150) -> Tuple[str, Dict[str, Any]]:
+    """Sort a query into 'code', 'complex' or 'simple' by code markers, length and reasoning cues"""
+    tokens = count_tokens(query)
+    code = bool(CODE_PATTERN.search(query))
+    reasoning = len(REASONING_PATTERN.findall(query))
+    if code:
+        name = 'code'
+    elif tokens >= long_tokens or reasoning >= 2 or (reasoning and tokens >= long_tokens // 3):
+        name = 'complex'
+    else:
+        name = 'simple'
+    return name, {'tokens': tokens, 'code': code, 'reasoning_cues': reasoning}
+
+
+class ModelStats:
+    """The last window replies of one model: TTFT, generation speed and errors"""
+
+    def __init__(self, window: int):
+        self.samples: deque = deque(maxlen=window)
+        # Seeded from the usage rollups so a restart doesn't start cold: (ttft_ms, tokens_per_sec, requests)
+        self.prior: Optional[Tuple[Optional[float], Optional[float], int]] = None
+
+    def summary(self, min_samples: int) -> Dict[str, Any]:
+        ttfts = [ttft for ttft, _, error in self.samples if not error and ttft is not None]
+        speeds = [tps for _, tps, error in self.samples if not error and tps]
+        errors = sum(1 for _, _, error in self.samples if error)
+        if len(self.samples) < min_samples and self.prior is not None:
+            ttft, tps, requests = self.prior
+            return {'ttft_ms': ttft, 'tokens_per_sec': tps, 'error_rate': 0.0, 'samples': 0, 'seeded': requests}
+        return {
+            'ttft_ms': median(ttfts) if ttfts else None,
+            'tokens_per_sec': median(speeds) if speeds else None,
+            'error_rate': errors / len(self.samples) if self.samples else 0.0,
+            'samples': len(self.samples),
+        }
+
+
+class ModelRouter:
+    """Picks a provider and model for 'auto' messages from live latency statistics.
+
+    The query is classified (code, complex or simple) and each candidate
+    for that class is scored by its expected reply time: median TTFT plus
+    completion_tokens at its median tokens/sec over its last window
+    replies, inflated by its error rate. Candidates without an API key or
+    whose blended price (3 prompt tokens per completion token) is above the
+    class's cost ceiling are skipped. Candidates with fewer than
+    min_samples replies (failed ones included) are tried first, in
+    configured order, so every model gets measured; after that an explore
+    share of messages goes to a random other candidate to keep the
+    statistics fresh. A model failing at least max_error_rate of its
+    replies, or that has never replied, is only tried when exploring, or
+    when every other candidate is failing too.
+
+    Every decision and, once the reply is done, its outcome are written as
+    JSON lines to log_path, joined by decision id, so a policy can be
+    replayed and evaluated offline.
+    """
+
+    def __init__(self, candidates: Dict[str, List[Tuple[str, str]]], providers: Iterable[str],
+                 prices: Optional[Dict[str, Tuple[float, float, float]]] = None,
+                 ceilings: Optional[Dict[str, float]] = None, window: int = 50, min_samples: int = 3,
+                 explore: float = 0.05, completion_tokens: int = 300, long_tokens: int = 150,
+                 max_error_rate: float = 0.5, log_path: Optional[str] = None, rng: Optional[random.Random] = None):
+        self.candidates = candidates
+        self.providers = set(providers)
+        self.prices = prices or {}
+        self.ceilings = ceilings or {}
+        self.window = window
+        self.min_samples = min_samples
+        self.explore = explore
+        self.completion_tokens = completion_tokens
+        self.long_tokens = long_tokens
+        self.max_error_rate = max_error_rate
+        self.rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self._stats: Dict[Tuple[str, str], ModelStats] = {}
+
+        self.log = None
+        if log_path:
+            self.log = logging.getLogger('app.router.decisions')
+            self.log.propagate = False
+            if not self.log.handlers:
+                handler = RotatingFileHandler(log_path, maxBytes=20 * 1024 * 1024, backupCount=5)
+                handler.setFormatter(logging.Formatter('%(message)s'))
+                self.log.addHandler(handler)
+            self.log.setLevel(logging.INFO)
+
+    def _model_stats(self, provider: str, model: str) -> ModelStats:
+        stats = self._stats.get((provider, model))
+        if stats is None:
+            stats = self._stats[(provider, model)] = ModelStats(self.window)
+        return stats
+
+    def observe(self, provider: str, model: str, ttft_ms: Optional[float] = None,
+                tokens_per_sec: Optional[float] = None, error: bool = False):
+        """Add one reply (from any message, routed or not) to the model's statistics"""
+        with self._lock:
+            self._model_stats(provider, model).samples.append((ttft_ms, tokens_per_sec, error))
+
+    def seed(self, models: List[Dict[str, Any]]):
+        """Start from the usage summary's per-model TTFT and speed (UsageCollector.summary()['models'])"""
+        totals: Dict[Tuple[str, str], List[Any]] = {}
+        for row in models:
+            if row.get('ttft_ms') is None:
+                continue
+            total = totals.setdefault((row['provider'], row['model']), [0.0, 0.0, 0.0, 0])
+            total[0] += row['ttft_ms'] * row['requests']
+            total[1] += (row['tokens_per_sec'] or 0.0) * row['requests']
+            total[2] += row['requests'] if row['tokens_per_sec'] else 0
+            total[3] += row['requests']
+        with self._lock:
+            for key, (ttft, tps, tps_requests, requests) in totals.items():
+                if requests >= self.min_samples:
+                    self._model_stats(*key).prior = (ttft / requests, tps / tps_requests if tps_requests else None,
+                                                     requests)
+
+    def price_per_1k(self, model: str) -> Optional[float]:
+        price = self.prices.get(model)
+        if price is None:
+            return None
+        prompt, _, completion = price
+        return (3 * prompt + completion) / 4 / 1000
+
+    def _score(self, summary: Dict[str, Any]) -> Optional[float]:
+        """Expected reply time in ms, or None without measurements"""
+        if summary['ttft_ms'] is None:
+            return None
+        tokens_per_sec = summary['tokens_per_sec'] or DEFAULT_TOKENS_PER_SEC
+        expected = summary['ttft_ms'] + 1000 * self.completion_tokens / tokens_per_sec
+        return expected / max(1.0 - summary['error_rate'], 0.1)
+
+    def route(self, query: str) -> Dict[str, Any]:
+        """Choose a model for query; the decision has provider and model set to None when nothing is eligible"""
+        name, features = classify(query, self.long_tokens)
+        ceiling = self.ceilings.get(name)
+        evaluated, eligible = [], []
+        with self._lock:
+            for provider, model in self.candidates.get(name, []):
+                price = self.price_per_1k(model)
+                entry = {'provider': provider, 'model': model, 'price_per_1k': price}
+                entry.update(self._model_stats(provider, model).summary(self.min_samples))
+                if provider not in self.providers:
+                    entry['skipped'] = 'no_api_key'
+                elif ceiling and (price is None or price > ceiling):
+                    entry['skipped'] = 'over_cost_ceiling'
+                else:
+                    entry['expected_ms'] = self._score(entry)
+                    eligible.append(entry)
+                evaluated.append(entry)
+
+        # Errors count as samples, so a model that only fails is measured (as failing) rather than retried forever
+        measured, failing, unmeasured = [], [], []
+        for entry in eligible:
+            if entry['samples'] < self.min_samples and not entry.get('seeded'):
+                unmeasured.append(entry)
+            elif entry['expected_ms'] is None or entry['error_rate'] >= self.max_error_rate:
+                entry['failing'] = True
+                failing.append(entry)
+            else:
+                measured.append(entry)
+        if not eligible:
+            chosen, reason = None, 'no_candidate'
+        elif unmeasured:
+            chosen, reason = unmeasured[0], 'measure'
+        elif not measured:
+            chosen, reason = min(failing, key=lambda entry: entry['error_rate']), 'least_failing'
+        elif len(eligible) > 1 and self.rng.random() < self.explore:
+            # Failing models are explored too, so one that has recovered can win again
+            best = min(measured, key=lambda entry: entry['expected_ms'])
+            chosen, reason = self.rng.choice([entry for entry in eligible if entry is not best]), 'explore'
+        else:
+            chosen, reason = min(measured, key=lambda entry: (entry['expected_ms'], entry['price_per_1k'] or 0.0)), 'fastest'
+
+        decision = {
+            'id': uuid.uuid4().hex,
+            'class': name,
+            'reason': reason,
+            'provider': chosen['provider'] if chosen else None,
+            'model': chosen['model'] if chosen else None,
+        }
+        self._write({'event': 'decision', 'at': time.time(), **decision, 'features': features,
+                     'ceiling_per_1k': ceiling, 'candidates': evaluated})
+        return decision
+
+    def outcome(self, decision: Dict[str, Any], provider: str, model: Optional[str], **result: Any):
+        """Log how a routed message went (ttft_ms, tokens_per_sec, total_ms, usage, error)"""
+        self._write({'event': 'outcome', 'at': time.time(), 'id': decision['id'], 'provider': provider,
+                     'model': model, **result})
+
+    def _write(self, record: Dict[str, Any]):
+        if self.log is not None:
+            self.log.info(json.dumps(record, default=str))
@@ -0,0 +1,207 @@
+import json
+import socket
+import struct
+import threading
+from typing import Optional
+from urllib.parse import urlparse
+import logging
+
+import socketio
+
+logger = logging.getLogger(__name__)
+
+_FRAME_HEADER = struct.Struct('!I')
+
+
+def _recv_exact(sock, size: int) -> Optional[bytes]:
+    """Read exactly size bytes, or return None if the peer closed the connection"""
+    data = bytearray()
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data.extend(chunk)
+    return bytes(data)
+
+
+def read_frame(sock) -> Optional[bytes]:
+    header = _recv_exact(sock, _FRAME_HEADER.size)
+    if header is None:
+        return None
+    return _recv_exact(sock, _FRAME_HEADER.unpack(header)[0])
+
+
+def write_frame(sock, payload: bytes):
+    sock.sendall(_FRAME_HEADER.pack(len(payload)) + payload)
+
+
+class LocalQueueBroker:
+    """Minimal fan-out broker for local:// message queues.
+
+    Every frame received from a connected worker is forwarded to all
+    connected workers. It stands in for Redis on a single host and in
+    tests; it keeps no history, so workers only see messages published
+    while they are connected.
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0):
+        self._server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self._server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self._server.bind((host, port))
+        self._server.listen(128)
+        self.host, self.port = self._server.getsockname()
+        self._clients = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    @property
+    def url(self) -> str:
+        return f"local://{self.host}:{self.port}"
+
+    def _serve_client(self, conn):
+        with self._lock:
+            self._clients.add(conn)
+        try:
+            while True:
+                payload = read_frame(conn)
+                if payload is None:
+                    break
+                with self._lock:
+                    clients = list(self._clients)
+                for client in clients:
+                    try:
+                        write_frame(client, payload)
+                    except OSError:
+                        pass
+        except OSError:
+            pass
+        finally:
+            with self._lock:
+                self._clients.discard(conn)
+            conn.close()
+
+    def _accept(self):
+        while True:
+            try:
+                conn, _ = self._server.accept()
+            except OSError:
+                break
+            conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+            threading.Thread(target=self._serve_client, args=(conn,), name='queue-broker-client',
+                             daemon=True).start()
+
+    def start(self):
+        self._thread = threading.Thread(target=self._accept, name='queue-broker', daemon=True)
+        self._thread.start()
+        logger.info(f"Local message queue broker listening on {self.url}")
+        return self
+
+    def stop(self):
+        self._server.close()
+        with self._lock:
+            for client in self._clients:
+                client.close()
+            self._clients.clear()
+
+
+class LocalFirstMixin:
+    """Deliver emits addressed to a client connected to this worker without the queue.
+
+    With sticky sessions a streamed reply is emitted to its own socket's room,
+    which always lives in the emitting worker, so each token would otherwise
+    take a round trip through the message queue for nothing.
+    """
+
+    def emit(self, event, data, namespace=None, room=None, skip_sid=None, callback=None, to=None, **kwargs):
+        room = to or room
+        namespace = namespace or '/'
+        if (room is not None and callback is None and not kwargs.get('ignore_queue')
+                and self.is_connected(room, namespace)):
+            return super().emit(event, data, namespace=namespace, room=room, skip_sid=skip_sid,
+                                ignore_queue=True, **kwargs)
+        return super().emit(event, data, namespace=namespace, room=room, skip_sid=skip_sid,
+                            callback=callback, **kwargs)
+
+
+class LocalQueueManager(LocalFirstMixin, socketio.PubSubManager):
+    """Socket.IO client manager that publishes through a LocalQueueBroker"""
+
+    name = 'local'
+
+    def __init__(self, url: str = 'local://127.0.0.1:6390', channel: str = 'socketio', write_only: bool = False,
+                 logger=None, json=None):
+        parsed = urlparse(url)
+        self.address = (parsed.hostname or '127.0.0.1', parsed.port or 6390)
+        self._socket_module = socket
+        self._publisher = None
+        self._publish_lock = threading.Lock()
+        super().__init__(channel=channel, write_only=write_only, logger=logger, json=json)
+
+    def initialize(self):
+        # Connections are opened lazily so a manager built before fork is never shared.
+        # Under eventlet/gevent the sockets and the publish lock must be cooperative,
+        # otherwise a blocked publisher would stall every other green thread.
+        if self.server.async_mode == 'eventlet':
+            from eventlet.green import socket as green_socket
+            from eventlet.semaphore import Semaphore
+            self._socket_module = green_socket
+            self._publish_lock = Semaphore()
+        elif self.server.async_mode == 'gevent':
+            from gevent import socket as green_socket
+            from gevent.lock import Semaphore
+            self._socket_module = green_socket
+            self._publish_lock = Semaphore()
+        super().initialize()
+
+    def _connect(self):
+        sock = self._socket_module.create_connection(self.address)
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        return sock
+
+    def _publish(self, data):
+        payload = json.dumps({'channel': self.channel, 'data': data}).encode('utf-8')
+        with self._publish_lock:
+            for attempt in range(2):
+                try:
+                    if self._publisher is None:
+                        self._publisher = self._connect()
+                    write_frame(self._publisher, payload)
+                    return
+                except OSError as e:
+                    self._publisher = None
+                    if attempt:
+                        self._get_logger().error(f"Cannot publish to message queue {self.address}: {str(e)}")
+
+    def _listen(self):
+        retry_sleep = 1
+        while True:
+            try:
+                sock = self._connect()
+                retry_sleep = 1
+                while True:
+                    payload = read_frame(sock)
+                    if payload is None:
+                        raise OSError('message queue closed the connection')
+                    message = json.loads(payload)
+                    if message.get('channel') == self.channel:
+                        yield message['data']
+            except OSError as e:
+                self._get_logger().error(f"Message queue connection lost ({str(e)}), retrying in {retry_sleep}s")
+                self.server.sleep(retry_sleep)
+                retry_sleep = min(retry_sleep * 2, 60)
+
+
+class LocalFirstRedisManager(LocalFirstMixin, socketio.RedisManager):
+    """Redis client manager that skips the queue for emits to locally connected clients"""
+
+
+def create_client_manager(url: Optional[str]):
+    """Return a Socket.IO client manager for a message queue URL, or None for a single process"""
+    if not url:
+        return None
+    scheme = urlparse(url).scheme
+    if scheme == 'local':
+        return LocalQueueManager(url)
+    if scheme in ('redis', 'rediss', 'unix'):
+        return LocalFirstRedisManager(url)
+    raise ValueError(f"Unsupported message queue URL: {url}")
@@ -0,0 +1,165 @@
+import json
+import time
+import uuid
+import threading
+from collections import OrderedDict, deque
+from typing import Any, Callable, Dict, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# Bookkeeping charged per buffered message on top of its content
+MESSAGE_OVERHEAD = 64
+
+
+def message_size(payload: Dict[str, Any]) -> int:
+    content = payload.get('content')
+    if isinstance(content, str):
+        return len(content) + MESSAGE_OVERHEAD
+    return len(json.dumps(content, default=str)) + MESSAGE_OVERHEAD
+
+
+class ReplyStream:
+    """One reply's emitted messages, numbered from 0, and the socket they currently go to"""
+
+    def __init__(self, stream_id: str, socket_id: str, wire: str = 'json'):
+        self.stream_id = stream_id
+        self.socket_id = socket_id
+        self.wire = wire
+        self.messages: deque = deque()  # (offset, payload, size)
+        self.next_offset = 0
+        self.bytes = 0
+        self.finished_at: Optional[float] = None
+        # Held while emitting so a resume never interleaves replayed and live messages
+        self.lock = threading.Lock()
+
+    @property
+    def first_offset(self) -> int:
+        return self.messages[0][0] if self.messages else self.next_offset
+
+
+class StreamBuffers:
+    """Bounded buffers of the messages emitted for each reply, so a client that reconnects can resume it.
+
+    Every message of a reply carries its stream_id and offset. A client
+    whose connection dropped sends resume with the stream ID and the last
+    offset it received; the messages after it are replayed to the new
+    connection, which also receives the rest of the reply. A reply keeps
+    at most max_stream_bytes (oldest messages are dropped first) and is
+    forgotten ttl seconds after it finishes. When all buffers together
+    exceed max_bytes, finished replies are evicted oldest first, then the
+    oldest messages of the largest unfinished one.
+    """
+
+    def __init__(self, emit: Callable[[str, Dict[str, Any], str], None], ttl: float = 120.0,
+                 max_stream_bytes: int = 256 * 1024, max_bytes: int = 64 * 1024 * 1024, metrics=None):
+        self.emit_to = emit
+        self.ttl = ttl
+        self.max_stream_bytes = max_stream_bytes
+        self.max_bytes = max_bytes
+        self.metrics = metrics
+        self.bytes = 0
+        self._lock = threading.Lock()
+        self._streams: 'OrderedDict[str, ReplyStream]' = OrderedDict()
+
+    def open(self, socket_id: str, wire: str = 'json') -> str:
+        """Start buffering a reply for socket_id, sent in the given wire format; returns its stream ID"""
+        stream = ReplyStream(uuid.uuid4().hex, socket_id, wire)
+        with self._lock:
+            self._expire(time.time())
+            self._streams[stream.stream_id] = stream
+        self._report()
+        return stream.stream_id
+
+    def emit(self, stream_id: str, payload: Dict[str, Any]):
+        """Number, buffer and send one message of a reply"""
+        stream = self._streams.get(stream_id)
+        if stream is None:
+            return
+        size = message_size(payload)
+        with stream.lock:
+            message = dict(payload, stream_id=stream_id, offset=stream.next_offset)
+            stream.next_offset += 1
+            dropped = 0
+            stream.messages.append((message['offset'], message, size))
+            stream.bytes += size
+            while stream.bytes > self.max_stream_bytes and len(stream.messages) > 1:
+                removed = stream.messages.popleft()[2]
+                stream.bytes -= removed
+                dropped += removed
+            self.emit_to(stream.socket_id, message, stream.wire)
+        with self._lock:
+            self.bytes += size - dropped
+            if self.bytes > self.max_bytes:
+                self._shrink()
+        self._report()
+
+    def finish(self, stream_id: str):
+        """The reply is complete; its buffer is kept for ttl seconds for late resumes"""
+        stream = self._streams.get(stream_id)
+        if stream is not None:
+            stream.finished_at = time.time()
+
+    def resume(self, stream_id: str, socket_id: str, offset: int, wire: Optional[str] = None) -> Dict[str, Any]:
+        """Move a reply to socket_id (switching its wire format if given) and replay what came after offset.
+
+        status is 'resumed', 'gap' when messages after offset were already
+        dropped (the rest is replayed anyway), or 'unknown' for an expired
+        or never seen stream.
+        """
+        with self._lock:
+            self._expire(time.time())
+            stream = self._streams.get(stream_id)
+        if stream is None:
+            if self.metrics:
+                self.metrics.incr('stream_resumes', status='unknown')
+            return {'stream_id': stream_id, 'status': 'unknown', 'replayed': 0}
+        with stream.lock:
+            status = 'gap' if stream.first_offset > offset + 1 else 'resumed'
+            stream.socket_id = socket_id
+            stream.wire = wire or stream.wire
+            replay = [message for position, message, _ in stream.messages if position > offset]
+            for message in replay:
+                self.emit_to(socket_id, message, stream.wire)
+            finished = stream.finished_at is not None
+        if self.metrics:
+            self.metrics.incr('stream_resumes', status=status)
+            self.metrics.incr('stream_replayed_messages', len(replay))
+        logger.info(f"Resumed stream {stream_id} from offset {offset}: {len(replay)} messages replayed ({status})")
+        return {'stream_id': stream_id, 'status': status, 'replayed': len(replay), 'finished': finished}
+
+    def _drop(self, stream_id: str):
+        stream = self._streams.pop(stream_id)
+        self.bytes -= stream.bytes
+
+    def _expire(self, now: float):
+        # Called with _lock held; streams are in creation order, so finished ones are found by a scan
+        expired = [stream_id for stream_id, stream in self._streams.items()
+                   if stream.finished_at is not None and now - stream.finished_at > self.ttl]
+        for stream_id in expired:
+            self._drop(stream_id)
+
+    def _shrink(self):
+        # Called with _lock held
+        self._expire(time.time())
+        for stream_id in [stream_id for stream_id, stream in self._streams.items() if stream.finished_at is not None]:
+            if self.bytes <= self.max_bytes:
+                return
+            self._drop(stream_id)
+            if self.metrics:
+                self.metrics.incr('stream_buffer_evictions', kind='stream')
+        while self.bytes > self.max_bytes and self._streams:
+            largest = max(self._streams.values(), key=lambda stream: stream.bytes)
+            with largest.lock:
+                if len(largest.messages) <= 1:
+                    return
+                size = largest.messages.popleft()[2]
+                largest.bytes -= size
+            self.bytes -= size
+            if self.metrics:
+                self.metrics.incr('stream_buffer_evictions', kind='message')
+
+    def _report(self):
+        if self.metrics:
+            self.metrics.gauge('stream_buffer_bytes', self.bytes)
+            self.metrics.gauge('stream_buffers', len(self._streams))
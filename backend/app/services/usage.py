@@ -0,0 +1,306 @@
+import math
+import time
+import sqlite3
+import threading
+from collections import deque
+from typing import Any, Dict, List, Optional, Tuple
+import logging
+
+from .conversation_service import count_tokens
+
+logger = logging.getLogger(__name__)
+
+# List prices in USD per million tokens: (prompt, cached prompt, completion). Override with USAGE_PRICES
+PRICES = {
+    'gpt-4o-mini': (0.15, 0.075, 0.60),
+    'gpt-4o': (2.50, 1.25, 10.00),
+    'gpt-4': (30.00, 30.00, 60.00),
+    'gpt-3.5-turbo': (0.50, 0.50, 1.50),
+    'claude-3-5-haiku-latest': (0.80, 0.08, 4.00),
+    'claude-3-5-sonnet-latest': (3.00, 0.30, 15.00),
+    'claude-3-7-sonnet-latest': (3.00, 0.30, 15.00),
+    'claude-3-opus-latest': (15.00, 1.50, 75.00),
+    'llama-3.3-70b-versatile': (0.59, 0.59, 0.79),
+    'llama-3.1-8b-instant': (0.05, 0.05, 0.08),
+    'qwen-2.5-coder-32b': (0.79, 0.79, 0.79),
+    'deepseek-chat': (0.27, 0.07, 1.10),
+    'deepseek-reasoner': (0.55, 0.14, 2.19),
+    'mistral-large-latest': (2.00, 2.00, 6.00),
+    'mistral-small-latest': (0.20, 0.20, 0.60),
+    'codestral-latest': (0.30, 0.30, 0.90),
+    'grok-2-latest': (2.00, 2.00, 10.00),
+    'command-r-plus-08-2024': (2.50, 2.50, 10.00),
+    'command-r7b-12-2024': (0.0375, 0.0375, 0.15),
+}
+
+# Summed per (minute, provider, model, mode)
+ROLLUP_FIELDS = ('requests', 'errors', 'estimated', 'prompt_tokens', 'completion_tokens', 'cached_tokens',
+                 'cost', 'ttft_ms', 'ttft_count', 'stream_ms', 'stream_tokens')
+
+SCHEMA = f"""
+CREATE TABLE IF NOT EXISTS usage_rollup (
+    minute INTEGER NOT NULL,
+    provider TEXT NOT NULL,
+    model TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    {', '.join(f'{field} REAL NOT NULL DEFAULT 0' for field in ROLLUP_FIELDS)},
+    PRIMARY KEY (minute, provider, model, mode)
+);
+"""
+
+
+def parse_prices(spec: str) -> Dict[str, Tuple[float, float, float]]:
+    """Parse 'model=prompt:cached:completion,...' (USD per million tokens); cached defaults to the prompt price"""
+    prices = {}
+    for item in (spec or '').split(','):
+        if not item.strip():
+            continue
+        model, _, values = item.partition('=')
+        parts = [float(value) for value in values.split(':')]
+        if len(parts) == 2:
+            parts = [parts[0], parts[0], parts[1]]
+        if len(parts) != 3:
+            raise ValueError(f"Invalid price for {model.strip()}: expected prompt:cached:completion")
+        prices[model.strip()] = tuple(parts)
+    return prices
+
+
+class UsageCollector:
+    """Token usage, cost and latency per request, aggregated per provider, model and mode.
+
+    record() only appends to a deque, which needs no lock, so the request
+    path never waits on aggregation or disk. A background thread drains it
+    every flush_interval seconds (sooner once batch_size events are
+    waiting), folds the events into per-minute rollups and adds those to
+    the usage_rollup table in one transaction. Workers sharing db_path
+    therefore see each other's traffic, up to one flush behind. Without a
+    db_path the rollups stay in memory.
+    """
+
+    def __init__(self, db_path: Optional[str] = None, flush_interval: float = 5.0, batch_size: int = 1000,
+                 prices: Optional[Dict[str, Tuple[float, float, float]]] = None, retention_days: float = 30,
+                 latency_slack: float = 1.5, min_requests: int = 5, metrics=None):
+        self.db_path = db_path
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.prices = dict(PRICES, **(prices or {}))
+        self.retention_days = retention_days
+        self.latency_slack = latency_slack
+        self.min_requests = min_requests
+        self.metrics = metrics
+        self._events: deque = deque()
+        self._wake = threading.Event()
+        self._flush_lock = threading.Lock()
+        self._memory: Dict[Tuple, List[float]] = {}
+        self._local = threading.local()
+        self._stop = threading.Event()
+        if db_path:
+            conn = self._connect()
+            conn.executescript(SCHEMA)
+            conn.commit()
+        self._flusher = threading.Thread(target=self._run_flusher, name='usage-flusher', daemon=True)
+        self._flusher.start()
+
+    def _connect(self) -> sqlite3.Connection:
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.row_factory = sqlite3.Row
+            self._local.conn = conn
+        return conn
+
+    def cost(self, model: str, usage: Dict[str, int]) -> Optional[float]:
+        """USD cost of a request, or None for a model without a price"""
+        price = self.prices.get(model)
+        if price is None:
+            return None
+        prompt, cached, completion = price
+        cached_tokens = usage.get('cached_tokens', 0)
+        return ((usage['prompt_tokens'] - cached_tokens) * prompt + cached_tokens * cached
+                + usage['completion_tokens'] * completion) / 1_000_000
+
+    def record(self, provider: str, model: str, mode: str, usage: Optional[Dict[str, int]] = None,
+               prompt_tokens: int = 0, completion: str = '', ttft_ms: Optional[float] = None,
+               duration_ms: Optional[float] = None, error: bool = False) -> Dict[str, Any]:
+        """Queue one request's usage and return it with its cost.
+
+        Without provider-reported usage (or with a completion count of 0 for a
+        non-empty reply) the tokens are counted locally: prompt_tokens is the
+        prompt as built, completion the reply text.
+        """
+        estimated = not error and (not usage or (not usage.get('completion_tokens') and bool(completion)))
+        if not usage or estimated:
+            usage = {'prompt_tokens': prompt_tokens, 'completion_tokens': count_tokens(completion),
+                     'cached_tokens': 0}
+        usage = dict(usage, estimated=estimated)
+        usage['cost_usd'] = self.cost(model, usage)
+        stream_ms = None
+        if ttft_ms is not None and duration_ms is not None:
+            stream_ms = max(duration_ms - ttft_ms, 0.0)
+        self._events.append((time.time(), provider, model or '', mode, error, usage, ttft_ms, stream_ms))
+        if len(self._events) >= self.batch_size:
+            self._wake.set()
+        if self.metrics and usage['cost_usd']:
+            self.metrics.incr('llm_cost_usd', usage['cost_usd'], provider=provider, model=model)
+        return usage
+
+    def _rollup(self, events: List[tuple]) -> Dict[Tuple, List[float]]:
+        rollup: Dict[Tuple, List[float]] = {}
+        for timestamp, provider, model, mode, error, usage, ttft_ms, stream_ms in events:
+            row = rollup.setdefault((int(timestamp // 60), provider, model, mode), [0.0] * len(ROLLUP_FIELDS))
+            row[0] += 1
+            row[1] += error
+            row[2] += usage['estimated']
+            row[3] += usage['prompt_tokens']
+            row[4] += usage['completion_tokens']
+            row[5] += usage.get('cached_tokens', 0)
+            row[6] += usage['cost_usd'] or 0.0
+            if ttft_ms is not None:
+                row[7] += ttft_ms
+                row[8] += 1
+            # Generation speed only counts replies that streamed more than one token
+            if stream_ms and usage['completion_tokens'] > 1:
+                row[9] += stream_ms
+                row[10] += usage['completion_tokens']
+        return rollup
+
+    def flush(self):
+        """Fold every queued event into the rollups"""
+        with self._flush_lock:
+            events = []
+            while True:
+                try:
+                    events.append(self._events.popleft())
+                except IndexError:
+                    break
+            if not events:
+                return
+            rollup = self._rollup(events)
+            if not self.db_path:
+                for key, values in rollup.items():
+                    row = self._memory.setdefault(key, [0.0] * len(ROLLUP_FIELDS))
+                    for i, value in enumerate(values):
+                        row[i] += value
+                return
+            columns = ', '.join(ROLLUP_FIELDS)
+            updates = ', '.join(f'{field} = {field} + excluded.{field}' for field in ROLLUP_FIELDS)
+            conn = self._connect()
+            with conn:
+                conn.executemany(
+                    f"INSERT INTO usage_rollup (minute, provider, model, mode, {columns}) "
+                    f"VALUES (?, ?, ?, ?, {', '.join('?' * len(ROLLUP_FIELDS))}) "
+                    f"ON CONFLICT(minute, provider, model, mode) DO UPDATE SET {updates}",
+                    [key + tuple(values) for key, values in rollup.items()]
+                )
+
+    def _prune(self):
+        if not self.retention_days:
+            return
+        oldest = int((time.time() - self.retention_days * 86400) // 60)
+        with self._flush_lock:
+            if self.db_path:
+                conn = self._connect()
+                with conn:
+                    conn.execute("DELETE FROM usage_rollup WHERE minute < ?", (oldest,))
+            else:
+                self._memory = {key: row for key, row in self._memory.items() if key[0] >= oldest}
+
+    def _run_flusher(self):
+        last_prune = 0.0
+        while not self._stop.is_set():
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            try:
+                self.flush()
+                if time.time() - last_prune >= 3600:
+                    last_prune = time.time()
+                    self._prune()
+            except Exception as e:
+                logger.error(f"Error flushing usage: {str(e)}")
+
+    def close(self):
+        self._stop.set()
+        self._wake.set()
+        self._flusher.join(timeout=5)
+        self.flush()
+
+    def _totals(self, since_minute: int) -> Dict[Tuple, List[float]]:
+        if not self.db_path:
+            with self._flush_lock:
+                totals: Dict[Tuple, List[float]] = {}
+                for (minute, *group), values in self._memory.items():
+                    if minute >= since_minute:
+                        row = totals.setdefault(tuple(group), [0.0] * len(ROLLUP_FIELDS))
+                        for i, value in enumerate(values):
+                            row[i] += value
+                return totals
+        sums = ', '.join(f'SUM({field})' for field in ROLLUP_FIELDS)
+        rows = self._connect().execute(
+            f"SELECT provider, model, mode, {sums} FROM usage_rollup WHERE minute >= ? "
+            f"GROUP BY provider, model, mode", (since_minute,)
+        ).fetchall()
+        return {tuple(row[:3]): list(row[3:]) for row in rows}
+
+    def summary(self, hours: float = 24) -> Dict[str, Any]:
+        """Usage, cost and speed per provider/model/mode over the last hours, and the model to prefer per mode"""
+        if not math.isfinite(hours) or hours <= 0:
+            raise ValueError("hours must be a positive number")
+        self.flush()
+        # Hours reaching before the epoch cover everything
+        since_minute = int(max(time.time() - hours * 3600, 0) // 60)
+        models = []
+        for (provider, model, mode), values in sorted(self._totals(since_minute).items()):
+            row = dict(zip(ROLLUP_FIELDS, values))
+            requests = int(row['requests'])
+            tokens = row['prompt_tokens'] + row['completion_tokens']
+            priced = model in self.prices
+            models.append({
+                'provider': provider,
+                'model': model,
+                'mode': mode,
+                'requests': requests,
+                'errors': int(row['errors']),
+                'estimated': int(row['estimated']),
+                'prompt_tokens': int(row['prompt_tokens']),
+                'completion_tokens': int(row['completion_tokens']),
+                'cached_tokens': int(row['cached_tokens']),
+                'cost_usd': round(row['cost'], 6) if priced else None,
+                'cost_per_1k_tokens': round(1000 * row['cost'] / tokens, 6) if priced and tokens else None,
+                'ttft_ms': round(row['ttft_ms'] / row['ttft_count'], 1) if row['ttft_count'] else None,
+                'tokens_per_sec': round(1000 * row['stream_tokens'] / row['stream_ms'], 1) if row['stream_ms'] else None,
+            })
+        return {
+            'hours': hours,
+            'models': models,
+            'totals': {
+                'requests': sum(m['requests'] for m in models),
+                'prompt_tokens': sum(m['prompt_tokens'] for m in models),
+                'completion_tokens': sum(m['completion_tokens'] for m in models),
+                'cost_usd': round(sum(m['cost_usd'] or 0.0 for m in models), 6),
+            },
+            'recommended': self.recommend(models),
+        }
+
+    def recommend(self, models: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+        """Per mode, the cheapest model whose TTFT is within latency_slack of the fastest one.
+
+        Only models with min_requests requests, a measured TTFT and mostly
+        successful replies are considered.
+        """
+        by_mode: Dict[str, List[Dict[str, Any]]] = {}
+        for model in models:
+            if (model['requests'] >= self.min_requests and model['ttft_ms'] is not None
+                    and model['errors'] * 2 < model['requests']):
+                by_mode.setdefault(model['mode'], []).append(model)
+        recommended = {}
+        for mode, candidates in by_mode.items():
+            fastest = min(model['ttft_ms'] for model in candidates)
+            fast_enough = [model for model in candidates if model['ttft_ms'] <= fastest * self.latency_slack]
+            best = min(fast_enough, key=lambda model: (
+                model['cost_per_1k_tokens'] if model['cost_per_1k_tokens'] is not None else float('inf'),
+                model['ttft_ms']))
+            recommended[mode] = {key: best[key] for key in
+                                 ('provider', 'model', 'ttft_ms', 'tokens_per_sec', 'cost_per_1k_tokens')}
+        return recommended
@@ -0,0 +1,31 @@
+import struct
+from typing import Iterable, Optional, Tuple
+
+# Wire formats a client can ask for with 'wire' in its message; 'json' is the fallback
+WIRE_FORMATS = ('json', 'binary')
+
+# A 'chunk' frame: stream ID (its 32 hex digits as 16 bytes, zero without resumable streams), offset, then UTF-8 text
+CHUNK_HEADER = struct.Struct('!16sI')
+NO_STREAM = bytes(16)
+
+
+def parse_formats(spec: str) -> Tuple[str, ...]:
+    """Parse 'json,binary' into the formats this server accepts; JSON is always accepted"""
+    formats = [name.strip() for name in (spec or '').split(',') if name.strip() in WIRE_FORMATS]
+    return tuple(dict.fromkeys(['json'] + formats))
+
+
+def negotiate(requested: Optional[str], allowed: Iterable[str]) -> str:
+    return requested if requested in allowed else 'json'
+
+
+def encode_chunk(stream_id: Optional[str], offset: int, text: str) -> bytes:
+    header = CHUNK_HEADER.pack(bytes.fromhex(stream_id) if stream_id else NO_STREAM, offset)
+    return header + text.encode('utf-8')
+
+
+def decode_chunk(frame: bytes) -> Tuple[Optional[str], int, str]:
+    """The inverse of encode_chunk: (stream_id, offset, text)"""
+    raw_id, offset = CHUNK_HEADER.unpack_from(frame)
+    stream_id = raw_id.hex() if raw_id != NO_STREAM else None
+    return stream_id, offset, frame[CHUNK_HEADER.size:].decode('utf-8')
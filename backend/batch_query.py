@@ -0,0 +1,80 @@
+"""Answer a JSONL file of queries offline, appending results to an output JSONL file.
+
+Each input line is {"id": ..., "query": ..., "mode": ..., "provider": ...,
+"model": ..., "collection": ..., "filter": {...}}; only "query" is required.
+Duplicate queries are answered once, document retrieval is one embedding
+call and one vectorised search per collection and filter, and LLM calls
+run with bounded concurrency per provider.
+Run it again with the same output file to resume after an interruption:
+queries already answered there are skipped.
+
+Usage:
+    python batch_query.py queries.jsonl results.jsonl --mode rag --concurrency openai=8,groq=2
+"""
+import os
+import sys
+import json
+import argparse
+
+# Batch retrieval embeds in this process, so there is no use for a retrieval pool
+os.environ.setdefault('RETRIEVAL_PROCESSES', '0')
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of queries")
+    parser.add_argument('queries', help="Input JSONL, one query per line")
+    parser.add_argument('output', help="Output JSONL; answered queries in it are skipped")
+    parser.add_argument('--mode', choices=['llm', 'rag', 'web', 'hybrid'], help="Mode for lines without one (rag)")
+    parser.add_argument('--provider', help="Provider for lines without one (openai)")
+    parser.add_argument('--model', help="Model for lines without one (the provider's default)")
+    parser.add_argument('--collection', help="Document collection for lines without one (default)")
+    parser.add_argument('--concurrency', help="Requests in flight per provider, as 'openai=8,groq=2' "
+                                              "(default BATCH_PROVIDER_CONCURRENCY)")
+    parser.add_argument('--no-resume', action='store_true', help="Start the output file over")
+    parser.add_argument('--report', help="Also write the job report (JSON) to this file")
+    args = parser.parse_args()
+
+    from app import create_app
+    from app.services.batch import parse_concurrency, read_queries
+
+    defaults = {field: getattr(args, field) for field in ('mode', 'provider', 'model', 'collection')
+                if getattr(args, field)}
+    try:
+        with open(args.queries) as f:
+            queries = read_queries(f, defaults)
+    except (OSError, ValueError) as e:
+        print(f"Could not read {args.queries}: {str(e)}")
+        sys.exit(1)
+    if args.no_resume and os.path.exists(args.output):
+        os.remove(args.output)
+
+    # Not worker 0, so no document indexing jobs are started
+    app = create_app(worker_index=1)
+    runner = app.config['batch_runner']
+    if args.concurrency:
+        runner.concurrency = parse_concurrency(args.concurrency)
+
+    def progress(report):
+        print(f"  {report['completed'] + report['failed']}/{report['queries'] - report['resumed']} queries answered "
+              f"({report['failed']} failed)")
+
+    with app.app_context():
+        report = runner.run(queries, args.output, progress=progress)
+
+    print(f"{report['queries']} queries ({report['unique']} unique, {report['resumed']} already answered): "
+          f"{report['completed']} answered, {report['failed']} failed in {report['seconds']:.1f}s "
+          f"({report['queries_per_sec'] or 0:.1f} queries/s)")
+    print(f"Document retrieval: {report['retrieval']['queries']} queries in {report['retrieval']['ms']:.0f}ms")
+    latency = report['latency_ms']
+    if latency:
+        print(f"Latency: p50 {latency['p50']:.0f}ms, p90 {latency['p90']:.0f}ms, p99 {latency['p99']:.0f}ms, "
+              f"max {latency['max']:.0f}ms")
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+    if report['failed']:
+        sys.exit(2)
+
+
+if __name__ == '__main__':
+    main()
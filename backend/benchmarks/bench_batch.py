@@ -0,0 +1,162 @@
+"""Batch query runs (batch_query.py) against answering the same queries one at a time.
+
+Builds a synthetic mmap store of --chunks chunks, starts the fake provider
+and loads the app in this process. A file of --queries queries, a
+--duplicates fraction of them repeats, is then answered twice in RAG mode:
+
+- sequential: one query at a time through build_context and the LLM, as
+  driving the chat path message by message does today;
+- batch: BatchRunner, which answers duplicates once, retrieves for all
+  queries with one embedding call and one vectorised search, and runs
+  --concurrency LLM requests at a time.
+
+Also times retrieval alone for the unique queries: per-query embedding and
+search against one batch embedding call and one batch search, with search
+time reported separately. Reports queries/sec and latency percentiles.
+
+Usage:
+    python benchmarks/bench_batch.py --queries 500 --duplicates 0.2 --chunks 50000 --concurrency 8
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from benchmarks.common import free_port, percentiles, save_results, spawn, wait_for_http  # noqa: E402
+
+WORDS = ("retrieval index vector model latency cache token stream provider document chunk search "
+         "embedding query answer context prompt batch throughput memory").split()
+
+
+def build_store(path, chunks, dim):
+    from langchain_core.documents import Document
+    from app.services.mmap_store import MMAP_DIRNAME, write_mmap_store
+
+    rng = np.random.default_rng(0)
+    words = np.array(WORDS)
+    documents = [Document(page_content=f"Chunk {i}: " + ' '.join(rng.choice(words, 60)),
+                          metadata={'source': f"doc-{i // 50}.pdf"}) for i in range(chunks)]
+    write_mmap_store(os.path.join(path, MMAP_DIRNAME), rng.standard_normal((chunks, dim), dtype=np.float32),
+                     documents)
+
+
+def make_queries(count, duplicates):
+    rng = random.Random(0)
+    unique = [f"How does {' '.join(rng.sample(WORDS, 4))} work? ({n})"
+              for n in range(max(1, int(count * (1 - duplicates))))]
+    queries = unique + [rng.choice(unique) for _ in range(count - len(unique))]
+    rng.shuffle(queries)
+    return [{'id': str(n), 'query': query, 'mode': 'rag', 'provider': 'openai', 'model': None, 'persona': 'default'}
+            for n, query in enumerate(queries)]
+
+
+def run_sequential(app, queries):
+    from app.services.llm_service import invoke_messages
+
+    rag_service, conversation_store = app.config['rag_service'], app.config['conversation_store']
+    rag_service.clear_document_cache()
+    latencies = []
+    started = time.perf_counter()
+    with app.app_context():
+        llm = app.config['llm_factory'].get_llm('openai', streaming=False)
+        for query in queries:
+            sent = time.perf_counter()
+            context, _ = rag_service.build_context(query['query'].strip(), False, True, llm.model_name)
+            messages, _ = conversation_store.build_messages('bench-sequential', query['query'], llm.model_name,
+                                                            context=context)
+            invoke_messages(llm, messages)
+            latencies.append((time.perf_counter() - sent) * 1000)
+    seconds = time.perf_counter() - started
+    return {'seconds': seconds, 'queries_per_sec': len(queries) / seconds, 'llm_requests': len(queries),
+            'latency_ms': percentiles(latencies, points=(50, 90, 99))}
+
+
+def run_batch(app, queries, output_path):
+    with app.app_context():
+        report = app.config['batch_runner'].run(queries, output_path)
+    return {'seconds': report['seconds'], 'queries_per_sec': report['queries_per_sec'],
+            'llm_requests': report['unique'], 'retrieval_ms': report['retrieval']['ms'],
+            'failed': report['failed'], 'latency_ms': report['latency_ms']}
+
+
+def time_retrieval(rag_service, texts, k=5):
+    """Per-query embedding and search against one batch call of each, for the same texts"""
+    store, embeddings = rag_service.vector_store, rag_service.embeddings
+    started = time.perf_counter()
+    vectors = [embeddings.embed_query(text) for text in texts]
+    embedded = time.perf_counter()
+    for vector in vectors:
+        store.similarity_search_with_score_by_vector(vector, k)
+    per_query = {'embed_ms': (embedded - started) * 1000, 'search_ms': (time.perf_counter() - embedded) * 1000}
+
+    started = time.perf_counter()
+    vectors = embeddings.embed_documents(texts)
+    embedded = time.perf_counter()
+    store.similarity_search_by_vectors_with_score(vectors, k)
+    batched = {'embed_ms': (embedded - started) * 1000, 'search_ms': (time.perf_counter() - embedded) * 1000}
+    return {'per_query': per_query, 'batch': batched}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Batch query runs against one query at a time")
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--duplicates', type=float, default=0.2, help="Fraction of queries that repeat another")
+    parser.add_argument('--chunks', type=int, default=50000, help="Chunks in the synthetic store")
+    parser.add_argument('--concurrency', type=int, default=8, help="Batch LLM requests in flight")
+    parser.add_argument('--tokens', type=int, default=50, help="Tokens per fake completion")
+    parser.add_argument('--tps', type=float, default=500, help="Fake provider tokens per second")
+    parser.add_argument('--ttft', type=float, default=0.2, help="Fake provider time to first token")
+    parser.add_argument('--output-dir', help="Directory for the JSON results")
+    args = parser.parse_args()
+
+    workdir = tempfile.mkdtemp(prefix='bench-batch-')
+    provider_port = free_port()
+    provider_url = f"http://127.0.0.1:{provider_port}"
+    # Configuration is read from the environment when the app package is first imported
+    os.environ.update({
+        'OPENAI_API_KEY': 'fake-key', 'OPENAI_BASE_URL': f"{provider_url}/v1", 'VECTOR_STORE_PATH': workdir,
+        'RETRIEVAL_PROCESSES': '0', 'DOCUMENT_UPLOADS_ENABLED': 'False', 'USAGE_TRACKING': 'False',
+        'CONVERSATION_DB_PATH': '', 'RATE_LIMIT_ENABLED': 'False',
+        'BATCH_PROVIDER_CONCURRENCY': f"openai={args.concurrency}",
+    })
+    from langchain_huggingface import HuggingFaceEmbeddings
+    dim = len(HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2").embed_query('dimension'))
+    build_store(workdir, args.chunks, dim)
+    provider = spawn(['benchmarks/fake_provider.py', '--port', str(provider_port), '--ttft', str(args.ttft),
+                      '--tps', str(args.tps), '--max-tokens', str(args.tokens)])
+    queries = make_queries(args.queries, args.duplicates)
+    results = {'config': {key: value for key, value in vars(args).items() if key != 'output_dir'}}
+    try:
+        wait_for_http(f"{provider_url}/health")
+        from app import create_app
+        app = create_app(worker_index=1)
+
+        unique = list(dict.fromkeys(query['query'] for query in queries))
+        results['retrieval'] = time_retrieval(app.config['rag_service'], unique)
+        results['sequential'] = run_sequential(app, queries)
+        results['batch'] = run_batch(app, queries, os.path.join(workdir, 'results.jsonl'))
+    finally:
+        provider.terminate()
+        provider.wait()
+
+    for name, method in results['retrieval'].items():
+        print(f"[retrieval, {name}] {len(unique)} queries: embedding {method['embed_ms']:.0f}ms, "
+              f"search {method['search_ms']:.0f}ms")
+    for name in ('sequential', 'batch'):
+        run = results[name]
+        print(f"[{name}] {args.queries} queries in {run['seconds']:.1f}s ({run['queries_per_sec']:.1f} queries/s), "
+              f"{run['llm_requests']} LLM requests, latency p50 {run['latency_ms'].get('p50', 0):.0f}ms "
+              f"p99 {run['latency_ms'].get('p99', 0):.0f}ms")
+
+    path = save_results('batch', results, args.output_dir)
+    print(f"Results saved to {path}")
+
+
+if __name__ == '__main__':
+    main()
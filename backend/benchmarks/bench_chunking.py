@@ -0,0 +1,228 @@
+"""Chunking and duplicate removal in the indexing pipeline.
+
+Generates a text corpus with the kinds of repetition real document sets
+have (or uses --corpus): every document starts with the same boilerplate
+page, a --copies fraction of documents are exact copies of another and a
+--near-copies fraction are copies with one token per paragraph changed.
+Then, on the same pages:
+
+- splitting: langchain's RecursiveCharacterTextSplitter against
+  FastTextSplitter, in chunks/sec and MB/sec, checking that both make the
+  same chunks;
+- dedup: ChunkDeduplicator over all chunks for each --near-distances
+  value, reporting exact and near duplicates, the share of embedding
+  calls avoided and the time spent per chunk;
+- build (--build): create_index's StreamingIndexBuilder end to end with
+  dedup off and on, in chunks/sec and embedding calls made, checking that
+  a search filtered to each file still finds its first chunk when that
+  chunk was kept for an earlier file (the shared boilerplate).
+
+Exit status 1 if the splitters make different chunks or a filtered search
+misses a deduplicated chunk.
+
+Usage:
+    python benchmarks/bench_chunking.py --docs 100 --pages 20 --copies 0.1 --near-copies 0.1 --build
+    python benchmarks/bench_chunking.py --corpus ./documents --near-distances 0,4,6
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.bench_ingestion import WORDS, make_embeddings  # noqa: E402
+from benchmarks.common import save_results  # noqa: E402
+
+BOILERPLATE = ("Confidential. This document is provided for internal use only and may not be copied or "
+               "distributed without written permission. All trademarks are the property of their owners. "
+               "The information here is provided as is, without warranty of any kind.\n\n") * 4
+
+
+def make_corpus(path, docs, pages, copies, near_copies, seed=0):
+    """Write docs text files of a boilerplate page plus pages * 3KB of text, some of them copies"""
+    rng = random.Random(seed)
+    os.makedirs(path, exist_ok=True)
+    originals = []
+    for d in range(docs):
+        roll = rng.random()
+        if originals and roll < copies:
+            text = rng.choice(originals)
+        elif originals and roll < copies + near_copies:
+            # Same paragraphs with one word changed in each, like a revised export
+            paragraphs = rng.choice(originals).split('\n\n')
+            for n, paragraph in enumerate(paragraphs):
+                words = paragraph.split(' ')
+                if len(words) > 10:
+                    words[rng.randrange(len(words))] = f"rev{d}"
+                    paragraphs[n] = ' '.join(words)
+            text = '\n\n'.join(paragraphs)
+        else:
+            text = '\n\n'.join(' '.join(rng.choice(WORDS) for _ in range(80)) + '.' for _ in range(pages * 6))
+            originals.append(text)
+        with open(os.path.join(path, f"doc-{d:04d}.txt"), 'w') as f:
+            f.write(BOILERPLATE + text)
+    return sorted(os.path.join(path, name) for name in os.listdir(path))
+
+
+def read_pages(files):
+    from app.services.ingestion import iter_pages
+
+    return [page for file_path in files for _, page in iter_pages(file_path)]
+
+
+def time_split(splitter, pages, repeat):
+    best, chunks = None, None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        chunks = [chunk for page in pages for chunk in splitter.split_documents([page])]
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    size = sum(len(page.page_content) for page in pages)
+    return chunks, {'seconds': best, 'chunks': len(chunks), 'chunks_per_sec': len(chunks) / best,
+                    'mb_per_sec': size / best / (1024 * 1024)}
+
+
+def time_dedup(chunks, near_distance):
+    from app.services.dedup import ChunkDeduplicator
+
+    deduplicator = ChunkDeduplicator(near_distance)
+    started = time.perf_counter()
+    kept, _, duplicates = deduplicator.filter(chunks)
+    elapsed = time.perf_counter() - started
+    exact = sum(1 for duplicate in duplicates if duplicate['kind'] == 'exact')
+    return {'near_distance': near_distance, 'kept': len(kept), 'exact_duplicates': exact,
+            'near_duplicates': len(duplicates) - exact,
+            'embeddings_avoided_pct': 100.0 * len(duplicates) / len(chunks) if chunks else 0.0,
+            'us_per_chunk': elapsed * 1e6 / len(chunks) if chunks else 0.0}
+
+
+class CountingEmbeddings:
+    def __init__(self, embeddings):
+        self.embeddings = embeddings
+        self.texts = 0
+
+    def embed_documents(self, texts):
+        self.texts += len(texts)
+        return self.embeddings.embed_documents(texts)
+
+
+def filtered_misses(store, files, splitter):
+    """Files whose first chunk a search filtered to that file doesn't return"""
+    from app.services.ingestion import iter_pages
+    from app.services.metadata_filter import normalize_filter
+
+    misses = []
+    for file_path in files:
+        _, page = next(iter_pages(file_path))
+        text = splitter.split_documents([page])[0].page_content
+        hits = store.similarity_search_by_vector_with_score(store.embedding.embed_query(text), k=1,
+                                                            filter=normalize_filter({'source': file_path}))
+        if not hits or hits[0][0].page_content != text:
+            misses.append(file_path)
+    return misses
+
+
+def time_build(files, embeddings, chunk_size, chunk_overlap, dedup, near_distance):
+    from app.services.ingestion import StreamingIndexBuilder
+    from app.services.mmap_store import MMAP_DIRNAME, MmapVectorStore
+
+    index_path = tempfile.mkdtemp(prefix='bench-chunking-index-')
+    try:
+        counting = CountingEmbeddings(embeddings)
+        builder = StreamingIndexBuilder(counting, index_path, chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                        dedup=dedup, near_distance=near_distance)
+        summary = builder.build(files, resume=False)
+        store = MmapVectorStore(os.path.join(index_path, MMAP_DIRNAME), embeddings)
+        misses = filtered_misses(store, files, builder.splitter)
+        del store
+        return {'dedup': dedup, 'filtered_misses': len(misses), 'seconds': summary['seconds'], 'chunks_per_sec': summary['chunks_per_sec'],
+                'vectors': summary['vectors'], 'embedding_calls': counting.texts,
+                'exact_duplicates': summary['exact_duplicates'], 'near_duplicates': summary['near_duplicates'],
+                'embeddings_avoided_pct': summary['embeddings_avoided_pct']}
+    finally:
+        shutil.rmtree(index_path, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Chunking speed and duplicate removal before embedding")
+    parser.add_argument('--corpus', help="Directory of .txt/.pdf files (default: generate one)")
+    parser.add_argument('--docs', type=int, default=100, help="Generated documents")
+    parser.add_argument('--pages', type=int, default=20, help="Pages (~3KB each) per generated document")
+    parser.add_argument('--copies', type=float, default=0.1, help="Fraction of generated documents that are copies")
+    parser.add_argument('--near-copies', type=float, default=0.1,
+                        help="Fraction of generated documents that are copies with a word per paragraph changed")
+    parser.add_argument('--chunk-size', type=int, default=1000)
+    parser.add_argument('--chunk-overlap', type=int, default=200)
+    parser.add_argument('--near-distances', default='0,4', help="Comma-separated SimHash distances to try")
+    parser.add_argument('--repeat', type=int, default=3, help="Splitting runs; the fastest is reported")
+    parser.add_argument('--build', action='store_true', help="Also time full index builds with dedup off and on")
+    parser.add_argument('--fake-embeddings', action='store_true', help="Use a deterministic fake embedding model")
+    parser.add_argument('--output-dir', help="Directory for the JSON results")
+    args = parser.parse_args()
+
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from app.services.chunking import FastTextSplitter
+    from app.services.ingestion import find_documents
+
+    corpus_dir = None
+    if args.corpus:
+        files = find_documents(args.corpus)
+    else:
+        corpus_dir = tempfile.mkdtemp(prefix='bench-chunking-corpus-')
+        files = make_corpus(corpus_dir, args.docs, args.pages, args.copies, args.near_copies)
+
+    results = {'config': {key: value for key, value in vars(args).items() if key != 'output_dir'}}
+    try:
+        pages = read_pages(files)
+        splitters = {
+            'langchain': RecursiveCharacterTextSplitter(chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap),
+            'fast': FastTextSplitter(chunk_size=args.chunk_size, chunk_overlap=args.chunk_overlap),
+        }
+        results['split'] = {}
+        outputs = {}
+        for name, splitter in splitters.items():
+            outputs[name], results['split'][name] = time_split(splitter, pages, args.repeat)
+            run = results['split'][name]
+            print(f"[split, {name}] {len(pages)} pages into {run['chunks']} chunks in {run['seconds'] * 1000:.0f}ms: "
+                  f"{run['chunks_per_sec']:.0f} chunks/s, {run['mb_per_sec']:.1f} MB/s")
+        identical = ([doc.page_content for doc in outputs['langchain']] ==
+                     [doc.page_content for doc in outputs['fast']])
+        results['split']['identical'] = identical
+        results['split']['speedup'] = results['split']['langchain']['seconds'] / results['split']['fast']['seconds']
+        print(f"FastTextSplitter speedup {results['split']['speedup']:.1f}x, "
+              f"{'same chunks' if identical else 'CHUNKS DIFFER'}")
+
+        results['dedup'] = []
+        for distance in [int(d) for d in args.near_distances.split(',') if d.strip()]:
+            run = time_dedup(outputs['fast'], distance)
+            results['dedup'].append(run)
+            print(f"[dedup, near distance {distance}] {run['exact_duplicates']} exact and {run['near_duplicates']} "
+                  f"near duplicates of {len(outputs['fast'])} chunks: {run['embeddings_avoided_pct']:.1f}% of "
+                  f"embedding calls avoided, {run['us_per_chunk']:.0f}us/chunk")
+
+        if args.build:
+            embeddings = make_embeddings(args.fake_embeddings)
+            distance = int(args.near_distances.split(',')[-1])
+            results['build'] = [time_build(files, embeddings, args.chunk_size, args.chunk_overlap, dedup, distance)
+                                for dedup in (False, True)]
+            for run in results['build']:
+                print(f"[build, dedup {'on' if run['dedup'] else 'off'}] {run['vectors']} vectors in "
+                      f"{run['seconds']:.1f}s ({run['chunks_per_sec']:.0f} chunks/s), "
+                      f"{run['embedding_calls']} chunks embedded ({run['embeddings_avoided_pct']:.1f}% avoided), "
+                      f"{run['filtered_misses']} of {len(files)} files' filtered searches missed their first chunk")
+    finally:
+        if corpus_dir:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    path = save_results('chunking', results, args.output_dir)
+    print(f"Results saved to {path}")
+    if not identical or any(run['filtered_misses'] for run in results.get('build', [])):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+"""Search scoped to one collection: partitioned indexes and metadata filters against searching everything.
+
+Writes a synthetic corpus of --collections tenants with
+--chunks-per-collection random vectors each, in --chunks-per-file files,
+twice: as one global mmap store whose files.jsonl tags every file with
+its tenant, and as one store per tenant under collections/, as
+create_index.py --partition-by writes them. Then the same --queries
+(query vector, tenant) pairs, tenants drawn with Zipf skew --skew, are
+searched three ways:
+
+- global: the whole store, unfiltered; what a scoped question cost before
+  collections existed (and the hits may belong to any tenant);
+- filtered: the global store with {"tenant": ...}, scanning only that
+  tenant's rows;
+- partitioned: the tenant's own store through CollectionManager, with at
+  most --max-loaded stores open, so collection opens and closes are part
+  of the latency.
+
+Reports latency percentiles, queries/sec, rows scanned per query, peak
+RSS, and opens and closes for the partitioned run, and checks that the
+filtered and partitioned searches return the same hits (exit status 1
+if not).
+
+Usage:
+    python benchmarks/bench_collections.py --collections 16 --chunks-per-collection 20000 --max-loaded 4
+"""
+import argparse
+import gc
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+
+from benchmarks.common import ResourceSampler, percentiles, save_results  # noqa: E402
+
+
+def write_corpus(path, collections, chunks_per_collection, chunks_per_file, dim, dtype):
+    """Write the global store and one store per tenant; returns the tenant names"""
+    from langchain_core.documents import Document
+    from app.services.collection_store import collection_path
+    from app.services.mmap_store import FILES_FILE, MMAP_DIRNAME, MmapStoreWriter
+
+    rng = np.random.default_rng(0)
+    tenants = [f"tenant{n:03d}" for n in range(collections)]
+    global_writer = MmapStoreWriter(os.path.join(path, MMAP_DIRNAME), dtype=dtype)
+    global_files = []
+    for tenant in tenants:
+        tenant_path = os.path.join(collection_path(path, tenant), MMAP_DIRNAME)
+        writer = MmapStoreWriter(tenant_path, dtype=dtype)
+        files = []
+        for start in range(0, chunks_per_collection, chunks_per_file):
+            count = min(chunks_per_file, chunks_per_collection - start)
+            source = f"{tenant}/doc-{start // chunks_per_file:05d}.txt"
+            metadata = {'source': source, 'tenant': tenant}
+            vectors = rng.standard_normal((count, dim), dtype=np.float32)
+            documents = [Document(page_content=f"{source} chunk {i}", metadata=metadata) for i in range(count)]
+            for store_writer, entries in ((writer, files), (global_writer, global_files)):
+                entries.append({'source': source, 'start': store_writer.count, 'end': store_writer.count + count,
+                                'metadata': metadata})
+                store_writer.append(vectors, documents)
+        writer.finalize()
+        write_files(os.path.join(tenant_path, FILES_FILE), files)
+    global_writer.finalize()
+    write_files(os.path.join(path, MMAP_DIRNAME, FILES_FILE), global_files)
+    return tenants
+
+
+def write_files(path, entries):
+    with open(path, 'w') as f:
+        for entry in entries:
+            f.write(json.dumps(entry) + '\n')
+
+
+def make_queries(tenants, count, dim, skew):
+    rng = np.random.default_rng(1)
+    # Zipf popularity: a few tenants get most of the traffic, as in a multi-tenant deployment
+    weights = 1.0 / np.arange(1, len(tenants) + 1) ** skew
+    picks = rng.choice(len(tenants), size=count, p=weights / weights.sum())
+    vectors = rng.standard_normal((count, dim), dtype=np.float32)
+    return [(vectors[n].tolist(), tenants[pick]) for n, pick in enumerate(picks)]
+
+
+def run(name, queries, search, k):
+    sampler = ResourceSampler(os.getpid(), interval=0.05).start()
+    latencies, hits, scanned = [], [], 0
+    started = time.perf_counter()
+    for vector, tenant in queries:
+        sent = time.perf_counter()
+        found, rows = search(vector, tenant, k)
+        latencies.append((time.perf_counter() - sent) * 1000)
+        hits.append([doc.page_content for doc, _ in found])
+        scanned += rows
+    seconds = time.perf_counter() - started
+    resources = sampler.stop()
+    result = {'seconds': seconds, 'queries_per_sec': len(queries) / seconds,
+              'rows_per_query': scanned / len(queries), 'latency_ms': percentiles(latencies, points=(50, 90, 99)),
+              'rss_peak_mb': resources['rss_peak_mb']}
+    print(f"[{name}] {len(queries)} queries in {seconds:.2f}s ({result['queries_per_sec']:.0f}/s), "
+          f"{result['rows_per_query']:.0f} rows scanned per query, p50 {result['latency_ms']['p50']:.2f}ms "
+          f"p99 {result['latency_ms']['p99']:.2f}ms, peak RSS {result['rss_peak_mb']:.0f}MB")
+    return result, hits
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Partitioned and filtered search against searching everything")
+    parser.add_argument('--collections', type=int, default=16, help="Tenants, one collection each")
+    parser.add_argument('--chunks-per-collection', type=int, default=20000)
+    parser.add_argument('--chunks-per-file', type=int, default=50)
+    parser.add_argument('--dim', type=int, default=384)
+    parser.add_argument('--dtype', choices=['float32', 'float16'], default='float32')
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--skew', type=float, default=1.2, help="Zipf exponent of tenant popularity")
+    parser.add_argument('--max-loaded', type=int, default=4, help="Collections open at once (COLLECTIONS_MAX_LOADED)")
+    parser.add_argument('--k', type=int, default=5)
+    parser.add_argument('--output-dir', help="Directory for the JSON results")
+    args = parser.parse_args()
+
+    from app.services.collection_store import CollectionManager, open_base_store
+    from app.services.live_store import LIVE_DIRNAME, LiveVectorStore
+    from app.services.metadata_filter import normalize_filter
+    from app.services.metrics import Metrics
+
+    workdir = tempfile.mkdtemp(prefix='bench-collections-')
+    results = {'config': {key: value for key, value in vars(args).items() if key != 'output_dir'}}
+    try:
+        started = time.perf_counter()
+        tenants = write_corpus(workdir, args.collections, args.chunks_per_collection, args.chunks_per_file,
+                               args.dim, args.dtype)
+        results['write_seconds'] = time.perf_counter() - started
+        queries = make_queries(tenants, args.queries, args.dim, args.skew)
+        total = args.collections * args.chunks_per_collection
+        print(f"{total} chunks in {args.collections} collections written in {results['write_seconds']:.1f}s")
+
+        base = open_base_store(workdir, None)
+        store = LiveVectorStore(base, os.path.join(workdir, LIVE_DIRNAME), None)
+
+        def search_global(vector, tenant, k):
+            return store.similarity_search_with_score_by_vector(vector, k), total
+
+        def search_filtered(vector, tenant, k):
+            scope = normalize_filter({'tenant': tenant})
+            runs = base.filter_runs(scope)
+            hits = store.similarity_search_with_score_by_vector(vector, k, filter=scope)
+            return hits, int((runs[:, 1] - runs[:, 0]).sum())
+
+        results['global'], _ = run('global', queries, search_global, args.k)
+        results['filtered'], filtered_hits = run('filtered', queries, search_filtered, args.k)
+        del base, store
+        gc.collect()
+
+        metrics = Metrics()
+        default = LiveVectorStore(open_base_store(workdir, None), os.path.join(workdir, LIVE_DIRNAME), None)
+        collections = CollectionManager(workdir, None, default, max_loaded=args.max_loaded, metrics=metrics)
+
+        def search_partitioned(vector, tenant, k):
+            collection = collections.get(tenant)
+            return collection.similarity_search_with_score_by_vector(vector, k), len(collection)
+
+        results['partitioned'], partitioned_hits = run('partitioned', queries, search_partitioned, args.k)
+        counters = metrics.snapshot()['counters']
+        results['partitioned'].update(opens=int(counters.get('collection_loads', 0)),
+                                      closes=int(counters.get('collection_unloads', 0)))
+        print(f"[partitioned] {results['partitioned']['opens']} collection opens, "
+              f"{results['partitioned']['closes']} closes with at most {args.max_loaded} open")
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    identical = filtered_hits == partitioned_hits
+    results['identical'] = identical
+    for name in ('filtered', 'partitioned'):
+        results[name]['speedup'] = results['global']['latency_ms']['p50'] / results[name]['latency_ms']['p50']
+    print(f"p50 speedup over global search: filtered {results['filtered']['speedup']:.1f}x, "
+          f"partitioned {results['partitioned']['speedup']:.1f}x; "
+          f"{'same hits' if identical else 'FILTERED AND PARTITIONED HITS DIFFER'}")
+
+    path = save_results('collections', results, args.output_dir)
+    print(f"Results saved to {path}")
+    if not identical:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,188 @@
+"""Context compression: tokens saved, answer retention and the effect on TTFT.
+
+Builds retrieval results from the labelled set in
+benchmarks/data/retrieval_eval.json the way the app sees them: each
+document is split into overlapping chunks, and every question gets all
+chunks of the document that answers it, --noise chunks from other
+documents and --duplicates repeated chunks (the same page found by
+document and web search), ordered by query term overlap as a stand-in
+for the retriever's ranking. The candidates are then put in the prompt raw,
+as before, and compressed by ContextCompressor.
+
+Reports prompt context tokens raw vs compressed, compression time, and
+answer retention: the share of each relevant passage's sentences that
+survive compression. Then it measures time to first token for both
+prompts against an OpenAI-compatible endpoint. By default this is the
+fake provider started in-process with --prefill-tps, so TTFT grows with
+prompt length the way a real model's prefill does; pass --base-url to
+measure a real provider instead.
+
+Usage:
+    python benchmarks/bench_context.py --chunk-size 400 --chunk-overlap 100 --noise 4 --duplicates 1
+    python benchmarks/bench_context.py --base-url http://localhost:8000/v1 --model llama3 --api-key none
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import free_port, percentiles, save_results  # noqa: E402
+
+EVAL_SET = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'retrieval_eval.json')
+
+
+def build_cases(path, chunk_size, chunk_overlap, noise, duplicates, seed=0):
+    """Return one case per question: its candidate passages and the text of its relevant passages"""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    from app.services.context_compression import _terms, _words
+
+    with open(path) as f:
+        data = json.load(f)
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+    chunks, owner, passage_text = {}, {}, {}
+    for document in data['documents']:
+        text = " ".join(passage['text'] for passage in document['passages'])
+        chunks[document['source']] = [(document['source'], chunk) for chunk in splitter.split_text(text)]
+        for passage in document['passages']:
+            owner[passage['id']] = document['source']
+            passage_text[passage['id']] = passage['text']
+
+    rng = random.Random(seed)
+    cases = []
+    for item in data['queries']:
+        source = owner[item['relevant'][0]]
+        candidates = list(chunks[source])
+        others = [chunk for name, document_chunks in chunks.items() if name != source for chunk in document_chunks]
+        candidates += rng.sample(others, min(noise, len(others)))
+        terms = _terms(_words(item['query']))
+        candidates.sort(key=lambda chunk: -len(terms & _terms(_words(chunk[1]))))
+        for chunk in candidates[:duplicates]:
+            candidates.append((f"https://example.com/{source}", chunk[1]))
+        cases.append({'query': item['query'], 'passages': candidates,
+                      'relevant': [passage_text[passage_id] for passage_id in item['relevant']]})
+    return cases
+
+
+def retention(context, relevant):
+    """Share of the relevant passages' sentences that appear in the context"""
+    from app.services.context_compression import split_sentences
+
+    normalized = " ".join(context.split())
+    sentences = [sentence for text in relevant for sentence in split_sentences(text)]
+    return sum(1 for sentence in sentences if sentence in normalized) / len(sentences) if sentences else 1.0
+
+
+def time_to_first_token(base_url, model, api_key, context, query, max_tokens):
+    """Stream one completion and return ms until the first content token"""
+    headers = {'Authorization': f"Bearer {api_key}"} if api_key else {}
+    payload = {
+        'model': model, 'stream': True, 'max_tokens': max_tokens,
+        'messages': [
+            {'role': 'system', 'content': f"Answer using this context:\n\n{context}"},
+            {'role': 'user', 'content': query},
+        ],
+    }
+    started = time.perf_counter()
+    with requests.post(f"{base_url.rstrip('/')}/chat/completions", json=payload, headers=headers,
+                       stream=True, timeout=120) as response:
+        response.raise_for_status()
+        for line in response.iter_lines():
+            if not line.startswith(b'data: ') or line == b'data: [DONE]':
+                continue
+            choices = json.loads(line[6:]).get('choices') or [{}]
+            if choices[0].get('delta', {}).get('content'):
+                return (time.perf_counter() - started) * 1000
+    return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Context compression savings, retention and TTFT")
+    parser.add_argument('--eval-set', default=EVAL_SET, help="Labelled passages and questions (JSON)")
+    parser.add_argument('--chunk-size', type=int, default=400)
+    parser.add_argument('--chunk-overlap', type=int, default=100)
+    parser.add_argument('--noise', type=int, default=4, help="Chunks from unrelated documents per question")
+    parser.add_argument('--duplicates', type=int, default=1, help="Chunks repeated as web results per question")
+    parser.add_argument('--max-tokens', type=int, default=1500, help="Compressor token cap")
+    parser.add_argument('--budget-fraction', type=float, default=0.25)
+    parser.add_argument('--model', default='gpt-4o-mini', help="Model id for the budget and the TTFT requests")
+    parser.add_argument('--base-url', help="OpenAI-compatible endpoint for TTFT (default: in-process fake provider)")
+    parser.add_argument('--api-key', default=os.environ.get('OPENAI_API_KEY'))
+    parser.add_argument('--ttft', type=float, default=0.1, help="Fake provider fixed TTFT in seconds")
+    parser.add_argument('--prefill-tps', type=float, default=2000.0, help="Fake provider prompt tokens/sec")
+    parser.add_argument('--skip-ttft', action='store_true', help="Only measure tokens and retention")
+    parser.add_argument('--output-dir', help="Directory for the JSON results")
+    args = parser.parse_args()
+
+    from app.services.context_compression import ContextCompressor, format_passages
+    from app.services.conversation_service import count_tokens
+
+    cases = build_cases(args.eval_set, args.chunk_size, args.chunk_overlap, args.noise, args.duplicates)
+    compressor = ContextCompressor(max_tokens=args.max_tokens, budget_fraction=args.budget_fraction)
+    rows = []
+    for case in cases:
+        raw = format_passages(case['passages'])
+        compressed, report = compressor.compress(case['query'], case['passages'], args.model)
+        rows.append({'query': case['query'], 'raw': raw, 'compressed': compressed, 'report': report,
+                     'raw_tokens': count_tokens(raw), 'retention_raw': retention(raw, case['relevant']),
+                     'retention': retention(compressed, case['relevant'])})
+
+    raw_tokens = [row['raw_tokens'] for row in rows]
+    compressed_tokens = [row['report']['context_tokens'] for row in rows]
+    results = {
+        'config': vars(args).copy(),
+        'questions': len(rows),
+        'raw_tokens': percentiles(raw_tokens, points=(50, 99)),
+        'compressed_tokens': percentiles(compressed_tokens, points=(50, 99)),
+        'saved_pct': 100.0 * (1 - sum(compressed_tokens) / sum(raw_tokens)),
+        'compress_ms': percentiles([row['report']['ms'] for row in rows], points=(50, 99)),
+        'duplicate_passages': sum(row['report']['duplicate_passages'] for row in rows),
+        'overlapping_sentences': sum(row['report']['overlapping_sentences'] for row in rows),
+        'retention_raw': sum(row['retention_raw'] for row in rows) / len(rows),
+        'retention': sum(row['retention'] for row in rows) / len(rows),
+    }
+    for key in ('output_dir', 'api_key'):
+        results['config'].pop(key, None)
+    print(f"{len(rows)} questions: context tokens p50 {results['raw_tokens']['p50']} -> "
+          f"{results['compressed_tokens']['p50']} ({results['saved_pct']:.1f}% saved), "
+          f"compress p50 {results['compress_ms']['p50']:.2f}ms; "
+          f"{results['duplicate_passages']} duplicate passages, "
+          f"{results['overlapping_sentences']} overlapping sentences dropped; "
+          f"answer retention {results['retention']:.1%} (raw {results['retention_raw']:.1%})")
+
+    if not args.skip_ttft:
+        server = None
+        base_url = args.base_url
+        if not base_url:
+            from benchmarks.fake_provider import FakeProviderConfig, start_fake_provider
+            port = free_port()
+            server = start_fake_provider(port=port, config=FakeProviderConfig(
+                ttft=args.ttft, max_tokens=8, prefill_tokens_per_sec=args.prefill_tps))
+            base_url = f"http://127.0.0.1:{port}/v1"
+        try:
+            ttft = {'raw': [], 'compressed': []}
+            for row in rows:
+                for name in ttft:
+                    value = time_to_first_token(base_url, args.model, args.api_key, row[name], row['query'], 8)
+                    if value is not None:
+                        ttft[name].append(value)
+        finally:
+            if server:
+                server.shutdown()
+        results['ttft_ms'] = {name: percentiles(values, points=(50, 99)) for name, values in ttft.items()}
+        raw_p50, compressed_p50 = results['ttft_ms']['raw'].get('p50'), results['ttft_ms']['compressed'].get('p50')
+        if raw_p50 and compressed_p50:
+            print(f"TTFT p50 raw {raw_p50:.0f}ms -> compressed {compressed_p50:.0f}ms "
+                  f"({raw_p50 - compressed_p50:+.0f}ms saved)")
+
+    path = save_results('context', results, args.output_dir)
+    print(f"Results saved to {path}")
+
+
+if __name__ == '__main__':
+    main()
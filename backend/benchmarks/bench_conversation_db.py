@@ -0,0 +1,136 @@
+"""Benchmark conversation persistence under concurrent streams.
+
+Simulates N concurrent streams that each produce M exchanges of T tokens.
+The batched mode is what the server does: tokens accumulate in memory and
+each finished exchange is queued once at ``done`` for the batching writer.
+The per-token mode commits an UPDATE for every streamed token, as a
+baseline for what batching avoids.
+
+Usage:
+    python benchmarks/bench_conversation_db.py --streams 50 --exchanges 20 --tokens 200
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.conversation_db import ConversationDB  # noqa: E402
+from app.services.conversation_service import ConversationStore  # noqa: E402
+from benchmarks.common import percentiles, save_results  # noqa: E402
+
+TOKEN = "lorem "
+
+
+def run_batched(path, streams, exchanges, tokens):
+    db = ConversationDB(path, compaction_interval=0)
+    store = ConversationStore(db=db)
+    enqueue_latencies = []
+    lock = threading.Lock()
+
+    def stream(index):
+        conversation_id = f"bench-{index}"
+        for n in range(exchanges):
+            reply = []
+            for _ in range(tokens):
+                reply.append(TOKEN)
+            started = time.perf_counter()
+            store.append_exchange(conversation_id, f"question {n}", "".join(reply))
+            with lock:
+                enqueue_latencies.append((time.perf_counter() - started) * 1000)
+
+    threads = [threading.Thread(target=stream, args=(i,)) for i in range(streams)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    db.flush()
+    elapsed = time.perf_counter() - start
+    db.close()
+
+    messages = streams * exchanges * 2
+    return {
+        'messages': messages,
+        'seconds': elapsed,
+        'messages_per_sec': messages / elapsed,
+        'append_latency_ms': percentiles(enqueue_latencies),
+    }
+
+
+def run_per_token(path, streams, exchanges, tokens):
+    setup = sqlite3.connect(path)
+    setup.execute("PRAGMA journal_mode=WAL")
+    setup.execute("CREATE TABLE IF NOT EXISTS messages (id INTEGER PRIMARY KEY, conversation_id TEXT, "
+                  "role TEXT, content TEXT, created_at REAL)")
+    setup.commit()
+    setup.close()
+
+    def stream(index):
+        conn = sqlite3.connect(path, timeout=60)
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conversation_id = f"bench-{index}"
+        for n in range(exchanges):
+            with conn:
+                conn.execute("INSERT INTO messages (conversation_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+                             (conversation_id, 'user', f"question {n}", time.time()))
+                cursor = conn.execute("INSERT INTO messages (conversation_id, role, content, created_at) "
+                                      "VALUES (?, ?, '', ?)", (conversation_id, 'assistant', time.time()))
+                row_id = cursor.lastrowid
+            for _ in range(tokens):
+                with conn:
+                    conn.execute("UPDATE messages SET content = content || ? WHERE id = ?", (TOKEN, row_id))
+        conn.close()
+
+    threads = [threading.Thread(target=stream, args=(i,)) for i in range(streams)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+
+    messages = streams * exchanges * 2
+    commits = streams * exchanges * (tokens + 1)
+    return {
+        'messages': messages,
+        'commits': commits,
+        'seconds': elapsed,
+        'messages_per_sec': messages / elapsed,
+        'commits_per_sec': commits / elapsed,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Conversation persistence throughput benchmark")
+    parser.add_argument('--streams', type=int, default=50, help="Concurrent streams")
+    parser.add_argument('--exchanges', type=int, default=20, help="Exchanges per stream")
+    parser.add_argument('--tokens', type=int, default=200, help="Tokens per assistant reply")
+    parser.add_argument('--skip-per-token', action='store_true', help="Only run the batched mode")
+    parser.add_argument('--output-dir', help="Directory for the JSON results")
+    args = parser.parse_args()
+
+    results = {'config': vars(args).copy()}
+    with tempfile.TemporaryDirectory() as tmp:
+        results['batched'] = run_batched(os.path.join(tmp, 'batched.db'), args.streams, args.exchanges, args.tokens)
+        print(f"batched:   {results['batched']['messages_per_sec']:.0f} messages/s "
+              f"({results['batched']['messages']} messages in {results['batched']['seconds']:.2f}s), "
+              f"append p99 {results['batched']['append_latency_ms'].get('p99', 0):.3f}ms")
+
+        if not args.skip_per_token:
+            results['per_token'] = run_per_token(os.path.join(tmp, 'per_token.db'),
+                                                 args.streams, args.exchanges, args.tokens)
+            print(f"per-token: {results['per_token']['messages_per_sec']:.0f} messages/s "
+                  f"({results['per_token']['commits_per_sec']:.0f} commits/s)")
+
+    results['config'].pop('output_dir', None)
+    path = save_results('conversation_db', results, args.output_dir)
+    print(f"Results saved to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,197 @@
+"""Runtime document ingestion throughput, and search latency while it runs.
+
+Generates a local text corpus (or uses --corpus), uploads every file to a
+DocumentService backed by a live vector store in a temporary directory,
+and times the indexer until all documents are indexed. Reader threads
+search the store the whole time. Their latency is compared with an idle
+phase before the uploads, which shows how much the writer lock and the
+embedding work slow down concurrent searches. Finally a fresh store is
+loaded from disk to check that every chunk was persisted.
+
+By default the real MiniLM embeddings are used; --fake-embeddings swaps in
+a deterministic fake to measure the pipeline without the model.
+
+Usage:
+    python benchmarks/bench_ingestion.py --docs 50 --pages 20 --batch-sizes 16,32,64 --readers 2
+    python benchmarks/bench_ingestion.py --corpus ./documents --batch-sizes 32
+"""
+import argparse
+import os
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import percentiles, save_results  # noqa: E402
+
+WORDS = ("retrieval augmented generation language model document knowledge base answer question "
+         "vector embedding index search chunk page token stream server worker latency memory").split()
+QUERIES = ["How does retrieval work?", "What is a vector index?", "Explain token streaming",
+           "Where is the knowledge base stored?", "How are documents chunked?"]
+
+
+def make_corpus(path, docs, pages, seed=0):
+    """Write docs text files of roughly pages * 3KB each"""
+    rng = random.Random(seed)
+    os.makedirs(path, exist_ok=True)
+    for d in range(docs):
+        with open(os.path.join(path, f"doc-{d:04d}.txt"), 'w') as f:
+            for _ in range(pages * 6):
+                f.write(" ".join(rng.choice(WORDS) for _ in range(80)) + ".\n\n")
+    return sorted(os.path.join(path, name) for name in os.listdir(path))
+
+
+def make_embeddings(fake):
+    if fake:
+        from langchain_core.embeddings import DeterministicFakeEmbedding
+        return DeterministicFakeEmbedding(size=384)
+    from langchain_huggingface import HuggingFaceEmbeddings
+    return HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+
+
+def search_loop(store, stop, latencies):
+    n = 0
+    while not stop.is_set():
+        started = time.perf_counter()
+        store.similarity_search(QUERIES[n % len(QUERIES)], k=5)
+        latencies.append((time.perf_counter() - started) * 1000)
+        n += 1
+
+
+def run(files, embeddings, batch_size, readers, idle_seconds):
+    from langchain_community.vectorstores import FAISS
+    from app.services.document_service import DocumentService
+    from app.services.live_store import LIVE_DIRNAME, LiveVectorStore
+    from app.services.metrics import Metrics
+
+    tmp = tempfile.mkdtemp(prefix='bench-ingestion-')
+    try:
+        live_path = os.path.join(tmp, LIVE_DIRNAME)
+        base = FAISS.from_texts(["Initialize empty vector store"], embeddings)
+        store = LiveVectorStore(base, live_path, embeddings)
+        rag_service = types.SimpleNamespace(vector_store=store, embeddings=embeddings, retrieval=None)
+
+        done = threading.Event()
+        finished = {}
+        first_indexed = []
+
+        def notify(record):
+            if record['status'] in ('indexed', 'failed'):
+                finished[record['id']] = record
+                if not first_indexed:
+                    first_indexed.append(time.perf_counter())
+                if len(finished) == len(files):
+                    done.set()
+
+        metrics = Metrics()
+        service = DocumentService(rag_service, batch_size=batch_size, persist_interval=5.0, poll_interval=0.1,
+                                  notify=notify, metrics=metrics)
+
+        # Search latency with the indexer idle
+        stop = threading.Event()
+        idle_latencies = []
+        threads = [threading.Thread(target=search_loop, args=(store, stop, idle_latencies)) for _ in range(readers)]
+        for thread in threads:
+            thread.start()
+        time.sleep(idle_seconds)
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        stop = threading.Event()
+        busy_latencies = []
+        threads = [threading.Thread(target=search_loop, args=(store, stop, busy_latencies)) for _ in range(readers)]
+        for thread in threads:
+            thread.start()
+
+        started = time.perf_counter()
+        for file_path in files:
+            with open(file_path, 'rb') as f:
+                service.upload(os.path.basename(file_path), f)
+        uploaded = time.perf_counter()
+        service.start()
+        done.wait()
+        indexed = time.perf_counter()
+        service.stop()
+        persisted = time.perf_counter()
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        chunks = sum(record['chunks'] for record in finished.values())
+        reloaded = LiveVectorStore(base, live_path, embeddings)
+        elapsed = indexed - uploaded
+        snapshot = metrics.snapshot()
+        return {
+            'batch_size': batch_size,
+            'documents': len(files),
+            'failed': sum(1 for record in finished.values() if record['status'] == 'failed'),
+            'pages': sum(record['pages'] for record in finished.values()),
+            'chunks': chunks,
+            'bytes': sum(os.path.getsize(f) for f in files),
+            'upload_seconds': uploaded - started,
+            'index_seconds': elapsed,
+            'final_persist_seconds': persisted - indexed,
+            'first_indexed_seconds': first_indexed[0] - uploaded if first_indexed else None,
+            'docs_per_sec': len(files) / elapsed,
+            'chunks_per_sec': chunks / elapsed,
+            'mb_per_sec': sum(os.path.getsize(f) for f in files) / elapsed / (1024 * 1024),
+            'persist': snapshot.get('summaries', {}).get('document_persist_seconds'),
+            'search_idle_ms': percentiles(idle_latencies, points=(50, 99)),
+            'search_during_ingest_ms': percentiles(busy_latencies, points=(50, 99)),
+            'persisted_chunks': reloaded.delta_count(),
+        }
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Runtime document ingestion throughput")
+    parser.add_argument('--corpus', help="Directory of .txt/.pdf files (default: generate one)")
+    parser.add_argument('--docs', type=int, default=20, help="Generated documents")
+    parser.add_argument('--pages', type=int, default=10, help="Pages (~3KB each) per generated document")
+    parser.add_argument('--batch-sizes', default='16,32,64', help="Comma-separated embedding batch sizes")
+    parser.add_argument('--readers', type=int, default=2, help="Threads searching during ingestion")
+    parser.add_argument('--idle-seconds', type=float, default=3.0, help="Baseline search phase before uploading")
+    parser.add_argument('--fake-embeddings', action='store_true', help="Use a deterministic fake embedding model")
+    parser.add_argument('--output-dir', help="Directory for the JSON results")
+    args = parser.parse_args()
+
+    from app.services.ingestion import find_documents
+
+    corpus_dir = None
+    if args.corpus:
+        files = find_documents(args.corpus)
+    else:
+        corpus_dir = tempfile.mkdtemp(prefix='bench-corpus-')
+        files = make_corpus(corpus_dir, args.docs, args.pages)
+
+    embeddings = make_embeddings(args.fake_embeddings)
+    results = {'config': vars(args).copy(), 'runs': []}
+    results['config'].pop('output_dir', None)
+    try:
+        for batch_size in [int(b) for b in args.batch_sizes.split(',') if b.strip()]:
+            run_result = run(files, embeddings, batch_size, args.readers, args.idle_seconds)
+            results['runs'].append(run_result)
+            idle, busy = run_result['search_idle_ms'], run_result['search_during_ingest_ms']
+            print(f"[batch {batch_size}] {run_result['documents']} docs, {run_result['chunks']} chunks in "
+                  f"{run_result['index_seconds']:.1f}s: {run_result['docs_per_sec']:.1f} docs/s, "
+                  f"{run_result['chunks_per_sec']:.0f} chunks/s, {run_result['mb_per_sec']:.2f} MB/s; "
+                  f"search p50/p99 idle {idle.get('p50', 0):.1f}/{idle.get('p99', 0):.1f}ms, "
+                  f"ingesting {busy.get('p50', 0):.1f}/{busy.get('p99', 0):.1f}ms; "
+                  f"persisted {run_result['persisted_chunks']}/{run_result['chunks']} chunks")
+    finally:
+        if corpus_dir:
+            shutil.rmtree(corpus_dir, ignore_errors=True)
+
+    path = save_results('ingestion', results, args.output_dir)
+    print(f"Results saved to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,160 @@
+"""Startup time and per-process memory: pickled FAISS store vs the mmap vector store.
+
+Builds a synthetic index (random vectors, filler chunks) in both formats,
+then starts N worker processes per format, each loading the store and
+running a few searches, as the server workers would. Every worker reports
+its load time. While all N are alive, the parent records each worker's
+RSS, USS (memory private to it) and PSS. With FAISS each worker unpickles
+its own copy of the vectors and docstore. With mmap the pages come from
+the shared page cache, so USS stays small and PSS is split between
+workers.
+
+Usage:
+    python benchmarks/bench_mmap_store.py --chunks 200000 --dim 384 --workers 4 --dtype float16
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import numpy as np  # noqa: E402
+import psutil  # noqa: E402
+
+from benchmarks.common import BACKEND_DIR, save_results  # noqa: E402
+
+FILLER = ("Retrieval augmented generation combines a language model with documents retrieved "
+          "from a knowledge base to answer questions with up to date facts. ")
+
+
+def build(path, chunks, dim, dtype):
+    """Write the synthetic corpus as a FAISS index and as the mmap store"""
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+    from langchain_core.documents import Document
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    import faiss
+
+    from app.services.mmap_store import MMAP_DIRNAME, export_faiss
+
+    rng = np.random.default_rng(0)
+    vectors = rng.standard_normal((chunks, dim), dtype=np.float32)
+    documents = {
+        str(i): Document(page_content=f"Chunk {i}. " + FILLER * 6, metadata={'source': f"doc-{i // 50}.pdf", 'page': i % 50})
+        for i in range(chunks)
+    }
+    index = faiss.IndexFlatL2(dim)
+    index.add(vectors)
+    store = FAISS(DeterministicFakeEmbedding(size=dim), index, InMemoryDocstore(documents),
+                  {i: str(i) for i in range(chunks)})
+    store.save_local(path)
+    export_faiss(store, os.path.join(path, MMAP_DIRNAME), dtype=dtype)
+
+
+def child(kind, path, dim, queries):
+    """Load one store, search, report timings and wait for the parent to finish measuring"""
+    started = time.perf_counter()
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from langchain_community.vectorstores import FAISS
+    from app.services.mmap_store import MMAP_DIRNAME, MmapVectorStore
+    embeddings = DeterministicFakeEmbedding(size=dim)
+    imported = time.perf_counter()
+
+    if kind == 'faiss':
+        store = FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
+    else:
+        store = MmapVectorStore(os.path.join(path, MMAP_DIRNAME), embeddings)
+    loaded = time.perf_counter()
+
+    search_times = []
+    for n in range(queries):
+        t = time.perf_counter()
+        store.similarity_search(f"query {n}", k=5)
+        search_times.append((time.perf_counter() - t) * 1000)
+
+    print(json.dumps({
+        'import_seconds': imported - started,
+        'load_seconds': loaded - imported,
+        'first_search_ms': search_times[0] if search_times else None,
+        'search_ms_mean': sum(search_times[1:]) / max(1, len(search_times) - 1),
+    }), flush=True)
+    # Stay alive until the parent has sampled memory with all workers running
+    sys.stdin.read()
+
+
+def run_workers(kind, path, dim, workers, queries):
+    procs = [
+        subprocess.Popen([sys.executable, os.path.abspath(__file__), '--child', kind, '--path', path,
+                          '--dim', str(dim), '--queries', str(queries)],
+                         cwd=BACKEND_DIR, stdin=subprocess.PIPE, stdout=subprocess.PIPE, text=True)
+        for _ in range(workers)
+    ]
+    reports = [json.loads(proc.stdout.readline()) for proc in procs]
+
+    mb = 1024 * 1024
+    memory = []
+    for proc in procs:
+        info = psutil.Process(proc.pid).memory_full_info()
+        memory.append({'rss_mb': info.rss / mb, 'uss_mb': info.uss / mb, 'pss_mb': getattr(info, 'pss', info.rss) / mb})
+    for proc in procs:
+        proc.stdin.close()
+        proc.wait()
+
+    def mean(values):
+        return sum(values) / len(values)
+
+    return {
+        'workers': workers,
+        'load_seconds': mean([r['load_seconds'] for r in reports]),
+        'first_search_ms': mean([r['first_search_ms'] for r in reports]),
+        'search_ms_mean': mean([r['search_ms_mean'] for r in reports]),
+        'rss_mb_per_worker': mean([m['rss_mb'] for m in memory]),
+        'uss_mb_per_worker': mean([m['uss_mb'] for m in memory]),
+        'pss_mb_total': sum(m['pss_mb'] for m in memory),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="FAISS pickle vs mmap vector store startup and memory")
+    parser.add_argument('--chunks', type=int, default=100000, help="Synthetic chunks in the index")
+    parser.add_argument('--dim', type=int, default=384, help="Vector dimension")
+    parser.add_argument('--dtype', default='float32', choices=['float32', 'float16'])
+    parser.add_argument('--workers', type=int, default=4, help="Worker processes loading each store")
+    parser.add_argument('--queries', type=int, default=20, help="Searches per worker")
+    parser.add_argument('--child', choices=['faiss', 'mmap'], help=argparse.SUPPRESS)
+    parser.add_argument('--path', help=argparse.SUPPRESS)
+    parser.add_argument('--output-dir', help="Directory for the JSON results")
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.path, args.dim, args.queries)
+        return
+
+    results = {'config': {k: v for k, v in vars(args).items() if k in ('chunks', 'dim', 'dtype', 'workers', 'queries')}}
+    with tempfile.TemporaryDirectory() as tmp:
+        started = time.perf_counter()
+        build(tmp, args.chunks, args.dim, args.dtype)
+        results['build_seconds'] = time.perf_counter() - started
+        results['index_bytes'] = {
+            name: os.path.getsize(os.path.join(root, name))
+            for root, _, files in os.walk(tmp) for name in files
+        }
+
+        for kind in ('faiss', 'mmap'):
+            run = run_workers(kind, tmp, args.dim, args.workers, args.queries)
+            results[kind] = run
+            print(f"[{kind}] load {run['load_seconds'] * 1000:.0f}ms, first search {run['first_search_ms']:.1f}ms, "
+                  f"search {run['search_ms_mean']:.1f}ms, per worker RSS {run['rss_mb_per_worker']:.0f}MB "
+                  f"USS {run['uss_mb_per_worker']:.0f}MB, total PSS {run['pss_mb_total']:.0f}MB "
+                  f"({args.workers} workers)")
+
+    path = save_results('mmap_store', results, args.output_dir)
+    print(f"Results saved to {path}")
+
+
+if __name__ == '__main__':
+    main()
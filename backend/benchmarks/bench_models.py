@@ -0,0 +1,96 @@
+"""Model catalog: full loads against ETag revalidations, and model validation cost.
+
+Starts the fake provider and a backend, then requests /api/chat/models
+--requests times without a validator (what every page load did before)
+and --requests times with If-None-Match, and reports latency percentiles
+and bytes transferred. It also times LLMFactory's model validation with
+the catalog's set lookup against a scan of the provider's model list.
+
+Usage:
+    python benchmarks/bench_models.py --requests 500
+"""
+import argparse
+import os
+import sys
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import free_port, percentiles, save_results, spawn, wait_for_http  # noqa: E402
+
+
+def load(url, count, etag=None):
+    session = requests.Session()
+    headers = {'If-None-Match': etag} if etag else {}
+    latencies, transferred, statuses = [], 0, {}
+    for _ in range(count):
+        started = time.perf_counter()
+        response = session.get(url, headers=headers, timeout=10)
+        latencies.append((time.perf_counter() - started) * 1000)
+        transferred += len(response.content)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+    return {'latency_ms': percentiles(latencies, points=(50, 99)), 'bytes': transferred, 'statuses': statuses}
+
+
+def validation(lookups):
+    from app.services.llm_service import LLMFactory
+    from app.services.model_registry import ModelRegistry
+
+    factory = LLMFactory()
+    factory.registry = ModelRegistry(factory.AVAILABLE_MODELS, providers=factory.AVAILABLE_MODELS)
+    queries = [(provider, model['id']) for provider, models in factory.AVAILABLE_MODELS.items() for model in models]
+    queries.append(('huggingface', 'not-a-model'))
+    started = time.perf_counter()
+    for n in range(lookups):
+        provider, model_id = queries[n % len(queries)]
+        model_id in [model['id'] for model in factory.AVAILABLE_MODELS[provider]]
+    scan = (time.perf_counter() - started) * 1e9 / lookups
+    started = time.perf_counter()
+    for n in range(lookups):
+        factory.is_known_model(*queries[n % len(queries)])
+    lookup = (time.perf_counter() - started) * 1e9 / lookups
+    return {'list_scan_ns': scan, 'set_lookup_ns': lookup}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Model catalog caching and validation")
+    parser.add_argument('--requests', type=int, default=500, help="Catalog requests per phase")
+    parser.add_argument('--lookups', type=int, default=200000, help="Model validations timed")
+    parser.add_argument('--output-dir', help="Directory for the JSON results")
+    args = parser.parse_args()
+
+    provider_port, server_port = free_port(), free_port()
+    provider_url = f"http://127.0.0.1:{provider_port}"
+    server_url = f"http://127.0.0.1:{server_port}"
+    processes = [spawn(['benchmarks/fake_provider.py', '--port', str(provider_port)])]
+    try:
+        wait_for_http(f"{provider_url}/health")
+        processes.append(spawn(['benchmarks/bench_server.py', '--port', str(server_port),
+                                '--provider-url', provider_url]))
+        wait_for_http(f"{server_url}/api/chat/health", timeout=300)
+        url = f"{server_url}/api/chat/models"
+        etag = requests.get(url, timeout=10).headers.get('ETag')
+        results = {'config': {'requests': args.requests, 'lookups': args.lookups},
+                   'full': load(url, args.requests), 'revalidated': load(url, args.requests, etag)}
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    results['validation'] = validation(args.lookups)
+    for name in ('full', 'revalidated'):
+        run = results[name]
+        print(f"[{name}] p50 {run['latency_ms']['p50']:.2f}ms p99 {run['latency_ms']['p99']:.2f}ms, "
+              f"{run['bytes'] / args.requests:.0f} bytes/request, statuses {run['statuses']}")
+    print(f"model validation: list scan {results['validation']['list_scan_ns']:.0f}ns, "
+          f"set lookup {results['validation']['set_lookup_ns']:.0f}ns")
+
+    path = save_results('models', results, args.output_dir)
+    print(f"Results saved to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""Time to first token with and without speculative search on 'typing' events.
+
+Starts the fake provider (with --page-delay standing in for slow result
+pages) and a backend with prefetching enabled. Each client then sends
+its messages in two phases: first without typing events, then typing
+them word by word (one 'typing' event every --word-ms), pausing
+--think-ms and sending. In a share of the messages (--edit-rate) the
+user changes the query after the last draft, so its prefetch misses.
+Reports TTFT per phase and the prefetch hit/miss and skip counters
+read from /api/chat/metrics.
+
+Usage:
+    python benchmarks/bench_prefetch.py --clients 4 --messages 5 --modes web,hybrid --page-delay 0.5
+"""
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import free_port, percentiles, save_results, spawn, wait_for_http  # noqa: E402
+from benchmarks.load_test import BenchClient  # noqa: E402
+
+
+def prefetch_counters(server_url):
+    counters = requests.get(f"{server_url}/api/chat/metrics", timeout=10).json().get('counters', {})
+    return {name: value for name, value in counters.items() if name.startswith('prefetch_')}
+
+
+def run_phase(server_url, mode, clients, messages, typing, args, seed):
+    bench_clients = [BenchClient(server_url, i) for i in range(clients)]
+    for client in bench_clients:
+        client.connect()
+
+    def drive(client):
+        rng = random.Random(seed + client.client_id)
+        for n in range(messages):
+            # Unique queries so only prefetching, not earlier messages, can warm the caches
+            query = f"How do I configure feature {client.client_id}-{n}-{mode}-{seed} for my home network?"
+            if typing:
+                words = query.split()
+                for i in range(1, len(words) + 1):
+                    client.sio.emit('typing', {'content': " ".join(words[:i]), 'mode': mode})
+                    time.sleep(args.word_ms / 1000)
+                time.sleep(args.think_ms / 1000)
+                if rng.random() < args.edit_rate:
+                    query += " Thanks"
+            client.send(mode, query, args.timeout)
+
+    threads = [threading.Thread(target=drive, args=(c,)) for c in bench_clients]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    for client in bench_clients:
+        client.close()
+    records = [r for c in bench_clients for r in c.records if r['ok']]
+    return {
+        'messages': clients * messages,
+        'succeeded': len(records),
+        'ttft_ms': percentiles([r['ttft'] * 1000 for r in records if r['ttft'] is not None], points=(50, 90, 99)),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="TTFT with and without typing prefetch")
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--messages', type=int, default=5, help="Messages per client per phase")
+    parser.add_argument('--modes', default='web,hybrid')
+    parser.add_argument('--page-delay', type=float, default=0.5, help="Fake web page latency (s)")
+    parser.add_argument('--ttft', type=float, default=0.1, help="Fake provider time-to-first-token (s)")
+    parser.add_argument('--word-ms', type=float, default=150, help="Typing speed: ms per word")
+    parser.add_argument('--think-ms', type=float, default=1000, help="Pause between the last word and sending")
+    parser.add_argument('--edit-rate', type=float, default=0.2, help="Share of messages changed after the draft")
+    parser.add_argument('--debounce-ms', type=int, default=400)
+    parser.add_argument('--budget', type=int, default=6, help="Prefetches per connection per minute")
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--output-dir', help="Directory for the JSON results")
+    args = parser.parse_args()
+
+    provider_port, server_port = free_port(), free_port()
+    provider_url = f"http://127.0.0.1:{provider_port}"
+    server_url = f"http://127.0.0.1:{server_port}"
+    processes = [spawn(['benchmarks/fake_provider.py', '--port', str(provider_port), '--ttft', str(args.ttft),
+                        '--tps', '500', '--max-tokens', '20', '--page-delay', str(args.page_delay)])]
+    try:
+        wait_for_http(f"{provider_url}/health")
+        processes.append(spawn(
+            ['benchmarks/bench_server.py', '--port', str(server_port), '--provider-url', provider_url],
+            env={'PREFETCH_ENABLED': 'True', 'PREFETCH_DEBOUNCE_MS': str(args.debounce_ms),
+                 'PREFETCH_BUDGET': str(args.budget)}
+        ))
+        wait_for_http(f"{server_url}/api/chat/health", timeout=300)
+
+        results = {'config': vars(args).copy(), 'modes': {}}
+        results['config'].pop('output_dir', None)
+        for mode in [m.strip() for m in args.modes.split(',') if m.strip()]:
+            baseline = run_phase(server_url, mode, args.clients, args.messages, False, args, seed=1)
+            before = prefetch_counters(server_url)
+            typed = run_phase(server_url, mode, args.clients, args.messages, True, args, seed=2)
+            after = prefetch_counters(server_url)
+            counters = {name: value - before.get(name, 0) for name, value in after.items()}
+            hits = counters.get('prefetch_queries{result=hit}', 0)
+            claimed = sum(value for name, value in counters.items() if name.startswith('prefetch_queries'))
+            results['modes'][mode] = {'no_typing': baseline, 'typing': typed, 'prefetch': counters,
+                                      'hit_rate': hits / claimed if claimed else 0.0}
+            print(f"[{mode}] TTFT p50 {baseline['ttft_ms'].get('p50', 0):.0f}ms -> "
+                  f"{typed['ttft_ms'].get('p50', 0):.0f}ms with typing prefetch "
+                  f"(p90 {baseline['ttft_ms'].get('p90', 0):.0f} -> {typed['ttft_ms'].get('p90', 0):.0f}ms), "
+                  f"hit rate {results['modes'][mode]['hit_rate']:.0%}; {counters}")
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    path = save_results('prefetch', results, args.output_dir)
+    print(f"Results saved to {path}")
+
+
+if __name__ == '__main__':
+    main()
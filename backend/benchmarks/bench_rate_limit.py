@@ -0,0 +1,95 @@
+"""Fair scheduling of a saturated provider: queueing delay per client.
+
+Drives RateLimiter in-process with a provider limit of --provider-rpm.
+One heavy client submits --heavy-requests at once, while --light-clients
+each send a request every --light-interval seconds. Every admitted
+request then holds the "provider" for --service-ms. The same workload
+runs twice: with round-robin fair scheduling (each client has its own
+queue), and with plain FIFO (all requests share one queue, as if there
+were no per-client fairness). Reports queueing delay p50/p99 for light
+and heavy requests and how many requests timed out.
+
+Usage:
+    python benchmarks/bench_rate_limit.py --provider-rpm 120 --heavy-requests 40 --light-clients 4
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import percentiles, save_results  # noqa: E402
+
+
+def run(args, fair):
+    from app.services.rate_limit import RateLimited, RateLimiter
+
+    limiter = RateLimiter(client_requests=0, client_tokens=0,
+                          provider_limits={'fake': (args.provider_rpm, 0)}, queue_timeout=args.queue_timeout)
+    # Start with an empty bucket so the provider is saturated from the first request
+    limiter._provider('fake')['requests'].level = 0
+    waits = {'heavy': [], 'light': []}
+    timeouts = {'heavy': 0, 'light': 0}
+    lock = threading.Lock()
+
+    def request(kind, client_id):
+        try:
+            queued = limiter.acquire(client_id if fair else 'shared', 'fake', 100)
+        except RateLimited:
+            with lock:
+                timeouts[kind] += 1
+            return
+        with lock:
+            waits[kind].append(queued * 1000)
+        time.sleep(args.service_ms / 1000)
+
+    threads = [threading.Thread(target=request, args=('heavy', 'heavy')) for _ in range(args.heavy_requests)]
+    for thread in threads:
+        thread.start()
+
+    def light(client_id):
+        for _ in range(args.light_requests):
+            request('light', client_id)
+            time.sleep(args.light_interval)
+
+    light_threads = [threading.Thread(target=light, args=(f"light-{i}",)) for i in range(args.light_clients)]
+    time.sleep(0.1)
+    for thread in light_threads:
+        thread.start()
+    for thread in threads + light_threads:
+        thread.join()
+    return {
+        'light_queued_ms': percentiles(waits['light'], points=(50, 99)),
+        'heavy_queued_ms': percentiles(waits['heavy'], points=(50, 99)),
+        'timeouts': timeouts,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Fair scheduling under a saturated provider")
+    parser.add_argument('--provider-rpm', type=float, default=120, help="Provider requests per minute")
+    parser.add_argument('--heavy-requests', type=int, default=40, help="Requests the heavy client sends at once")
+    parser.add_argument('--light-clients', type=int, default=4)
+    parser.add_argument('--light-requests', type=int, default=3, help="Requests per light client")
+    parser.add_argument('--light-interval', type=float, default=1.0, help="Seconds between a light client's requests")
+    parser.add_argument('--service-ms', type=float, default=200, help="Time a request holds the provider")
+    parser.add_argument('--queue-timeout', type=float, default=60.0)
+    parser.add_argument('--output-dir', help="Directory for the JSON results")
+    args = parser.parse_args()
+
+    results = {'config': vars(args).copy(), 'runs': {}}
+    results['config'].pop('output_dir', None)
+    for name, fair in (('fifo', False), ('fair', True)):
+        run_result = results['runs'][name] = run(args, fair)
+        light, heavy = run_result['light_queued_ms'], run_result['heavy_queued_ms']
+        print(f"[{name}] light queued p50/p99 {light.get('p50', 0):.0f}/{light.get('p99', 0):.0f}ms, "
+              f"heavy {heavy.get('p50', 0):.0f}/{heavy.get('p99', 0):.0f}ms, timeouts {run_result['timeouts']}")
+
+    path = save_results('rate_limit', results, args.output_dir)
+    print(f"Results saved to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""Retrieval quality and latency with and without cross-encoder reranking.
+
+Indexes the labelled passages in benchmarks/data/retrieval_eval.json with
+the app's embedding model, then answers each question two ways: the
+vector search order (what document_search used before reranking), and
+the top --candidates hits reranked by the cross-encoder under each
+--budgets value. Reports recall@1/3/k, precision@k and MRR against the
+labels, vector search and rerank latency percentiles, and how often each
+budget fell back to vector order.
+
+Usage:
+    python benchmarks/bench_rerank.py --candidates 20 --k 5 --budgets 50,200,1000
+    python benchmarks/bench_rerank.py --backend onnx --model cross-encoder/ms-marco-TinyBERT-L-2-v2
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import percentiles, save_results  # noqa: E402
+
+EVAL_SET = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'retrieval_eval.json')
+
+
+def load_eval_set(path=EVAL_SET):
+    """Return (passages as Documents, queries) from the labelled set"""
+    from langchain_core.documents import Document
+
+    with open(path) as f:
+        data = json.load(f)
+    passages = [
+        Document(page_content=passage['text'], metadata={'source': document['source'], 'passage_id': passage['id']})
+        for document in data['documents'] for passage in document['passages']
+    ]
+    return passages, data['queries']
+
+
+def score(ranked_ids, relevant, k):
+    """Per-query retrieval metrics for a ranked list of passage ids"""
+    relevant = set(relevant)
+    hits = [i for i, passage_id in enumerate(ranked_ids) if passage_id in relevant]
+    return {
+        'recall@1': len([i for i in hits if i < 1]) / len(relevant),
+        'recall@3': len([i for i in hits if i < 3]) / len(relevant),
+        f'recall@{k}': len([i for i in hits if i < k]) / len(relevant),
+        f'precision@{k}': len([i for i in hits if i < k]) / k,
+        'mrr': 1.0 / (hits[0] + 1) if hits else 0.0,
+    }
+
+
+def mean_scores(rows):
+    return {key: sum(row[key] for row in rows) / len(rows) for key in rows[0]} if rows else {}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cross-encoder reranking quality and latency")
+    parser.add_argument('--eval-set', default=EVAL_SET, help="Labelled passages and questions (JSON)")
+    parser.add_argument('--model', default='cross-encoder/ms-marco-MiniLM-L-6-v2')
+    parser.add_argument('--backend', default='torch', choices=['torch', 'onnx', 'openvino'])
+    parser.add_argument('--candidates', type=int, default=20, help="Vector hits passed to the reranker")
+    parser.add_argument('--k', type=int, default=5, help="Hits kept for the prompt")
+    parser.add_argument('--batch-size', type=int, default=16)
+    parser.add_argument('--budgets', default='50,200,1000', help="Comma-separated per-query budgets in ms")
+    parser.add_argument('--repeat', type=int, default=3, help="Passes over the questions for latency samples")
+    parser.add_argument('--output-dir', help="Directory for the JSON results")
+    args = parser.parse_args()
+
+    from langchain_community.vectorstores import FAISS
+    from langchain_huggingface import HuggingFaceEmbeddings
+    from app.services.reranker import Reranker
+
+    passages, queries = load_eval_set(args.eval_set)
+    embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
+    store = FAISS.from_documents(passages, embeddings)
+    print(f"Indexed {len(passages)} passages; {len(queries)} labelled questions")
+
+    # Vector candidates are computed once and shared by every configuration
+    candidates = []
+    search_ms = []
+    for _ in range(args.repeat):
+        for item in queries:
+            started = time.perf_counter()
+            docs = store.similarity_search(item['query'], k=max(args.k, args.candidates))
+            search_ms.append((time.perf_counter() - started) * 1000)
+            if len(candidates) < len(queries):
+                candidates.append([(doc.page_content, doc.metadata) for doc in docs])
+
+    def ids(hits):
+        return [metadata['passage_id'] for _, metadata in hits]
+
+    results = {'config': vars(args).copy(), 'passages': len(passages), 'queries': len(queries),
+               'vector_search_ms': percentiles(search_ms, points=(50, 99)), 'runs': {}}
+    results['config'].pop('output_dir', None)
+    results['runs']['vector'] = mean_scores([
+        score(ids(hits[:args.k]), item['relevant'], args.k) for item, hits in zip(queries, candidates)
+    ])
+
+    reranker = Reranker(args.model, backend=args.backend, batch_size=args.batch_size)
+    for budget in [float(b) for b in args.budgets.split(',') if b.strip()]:
+        reranker.budget_ms = budget
+        rows, rerank_ms, fallbacks = [], [], {}
+        for n in range(args.repeat):
+            for item, hits in zip(queries, candidates):
+                ranked, report = reranker.rerank(item['query'], hits, args.k)
+                rerank_ms.append(report['ms'])
+                if report['fallback']:
+                    fallbacks[report['fallback']] = fallbacks.get(report['fallback'], 0) + 1
+                if n == 0:
+                    rows.append(score(ids(ranked), item['relevant'], args.k))
+        run = mean_scores(rows)
+        run.update(rerank_ms=percentiles(rerank_ms, points=(50, 99)), fallbacks=fallbacks,
+                   fallback_rate=sum(fallbacks.values()) / len(rerank_ms))
+        results['runs'][f'rerank_{budget:g}ms'] = run
+
+    print(f"vector search p50 {results['vector_search_ms']['p50']:.1f}ms")
+    print(f"{'config':<18}{'R@1':>7}{'R@3':>7}{f'R@{args.k}':>7}{f'P@{args.k}':>7}{'MRR':>7}"
+          f"{'rerank p50':>12}{'p99':>9}{'fallback':>10}")
+    for name, run in results['runs'].items():
+        latency = run.get('rerank_ms', {})
+        print(f"{name:<18}{run['recall@1']:>7.3f}{run['recall@3']:>7.3f}{run[f'recall@{args.k}']:>7.3f}"
+              f"{run[f'precision@{args.k}']:>7.3f}{run['mrr']:>7.3f}"
+              f"{latency.get('p50', 0):>10.1f}ms{latency.get('p99', 0):>7.1f}ms{run.get('fallback_rate', 0):>10.0%}")
+
+    path = save_results('rerank', results, args.output_dir)
+    print(f"Results saved to {path}")
+
+
+if __name__ == '__main__':
+    main()
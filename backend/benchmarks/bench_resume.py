@@ -0,0 +1,166 @@
+"""Resumable replies: connections dropped mid-answer and resumed on a new connection.
+
+Starts the fake provider and a backend. Each client sends --messages
+messages; for each, it disconnects after --drop-after streamed tokens,
+stays offline --offline-ms, reconnects and sends resume with the stream
+ID and the last offset it received. A reply counts as complete when its
+offsets are contiguous from 0 and it ends in metadata. Reports complete
+replies, messages replayed (what would have been lost, and re-asked,
+without resume), resume latency and the stream buffer gauges read from
+/api/chat/metrics.
+
+Usage:
+    python benchmarks/bench_resume.py --clients 8 --messages 5 --offline-ms 500
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+import uuid
+
+import requests
+import socketio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import free_port, percentiles, save_results, spawn, wait_for_http  # noqa: E402
+
+
+class ResumingClient:
+    def __init__(self, server_url, client_id):
+        self.server_url = server_url
+        self.client_id = client_id
+        self.conversation_id = f"resume-{client_id}-{uuid.uuid4().hex}"
+        self.conversation_token = None
+        self.records = []
+        self._messages = []
+        self._resumed_at = None
+        self._resume_latency = None
+        self._done = threading.Event()
+        self._dropped = threading.Event()
+
+    def _connect(self, drop_after=None):
+        sio = socketio.Client(reconnection=False)
+
+        @sio.on('message')
+        def on_message(data):
+            if data.get('type') == 'resume':
+                self._resume_status = data['content']
+                if self._resume_latency is None:
+                    self._resume_latency = time.perf_counter() - self._resumed_at
+                return
+            if self._resumed_at is not None and self._resume_latency is None:
+                self._resume_latency = time.perf_counter() - self._resumed_at
+            self._messages.append(data)
+            streamed = sum(1 for message in self._messages if message['type'] == 'stream')
+            if drop_after is not None and streamed >= drop_after and not self._dropped.is_set():
+                self._dropped.set()
+            if data['type'] == 'metadata':
+                self.conversation_token = data['content'].get('conversation_token')
+            if data['type'] in ('metadata', 'error', 'backpressure'):
+                self._done.set()
+
+        sio.connect(self.server_url, transports=['websocket'])
+        return sio
+
+    def send(self, content, drop_after, offline, timeout):
+        self._messages, self._resumed_at, self._resume_latency, self._resume_status = [], None, None, None
+        self._done.clear()
+        self._dropped.clear()
+        sio = self._connect(drop_after)
+        sio.emit('message', {'type': 'message', 'content': content, 'provider': 'openai', 'mode': 'llm',
+                             'conversation_id': self.conversation_id, 'conversation_token': self.conversation_token})
+        self._dropped.wait(timeout)
+        sio.disconnect()
+        received = len(self._messages)
+        time.sleep(offline)
+        last = self._messages[-1] if self._messages else {}
+        sio = self._connect()
+        self._resumed_at = time.perf_counter()
+        sio.emit('resume', {'stream_id': last.get('stream_id'), 'offset': last.get('offset', -1)})
+        self._done.wait(timeout)
+        sio.disconnect()
+        offsets = [message.get('offset') for message in self._messages]
+        self.records.append({
+            'complete': offsets == list(range(len(offsets))) and self._messages[-1]['type'] == 'metadata',
+            'received_before_drop': received,
+            'replayed': (self._resume_status or {}).get('replayed', 0),
+            'status': (self._resume_status or {}).get('status'),
+            'resume_ms': self._resume_latency * 1000 if self._resume_latency is not None else None,
+        })
+
+
+def stream_gauges(server_url):
+    snapshot = requests.get(f"{server_url}/api/chat/metrics", timeout=10).json()
+    values = dict(snapshot.get('gauges', {}))
+    values.update({name: value for name, value in snapshot.get('counters', {}).items() if name.startswith('stream_')})
+    return {name: value for name, value in values.items() if name.startswith('stream_')}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Replies resumed after a dropped connection")
+    parser.add_argument('--clients', type=int, default=8)
+    parser.add_argument('--messages', type=int, default=5, help="Messages per client")
+    parser.add_argument('--drop-after', type=int, default=20, help="Streamed tokens received before disconnecting")
+    parser.add_argument('--offline-ms', type=float, default=500, help="Time between disconnecting and resuming")
+    parser.add_argument('--tokens', type=int, default=200, help="Tokens per fake completion")
+    parser.add_argument('--tps', type=float, default=100, help="Fake provider tokens per second")
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--output-dir', help="Directory for the JSON results")
+    args = parser.parse_args()
+
+    provider_port, server_port = free_port(), free_port()
+    provider_url = f"http://127.0.0.1:{provider_port}"
+    server_url = f"http://127.0.0.1:{server_port}"
+    processes = [spawn(['benchmarks/fake_provider.py', '--port', str(provider_port), '--ttft', '0.1',
+                        '--tps', str(args.tps), '--max-tokens', str(args.tokens)])]
+    try:
+        wait_for_http(f"{provider_url}/health")
+        processes.append(spawn(['benchmarks/bench_server.py', '--port', str(server_port),
+                                '--provider-url', provider_url], env={'STREAM_RESUME_ENABLED': 'True'}))
+        wait_for_http(f"{server_url}/api/chat/health", timeout=300)
+
+        clients = [ResumingClient(server_url, i) for i in range(args.clients)]
+
+        def drive(client):
+            for n in range(args.messages):
+                client.send(f"Tell me about topic {client.client_id}-{n}", args.drop_after,
+                            args.offline_ms / 1000, args.timeout)
+
+        threads = [threading.Thread(target=drive, args=(client,)) for client in clients]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        gauges = stream_gauges(server_url)
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    records = [record for client in clients for record in client.records]
+    results = {
+        'config': {key: value for key, value in vars(args).items() if key != 'output_dir'},
+        'replies': len(records),
+        'complete': sum(1 for record in records if record['complete']),
+        'statuses': {status: sum(1 for record in records if record['status'] == status)
+                     for status in {record['status'] for record in records}},
+        'replayed_messages': percentiles([record['replayed'] for record in records], points=(50, 90)),
+        'replayed_total': sum(record['replayed'] for record in records),
+        'resume_ms': percentiles([record['resume_ms'] for record in records if record['resume_ms'] is not None],
+                                 points=(50, 90, 99)),
+        'server': gauges,
+    }
+    print(f"{results['complete']}/{results['replies']} replies complete after resume {results['statuses']}, "
+          f"{results['replayed_total']} messages replayed (lost without resume), "
+          f"resume p50 {results['resume_ms'].get('p50', 0):.1f}ms p99 {results['resume_ms'].get('p99', 0):.1f}ms")
+    print(f"server: {gauges}")
+
+    path = save_results('resume', results, args.output_dir)
+    print(f"Results saved to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,289 @@
+"""Retrieval quality and latency across indexing configurations, against labelled questions.
+
+Rebuilds the documents of benchmarks/data/retrieval_eval.json (or
+--eval-set) from their passages. For each --chunk-sizes and --overlaps
+pair it splits them as create_index.py does and embeds the chunks, then
+builds each --index-types store: 'faiss' (the pickled flat FAISS index),
+'mmap' and 'mmap-f16' (the memory-mapped store in float32 or float16).
+--pad-chunks unrelated filler chunks are added to every store so that
+search time and index size are measured at a more realistic size.
+
+Every question is searched in every store, with and without cross-encoder
+reranking (--rerank off,on), and scored at each --k. A chunk retrieves a
+labelled passage when they overlap by at least half of the shorter one.
+The table reports recall@k, MRR@k, context characters per question, search
+and rerank latency and index size; chunk embedding throughput is reported
+per chunking. With --min-recall and/or --min-mrr the fastest configuration
+meeting the bar is named, with the settings that select it, and the exit
+status is 1 when none does. --baseline compares with an earlier run.
+
+Usage:
+    python benchmarks/bench_retrieval.py --chunk-sizes 300,600,1000 --overlaps 0,100,200 --k 3,5,8
+    python benchmarks/bench_retrieval.py --rerank off,on --min-recall 0.9 --min-mrr 0.7
+"""
+import argparse
+import json
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import compare_results, percentiles, save_results  # noqa: E402
+
+EVAL_SET = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data', 'retrieval_eval.json')
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+INDEX_TYPES = ('faiss', 'mmap', 'mmap-f16')
+FILLER_WORDS = ("the quarterly report lists travel expenses meeting notes office supplies and the schedule for "
+                "next week while the team reviews budget items vendor invoices parking permits and holiday "
+                "rosters before the deadline").split()
+
+
+def load_corpus(path=EVAL_SET):
+    """Return (documents, queries); each document's passages are joined and their character spans kept"""
+    with open(path) as f:
+        data = json.load(f)
+    documents = []
+    for document in data['documents']:
+        text, spans = '', {}
+        for passage in document['passages']:
+            if text:
+                text += '\n\n'
+            spans[passage['id']] = (len(text), len(text) + len(passage['text']))
+            text += passage['text']
+        documents.append({'source': document['source'], 'text': text, 'spans': spans})
+    return documents, data['queries']
+
+
+def split(documents, chunk_size, chunk_overlap):
+    """Chunk the documents with create_index.py's splitter, labelling each chunk with the passages it retrieves"""
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+
+    splitter = RecursiveCharacterTextSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                              add_start_index=True)
+    chunks = []
+    for document in documents:
+        for chunk in splitter.create_documents([document['text']], metadatas=[{'source': document['source']}]):
+            start = chunk.metadata['start_index']
+            end = start + len(chunk.page_content)
+            chunk.metadata['passages'] = [
+                passage_id for passage_id, (first, last) in document['spans'].items()
+                if min(end, last) - max(start, first) >= 0.5 * min(last - first, end - start)
+            ]
+            chunks.append(chunk)
+    return chunks
+
+
+def filler(count, seed=0):
+    from langchain_core.documents import Document
+
+    rng = random.Random(seed)
+    return [Document(page_content=f"Note {i}: " + ' '.join(rng.choices(FILLER_WORDS, k=60)),
+                     metadata={'source': f"filler-{i // 50}.txt", 'passages': []}) for i in range(count)]
+
+
+def directory_size(path):
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, names in os.walk(path) for name in names)
+
+
+def build_store(kind, chunks, vectors, embeddings, path):
+    """Write one store type to path and load it as the server would; returns (store, bytes on disk)"""
+    import numpy as np
+
+    if kind == 'faiss':
+        import faiss
+        from langchain_community.docstore.in_memory import InMemoryDocstore
+        from langchain_community.vectorstores import FAISS
+
+        index = faiss.IndexFlatL2(vectors.shape[1])
+        index.add(vectors)
+        FAISS(embeddings, index, InMemoryDocstore({str(i): chunk for i, chunk in enumerate(chunks)}),
+              {i: str(i) for i in range(len(chunks))}).save_local(path)
+        store = FAISS.load_local(path, embeddings, allow_dangerous_deserialization=True)
+    else:
+        from app.services.mmap_store import MmapVectorStore, write_mmap_store
+
+        write_mmap_store(path, np.asarray(vectors), chunks, dtype='float16' if kind == 'mmap-f16' else 'float32')
+        store = MmapVectorStore(path, embeddings)
+    return store, directory_size(path)
+
+
+def score(ranked, relevant, k):
+    """recall@k, MRR@k and context characters for a ranked list of (content, metadata)"""
+    relevant = set(relevant)
+    found, first = set(), None
+    for rank, (_, metadata) in enumerate(ranked[:k]):
+        matched = relevant.intersection(metadata.get('passages', ()))
+        if matched and first is None:
+            first = rank
+        found |= matched
+    return {
+        'recall': len(found) / len(relevant),
+        'mrr': 1.0 / (first + 1) if first is not None else 0.0,
+        'context_chars': sum(len(content) for content, _ in ranked[:k]),
+    }
+
+
+def mean_scores(rows):
+    return {key: sum(row[key] for row in rows) / len(rows) for key in rows[0]} if rows else {}
+
+
+def evaluate(store, queries, query_vectors, ks, reranker, candidates, repeat):
+    """Search every question (repeat times for latency samples); returns per-k scores and latencies"""
+    depth = max(max(ks), candidates if reranker is not None else 0)
+    search_ms, rerank_ms, ranked_lists = [], [], []
+    for n in range(repeat):
+        for item, vector in zip(queries, query_vectors):
+            started = time.perf_counter()
+            docs = store.similarity_search_with_score_by_vector(vector, depth)
+            search_ms.append((time.perf_counter() - started) * 1000)
+            hits = [(doc.page_content, doc.metadata) for doc, _ in docs]
+            if reranker is not None:
+                hits, report = reranker.rerank(item['query'], hits, max(ks))
+                rerank_ms.append(report['ms'])
+            if n == 0:
+                ranked_lists.append(hits)
+    scores = {k: mean_scores([score(hits, item['relevant'], k) for item, hits in zip(queries, ranked_lists)])
+              for k in ks}
+    return scores, percentiles(search_ms, points=(50, 99)), percentiles(rerank_ms, points=(50, 99))
+
+
+def settings(run):
+    """The configuration that reproduces a run in the app"""
+    env = [f"CHUNK_SIZE={run['chunk_size']}", f"CHUNK_OVERLAP={run['chunk_overlap']}", f"RETRIEVAL_K={run['k']}",
+           f"RERANK_ENABLED={run['rerank']}"]
+    if run['index'] == 'faiss':
+        env.append("VECTOR_STORE_MMAP=False (create_index.py --faiss)")
+    elif run['index'] == 'mmap-f16':
+        env.append("create_index.py --dtype float16")
+    return ', '.join(env)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Retrieval quality and latency across chunking, index and rerank")
+    parser.add_argument('--eval-set', default=EVAL_SET, help="Labelled documents and questions (JSON)")
+    parser.add_argument('--chunk-sizes', default='300,600,1000', help="Comma-separated characters per chunk")
+    parser.add_argument('--overlaps', default='0,100,200', help="Comma-separated chunk overlaps (below the size)")
+    parser.add_argument('--index-types', default=','.join(INDEX_TYPES), help=f"Comma-separated, of {INDEX_TYPES}")
+    parser.add_argument('--rerank', default='off', help="'off', 'on' or 'off,on'")
+    parser.add_argument('--k', default='3,5,8', help="Comma-separated passages retrieved per question")
+    parser.add_argument('--pad-chunks', type=int, default=2000, help="Unrelated filler chunks added to every index")
+    parser.add_argument('--candidates', type=int, default=20, help="Vector hits passed to the reranker")
+    parser.add_argument('--rerank-model', default='cross-encoder/ms-marco-MiniLM-L-6-v2')
+    parser.add_argument('--rerank-budget', type=float, default=200, help="Rerank budget per question in ms")
+    parser.add_argument('--repeat', type=int, default=3, help="Passes over the questions for latency samples")
+    parser.add_argument('--min-recall', type=float, help="Quality bar: minimum mean recall@k")
+    parser.add_argument('--min-mrr', type=float, help="Quality bar: minimum MRR@k")
+    parser.add_argument('--baseline', help="Earlier results JSON to compare against")
+    parser.add_argument('--output-dir', help="Directory for the JSON results")
+    args = parser.parse_args()
+
+    import numpy as np
+    from langchain_huggingface import HuggingFaceEmbeddings
+
+    ks = [int(k) for k in args.k.split(',') if k.strip()]
+    index_types = [kind.strip() for kind in args.index_types.split(',') if kind.strip()]
+    unknown = set(index_types) - set(INDEX_TYPES)
+    if unknown:
+        parser.error(f"Unknown index types: {', '.join(sorted(unknown))}")
+    rerank_modes = [mode.strip() == 'on' for mode in args.rerank.split(',') if mode.strip()]
+    chunkings = [(size, overlap) for size in [int(s) for s in args.chunk_sizes.split(',') if s.strip()]
+                 for overlap in [int(o) for o in args.overlaps.split(',') if o.strip()] if overlap < size]
+
+    documents, queries = load_corpus(args.eval_set)
+    embeddings = HuggingFaceEmbeddings(model_name=MODEL_NAME)
+    reranker = None
+    if True in rerank_modes:
+        from app.services.reranker import Reranker
+        try:
+            reranker = Reranker(args.rerank_model, budget_ms=args.rerank_budget)
+        except Exception as e:
+            print(f"Reranker unavailable ({str(e)}); skipping rerank runs")
+            rerank_modes = [mode for mode in rerank_modes if not mode]
+
+    # Query embedding and the filler vectors don't depend on the configuration
+    query_embed_ms = []
+    for _ in range(args.repeat):
+        for item in queries:
+            started = time.perf_counter()
+            embeddings.embed_query(item['query'])
+            query_embed_ms.append((time.perf_counter() - started) * 1000)
+    query_vectors = embeddings.embed_documents([item['query'] for item in queries])
+    padding = filler(args.pad_chunks)
+    padding_vectors = embeddings.embed_documents([doc.page_content for doc in padding]) if padding else []
+    print(f"{len(documents)} documents, {len(queries)} labelled questions, {len(padding)} filler chunks; "
+          f"query embedding p50 {percentiles(query_embed_ms)['p50']:.1f}ms")
+
+    results = {'config': {key: value for key, value in vars(args).items() if key not in ('output_dir', 'baseline')},
+               'queries': len(queries), 'query_embed_ms': percentiles(query_embed_ms, points=(50, 99)),
+               'chunkings': {}, 'runs': {}}
+    workdir = tempfile.mkdtemp(prefix='bench-retrieval-')
+    try:
+        for chunk_size, chunk_overlap in chunkings:
+            chunks = split(documents, chunk_size, chunk_overlap)
+            started = time.perf_counter()
+            vectors = embeddings.embed_documents([chunk.page_content for chunk in chunks])
+            embed_seconds = time.perf_counter() - started
+            results['chunkings'][f"{chunk_size}/{chunk_overlap}"] = {
+                'chunks': len(chunks), 'embed_ms': embed_seconds * 1000,
+                'chunks_per_sec': len(chunks) / embed_seconds if embed_seconds else None,
+            }
+            all_vectors = np.asarray(list(vectors) + list(padding_vectors), dtype=np.float32)
+            for kind in index_types:
+                path = os.path.join(workdir, f"{chunk_size}-{chunk_overlap}-{kind}")
+                store, size = build_store(kind, chunks + padding, all_vectors, embeddings, path)
+                for rerank in rerank_modes:
+                    scores, search_ms, rerank_ms = evaluate(store, queries, query_vectors, ks,
+                                                            reranker if rerank else None, args.candidates,
+                                                            args.repeat)
+                    for k in ks:
+                        name = f"{chunk_size}/{chunk_overlap}/{kind}/{'rerank' if rerank else 'vector'}/k{k}"
+                        results['runs'][name] = {
+                            'chunk_size': chunk_size, 'chunk_overlap': chunk_overlap, 'index': kind,
+                            'rerank': rerank, 'k': k, 'chunks': len(chunks), **scores[k],
+                            'search_ms': search_ms, 'rerank_ms': rerank_ms,
+                            'latency_p50_ms': search_ms['p50'] + rerank_ms.get('p50', 0.0),
+                            'index_mb': size / (1024 * 1024),
+                        }
+                shutil.rmtree(path, ignore_errors=True)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    for name, chunking in results['chunkings'].items():
+        print(f"chunking {name}: {chunking['chunks']} chunks embedded at {chunking['chunks_per_sec']:.0f} chunks/s")
+    print(f"{'size/overlap':<14}{'index':<10}{'rerank':<8}{'k':>3}{'recall':>8}{'MRR':>7}{'ctx chars':>11}"
+          f"{'search p50':>12}{'p99':>8}{'rerank p50':>12}{'index MB':>10}")
+    for run in results['runs'].values():
+        chunking = f"{run['chunk_size']}/{run['chunk_overlap']}"
+        print(f"{chunking:<14}{run['index']:<10}{'on' if run['rerank'] else 'off':<8}{run['k']:>3}{run['recall']:>8.3f}"
+              f"{run['mrr']:>7.3f}{run['context_chars']:>11.0f}{run['search_ms']['p50']:>10.2f}ms"
+              f"{run['search_ms']['p99']:>6.2f}ms{run['rerank_ms'].get('p50', 0):>10.1f}ms{run['index_mb']:>10.2f}")
+
+    exit_status = 0
+    if args.min_recall is not None or args.min_mrr is not None:
+        passing = [(name, run) for name, run in results['runs'].items()
+                   if run['recall'] >= (args.min_recall or 0) and run['mrr'] >= (args.min_mrr or 0)]
+        # Fastest first; then the smaller prompt and the smaller index
+        passing.sort(key=lambda item: (item[1]['latency_p50_ms'], item[1]['context_chars'], item[1]['index_mb']))
+        results['recommended'] = passing[0][0] if passing else None
+        if passing:
+            name, run = passing[0]
+            print(f"\nFastest configuration meeting the bar ({len(passing)} of {len(results['runs'])} do): {name}, "
+                  f"recall {run['recall']:.3f}, MRR {run['mrr']:.3f}, {run['latency_p50_ms']:.2f}ms p50\n"
+                  f"  {settings(run)}")
+        else:
+            print("\nNo configuration meets the quality bar")
+            exit_status = 1
+
+    path = save_results('retrieval', results, args.output_dir)
+    print(f"Results saved to {path}")
+    if args.baseline:
+        compare_results(results, args.baseline)
+    sys.exit(exit_status)
+
+
+if __name__ == '__main__':
+    main()
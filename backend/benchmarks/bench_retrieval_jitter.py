@@ -0,0 +1,154 @@
+"""Token-stream jitter while heavy RAG queries run in parallel.
+
+Runs the same workload against a server with retrieval in-process
+(RETRIEVAL_PROCESSES=0) and with the retrieval process pool. Stream
+clients chat in llm mode and record the gap between consecutive tokens.
+Meanwhile heavy clients send rag/web queries whose large synthetic pages
+make HTML parsing and embedding expensive. With retrieval in-process that
+CPU work stalls every stream in the worker. With the pool, only the I/O
+stays in the server, so the p99 and max gaps should stay close to the
+provider's token interval.
+
+Usage:
+    python benchmarks/bench_retrieval_jitter.py --processes 2 --stream-clients 4 --heavy-clients 4
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import free_port, percentiles, save_results, spawn, wait_for_http  # noqa: E402
+from benchmarks.load_test import BenchClient  # noqa: E402
+
+
+class GapClient(BenchClient):
+    """BenchClient that also records the interval between streamed tokens"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.gaps = []
+        self._last_token_at = None
+
+    def _on_message(self, data):
+        if data.get('type') == 'stream' and data.get('content'):
+            now = time.perf_counter()
+            if self._last_token_at is not None:
+                self.gaps.append(now - self._last_token_at)
+            self._last_token_at = now
+        super()._on_message(data)
+
+    def send(self, mode, content, timeout):
+        self._last_token_at = None
+        super().send(mode, content, timeout)
+
+
+def run_config(label, retrieval_processes, args, provider_url):
+    port = free_port()
+    server = spawn(['benchmarks/bench_server.py', '--port', str(port), '--provider-url', provider_url],
+                   env={'RETRIEVAL_PROCESSES': str(retrieval_processes)})
+    server_url = f"http://127.0.0.1:{port}"
+    try:
+        wait_for_http(f"{server_url}/api/chat/health", timeout=300)
+        stream_clients = [GapClient(server_url, i) for i in range(args.stream_clients)]
+        heavy_clients = [BenchClient(server_url, 1000 + i) for i in range(args.heavy_clients)]
+        for client in stream_clients + heavy_clients:
+            client.connect()
+
+        stop = threading.Event()
+
+        def drive_stream(client):
+            for n in range(args.messages):
+                client.send('llm', f"Tell me about streaming {client.client_id}-{n}", args.timeout)
+
+        def drive_heavy(client):
+            n = 0
+            while not stop.is_set():
+                mode = args.heavy_modes[n % len(args.heavy_modes)]
+                # Unique queries defeat the web and document caches
+                client.send(mode, f"Heavy {mode} query {client.client_id}-{n}-{label}", args.timeout)
+                n += 1
+
+        heavy_threads = [threading.Thread(target=drive_heavy, args=(c,)) for c in heavy_clients]
+        stream_threads = [threading.Thread(target=drive_stream, args=(c,)) for c in stream_clients]
+        for thread in heavy_threads:
+            thread.start()
+        # Let the heavy load build up before measuring the streams
+        time.sleep(args.warmup)
+        start = time.perf_counter()
+        for thread in stream_threads:
+            thread.start()
+        for thread in stream_threads:
+            thread.join()
+        wall = time.perf_counter() - start
+        stop.set()
+        for thread in heavy_threads:
+            thread.join()
+        for client in stream_clients + heavy_clients:
+            client.close()
+    finally:
+        server.terminate()
+        server.wait()
+
+    gaps = [gap * 1000 for client in stream_clients for gap in client.gaps]
+    stream_records = [r for c in stream_clients for r in c.records]
+    heavy_records = [r for c in heavy_clients for r in c.records]
+    return {
+        'retrieval_processes': retrieval_processes,
+        'wall_seconds': wall,
+        'token_gap_ms': percentiles(gaps, points=(50, 90, 99, 100)),
+        'stream_ttft_ms': percentiles([r['ttft'] * 1000 for r in stream_records if r['ok'] and r['ttft']]),
+        'stream_failed': sum(1 for r in stream_records if not r['ok']),
+        'heavy_messages': len(heavy_records),
+        'heavy_failed': sum(1 for r in heavy_records if not r['ok']),
+        'heavy_latency_ms': percentiles([r['latency'] * 1000 for r in heavy_records if r['ok']]),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Token jitter with and without the retrieval process pool")
+    parser.add_argument('--processes', type=int, default=2, help="Retrieval processes for the pooled run")
+    parser.add_argument('--stream-clients', type=int, default=4)
+    parser.add_argument('--heavy-clients', type=int, default=4)
+    parser.add_argument('--heavy-modes', default='web,rag', help="Comma-separated modes for the heavy clients")
+    parser.add_argument('--messages', type=int, default=5, help="Messages per stream client")
+    parser.add_argument('--tps', type=float, default=50.0, help="Fake provider tokens/sec")
+    parser.add_argument('--max-tokens', type=int, default=100, help="Tokens per fake completion")
+    parser.add_argument('--page-paragraphs', type=int, default=400, help="Paragraphs per fake web page")
+    parser.add_argument('--warmup', type=float, default=2.0, help="Seconds of heavy load before streaming")
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--output-dir', help="Directory for the JSON results")
+    args = parser.parse_args()
+    args.heavy_modes = [m.strip() for m in args.heavy_modes.split(',') if m.strip()]
+
+    provider_port = free_port()
+    provider_url = f"http://127.0.0.1:{provider_port}"
+    provider = spawn([
+        'benchmarks/fake_provider.py', '--port', str(provider_port), '--ttft', '0.05',
+        '--tps', str(args.tps), '--max-tokens', str(args.max_tokens),
+        '--page-paragraphs', str(args.page_paragraphs),
+    ])
+    results = {'config': vars(args).copy(), 'runs': {}}
+    results['config'].pop('output_dir', None)
+    try:
+        wait_for_http(f"{provider_url}/health")
+        for label, processes in (('in_process', 0), ('pool', args.processes)):
+            run = run_config(label, processes, args, provider_url)
+            results['runs'][label] = run
+            gap = run['token_gap_ms']
+            print(f"[{label}] token gap p50={gap.get('p50', 0):.1f}ms p99={gap.get('p99', 0):.1f}ms "
+                  f"max={gap.get('max', 0):.1f}ms (ideal {1000 / args.tps:.1f}ms), "
+                  f"heavy {run['heavy_messages']} msgs ({run['heavy_failed']} failed), "
+                  f"heavy p50={run['heavy_latency_ms'].get('p50', 0):.0f}ms")
+    finally:
+        provider.terminate()
+        provider.wait()
+
+    path = save_results('retrieval_jitter', results, args.output_dir)
+    print(f"Results saved to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,149 @@
+"""Automatic model routing: reply time and cost against fixed model choices.
+
+Simulates --messages queries (a --code-share of code questions and a
+--complex-share of long reasoning ones) against three simulated models
+per class with different TTFT, speed and price. Halfway through, the
+fastest model slows down by --degrade times, standing in for a provider
+incident. ModelRouter sees the same latencies the server would report
+and picks a model for every message. Each fixed choice sends every
+message to one candidate. Reports mean/p90 reply time and total cost
+per policy.
+
+With --replay, the decision and outcome lines of a ROUTER_LOG_PATH file
+are joined instead, and reply time and cost are summarised per query
+class, model and decision reason, for evaluating the live policy offline.
+
+Usage:
+    python benchmarks/bench_router.py --messages 2000 --degrade 4
+    python benchmarks/bench_router.py --replay routing.log
+"""
+import argparse
+import json
+import os
+import random
+import sys
+from collections import defaultdict
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import percentiles, save_results  # noqa: E402
+
+# (provider, model): (ttft_ms, tokens_per_sec); the first model of each class degrades
+SIMULATED = {
+    'simple': {('groq', 'llama-3.1-8b-instant'): (150, 600), ('openai', 'gpt-4o-mini'): (400, 90),
+               ('deepseek', 'deepseek-chat'): (900, 40)},
+    'code': {('groq', 'qwen-2.5-coder-32b'): (250, 300), ('mistral', 'codestral-latest'): (450, 120),
+             ('openai', 'gpt-4o-mini'): (400, 90)},
+    'complex': {('groq', 'llama-3.3-70b-versatile'): (300, 250), ('openai', 'gpt-4o'): (600, 80),
+                ('anthropic', 'claude-3-7-sonnet-latest'): (900, 60)},
+}
+QUERIES = {
+    'simple': "What's the capital of France?",
+    'code': "Why does this fail?\n```python\nprint(items[3])\n```",
+    'complex': "Explain and compare the design trade-offs of leader election in raft and paxos",
+}
+
+
+def simulate(args):
+    from app.services.router import ModelRouter
+    from app.services.usage import PRICES
+
+    rng = random.Random(args.seed)
+    candidates = {name: list(models) for name, models in SIMULATED.items()}
+    router = ModelRouter(candidates, {provider for models in SIMULATED.values() for provider, _ in models},
+                         PRICES, explore=args.explore, completion_tokens=args.completion_tokens, rng=rng)
+    totals = {policy: {'ms': [], 'cost': 0.0} for policy in ('auto', 'first', 'cheapest')}
+    chosen = defaultdict(int)
+
+    def reply(name, key, degraded):
+        ttft, tps = SIMULATED[name][key]
+        if degraded and key == next(iter(SIMULATED[name])):
+            ttft, tps = ttft * args.degrade, tps / args.degrade
+        ttft *= rng.lognormvariate(0, 0.25)
+        tps *= rng.lognormvariate(0, 0.15)
+        tokens = int(args.completion_tokens * rng.uniform(0.5, 1.5))
+        prompt, _, completion = PRICES[key[1]]
+        cost = (args.prompt_tokens * prompt + tokens * completion) / 1_000_000
+        return ttft, tps, ttft + 1000 * tokens / tps, cost
+
+    for n in range(args.messages):
+        draw = rng.random()
+        name = 'code' if draw < args.code_share else 'complex' if draw < args.code_share + args.complex_share else 'simple'
+        degraded = n >= args.messages // 2
+        decision = router.route(QUERIES[name])
+        key = (decision['provider'], decision['model'])
+        chosen[f"{name}/{key[1]}/{'after' if degraded else 'before'}"] += 1
+        ttft, tps, total, cost = reply(name, key, degraded)
+        router.observe(*key, ttft_ms=ttft, tokens_per_sec=tps)
+        totals['auto']['ms'].append(total)
+        totals['auto']['cost'] += cost
+        # Fixed choices: the configured first candidate, and the cheapest one
+        cheapest = min(SIMULATED[name], key=lambda model: router.price_per_1k(model[1]))
+        for policy, fixed in (('first', next(iter(SIMULATED[name]))), ('cheapest', cheapest)):
+            _, _, total, cost = reply(name, fixed, degraded)
+            totals[policy]['ms'].append(total)
+            totals[policy]['cost'] += cost
+
+    results = {'config': vars(args).copy(), 'policies': {}, 'auto_choices': dict(sorted(chosen.items()))}
+    for policy, total in totals.items():
+        results['policies'][policy] = {'reply_ms': percentiles(total['ms'], points=(50, 90, 99)),
+                                       'mean_ms': sum(total['ms']) / len(total['ms']), 'cost_usd': total['cost']}
+        print(f"[{policy}] reply mean {results['policies'][policy]['mean_ms']:.0f}ms, "
+              f"p90 {results['policies'][policy]['reply_ms']['p90']:.0f}ms, cost ${total['cost']:.4f}")
+    return results
+
+
+def replay(path):
+    decisions, outcomes = {}, {}
+    with open(path) as f:
+        for line in f:
+            record = json.loads(line)
+            (decisions if record['event'] == 'decision' else outcomes)[record['id']] = record
+    groups = defaultdict(lambda: {'ms': [], 'ttft': [], 'cost': 0.0, 'errors': 0})
+    for decision_id, decision in decisions.items():
+        outcome = outcomes.get(decision_id)
+        if outcome is None:
+            continue
+        group = groups[f"{decision['class']}/{outcome['provider']}:{outcome['model']}/{decision['reason']}"]
+        if outcome.get('error'):
+            group['errors'] += 1
+            continue
+        group['ms'].append(outcome['total_ms'])
+        if outcome.get('ttft_ms') is not None:
+            group['ttft'].append(outcome['ttft_ms'])
+        group['cost'] += (outcome.get('usage') or {}).get('cost_usd') or 0.0
+    results = {'log': path, 'decisions': len(decisions), 'outcomes': len(outcomes), 'groups': {}}
+    for name, group in sorted(groups.items()):
+        results['groups'][name] = {'replies': len(group['ms']), 'errors': group['errors'], 'cost_usd': group['cost'],
+                                   'reply_ms': percentiles(group['ms'], points=(50, 90)),
+                                   'ttft_ms': percentiles(group['ttft'], points=(50, 90))}
+        print(f"{name}: {len(group['ms'])} replies, {group['errors']} errors, "
+              f"reply p50 {results['groups'][name]['reply_ms'].get('p50', 0):.0f}ms, cost ${group['cost']:.4f}")
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Automatic model routing against fixed choices")
+    parser.add_argument('--messages', type=int, default=2000)
+    parser.add_argument('--code-share', type=float, default=0.2)
+    parser.add_argument('--complex-share', type=float, default=0.2)
+    parser.add_argument('--degrade', type=float, default=4.0, help="Slowdown of the fastest models after halfway")
+    parser.add_argument('--explore', type=float, default=0.05)
+    parser.add_argument('--completion-tokens', type=int, default=300)
+    parser.add_argument('--prompt-tokens', type=int, default=1000)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--replay', help="Summarise a ROUTER_LOG_PATH decision log instead of simulating")
+    parser.add_argument('--output-dir', help="Directory for the JSON results")
+    args = parser.parse_args()
+
+    if args.replay:
+        path = save_results('router_replay', replay(args.replay), args.output_dir)
+    else:
+        results = simulate(args)
+        results['config'].pop('output_dir', None)
+        path = save_results('router', results, args.output_dir)
+    print(f"Results saved to {path}")
+
+
+if __name__ == '__main__':
+    main()
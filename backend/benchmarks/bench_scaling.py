@@ -0,0 +1,120 @@
+"""Measure throughput scaling of the preforked multi-worker server.
+
+For each worker count, starts one fake provider per worker and a
+bench_server.py with --workers N (cross-process emits through the local
+message-queue broker), spreads the Socket.IO clients over the worker ports
+and reports messages/sec, latency percentiles, CPU and the memory of the
+whole process tree. Efficiency is throughput(N) / (N * throughput(1)); it
+should stay close to 1 while N is below the number of cores.
+
+The defaults make each message CPU-heavy for the server (many fast tokens
+per reply) so the benchmark measures the workers rather than the fake
+provider's sleeps.
+
+Usage:
+    python benchmarks/bench_scaling.py --workers 1,2,4 --clients-per-worker 8 --messages 5
+"""
+import argparse
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import (  # noqa: E402
+    ResourceSampler, free_port, memory_footprint, save_results, spawn, wait_for_http
+)
+from benchmarks.load_test import run_phase, summarize  # noqa: E402
+
+
+def start_scaled_stack(workers, args):
+    """Start one fake provider per worker plus the multi-worker server; returns (urls, server, processes)"""
+    processes = []
+    provider_urls = []
+    for _ in range(workers):
+        port = free_port()
+        processes.append(spawn([
+            'benchmarks/fake_provider.py', '--port', str(port),
+            '--ttft', str(args.ttft), '--tps', str(args.tps), '--max-tokens', str(args.max_tokens),
+        ]))
+        provider_urls.append(f"http://127.0.0.1:{port}")
+    for url in provider_urls:
+        wait_for_http(f"{url}/health")
+
+    # Worker i listens on base_port + i, so look for a free block
+    base_port = free_port()
+    server = spawn([
+        'benchmarks/bench_server.py', '--port', str(base_port), '--workers', str(workers),
+        '--provider-url', ','.join(provider_urls),
+    ])
+    processes.insert(0, server)
+    urls = [f"http://127.0.0.1:{base_port + i}" for i in range(workers)]
+    for url in urls:
+        wait_for_http(f"{url}/api/chat/health", timeout=300)
+    return urls, server, processes
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-worker scaling benchmark")
+    parser.add_argument('--workers', default='1,2,4', help="Comma-separated worker counts")
+    parser.add_argument('--clients-per-worker', type=int, default=8, help="Socket.IO clients per worker")
+    parser.add_argument('--messages', type=int, default=5, help="Messages per client")
+    parser.add_argument('--mode', default='llm', help="Chat mode to exercise")
+    parser.add_argument('--ttft', type=float, default=0.05, help="Fake provider time-to-first-token (s)")
+    parser.add_argument('--tps', type=float, default=2000.0, help="Fake provider tokens/sec")
+    parser.add_argument('--max-tokens', type=int, default=400, help="Tokens per fake completion")
+    parser.add_argument('--timeout', type=float, default=120.0, help="Per-message timeout (s)")
+    parser.add_argument('--output-dir', help="Directory for the JSON results")
+    args = parser.parse_args()
+
+    results = {
+        'config': {
+            'clients_per_worker': args.clients_per_worker,
+            'messages_per_client': args.messages,
+            'mode': args.mode,
+            'ttft': args.ttft,
+            'tokens_per_sec': args.tps,
+            'max_tokens': args.max_tokens,
+            'cpu_count': os.cpu_count(),
+        },
+        'workers': {},
+    }
+
+    baseline = None
+    for workers in [int(w) for w in args.workers.split(',') if w.strip()]:
+        urls, server, processes = start_scaled_stack(workers, args)
+        try:
+            idle_memory = memory_footprint(server.pid)
+            sampler = ResourceSampler(server.pid).start()
+            records, wall = run_phase(urls, args.mode, workers * args.clients_per_worker,
+                                      args.messages, args.timeout)
+            summary = summarize(records, wall)
+            summary['server'] = sampler.stop()
+            summary['memory_idle'] = idle_memory
+            summary['memory_loaded'] = memory_footprint(server.pid)
+        finally:
+            for process in processes:
+                process.terminate()
+            for process in processes:
+                process.wait()
+
+        throughput = summary['messages_per_sec']
+        if baseline is None:
+            baseline = throughput / workers if workers else throughput
+        summary['speedup'] = throughput / baseline if baseline else 0.0
+        summary['efficiency'] = summary['speedup'] / workers if workers else 0.0
+        results['workers'][str(workers)] = summary
+
+        print(f"[{workers} workers] {summary['succeeded']}/{summary['messages']} ok, "
+              f"{throughput:.2f} msg/s, speedup {summary['speedup']:.2f}x "
+              f"(efficiency {summary['efficiency'] * 100:.0f}%), "
+              f"latency p50={summary['latency_ms'].get('p50', 0):.0f}ms "
+              f"p99={summary['latency_ms'].get('p99', 0):.0f}ms, "
+              f"CPU {summary['server']['avg_cpu_percent']:.0f}%, "
+              f"RSS {summary['memory_loaded']['rss_mb']:.0f}MB / PSS {summary['memory_loaded']['pss_mb']:.0f}MB")
+
+    path = save_results('scaling', results, args.output_dir)
+    print(f"Results saved to {path}")
+
+
+if __name__ == '__main__':
+    main()
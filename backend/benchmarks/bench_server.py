@@ -0,0 +1,60 @@
+"""Run the backend against the local fake provider for benchmarking.
+
+OpenAI requests are routed to the fake provider via OPENAI_BASE_URL and
+web search is replaced with FakeSearch, so no external service is called.
+The server runs through serve.py, so --workers N benchmarks the preforked
+multi-worker mode; worker i listens on port + i. A comma-separated
+--provider-url spreads workers across several fake providers so the
+provider is not the bottleneck.
+
+Usage:
+    python benchmarks/bench_server.py --port 5050 --provider-url http://127.0.0.1:8900
+    python benchmarks/bench_server.py --workers 4 --provider-url http://127.0.0.1:8900,http://127.0.0.1:8901
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import serve  # noqa: E402  (monkey-patches eventlet before anything else imports socket)
+
+import argparse  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Backend server wired to the fake provider")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=5050)
+    parser.add_argument('--workers', type=int, default=1)
+    parser.add_argument('--provider-url', default='http://127.0.0.1:8900',
+                        help="Fake provider URL, or a comma-separated list assigned to workers round-robin")
+    args = parser.parse_args()
+    provider_urls = [url.strip().rstrip('/') for url in args.provider_url.split(',') if url.strip()]
+
+    # Configuration is read from the environment at import time
+    os.environ['OPENAI_API_KEY'] = 'fake-key'
+    os.environ['OPENAI_BASE_URL'] = f"{provider_urls[0]}/v1"
+    # Load tests drive many messages per connection; opt back in with RATE_LIMIT_ENABLED=True
+    os.environ.setdefault('RATE_LIMIT_ENABLED', 'False')
+
+    from benchmarks.fake_provider import FakeSearch
+
+    def preload():
+        services = serve.preload_services()
+        services['rag_service'].search = FakeSearch(provider_urls[0])
+        return services
+
+    def app_factory(services, index):
+        from app import create_app
+
+        provider_url = provider_urls[index % len(provider_urls)]
+        app = create_app(services, worker_index=index)
+        app.config['OPENAI_BASE_URL'] = f"{provider_url}/v1"
+        app.config['rag_service'].search = FakeSearch(provider_url)
+        return app
+
+    serve.run_workers(args.workers, args.host, args.port, app_factory=app_factory, preload=preload)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,138 @@
+"""HTTP streaming (POST /api/chat/stream, Server-Sent Events) against the Socket.IO message path.
+
+Starts the fake provider and a backend, then for each concurrency level
+in --levels runs the same workload twice: Socket.IO clients sending
+'message' events over a websocket, and HTTP clients posting to
+/api/chat/stream and reading the event stream. Reports messages/sec,
+TTFT and completion latency percentiles and server CPU per message and
+peak RSS for each transport and level.
+
+Usage:
+    python benchmarks/bench_sse.py --levels 10,50,100 --messages 3
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import ResourceSampler, free_port, save_results, spawn, wait_for_http  # noqa: E402
+from benchmarks.load_test import run_phase, summarize  # noqa: E402
+
+
+def sse_send(session, url, content, timeout):
+    """Post one message and read its event stream to the end, recording timings"""
+    sent_at = time.perf_counter()
+    first_token_at, error = None, None
+    try:
+        with session.post(url, json={'content': content, 'provider': 'openai', 'mode': 'llm'},
+                          stream=True, timeout=timeout) as response:
+            if response.status_code != 200:
+                error = f"HTTP {response.status_code}"
+            else:
+                event = None
+                for line in response.iter_lines(chunk_size=None, decode_unicode=True):
+                    if line.startswith('event: '):
+                        event = line[7:]
+                    elif line.startswith('data: ') and event in ('stream', 'error', 'backpressure'):
+                        payload = json.loads(line[6:])
+                        if event == 'stream' and payload['content'] and first_token_at is None:
+                            first_token_at = time.perf_counter()
+                        elif event != 'stream':
+                            error = payload['content'] if event == 'error' else 'backpressure'
+    except requests.RequestException as e:
+        error = type(e).__name__
+    return {
+        'mode': 'llm',
+        'ok': error is None,
+        'error': error,
+        'ttft': (first_token_at - sent_at) if first_token_at else None,
+        'latency': time.perf_counter() - sent_at,
+    }
+
+
+def run_sse_phase(server_url, clients, messages, timeout):
+    url = f"{server_url}/api/chat/stream"
+    records = []
+    lock = threading.Lock()
+
+    def drive(client_id):
+        # One keep-alive connection per client, like a pooled HTTP client behind a load balancer
+        session = requests.Session()
+        local = [sse_send(session, url, f"What does the knowledge base say about topic {client_id}-{n}?", timeout)
+                 for n in range(messages)]
+        session.close()
+        with lock:
+            records.extend(local)
+
+    threads = [threading.Thread(target=drive, args=(i,)) for i in range(clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return records, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SSE endpoint against Socket.IO: overhead and connection scaling")
+    parser.add_argument('--levels', default='10,50,100', help="Concurrent clients per run")
+    parser.add_argument('--messages', type=int, default=3, help="Messages per client")
+    parser.add_argument('--tokens', type=int, default=100, help="Tokens per fake completion")
+    parser.add_argument('--tps', type=float, default=200, help="Fake provider tokens per second")
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--output-dir', help="Directory for the JSON results")
+    args = parser.parse_args()
+
+    provider_port, server_port = free_port(), free_port()
+    provider_url = f"http://127.0.0.1:{provider_port}"
+    server_url = f"http://127.0.0.1:{server_port}"
+    processes = [spawn(['benchmarks/fake_provider.py', '--port', str(provider_port), '--ttft', '0.1',
+                        '--tps', str(args.tps), '--max-tokens', str(args.tokens)])]
+    results = {'config': {key: value for key, value in vars(args).items() if key != 'output_dir'}, 'levels': {}}
+    try:
+        wait_for_http(f"{provider_url}/health")
+        server = spawn(['benchmarks/bench_server.py', '--port', str(server_port), '--provider-url', provider_url])
+        processes.append(server)
+        wait_for_http(f"{server_url}/api/chat/health", timeout=300)
+        # Warm up both paths
+        run_phase(server_url, 'llm', 1, 1, args.timeout)
+        run_sse_phase(server_url, 1, 1, args.timeout)
+
+        for clients in [int(level) for level in args.levels.split(',') if level.strip()]:
+            level = results['levels'][clients] = {}
+            for transport in ('socketio', 'sse'):
+                sampler = ResourceSampler(server.pid).start()
+                if transport == 'socketio':
+                    records, wall = run_phase(server_url, 'llm', clients, args.messages, args.timeout)
+                else:
+                    records, wall = run_sse_phase(server_url, clients, args.messages, args.timeout)
+                usage = sampler.stop()
+                summary = summarize(records, wall)
+                summary['server_cpu_ms_per_message'] = (usage['cpu_seconds'] * 1000 / summary['succeeded']
+                                                        if summary['succeeded'] else None)
+                summary['server_rss_peak_mb'] = usage['rss_peak_mb']
+                level[transport] = summary
+                print(f"[{clients} clients, {transport}] {summary['succeeded']}/{summary['messages']} ok, "
+                      f"{summary['messages_per_sec']:.1f} msg/s, TTFT p50 {summary['ttft_ms'].get('p50', 0):.0f}ms "
+                      f"p99 {summary['ttft_ms'].get('p99', 0):.0f}ms, latency p50 "
+                      f"{summary['latency_ms'].get('p50', 0):.0f}ms, "
+                      f"{summary['server_cpu_ms_per_message'] or 0:.1f}ms CPU/message, "
+                      f"RSS {usage['rss_peak_mb']:.0f}MB")
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    path = save_results('sse', results, args.output_dir)
+    print(f"Results saved to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Cost of usage accounting on the request path.
+
+N threads each record M requests' usage. The collector mode is what the
+server does: record() appends to a queue and a background thread rolls
+the events up and writes them to SQLite in batches. The per-request mode
+inserts and commits one row per request on the calling thread, as a
+baseline for what batching avoids. Reports record() latency
+percentiles, throughput and the rows written.
+
+Usage:
+    python benchmarks/bench_usage.py --threads 16 --requests 2000
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.usage import UsageCollector  # noqa: E402
+from benchmarks.common import percentiles, save_results  # noqa: E402
+
+MODELS = [('openai', 'gpt-4o-mini'), ('groq', 'llama-3.1-8b-instant'), ('anthropic', 'claude-3-5-haiku-latest')]
+MODES = ['llm', 'rag', 'web', 'hybrid']
+USAGE = {'prompt_tokens': 1200, 'completion_tokens': 300, 'cached_tokens': 400}
+
+
+def drive(threads, requests, record):
+    latencies = []
+    lock = threading.Lock()
+
+    def worker(index):
+        local = []
+        for n in range(requests):
+            provider, model = MODELS[(index + n) % len(MODELS)]
+            started = time.perf_counter()
+            record(provider, model, MODES[n % len(MODES)])
+            local.append((time.perf_counter() - started) * 1e6)
+        with lock:
+            latencies.extend(local)
+
+    workers = [threading.Thread(target=worker, args=(i,)) for i in range(threads)]
+    started = time.perf_counter()
+    for thread in workers:
+        thread.start()
+    for thread in workers:
+        thread.join()
+    return time.perf_counter() - started, latencies
+
+
+def run_collector(path, threads, requests):
+    collector = UsageCollector(db_path=path, flush_interval=0.5)
+
+    def record(provider, model, mode):
+        collector.record(provider, model, mode, USAGE, ttft_ms=250.0, duration_ms=1500.0)
+
+    elapsed, latencies = drive(threads, requests, record)
+    collector.close()
+    rows = sqlite3.connect(path).execute("SELECT COUNT(*), SUM(requests) FROM usage_rollup").fetchone()
+    return {'seconds': elapsed, 'records_per_sec': threads * requests / elapsed,
+            'record_us': percentiles(latencies, points=(50, 99)), 'rows': rows[0], 'requests': int(rows[1])}
+
+
+def run_per_request(path, threads, requests):
+    collector = UsageCollector(flush_interval=3600)
+    local = threading.local()
+    conn = sqlite3.connect(path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("CREATE TABLE usage (at REAL, provider TEXT, model TEXT, mode TEXT, prompt_tokens INTEGER, "
+                 "completion_tokens INTEGER, cached_tokens INTEGER, cost REAL, ttft_ms REAL)")
+    conn.commit()
+
+    def record(provider, model, mode):
+        db = getattr(local, 'conn', None)
+        if db is None:
+            db = local.conn = sqlite3.connect(path, timeout=60)
+            db.execute("PRAGMA synchronous=NORMAL")
+        with db:
+            db.execute("INSERT INTO usage VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                       (time.time(), provider, model, mode, USAGE['prompt_tokens'], USAGE['completion_tokens'],
+                        USAGE['cached_tokens'], collector.cost(model, USAGE), 250.0))
+
+    elapsed, latencies = drive(threads, requests, record)
+    collector.close()
+    rows = conn.execute("SELECT COUNT(*) FROM usage").fetchone()[0]
+    return {'seconds': elapsed, 'records_per_sec': threads * requests / elapsed,
+            'record_us': percentiles(latencies, points=(50, 99)), 'rows': rows, 'requests': rows}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Usage accounting overhead per request")
+    parser.add_argument('--threads', type=int, default=16)
+    parser.add_argument('--requests', type=int, default=2000, help="Requests recorded per thread")
+    parser.add_argument('--output-dir', help="Directory for the JSON results")
+    args = parser.parse_args()
+
+    results = {'config': {'threads': args.threads, 'requests': args.requests}}
+    with tempfile.TemporaryDirectory() as tmp:
+        results['collector'] = run_collector(os.path.join(tmp, 'collector.db'), args.threads, args.requests)
+        results['per_request'] = run_per_request(os.path.join(tmp, 'per_request.db'), args.threads, args.requests)
+
+    for name in ('collector', 'per_request'):
+        run = results[name]
+        print(f"[{name}] {run['records_per_sec']:.0f} records/s, record() p50 {run['record_us']['p50']:.1f}us "
+              f"p99 {run['record_us']['p99']:.1f}us, {run['rows']} rows for {run['requests']} requests")
+
+    path = save_results('usage', results, args.output_dir)
+    print(f"Results saved to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,221 @@
+"""Streaming wire formats: bytes on the wire and server CPU per 1k tokens.
+
+Starts the fake provider and a backend behind a byte-counting TCP relay.
+--clients clients each stream --messages replies over a websocket, first
+with the default JSON message events and then with 'wire': 'binary'
+chunk frames. Reports bytes sent to the clients and server CPU seconds
+per 1k streamed tokens for each format.
+
+The Python client doesn't negotiate permessage-deflate, which browsers
+do with the eventlet server, so the same token sequence is also encoded
+offline with the Socket.IO packet encoder, raw and through a per-connection
+deflate stream (context takeover, one sync flush per frame), to show
+what each format costs on a compressed connection.
+
+Usage:
+    python benchmarks/bench_wire.py --clients 4 --messages 5 --tokens 500
+"""
+import argparse
+import os
+import socket
+import sys
+import threading
+import time
+import uuid
+import zlib
+
+import socketio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.services.wire import decode_chunk, encode_chunk  # noqa: E402
+from benchmarks.common import ResourceSampler, free_port, save_results, spawn, wait_for_http  # noqa: E402
+
+
+class CountingRelay:
+    """Forwards TCP connections to a target and counts the bytes sent back to clients"""
+
+    def __init__(self, target_port):
+        self.target = ('127.0.0.1', target_port)
+        self.server = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.server.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.server.bind(('127.0.0.1', 0))
+        self.server.listen(64)
+        self.port = self.server.getsockname()[1]
+        self.downstream = 0
+        self._lock = threading.Lock()
+        threading.Thread(target=self._accept, daemon=True).start()
+
+    def _pipe(self, source, sink, count):
+        try:
+            while True:
+                data = source.recv(65536)
+                if not data:
+                    break
+                if count:
+                    with self._lock:
+                        self.downstream += len(data)
+                sink.sendall(data)
+        except OSError:
+            pass
+        finally:
+            for sock in (source, sink):
+                try:
+                    sock.shutdown(socket.SHUT_RDWR)
+                except OSError:
+                    pass
+
+    def _accept(self):
+        while True:
+            try:
+                client, _ = self.server.accept()
+            except OSError:
+                break
+            upstream = socket.create_connection(self.target)
+            threading.Thread(target=self._pipe, args=(client, upstream, False), daemon=True).start()
+            threading.Thread(target=self._pipe, args=(upstream, client, True), daemon=True).start()
+
+    def take(self):
+        with self._lock:
+            value, self.downstream = self.downstream, 0
+        return value
+
+
+def stream_replies(url, wire, clients, messages, timeout):
+    """Run every client's messages; returns the streamed tokens received, in order per reply"""
+    replies = []
+    lock = threading.Lock()
+
+    def drive(client_id):
+        sio = socketio.Client(reconnection=False)
+        tokens, done = [], threading.Event()
+
+        @sio.on('message')
+        def on_message(data):
+            if data['type'] == 'stream':
+                tokens.append(data['content'])
+            elif data['type'] in ('metadata', 'error', 'backpressure'):
+                done.set()
+
+        @sio.on('chunk')
+        def on_chunk(frame):
+            tokens.append(decode_chunk(frame)[2])
+
+        sio.connect(url, transports=['websocket'])
+        for n in range(messages):
+            tokens.clear()
+            done.clear()
+            sio.emit('message', {'type': 'message', 'content': f"Tell me about topic {client_id}-{n}",
+                                 'provider': 'openai', 'mode': 'llm', 'wire': wire,
+                                 'conversation_id': f"wire-{wire}-{client_id}-{n}-{uuid.uuid4().hex}"})
+            done.wait(timeout)
+            with lock:
+                replies.append([token for token in tokens if token])
+        sio.disconnect()
+
+    threads = [threading.Thread(target=drive, args=(i,)) for i in range(clients)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return replies
+
+
+def encode_offline(replies):
+    """Frame the received token sequences with the Socket.IO encoder in each format, raw and deflated"""
+    from engineio import packet as eio_packet
+    from socketio import packet as sio_packet
+
+    stream_id = '0123456789abcdef0123456789abcdef'
+    formats = {
+        'json': lambda offset, token: ['message', {'type': 'stream', 'content': token, 'stream_id': stream_id,
+                                                   'offset': offset}],
+        'binary': lambda offset, token: ['chunk', encode_chunk(stream_id, offset, token)],
+    }
+    tokens = sum(len(reply) for reply in replies)
+    results = {}
+    for name, build in formats.items():
+        started = time.perf_counter()
+        frames = []
+        for reply in replies:
+            for offset, token in enumerate(reply):
+                encoded = sio_packet.Packet(sio_packet.EVENT, data=build(offset, token)).encode()
+                for part in encoded if isinstance(encoded, list) else [encoded]:
+                    frames.append(eio_packet.Packet(eio_packet.MESSAGE, data=part).encode())
+        encode_seconds = time.perf_counter() - started
+        raw = deflated = 0
+        compressor = zlib.compressobj(6, zlib.DEFLATED, -zlib.MAX_WBITS)
+        for frame in frames:
+            data = frame if isinstance(frame, bytes) else frame.encode()
+            # Websocket header: 2 bytes up to 125 bytes of payload, 4 up to 64k
+            raw += len(data) + (2 if len(data) < 126 else 4)
+            # permessage-deflate drops the 4-byte sync flush trailer
+            size = len(compressor.compress(data) + compressor.flush(zlib.Z_SYNC_FLUSH)) - 4
+            deflated += size + (2 if size < 126 else 4)
+        results[name] = {'frames': len(frames), 'bytes_per_1k_tokens': raw * 1000 / tokens,
+                         'deflated_bytes_per_1k_tokens': deflated * 1000 / tokens,
+                         'encode_us_per_1k_tokens': encode_seconds * 1e9 / tokens}
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Bytes and CPU per 1k streamed tokens per wire format")
+    parser.add_argument('--clients', type=int, default=4)
+    parser.add_argument('--messages', type=int, default=5, help="Replies per client per format")
+    parser.add_argument('--tokens', type=int, default=500, help="Tokens per fake completion")
+    parser.add_argument('--tps', type=float, default=2000, help="Fake provider tokens per second")
+    parser.add_argument('--timeout', type=float, default=120.0)
+    parser.add_argument('--output-dir', help="Directory for the JSON results")
+    args = parser.parse_args()
+
+    provider_port, server_port = free_port(), free_port()
+    provider_url = f"http://127.0.0.1:{provider_port}"
+    processes = [spawn(['benchmarks/fake_provider.py', '--port', str(provider_port), '--ttft', '0.05',
+                        '--tps', str(args.tps), '--max-tokens', str(args.tokens)])]
+    results = {'config': {key: value for key, value in vars(args).items() if key != 'output_dir'}, 'live': {}}
+    try:
+        wait_for_http(f"{provider_url}/health")
+        server = spawn(['benchmarks/bench_server.py', '--port', str(server_port), '--provider-url', provider_url],
+                       env={'STREAM_WIRE_FORMATS': 'json,binary'})
+        processes.append(server)
+        wait_for_http(f"http://127.0.0.1:{server_port}/api/chat/health", timeout=300)
+        relay = CountingRelay(server_port)
+        url = f"http://127.0.0.1:{relay.port}"
+
+        # Warm up connections and code paths before measuring
+        stream_replies(url, 'json', 1, 1, args.timeout)
+        for wire in ('json', 'binary'):
+            relay.take()
+            sampler = ResourceSampler(server.pid).start()
+            replies = stream_replies(url, wire, args.clients, args.messages, args.timeout)
+            usage = sampler.stop()
+            time.sleep(0.2)
+            tokens = sum(len(reply) for reply in replies)
+            results['live'][wire] = {
+                'replies': len(replies),
+                'tokens': tokens,
+                'bytes_per_1k_tokens': relay.take() * 1000 / tokens if tokens else None,
+                'server_cpu_ms_per_1k_tokens': usage['cpu_seconds'] * 1e6 / tokens if tokens else None,
+            }
+            if wire == 'json':
+                json_replies = replies
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    results['encoded'] = encode_offline(json_replies)
+    for wire, run in results['live'].items():
+        encoded = results['encoded'][wire]
+        print(f"[{wire}] live: {run['bytes_per_1k_tokens']:.0f} bytes and "
+              f"{run['server_cpu_ms_per_1k_tokens']:.0f}ms server CPU per 1k tokens; encoded: "
+              f"{encoded['bytes_per_1k_tokens']:.0f} bytes raw, {encoded['deflated_bytes_per_1k_tokens']:.0f} "
+              f"deflated, {encoded['encode_us_per_1k_tokens']:.0f}us to encode per 1k tokens")
+
+    path = save_results('wire', results, args.output_dir)
+    print(f"Results saved to {path}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,198 @@
+"""Shared helpers for the benchmark scripts"""
+import datetime
+import json
+import os
+import socket
+import subprocess
+import sys
+import threading
+import time
+
+import psutil
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+RESULTS_DIR = os.path.join(BACKEND_DIR, 'benchmarks', 'results')
+
+
+def percentiles(values, points=(50, 90, 95, 99)):
+    """Return summary statistics (in the input's unit) for a list of samples"""
+    if not values:
+        return {'count': 0}
+    ordered = sorted(values)
+    summary = {
+        'count': len(ordered),
+        'mean': sum(ordered) / len(ordered),
+        'min': ordered[0],
+        'max': ordered[-1],
+    }
+    for point in points:
+        index = min(len(ordered) - 1, max(0, int(round(point / 100.0 * len(ordered))) - 1))
+        summary[f'p{point}'] = ordered[index]
+    return summary
+
+
+def free_port():
+    """Ask the OS for a free TCP port"""
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_http(url, timeout=120.0):
+    """Poll an HTTP URL until it answers 200 or the timeout expires"""
+    import requests
+
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            if requests.get(url, timeout=1).status_code == 200:
+                return True
+        except requests.RequestException:
+            pass
+        time.sleep(0.25)
+    raise TimeoutError(f"{url} did not become ready within {timeout}s")
+
+
+def spawn(args, env=None):
+    """Start a Python subprocess from the backend directory"""
+    full_env = dict(os.environ)
+    full_env.update(env or {})
+    return subprocess.Popen([sys.executable] + args, cwd=BACKEND_DIR, env=full_env)
+
+
+def git_revision():
+    """Return the current git commit hash, if available"""
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'], cwd=BACKEND_DIR, stderr=subprocess.DEVNULL
+        ).decode().strip()
+    except Exception:
+        return None
+
+
+class ResourceSampler:
+    """Samples CPU time and RSS of a process tree in a background thread"""
+
+    def __init__(self, pid, interval=0.5):
+        self.process = psutil.Process(pid)
+        self.interval = interval
+        self.rss_samples = []
+        self._stop = threading.Event()
+        self._thread = None
+        self._start_cpu = None
+        self._start_time = None
+
+    def _processes(self):
+        try:
+            return [self.process] + self.process.children(recursive=True)
+        except psutil.NoSuchProcess:
+            return []
+
+    def _cpu_seconds(self):
+        total = 0.0
+        for proc in self._processes():
+            try:
+                times = proc.cpu_times()
+                total += times.user + times.system
+            except psutil.NoSuchProcess:
+                continue
+        return total
+
+    def _rss(self):
+        total = 0
+        for proc in self._processes():
+            try:
+                total += proc.memory_info().rss
+            except psutil.NoSuchProcess:
+                continue
+        return total
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.rss_samples.append(self._rss())
+
+    def start(self):
+        self._start_cpu = self._cpu_seconds()
+        self._start_time = time.perf_counter()
+        self.rss_samples = [self._rss()]
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        """Stop sampling and return a summary dict"""
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        elapsed = time.perf_counter() - self._start_time
+        cpu_seconds = self._cpu_seconds() - self._start_cpu
+        mb = 1024 * 1024
+        return {
+            'cpu_seconds': cpu_seconds,
+            'avg_cpu_percent': 100.0 * cpu_seconds / elapsed if elapsed else 0.0,
+            'rss_start_mb': self.rss_samples[0] / mb if self.rss_samples else 0.0,
+            'rss_peak_mb': max(self.rss_samples) / mb if self.rss_samples else 0.0,
+        }
+
+
+def memory_footprint(pid):
+    """Return RSS and PSS (MB) summed over a process tree.
+
+    Summed RSS counts pages shared between forked workers once per process;
+    PSS splits each shared page between its users, so it shows what the
+    tree really costs.
+    """
+    root = psutil.Process(pid)
+    rss = pss = 0
+    for proc in [root] + root.children(recursive=True):
+        try:
+            info = proc.memory_full_info()
+        except (psutil.NoSuchProcess, psutil.AccessDenied):
+            continue
+        rss += info.rss
+        pss += getattr(info, 'pss', info.rss)
+    mb = 1024 * 1024
+    return {'rss_mb': rss / mb, 'pss_mb': pss / mb}
+
+
+def save_results(name, results, output_dir=None):
+    """Write benchmark results as JSON and return the file path"""
+    output_dir = output_dir or RESULTS_DIR
+    os.makedirs(output_dir, exist_ok=True)
+    stamp = datetime.datetime.now().strftime('%Y%m%d-%H%M%S')
+    results = dict(results)
+    results.setdefault('benchmark', name)
+    results.setdefault('timestamp', datetime.datetime.now().isoformat())
+    results.setdefault('git_revision', git_revision())
+    path = os.path.join(output_dir, f"{name}-{stamp}.json")
+    with open(path, 'w') as f:
+        json.dump(results, f, indent=2)
+    return path
+
+
+def _flatten(data, prefix=''):
+    flat = {}
+    for key, value in data.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(_flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = value
+    return flat
+
+
+def compare_results(current, baseline_path):
+    """Print numeric differences between the current results and a saved baseline"""
+    with open(baseline_path) as f:
+        baseline = json.load(f)
+
+    current_flat = _flatten(current)
+    baseline_flat = _flatten(baseline)
+    print(f"\nComparison against {baseline_path}")
+    print(f"{'metric':<50} {'baseline':>12} {'current':>12} {'change':>9}")
+    for key in sorted(current_flat):
+        if key not in baseline_flat:
+            continue
+        old, new = baseline_flat[key], current_flat[key]
+        change = f"{(new - old) / old * 100:+.1f}%" if old else "n/a"
+        print(f"{key:<50} {old:>12.2f} {new:>12.2f} {change:>9}")
@@ -0,0 +1,288 @@
+"""Local OpenAI-compatible fake LLM provider for offline benchmarking.
+
+Serves ``/v1/chat/completions`` (streaming SSE and non-streaming) with a
+configurable time-to-first-token, tokens/sec and error rate, plus a few
+HTML pages that stand in for web search results.
+
+Usage:
+    python benchmarks/fake_provider.py --port 8900 --ttft 0.3 --tps 50
+    python benchmarks/fake_provider.py --ttft 0.1 --prefill-tps 5000  # TTFT grows with prompt length
+"""
+import argparse
+import json
+import random
+import re
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs, quote_plus
+
+WORDS = (
+    "the quick brown fox jumps over the lazy dog while retrieval augmented "
+    "generation combines search results with a language model to answer "
+    "questions about documents and the web in real time"
+).split()
+
+TOOL_PATTERN = re.compile(r"^(Document Search|Web Search):", re.MULTILINE)
+
+
+class FakeProviderConfig:
+    """Runtime knobs for the fake provider"""
+
+    def __init__(self, ttft=0.3, tokens_per_sec=50.0, error_rate=0.0,
+                 error_status=500, max_tokens=200, page_paragraphs=40, prefill_tokens_per_sec=0.0,
+                 page_delay=0.0):
+        self.ttft = ttft
+        self.page_delay = page_delay
+        self.prefill_tokens_per_sec = prefill_tokens_per_sec
+        self.tokens_per_sec = tokens_per_sec
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.max_tokens = max_tokens
+        self.page_paragraphs = page_paragraphs
+
+
+def _last_user_content(messages):
+    """Return the content of the last user message in an OpenAI messages list"""
+    for message in reversed(messages or []):
+        if message.get('role') == 'user':
+            content = message.get('content', '')
+            if isinstance(content, list):
+                return " ".join(part.get('text', '') for part in content if isinstance(part, dict))
+            return content
+    return ""
+
+
+def build_reply(messages, max_tokens):
+    """Build the reply tokens, following the ReAct format when an agent prompt is detected"""
+    prompt = _last_user_content(messages)
+    filler = [random.choice(WORDS) for _ in range(max_tokens)]
+
+    if "Action Input:" in prompt:
+        if "Observation:" in prompt:
+            text = "Thought: I now know the final answer\nFinal Answer: " + " ".join(filler)
+        else:
+            tools = TOOL_PATTERN.findall(prompt)
+            question = prompt.rsplit("Question:", 1)[-1].split("\n", 1)[0].strip()
+            tool = tools[0] if tools else "Document Search"
+            text = f"Thought: I should search for this.\nAction: {tool}\nAction Input: {question}"
+        # Keep whitespace attached to words so the stream reassembles exactly
+        return re.findall(r"\S+\s*|\s+", text)
+
+    return [word + " " for word in filler]
+
+
+class FakeProviderHandler(BaseHTTPRequestHandler):
+    """HTTP handler implementing the subset of the OpenAI API used by the backend"""
+
+    protocol_version = "HTTP/1.1"
+    config = FakeProviderConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def _send_json(self, status, payload):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        if status == 429:
+            self.send_header('Retry-After', '1')
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        parsed = urlparse(self.path)
+        if parsed.path == '/v1/models':
+            self._send_json(200, {
+                'object': 'list',
+                'data': [{'id': 'fake-model', 'object': 'model', 'owned_by': 'fake'}]
+            })
+        elif parsed.path.startswith('/page/'):
+            self._send_page(parsed)
+        elif parsed.path == '/health':
+            self._send_json(200, {'status': 'ok'})
+        else:
+            self._send_json(404, {'error': {'message': 'not found'}})
+
+    def _send_page(self, parsed):
+        """Serve a synthetic HTML page used as a web search result"""
+        query = parse_qs(parsed.query).get('q', [''])[0]
+        time.sleep(self.config.page_delay)
+        paragraphs = "".join(
+            f"<p>{query} {' '.join(random.choice(WORDS) for _ in range(60))}</p>"
+            for _ in range(self.config.page_paragraphs)
+        )
+        body = (
+            f"<html><head><title>{query}</title></head><body>"
+            f"<nav>menu</nav><article>{paragraphs}</article></body></html>"
+        ).encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/html; charset=utf-8')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        parsed = urlparse(self.path)
+        if not parsed.path.endswith('/chat/completions'):
+            self._send_json(404, {'error': {'message': 'not found'}})
+            return
+
+        length = int(self.headers.get('Content-Length', 0))
+        request = json.loads(self.rfile.read(length) or b'{}')
+        config = self.config
+
+        if config.error_rate and random.random() < config.error_rate:
+            self._send_json(config.error_status, {
+                'error': {'message': 'Injected fake provider error', 'type': 'fake_error'}
+            })
+            return
+
+        max_tokens = request.get('max_tokens') or config.max_tokens
+        tokens = build_reply(request.get('messages'), max_tokens)
+        prompt_tokens = sum(len(str(m.get('content', '')).split()) for m in request.get('messages') or [])
+        model = request.get('model', 'fake-model')
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+
+        # Like a real model, the first token waits for the whole prompt to be processed
+        prefill = prompt_tokens / config.prefill_tokens_per_sec if config.prefill_tokens_per_sec else 0.0
+        time.sleep(config.ttft + prefill)
+
+        if not request.get('stream'):
+            self._send_json(200, {
+                'id': completion_id,
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{
+                    'index': 0,
+                    'message': {'role': 'assistant', 'content': "".join(tokens)},
+                    'finish_reason': 'stop'
+                }],
+                'usage': {
+                    'prompt_tokens': prompt_tokens,
+                    'completion_tokens': len(tokens),
+                    'total_tokens': prompt_tokens + len(tokens)
+                }
+            })
+            return
+
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/event-stream')
+        self.send_header('Cache-Control', 'no-cache')
+        self.send_header('Transfer-Encoding', 'chunked')
+        self.end_headers()
+
+        def write_event(payload):
+            data = f"data: {payload}\n\n".encode('utf-8')
+            self.wfile.write(f"{len(data):X}\r\n".encode('ascii') + data + b"\r\n")
+            self.wfile.flush()
+
+        def chunk(delta, finish_reason=None, usage=None):
+            payload = {
+                'id': completion_id,
+                'object': 'chat.completion.chunk',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': 0, 'delta': delta, 'finish_reason': finish_reason}] if delta is not None else [],
+            }
+            if usage is not None:
+                payload['usage'] = usage
+            return json.dumps(payload)
+
+        interval = 1.0 / config.tokens_per_sec if config.tokens_per_sec > 0 else 0
+        try:
+            write_event(chunk({'role': 'assistant', 'content': ''}))
+            next_at = time.perf_counter()
+            for token in tokens:
+                write_event(chunk({'content': token}))
+                next_at += interval
+                delay = next_at - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            write_event(chunk({}, finish_reason='stop'))
+            if (request.get('stream_options') or {}).get('include_usage'):
+                write_event(chunk(None, usage={
+                    'prompt_tokens': prompt_tokens,
+                    'completion_tokens': len(tokens),
+                    'total_tokens': prompt_tokens + len(tokens)
+                }))
+            write_event("[DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+
+class FakeSearch:
+    """Drop-in replacement for DuckDuckGoSearchAPIWrapper pointing at the fake provider's pages"""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+
+    def results(self, query, max_results=3, **kwargs):
+        return [
+            {
+                'title': f"Result {i} for {query}",
+                'snippet': f"Synthetic snippet {i} for {query}",
+                'link': f"{self.base_url}/page/{i}?q={quote_plus(query)}"
+            }
+            for i in range(max_results)
+        ]
+
+
+def make_server(host='127.0.0.1', port=8900, config=None):
+    """Create a fake provider HTTP server bound to host:port"""
+    handler = type('ConfiguredFakeProviderHandler', (FakeProviderHandler,), {
+        'config': config or FakeProviderConfig()
+    })
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    return server
+
+
+def start_fake_provider(host='127.0.0.1', port=8900, config=None):
+    """Start the fake provider in a daemon thread and return the server"""
+    server = make_server(host, port, config)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="OpenAI-compatible fake LLM provider")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8900)
+    parser.add_argument('--ttft', type=float, default=0.3, help="Seconds before the first token")
+    parser.add_argument('--tps', type=float, default=50.0, help="Tokens per second after the first token")
+    parser.add_argument('--prefill-tps', type=float, default=0.0,
+                        help="Prompt tokens processed per second before the first token (0: fixed TTFT)")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument('--error-status', type=int, default=500, help="HTTP status used for injected errors")
+    parser.add_argument('--max-tokens', type=int, default=200, help="Tokens per completion")
+    parser.add_argument('--page-paragraphs', type=int, default=40, help="Paragraphs per synthetic web page")
+    parser.add_argument('--page-delay', type=float, default=0.0, help="Seconds before a web page is served")
+    args = parser.parse_args()
+
+    config = FakeProviderConfig(
+        ttft=args.ttft,
+        tokens_per_sec=args.tps,
+        error_rate=args.error_rate,
+        error_status=args.error_status,
+        max_tokens=args.max_tokens,
+        page_paragraphs=args.page_paragraphs,
+        prefill_tokens_per_sec=args.prefill_tps,
+        page_delay=args.page_delay,
+    )
+    server = make_server(args.host, args.port, config)
+    print(f"Fake provider listening on http://{args.host}:{args.port}/v1")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,222 @@
+"""Socket.IO load test for handle_message using the local fake provider.
+
+Starts the fake provider and a benchmark server (unless --server-url is
+given), opens N Socket.IO clients and drives ``message`` events through
+the llm, rag, web and hybrid modes. Reports messages/sec, TTFT and completion
+latency percentiles plus server CPU and RSS, and saves the results as JSON
+under benchmarks/results/ for comparison across runs.
+
+Usage:
+    python benchmarks/load_test.py --clients 20 --messages 5 --modes llm,rag,web
+    python benchmarks/load_test.py --baseline benchmarks/results/load_test-20250101-120000.json
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from benchmarks.common import (  # noqa: E402
+    ResourceSampler, compare_results, free_port, percentiles, save_results, spawn, wait_for_http
+)
+
+
+class BenchClient:
+    """One Socket.IO client sending messages sequentially and timing the responses"""
+
+    def __init__(self, server_url, client_id, payload_extra=None):
+        import socketio
+
+        self.server_url = server_url
+        self.client_id = client_id
+        self.payload_extra = payload_extra or {}
+        self.sio = socketio.Client(reconnection=False)
+        self.sio.on('message', self._on_message)
+        self._done = threading.Event()
+        self._sent_at = None
+        self._first_token_at = None
+        self._error = None
+        self.records = []
+
+    def _on_message(self, data):
+        kind = data.get('type')
+        if kind == 'stream' and data.get('content') and self._first_token_at is None:
+            self._first_token_at = time.perf_counter()
+        elif kind == 'done':
+            self._done.set()
+        elif kind == 'error':
+            self._error = data.get('content')
+            self._done.set()
+        elif kind == 'backpressure':
+            self._error = f"backpressure: {data['content']['scope']} {data['content']['reason']}"
+            self._done.set()
+
+    def connect(self):
+        self.sio.connect(self.server_url, transports=['websocket'])
+
+    def close(self):
+        self.sio.disconnect()
+
+    def send(self, mode, content, timeout):
+        """Send one message and block until it completes, recording timings"""
+        self._done.clear()
+        self._first_token_at = None
+        self._error = None
+        self._sent_at = time.perf_counter()
+        payload = {'type': 'message', 'content': content, 'provider': 'openai', 'mode': mode}
+        payload.update(self.payload_extra)
+        self.sio.emit('message', payload)
+        finished = self._done.wait(timeout)
+        end = time.perf_counter()
+        self.records.append({
+            'mode': mode,
+            'ok': finished and self._error is None,
+            'error': self._error if finished else 'timeout',
+            'ttft': (self._first_token_at - self._sent_at) if self._first_token_at else None,
+            'latency': end - self._sent_at,
+        })
+
+
+def run_phase(server_url, mode, clients, messages, timeout, payload_extra=None):
+    """Run all clients against one mode and return the raw records and wall time.
+
+    server_url may be a list of worker URLs; clients are spread over them
+    round-robin, each staying on one worker as a sticky proxy would do.
+    """
+    urls = server_url if isinstance(server_url, (list, tuple)) else [server_url]
+    bench_clients = [BenchClient(urls[i % len(urls)], i, payload_extra) for i in range(clients)]
+    for client in bench_clients:
+        client.connect()
+
+    def drive(client):
+        for n in range(messages):
+            # Unique queries keep the web and document caches from hiding the real cost
+            content = f"What does the knowledge base say about topic {client.client_id}-{n}-{mode}?"
+            client.send(mode, content, timeout)
+
+    threads = [threading.Thread(target=drive, args=(c,)) for c in bench_clients]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    wall = time.perf_counter() - start
+
+    for client in bench_clients:
+        client.close()
+    return [r for c in bench_clients for r in c.records], wall
+
+
+def summarize(records, wall):
+    """Aggregate per-message records into throughput and latency percentiles (ms)"""
+    ok = [r for r in records if r['ok']]
+    errors = {}
+    for r in records:
+        if not r['ok']:
+            errors[r['error']] = errors.get(r['error'], 0) + 1
+    return {
+        'messages': len(records),
+        'succeeded': len(ok),
+        'failed': len(records) - len(ok),
+        'errors': errors,
+        'wall_seconds': wall,
+        'messages_per_sec': len(ok) / wall if wall else 0.0,
+        'ttft_ms': percentiles([r['ttft'] * 1000 for r in ok if r['ttft'] is not None]),
+        'latency_ms': percentiles([r['latency'] * 1000 for r in ok]),
+    }
+
+
+def start_stack(args):
+    """Start the fake provider and benchmark server, returning (server_url, processes)"""
+    provider_port = free_port()
+    server_port = args.port or free_port()
+    provider_url = f"http://127.0.0.1:{provider_port}"
+    provider = spawn([
+        'benchmarks/fake_provider.py', '--port', str(provider_port),
+        '--ttft', str(args.ttft), '--tps', str(args.tps),
+        '--error-rate', str(args.error_rate), '--error-status', str(args.error_status),
+        '--max-tokens', str(args.max_tokens),
+    ])
+    wait_for_http(f"{provider_url}/health")
+    server = spawn([
+        'benchmarks/bench_server.py', '--port', str(server_port), '--provider-url', provider_url,
+    ])
+    server_url = f"http://127.0.0.1:{server_port}"
+    wait_for_http(f"{server_url}/api/chat/health", timeout=300)
+    return server_url, [server, provider]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Socket.IO load test with a fake LLM provider")
+    parser.add_argument('--clients', type=int, default=10, help="Concurrent Socket.IO clients")
+    parser.add_argument('--messages', type=int, default=5, help="Messages per client per mode")
+    parser.add_argument('--modes', default='llm,rag,web', help="Comma-separated modes to exercise")
+    parser.add_argument('--ttft', type=float, default=0.3, help="Fake provider time-to-first-token (s)")
+    parser.add_argument('--tps', type=float, default=50.0, help="Fake provider tokens/sec")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="Fake provider error rate")
+    parser.add_argument('--error-status', type=int, default=500, help="HTTP status of injected errors (429: rate limits)")
+    parser.add_argument('--max-tokens', type=int, default=200, help="Tokens per fake completion")
+    parser.add_argument('--timeout', type=float, default=120.0, help="Per-message timeout (s)")
+    parser.add_argument('--port', type=int, default=0, help="Port for the spawned backend")
+    parser.add_argument('--server-url', help="Use an already running backend instead of spawning one")
+    parser.add_argument('--server-pid', type=int, help="PID of --server-url's process for CPU/RSS sampling")
+    parser.add_argument('--output-dir', help="Directory for the JSON results")
+    parser.add_argument('--baseline', help="Earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    processes = []
+    if args.server_url:
+        server_url = args.server_url
+        server_pid = args.server_pid
+    else:
+        server_url, processes = start_stack(args)
+        server_pid = processes[0].pid
+
+    results = {
+        'config': {
+            'clients': args.clients,
+            'messages_per_client': args.messages,
+            'ttft': args.ttft,
+            'tokens_per_sec': args.tps,
+            'error_rate': args.error_rate,
+            'max_tokens': args.max_tokens,
+        },
+        'modes': {},
+        'server': {},
+    }
+
+    try:
+        for mode in [m.strip() for m in args.modes.split(',') if m.strip()]:
+            sampler = ResourceSampler(server_pid).start() if server_pid else None
+            records, wall = run_phase(server_url, mode, args.clients, args.messages, args.timeout)
+            results['modes'][mode] = summarize(records, wall)
+            if sampler:
+                results['server'][mode] = sampler.stop()
+
+            summary = results['modes'][mode]
+            print(f"[{mode}] {summary['succeeded']}/{summary['messages']} ok, "
+                  f"{summary['messages_per_sec']:.2f} msg/s, "
+                  f"TTFT p50={summary['ttft_ms'].get('p50', 0):.0f}ms "
+                  f"p99={summary['ttft_ms'].get('p99', 0):.0f}ms, "
+                  f"latency p50={summary['latency_ms'].get('p50', 0):.0f}ms "
+                  f"p99={summary['latency_ms'].get('p99', 0):.0f}ms")
+            if mode in results['server']:
+                server = results['server'][mode]
+                print(f"[{mode}] server CPU {server['avg_cpu_percent']:.0f}% "
+                      f"({server['cpu_seconds']:.1f}s), peak RSS {server['rss_peak_mb']:.0f}MB")
+    finally:
+        for process in processes:
+            process.terminate()
+        for process in processes:
+            process.wait()
+
+    path = save_results('load_test', results, args.output_dir)
+    print(f"Results saved to {path}")
+    if args.baseline:
+        compare_results(results, args.baseline)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,28 +1,19 @@
 import os
 import sys
-from langchain_community.vectorstores import FAISS
+import json
+import fnmatch
+import argparse
 from langchain_huggingface import HuggingFaceEmbeddings
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import PyPDFLoader, TextLoader
-import glob
+from app.services.collection_store import DEFAULT_COLLECTION, collection_path
+from app.services.ingestion import DUPLICATES_FILE, StreamingIndexBuilder, find_documents
+from app.services.mmap_store import MMAP_DIRNAME, MmapVectorStore
 
-def create_vector_store(documents_path='./documents', index_path='faiss_index'):
-    """Create a FAISS vector store from documents in the specified path"""
-    print(f"Creating vector store from documents in {documents_path}")
-    
-    # Create documents directory if it doesn't exist
-    if not os.path.exists(documents_path):
-        os.makedirs(documents_path)
-        print(f"Created documents directory at {documents_path}")
-        
-    # Create a sample document if none exists
-    sample_path = os.path.join(documents_path, 'sample.txt')
-    if not os.path.exists(sample_path):
-        with open(sample_path, 'w') as f:
-            f.write("""
+MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+
+SAMPLE_DOCUMENT = """
 # Sample Knowledge Base Document
 
-This is a sample document for the RAG Chat Application. 
+This is a sample document for the RAG Chat Application.
 
 The RAG Chat App allows users to:
 1. Ask questions about documents in the knowledge base
@@ -31,68 +22,127 @@ The RAG Chat App allows users to:
 
 To add more documents to the knowledge base, place them in the 'documents' folder
 and run this script again to update the index.
-            """)
+            """
+
+
+def write_faiss_index(index_path, embeddings):
+    """Write the pickled FAISS index from the mmap store (holds the whole corpus in memory)"""
+    import faiss
+    import numpy as np
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+
+    store = MmapVectorStore(os.path.join(index_path, MMAP_DIRNAME), embeddings)
+    index = faiss.IndexFlatL2(store.manifest['dim'])
+    for start in range(0, len(store), 65536):
+        index.add(np.asarray(store.vectors[start:start + 65536], dtype=np.float32))
+    docstore = InMemoryDocstore({str(i): store.document(i) for i in range(len(store))})
+    FAISS(embeddings, index, docstore, {i: str(i) for i in range(len(store))}).save_local(index_path)
+
+
+def file_metadata(documents_path, files, patterns=None):
+    """Per-file chunk metadata: the file's directory relative to documents_path, plus the metadata of every
+    pattern in patterns (glob -> metadata, matched against the relative path) that the file matches"""
+    metadata = {}
+    for file_path in files:
+        relative = os.path.relpath(file_path, documents_path).replace(os.sep, '/')
+        extra = {'directory': os.path.dirname(relative) or '.'}
+        for pattern, values in (patterns or {}).items():
+            if fnmatch.fnmatch(relative, pattern):
+                extra.update(values)
+        metadata[file_path] = extra
+    return metadata
+
+
+def partition(files, metadata, partition_by):
+    """Group files into collections by top-level directory or by a metadata key; the rest go to the default"""
+    groups = {}
+    for file_path in files:
+        if partition_by == 'directory':
+            value = metadata[file_path]['directory'].split('/')[0]
+            value = value if value != '.' else None
+        else:
+            value = metadata[file_path].get(partition_by)
+        name = str(value) if value not in (None, '') else DEFAULT_COLLECTION
+        groups.setdefault(name, []).append(file_path)
+    return groups
+
+
+def create_vector_store(documents_path='./documents', index_path='faiss_index', mmap_dtype=None,
+                        batch_size=256, resume=True, write_faiss=False, chunk_size=None, chunk_overlap=None,
+                        dedup=None, near_distance=None, collection=None, partition_by=None, metadata_path=None):
+    """Stream documents from the specified path into the memory-mapped vector store.
+
+    With collection, the index is the named collection's; with partition_by ('directory' or a metadata
+    key), each group of files becomes its own collection.
+    """
+    print(f"Creating vector store from documents in {documents_path}")
+
+    # Create documents directory if it doesn't exist
+    if not os.path.exists(documents_path):
+        os.makedirs(documents_path)
+        print(f"Created documents directory at {documents_path}")
+
+    # Create a sample document if none exists
+    sample_path = os.path.join(documents_path, 'sample.txt')
+    if not os.path.exists(sample_path):
+        with open(sample_path, 'w') as f:
+            f.write(SAMPLE_DOCUMENT)
         print("Created sample document")
-    
+
     try:
-        # Find all text and PDF files
-        text_files = glob.glob(os.path.join(documents_path, "**/*.txt"), recursive=True)
-        pdf_files = glob.glob(os.path.join(documents_path, "**/*.pdf"), recursive=True)
-        
-        if not text_files and not pdf_files:
-            print("No text or PDF files found. Using only the sample document.")
-        
-        # Read the content of each file
-        documents = []
-        
-        # Process text files
-        for file_path in text_files:
-            try:
-                print(f"Loading text file: {file_path}")
-                loader = TextLoader(file_path, encoding="utf-8", autodetect_encoding=True)
-                loaded_docs = loader.load()
-                documents.extend(loaded_docs)
-                print(f"Loaded: {file_path}")
-            except Exception as e:
-                print(f"Error reading {file_path}: {str(e)}")
-        
-        # Process PDF files
-        for file_path in pdf_files:
-            try:
-                print(f"Loading PDF file: {file_path}")
-                loader = PyPDFLoader(file_path)
-                loaded_docs = loader.load()
-                documents.extend(loaded_docs)
-                print(f"Loaded: {file_path} ({len(loaded_docs)} pages)")
-            except Exception as e:
-                print(f"Error reading {file_path}: {str(e)}")
-                import traceback
-                traceback.print_exc()
-        
-        if not documents:
-            print("No documents were successfully loaded. Creating an empty index.")
-            empty_text = "This is an empty vector store. Please add documents and reindex."
-            documents = [{"page_content": empty_text, "metadata": {"source": "empty"}}]
-        
-        print(f"Total documents loaded: {len(documents)}")
-        
-        # Split documents into chunks
-        text_splitter = RecursiveCharacterTextSplitter(chunk_size=1000, chunk_overlap=200)
-        chunks = text_splitter.split_documents(documents)
-        
-        print(f"Split into {len(chunks)} chunks")
-        
-        # Create embeddings and vector store
+        files = find_documents(documents_path)
+        print(f"Found {len(files)} text/PDF files")
+        patterns = None
+        if metadata_path:
+            with open(metadata_path) as f:
+                patterns = json.load(f)
+        metadata = file_metadata(documents_path, files, patterns)
+        if partition_by:
+            groups = partition(files, metadata, partition_by)
+        else:
+            groups = {collection or DEFAULT_COLLECTION: files}
+        # Raises on a name that can't be a collection before anything is embedded
+        paths = {name: collection_path(index_path, name) for name in groups}
+
         print("Initializing embeddings model...")
-        embeddings = HuggingFaceEmbeddings(model_name="sentence-transformers/all-MiniLM-L6-v2")
-        
-        print("Creating vector store...")
-        vector_store = FAISS.from_documents(chunks, embeddings)
-        
-        # Save vector store with allow_dangerous_serialization set to True
-        print(f"Saving vector store to {index_path}")
-        vector_store.save_local(index_path)
-        
+        embeddings = HuggingFaceEmbeddings(model_name=MODEL_NAME)
+
+        def report(stats):
+            print(f"  {stats['files']} files, {stats['pages']} pages, {stats['chunks']} chunks embedded, "
+                  f"{stats['exact_duplicates'] + stats['near_duplicates']} duplicates skipped "
+                  f"(peak RSS {stats['peak_rss_mb']:.0f}MB)")
+
+        # Pages are read, split and embedded incrementally, so memory is bounded by the batch size
+        mmap_dtype = mmap_dtype or os.environ.get('VECTOR_STORE_MMAP_DTYPE', 'float32')
+        chunk_size = chunk_size or int(os.environ.get('CHUNK_SIZE', 1000))
+        chunk_overlap = chunk_overlap if chunk_overlap is not None else int(os.environ.get('CHUNK_OVERLAP', 200))
+        dedup = dedup if dedup is not None else os.environ.get('DEDUP_ENABLED', 'True') == 'True'
+        near_distance = near_distance if near_distance is not None else int(os.environ.get('DEDUP_NEAR_DISTANCE', 4))
+        for name, group in groups.items():
+            path = paths[name]
+            if len(groups) > 1 or name != DEFAULT_COLLECTION:
+                print(f"Collection {name}: {len(group)} files into {path}")
+            builder = StreamingIndexBuilder(embeddings, path, chunk_size=chunk_size, chunk_overlap=chunk_overlap,
+                                            batch_size=batch_size, dtype=mmap_dtype, model_name=MODEL_NAME,
+                                            on_batch=report, dedup=dedup, near_distance=near_distance)
+            summary = builder.build(group, resume=resume, metadata={f: metadata[f] for f in group})
+
+            if write_faiss:
+                print(f"Saving pickled FAISS index to {path}")
+                write_faiss_index(path, embeddings)
+
+            print(f"Indexed {summary['files']} files, {summary['pages']} pages, {summary['chunks']} chunks "
+                  f"in {summary['seconds']:.1f}s ({summary['chunks_per_sec']:.1f} chunks/s)"
+                  f"{', resumed from checkpoint' if summary['resumed'] else ''}")
+            if dedup:
+                print(f"Skipped {summary['exact_duplicates']} exact and {summary['near_duplicates']} near-duplicate "
+                      f"chunks ({summary['embeddings_avoided_pct']:.1f}% of embeddings avoided); see "
+                      f"{os.path.join(path, MMAP_DIRNAME, DUPLICATES_FILE)}")
+            if summary['errors']:
+                print(f"{summary['errors']} files could not be read")
+        print(f"Peak RSS: {summary['peak_rss_mb']:.0f}MB")
+
         return True
     except Exception as e:
         print(f"Error creating vector store: {str(e)}")
@@ -101,11 +151,37 @@ and run this script again to update the index.
         return False
 
 if __name__ == "__main__":
-    # Use command line arguments or default paths
-    docs_path = sys.argv[1] if len(sys.argv) > 1 else './documents'
-    idx_path = sys.argv[2] if len(sys.argv) > 2 else 'faiss_index'
-    
-    if create_vector_store(docs_path, idx_path):
+    parser = argparse.ArgumentParser(description="Build the knowledge base index")
+    parser.add_argument('documents_path', nargs='?', default='./documents')
+    parser.add_argument('index_path', nargs='?', default='faiss_index')
+    parser.add_argument('--dtype', choices=['float32', 'float16'], help="Stored vector type (default float32)")
+    parser.add_argument('--batch-size', type=int, default=256, help="Chunks embedded per batch")
+    parser.add_argument('--chunk-size', type=int, help="Characters per chunk (default CHUNK_SIZE or 1000)")
+    parser.add_argument('--chunk-overlap', type=int, help="Characters shared by neighbouring chunks "
+                                                          "(default CHUNK_OVERLAP or 200)")
+    parser.add_argument('--no-dedup', action='store_true', help="Embed duplicate chunks too")
+    parser.add_argument('--near-distance', type=int, help="SimHash bits two chunks may differ in and still count "
+                                                          "as duplicates; 0 for exact copies only "
+                                                          "(default DEDUP_NEAR_DISTANCE or 4)")
+    parser.add_argument('--collection', help="Build the named collection (under index_path/collections) "
+                                             "instead of the default index")
+    parser.add_argument('--partition-by', help="Build one collection per top-level directory ('directory') or per "
+                                               "value of a --metadata key such as tenant; other files go to the "
+                                               "default index")
+    parser.add_argument('--metadata', help="JSON file mapping glob patterns (relative to documents_path) to "
+                                           "metadata for the matching files' chunks, e.g. "
+                                           "{\"hr/*\": {\"tags\": [\"policy\"], \"tenant\": \"acme\"}}")
+    parser.add_argument('--no-resume', action='store_true', help="Ignore an interrupted build's checkpoint")
+    parser.add_argument('--faiss', action='store_true',
+                        help="Also write the pickled FAISS index (loads the whole corpus into memory)")
+    args = parser.parse_args()
+
+    if create_vector_store(args.documents_path, args.index_path, args.dtype, args.batch_size,
+                           resume=not args.no_resume, write_faiss=args.faiss, chunk_size=args.chunk_size,
+                           chunk_overlap=args.chunk_overlap, dedup=False if args.no_dedup else None,
+                           near_distance=args.near_distance, collection=args.collection,
+                           partition_by=args.partition_by, metadata_path=args.metadata):
         print("Index created successfully!")
     else:
-        print("Failed to create index.") 
\ No newline at end of file
+        print("Failed to create index.")
+        sys.exit(1)
@@ -0,0 +1,184 @@
+"""Production server: N preforked worker processes sharing a Socket.IO message queue.
+
+The master loads the heavy, read-mostly services (embedding model, FAISS
+index, LLM factory) once and then forks the workers, so those pages are
+shared copy-on-write instead of being loaded N times. Each worker builds
+its own app around them (Socket.IO server, conversation DB writer,
+metrics) and listens on port + i. Put a proxy with sticky sessions in
+front of the worker ports (see "Production Deployment" in the README).
+
+Cross-process emits go through SOCKETIO_MESSAGE_QUEUE (redis://...). If it
+is not set and more than one worker is requested, a local fan-out broker
+is started in the master process instead.
+
+Usage:
+    python serve.py --workers 4 --port 5000
+    SOCKETIO_MESSAGE_QUEUE=redis://localhost:6379/0 python serve.py --workers 4
+"""
+import os
+
+# Green sockets let one worker overlap many provider streams; this must run
+# before anything imports socket, threading or ssl
+if os.environ.get('SERVE_MONKEY_PATCH', 'True') == 'True':
+    try:
+        import eventlet
+    except ImportError:
+        eventlet = None
+    if eventlet is not None:
+        # httpcore imports trio when it is installed, and trio needs the
+        # select.epoll that monkey patching removes, so load it beforehand
+        try:
+            import trio  # noqa: F401
+        except ImportError:
+            pass
+        eventlet.monkey_patch()
+
+import argparse
+import gc
+import signal
+import sys
+import time
+import logging
+
+logging.basicConfig(level=logging.INFO, format='%(asctime)s %(process)d %(name)s %(levelname)s %(message)s')
+logger = logging.getLogger('serve')
+
+
+def preload_services():
+    """Load the shared services in the master, inside an app context so configuration applies"""
+    from flask import Flask
+    from app.config import Config
+    from app.services.rag_service import RAGService
+    from app.services.llm_service import LLMFactory
+
+    config_app = Flask('preload')
+    config_app.config.from_object(Config)
+    with config_app.app_context():
+        return {'rag_service': RAGService(), 'llm_factory': LLMFactory()}
+
+
+def start_retrieval_pool(services):
+    """Fork the retrieval processes from the master so every web worker shares one pool"""
+    from app.config import Config
+    from app.services.retrieval_pool import RetrievalPool
+
+    if Config.RETRIEVAL_PROCESSES > 0:
+        services['retrieval_pool'] = RetrievalPool(services['rag_service'], Config.RETRIEVAL_PROCESSES,
+                                                   path=Config.RETRIEVAL_SOCKET or None).start()
+    return services.get('retrieval_pool')
+
+
+def default_app_factory(services, index):
+    from app import create_app
+    return create_app(services, worker_index=index)
+
+
+def _run_worker(app_factory, services, index, host, port):
+    from app import socketio
+
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    app = app_factory(services, index)
+    logger.info(f"Worker {index} serving on http://{host}:{port}")
+    socketio.run(app, host=host, port=port, log_output=False, allow_unsafe_werkzeug=True)
+
+
+def run_workers(workers, host='0.0.0.0', port=5000, app_factory=default_app_factory,
+                preload=preload_services, queue_port=0):
+    """Preload services, fork the workers and restart any that exit until the master is stopped"""
+    broker = None
+    if workers > 1 and not os.environ.get('SOCKETIO_MESSAGE_QUEUE'):
+        from app.services.socketio_queue import LocalQueueBroker
+        broker = LocalQueueBroker('127.0.0.1', queue_port).start()
+        os.environ['SOCKETIO_MESSAGE_QUEUE'] = broker.url
+
+    # Config reads the environment at import time, so the queue URL must be set first
+    started = time.time()
+    services = preload()
+    logger.info(f"Preloaded shared services in {time.time() - started:.1f}s")
+
+    # Keep the preloaded objects out of the collector's generations so that
+    # garbage collection in the forked processes does not touch (and copy) their pages
+    gc.collect()
+    gc.freeze()
+    retrieval_pool = start_retrieval_pool(services)
+
+    if workers == 1:
+        try:
+            _run_worker(app_factory, services, 0, host, port)
+        finally:
+            if retrieval_pool is not None:
+                retrieval_pool.stop()
+        return
+
+    children = {}
+    stopping = False
+
+    def spawn(index):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _run_worker(app_factory, services, index, host, port + index)
+            except BaseException:
+                logger.exception(f"Worker {index} crashed")
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = index
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children) + (retrieval_pool.pids if retrieval_pool else []):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for index in range(workers):
+        spawn(index)
+    logger.info(f"Started {workers} workers on ports {port}-{port + workers - 1} "
+                f"(message queue {os.environ['SOCKETIO_MESSAGE_QUEUE']})")
+
+    while children:
+        try:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+        except ChildProcessError:
+            break
+        if pid == 0:
+            time.sleep(0.5)
+            continue
+        if retrieval_pool is not None and retrieval_pool.owns(pid):
+            if not stopping:
+                retrieval_pool.respawn(pid)
+            continue
+        index = children.pop(pid, None)
+        if index is not None and not stopping:
+            logger.warning(f"Worker {index} (pid {pid}) exited with status {status}, restarting")
+            time.sleep(1)
+            spawn(index)
+
+    if retrieval_pool is not None:
+        retrieval_pool.stop()
+    if broker is not None:
+        broker.stop()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Multi-worker Socket.IO server")
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help="Worker processes")
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000, help="Port of the first worker (worker i uses port + i)")
+    parser.add_argument('--queue-port', type=int, default=0, help="Port for the local broker if no queue is set")
+    args = parser.parse_args()
+
+    run_workers(args.workers, args.host, args.port, queue_port=args.queue_port)
+
+
+if __name__ == '__main__':
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+    main()
@@ -259,6 +259,8 @@ function AppContent() {
   const [inputValue, setInputValue] = useState('');
   const [sidebarOpen, setSidebarOpen] = useState(true);
   const [provider, setProvider] = useState('groq');
+  // The server's catalog replaces the bundled list once loaded (revalidated with its ETag)
+  const [models, setModels] = useState(availableModels);
   const [modelId, setModelId] = useState('');
   const [mode, setMode] = useState('llm');
   const [isStreaming, setIsStreaming] = useState(false);
@@ -266,6 +268,15 @@ function AppContent() {
   const [responseMetadata, setResponseMetadata] = useState(null);
   const [persona, setPersona] = useState('default');
   const [customSystemMessage, setCustomSystemMessage] = useState('');
+  // The server hands out a token for each conversation it starts; continuing it or loading its history needs it
+  const [conversationToken, setConversationToken] = useState(() => localStorage.getItem('conversationToken') || '');
+  const [conversationId, setConversationId] = useState(() => {
+    const stored = localStorage.getItem('conversationId');
+    return stored && localStorage.getItem('conversationToken') ? stored : crypto.randomUUID();
+  });
+  
+  // The reply being received: { id, offset, finished }; resumed from offset after a reconnect
+  const replyStream = useRef(null);
   
   const { socket, isConnected, sendMessage } = useSocket();
   const isMobile = useMediaQuery('(max-width:900px)');
@@ -285,14 +296,59 @@ function AppContent() {
     localStorage.setItem('darkMode', JSON.stringify(darkMode));
   }, [darkMode]);
 
+  // Effect to persist the conversation and restore its history from the server
+  useEffect(() => {
+    localStorage.setItem('conversationId', conversationId);
+    if (!conversationToken) return undefined;
+
+    let cancelled = false;
+    fetch(`/api/chat/conversations/${encodeURIComponent(conversationId)}/messages?limit=100`, {
+      headers: { 'X-Conversation-Token': conversationToken }
+    })
+      .then(response => (response.ok ? response.json() : null))
+      .then(data => {
+        if (cancelled || !data || !data.messages || data.messages.length === 0) return;
+        // The API pages newest first
+        const restored = [...data.messages].reverse().map(({ role, content }) => ({ role, content }));
+        setMessages(prev => (prev.length === 0 ? restored : prev));
+      })
+      .catch(error => console.error('Failed to restore conversation:', error));
+
+    return () => {
+      cancelled = true;
+    };
+    // Not rerun when the token arrives: that is after the first reply, when there is nothing to restore
+  }, [conversationId]);
+
+  useEffect(() => {
+    localStorage.setItem('conversationToken', conversationToken);
+  }, [conversationToken]);
+
+  // Effect to load the model catalog (providers with an API key, chat models only)
+  useEffect(() => {
+    let cancelled = false;
+    fetch('/api/chat/models')
+      .then(response => (response.ok ? response.json() : null))
+      .then(data => {
+        if (cancelled || !data || Object.keys(data).length === 0) return;
+        setModels(data);
+        setProvider(current => (data[current] ? current : Object.keys(data)[0]));
+      })
+      .catch(error => console.error('Failed to load models:', error));
+
+    return () => {
+      cancelled = true;
+    };
+  }, []);
+
   // Effect to set modelId when provider changes
   useEffect(() => {
-    if (availableModels[provider] && availableModels[provider].length > 0) {
-      setModelId(availableModels[provider][0].id);
+    if (models[provider] && models[provider].length > 0) {
+      setModelId(current => (models[provider].some(model => model.id === current) ? current : models[provider][0].id));
     } else {
       setModelId('');
     }
-  }, [provider]);
+  }, [provider, models]);
 
   // Websocket message handler
   useEffect(() => {
@@ -300,7 +356,27 @@ function AppContent() {
 
     const handleMessage = (data) => {
       console.log('Socket message received:', data);
-      if (data.type === 'message') {
+      if (data.stream_id) {
+        const current = replyStream.current;
+        if (current && current.id === data.stream_id) {
+          // Already received before the connection dropped
+          if (data.offset <= current.offset) return;
+          current.offset = data.offset;
+        } else {
+          replyStream.current = { id: data.stream_id, offset: data.offset, finished: false };
+        }
+        if (data.type === 'metadata') replyStream.current.finished = true;
+      }
+      if (data.type === 'resume') {
+        const { status } = data.content || {};
+        if (status === 'unknown') {
+          replyStream.current = null;
+          setError('The connection dropped and the reply could not be resumed. Please retry.');
+          setIsStreaming(false);
+        } else if (status === 'gap') {
+          setError('The connection dropped and part of the reply was lost.');
+        }
+      } else if (data.type === 'message') {
         console.log('Adding new assistant message');
         setMessages(prev => {
           const newMessages = [...prev, { role: 'assistant', content: data.content }];
@@ -330,21 +406,43 @@ function AppContent() {
       } else if (data.type === 'metadata') {
         console.log('Received metadata:', data.content);
         setResponseMetadata(data.content);
+        if (data.content && data.content.conversation_token) {
+          setConversationToken(data.content.conversation_token);
+        }
       } else if (data.type === 'error') {
         console.error('Received error:', data.content);
         setError(data.content);
         setIsStreaming(false);
+      } else if (data.type === 'backpressure') {
+        // Rate limited: { scope, reason, provider, retry_after }
+        console.warn('Rate limited:', data.content);
+        const { scope, retry_after: retryAfter } = data.content || {};
+        setError(scope === 'client'
+          ? `You're sending messages too quickly.${retryAfter ? ` Try again in ${Math.ceil(retryAfter)}s.` : ''}`
+          : `The model provider is busy.${retryAfter ? ` Try again in ${Math.ceil(retryAfter)}s.` : ''}`);
+        setIsStreaming(false);
       } else if (data.type === 'done') {
         console.log('Stream complete');
         setIsStreaming(false);
       }
     };
 
+    // After a reconnect, ask for the rest of an unfinished reply
+    const handleConnect = () => {
+      const current = replyStream.current;
+      if (current && !current.finished) {
+        console.log('Resuming reply', current.id, 'after offset', current.offset);
+        socket.emit('resume', { stream_id: current.id, offset: current.offset });
+      }
+    };
+
     socket.on('message', handleMessage);
+    socket.on('connect', handleConnect);
     console.log('Socket message handler registered');
 
     return () => {
       socket.off('message', handleMessage);
+      socket.off('connect', handleConnect);
     };
   }, [socket]);
 
@@ -365,9 +463,13 @@ function AppContent() {
       content: inputValue,
       provider: provider,
       model: modelId,
-      mode: mode
+      mode: mode,
+      conversation_id: conversationId,
+      conversation_token: conversationToken || undefined,
+      persona: persona,
+      system_message: persona === 'custom' ? customSystemMessage : undefined
     });
-  }, [inputValue, isConnected, isStreaming, sendMessage, provider, modelId, mode]);
+  }, [inputValue, isConnected, isStreaming, sendMessage, provider, modelId, mode, conversationId, conversationToken, persona, customSystemMessage]);
 
   const handleRetry = useCallback(() => {
     if (!isConnected || isStreaming || messages.length === 0) return;
@@ -388,13 +490,20 @@ function AppContent() {
       content: lastUserMessage.content,
       provider: provider,
       model: modelId,
-      mode: mode
+      mode: mode,
+      conversation_id: conversationId,
+      conversation_token: conversationToken || undefined,
+      persona: persona,
+      system_message: persona === 'custom' ? customSystemMessage : undefined
     });
-  }, [messages, isConnected, isStreaming, sendMessage, provider, modelId, mode]);
+  }, [messages, isConnected, isStreaming, sendMessage, provider, modelId, mode, conversationId, conversationToken, persona, customSystemMessage]);
 
   const handleClearChat = useCallback(() => {
     setMessages([]);
     setResponseMetadata(null);
+    // Start a fresh server-side history
+    setConversationId(crypto.randomUUID());
+    setConversationToken('');
   }, []);
 
   const handleSaveChat = useCallback(() => {
@@ -495,7 +604,7 @@ function AppContent() {
           onProviderChange={handleProviderChange}
           modelId={modelId}
           onModelChange={handleModelChange}
-          availableModels={availableModels}
+          availableModels={models}
           mode={mode}
           onModeChange={handleModeChange}
           onClearChat={handleClearChat}
@@ -85,6 +85,7 @@ const Sidebar = ({
   // Function to get provider display name and color
   const getProviderInfo = (providerName) => {
     const providerMap = {
+      auto: { name: 'Automatic', color: theme.palette.secondary.main },
       openai: { name: 'OpenAI', color: '#00A67E' },
       anthropic: { name: 'Anthropic', color: '#b6262e' },
       groq: { name: 'Groq', color: '#5846f6' },
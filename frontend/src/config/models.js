@@ -2,6 +2,9 @@
  * Available models configuration for different providers
  */
 export const availableModels = {
+  'auto': [
+    { id: 'auto', name: 'Automatic', description: 'Picks the fastest model within the cost ceiling for each question' }
+  ],
   'openai': [
     { id: 'gpt-4o', name: 'GPT-4o', description: 'Optimized GPT-4 with improved performance' },
     { id: 'gpt-4o-mini', name: 'GPT-4o Mini', description: 'Optimized for balance of capability and speed' },
@@ -70,6 +73,7 @@ export const availableModels = {
  */
 export const providerWarnings = {
   // Example: set to true if API key is missing or invalid
+  'auto': false,
   'openai': false,
   'groq': false,
   'anthropic': false,
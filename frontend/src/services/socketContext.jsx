@@ -75,7 +75,11 @@ export const SocketProvider = ({ children }) => {
         content: data.content,
         provider: data.provider,
         model: data.model,
-        mode: data.mode
+        mode: data.mode,
+        conversation_id: data.conversation_id,
+        conversation_token: data.conversation_token,
+        persona: data.persona,
+        system_message: data.system_message
       };
       
       // Emit the message on the socket